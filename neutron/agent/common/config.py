@@ -31,6 +31,12 @@ ROOT_HELPER_OPTS = [
                help=_('Root helper application.')),
 ]
 
+ROOT_HELPER_DAEMON_OPTS = [
+    cfg.StrOpt('root_helper_daemon',
+               help=_('Command starting a root helper daemon, used instead '
+                      'of root_helper by the commands run by the agent.')),
+]
+
 AGENT_STATE_OPTS = [
     cfg.FloatOpt('report_interval', default=4,
                  help=_('Seconds between nodes reporting state to server; '
@@ -70,6 +76,7 @@ def register_root_helper(conf):
     # The first call is to ensure backward compatibility
     conf.register_opts(ROOT_HELPER_OPTS)
     conf.register_opts(ROOT_HELPER_OPTS, 'AGENT')
+    conf.register_opts(ROOT_HELPER_DAEMON_OPTS, 'AGENT')
 
 
 def register_agent_state_opts_helper(conf):
@@ -35,6 +35,7 @@ from neutron.common import topics
 from neutron.common import utils as common_utils
 from neutron import context
 from neutron import manager
+from neutron.openstack.common import excutils
 from neutron.openstack.common import importutils
 from neutron.openstack.common import lockutils
 from neutron.openstack.common import log as logging
@@ -97,6 +98,11 @@ class RouterInfo(object):
         self._snat_enabled = None
         self._snat_action = None
         self.internal_ports = []
+        # Floating ips applied on the gateway device, mapped to their
+        # fixed ip, and the /32 addresses configured on it
+        self.floating_ips = {}
+        self.floating_ip_cidrs = set()
+        self.floating_ip_device = None
         self.root_helper = root_helper
         self.use_namespaces = use_namespaces
         # Invoke the setter for establishing initial SNAT action
@@ -386,6 +392,16 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         port['ip_cidr'] = "%s/%s" % (ips[0]['ip_address'], prefixlen)
 
     def process_router(self, ri):
+        try:
+            self._process_router(ri)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                # The deferred address changes may not have been applied,
+                # the gateway device addresses are listed again next time
+                ri.floating_ip_device = None
+
+    @ip_lib.defer_apply
+    def _process_router(self, ri):
         ri.iptables_manager.defer_apply_on()
         ex_gw_port = self._get_ex_gw_port(ri)
         internal_ports = ri.router.get(l3_constants.INTERFACE_KEY, [])
@@ -423,6 +439,8 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         elif not ex_gw_port and ri.ex_gw_port:
             self.external_gateway_removed(ri, ri.ex_gw_port,
                                           interface_name, internal_cidrs)
+            ri.iptables_manager.ipv4['nat'].clear_rules_by_tag('floating_ip')
+            ri.floating_ip_device = None
 
         # Process SNAT rules for external gateway
         ri.perform_snat_action(self._handle_router_snat_rules,
@@ -464,42 +482,63 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         Configures floating ips in iptables and on the router's gateway device.
 
         Cleans up floating ips that should not longer be configured.
+        The addresses of the gateway device are only listed the first time
+        it is processed, afterwards only the floating ips added, removed or
+        associated to a new fixed ip since the previous call are changed.
         """
         interface_name = self.get_external_device_name(ex_gw_port['id'])
         device = ip_lib.IPDevice(interface_name, self.root_helper,
                                  namespace=ri.ns_name())
+        nat = ri.iptables_manager.ipv4['nat']
+
+        if ri.floating_ip_device != interface_name:
+            # Clear out all iptables rules for floating ips and learn the
+            # addresses which are already configured on the device
+            nat.clear_rules_by_tag('floating_ip')
+            ri.floating_ips = {}
+            ri.floating_ip_cidrs = set(
+                addr['cidr'] for addr in device.addr.list()
+                if addr['cidr'].endswith(FLOATING_IP_CIDR_SUFFIX))
+            ri.floating_ip_device = interface_name
+
+        new_fips = dict((fip['floating_ip_address'], fip['fixed_ip_address'])
+                        for fip in ri.router.get(l3_constants.FLOATINGIP_KEY,
+                                                 []))
+
+        # Remove the rules of the floating ips removed or remapped
+        for fip_ip, fixed in ri.floating_ips.items():
+            if new_fips.get(fip_ip) != fixed:
+                for chain, rule in self.floating_forward_rules(fip_ip, fixed):
+                    nat.remove_rule(chain, rule)
+                del ri.floating_ips[fip_ip]
+
+        for fip_ip, fixed in new_fips.iteritems():
+            if fip_ip not in ri.floating_ips:
+                for chain, rule in self.floating_forward_rules(fip_ip, fixed):
+                    nat.add_rule(chain, rule, tag='floating_ip')
+                ri.floating_ips[fip_ip] = fixed
 
-        # Clear out all iptables rules for floating ips
-        ri.iptables_manager.ipv4['nat'].clear_rules_by_tag('floating_ip')
-
-        existing_cidrs = set([addr['cidr'] for addr in device.addr.list()])
-        new_cidrs = set()
-
-        # Loop once to ensure that floating ips are configured.
-        for fip in ri.router.get(l3_constants.FLOATINGIP_KEY, []):
-            fip_ip = fip['floating_ip_address']
-            ip_cidr = str(fip_ip) + FLOATING_IP_CIDR_SUFFIX
-
-            new_cidrs.add(ip_cidr)
-
-            if ip_cidr not in existing_cidrs:
-                net = netaddr.IPNetwork(ip_cidr)
-                device.addr.add(net.version, ip_cidr, str(net.broadcast))
-                self._send_gratuitous_arp_packet(ri, interface_name, fip_ip)
+        ri.iptables_manager.apply()
 
-            # Rebuild iptables rules for the floating ip.
-            fixed = fip['fixed_ip_address']
-            for chain, rule in self.floating_forward_rules(fip_ip, fixed):
-                ri.iptables_manager.ipv4['nat'].add_rule(chain, rule,
-                                                         tag='floating_ip')
+        new_cidrs = set(str(fip_ip) + FLOATING_IP_CIDR_SUFFIX
+                        for fip_ip in new_fips)
 
-        ri.iptables_manager.apply()
+        # Configure the new addresses, gratuitous ARPs are sent
+        # asynchronously once all of them have been added
+        added_cidrs = new_cidrs - ri.floating_ip_cidrs
+        for ip_cidr in added_cidrs:
+            net = netaddr.IPNetwork(ip_cidr)
+            device.addr.add(net.version, ip_cidr, str(net.broadcast))
+            ri.floating_ip_cidrs.add(ip_cidr)
+        for ip_cidr in added_cidrs:
+            self._send_gratuitous_arp_packet(ri, interface_name,
+                                             ip_cidr.split('/')[0])
 
         # Clean up addresses that no longer belong on the gateway interface.
-        for ip_cidr in existing_cidrs - new_cidrs:
-            if ip_cidr.endswith(FLOATING_IP_CIDR_SUFFIX):
-                net = netaddr.IPNetwork(ip_cidr)
-                device.addr.delete(net.version, ip_cidr)
+        for ip_cidr in ri.floating_ip_cidrs - new_cidrs:
+            net = netaddr.IPNetwork(ip_cidr)
+            device.addr.delete(net.version, ip_cidr)
+            ri.floating_ip_cidrs.discard(ip_cidr)
 
     def _get_ex_gw_port(self, ri):
         return ri.router.get('gw_port')
@@ -522,6 +561,8 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
 
     def _send_gratuitous_arp_packet(self, ri, interface_name, ip_address):
         if self.conf.send_arp_for_ha > 0:
+            # The address must be configured before arping runs
+            ip_lib.flush_deferred()
             eventlet.spawn_n(self._arping, ri, interface_name, ip_address)
 
     def get_internal_device_name(self, port_id):
@@ -872,6 +913,7 @@ def main(manager='neutron.agent.l3_agent.L3NATAgentWithStateReport'):
     config.register_root_helper(conf)
     conf.register_opts(interface.OPTS)
     conf.register_opts(external_process.OPTS)
+    conf.register_opts(ip_lib.OPTS)
     conf(project='neutron')
     config.setup_logging(conf)
     legacy.modernize_quantum_config(conf)
@@ -721,6 +721,7 @@ class DeviceManager(object):
 
         return dhcp_port
 
+    @ip_lib.defer_apply
     def setup(self, network, reuse_existing=False):
         """Create and initialize a device for network's DHCP on this host."""
         port = self.setup_dhcp_port(network)
@@ -71,6 +71,7 @@ class LinuxInterfaceDriver(object):
         self.conf = conf
         self.root_helper = config.get_root_helper(conf)
 
+    @ip_lib.defer_apply
     def init_l3(self, device_name, ip_cidrs, namespace=None,
                 preserve_ips=[]):
         """Set the L3 settings for the interface using data from the port.
@@ -156,6 +157,7 @@ class OVSInterfaceDriver(LinuxInterfaceDriver):
                 'external-ids:attached-mac=%s' % mac_address]
         utils.execute(cmd, self.root_helper)
 
+    @ip_lib.defer_apply
     def plug(self, network_id, port_id, device_name, mac_address,
              bridge=None, namespace=None, prefix=None):
         """Plug in the interface."""
@@ -225,6 +227,7 @@ class OVSInterfaceDriver(LinuxInterfaceDriver):
 
 class MidonetInterfaceDriver(LinuxInterfaceDriver):
 
+    @ip_lib.defer_apply
     def plug(self, network_id, port_id, device_name, mac_address,
              bridge=None, namespace=None, prefix=None):
         """This method is called by the Dhcp agent or by the L3 agent
@@ -284,6 +287,7 @@ class IVSInterfaceDriver(LinuxInterfaceDriver):
         cmd = ['ivs-ctl', 'add-port', device_name]
         utils.execute(cmd, self.root_helper)
 
+    @ip_lib.defer_apply
     def plug(self, network_id, port_id, device_name, mac_address,
              bridge=None, namespace=None, prefix=None):
         """Plug in the interface."""
@@ -335,6 +339,7 @@ class BridgeInterfaceDriver(LinuxInterfaceDriver):
 
     DEV_NAME_PREFIX = 'ns-'
 
+    @ip_lib.defer_apply
     def plug(self, network_id, port_id, device_name, mac_address,
              bridge=None, namespace=None, prefix=None):
         """Plugin the interface."""
@@ -14,20 +14,35 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import functools
+import itertools
+import re
+
+from eventlet import greenthread
 import netaddr
 from oslo.config import cfg
 
 from neutron.agent.linux import utils
 from neutron.common import exceptions
+from neutron.openstack.common import excutils
+from neutron.openstack.common import log as logging
 
 
 OPTS = [
     cfg.BoolOpt('ip_lib_force_root',
                 default=False,
                 help=_('Force ip_lib calls to use the root helper')),
+    cfg.BoolOpt('ip_lib_batch',
+                default=False,
+                help=_('Run the ip commands deferred by the agents with a '
+                       'single "ip -batch" call per namespace. The root '
+                       'helper must allow "ip -force -batch -", whose input '
+                       'it cannot filter')),
 ]
 
 
+LOG = logging.getLogger(__name__)
+
 LOOPBACK_DEVNAME = 'lo'
 # NOTE(ethuleau): depend of the version of iproute2, the vlan
 # interface details vary.
@@ -35,6 +50,168 @@ VLAN_INTERFACE_DETAIL = ['vlan protocol 802.1q',
                          'vlan protocol 802.1Q',
                          'vlan id']
 
+# Sub-commands which can be queued while deferred mode is on, only commands
+# changing existing devices are deferred so that the devices created through
+# ip or other tools always exist when the batch runs. Link deletions are run
+# right away since their callers handle their failures.
+DEFERRABLE_COMMANDS = {'link': ('set',),
+                       'addr': ('add', 'del', 'flush'),
+                       'route': ('add', 'append', 'replace', 'del')}
+
+# Error reported by "ip -force -batch -" for a failing line of its input
+BATCH_FAILURE_RE = re.compile(r'^Command failed -:(\d+)$')
+
+# Commands queued by each green thread in deferred mode
+_deferred = {}
+
+
+class _DeferredCommands(object):
+    def __init__(self):
+        self.depth = 0
+        self.commands = []
+        # queued commands which failed and were not raised yet
+        self.failed = []
+
+    def run(self):
+        commands = self.commands
+        self.commands = []
+        self.failed.extend(_run_batches(commands))
+
+    def raise_failures(self):
+        failed = self.failed
+        self.failed = []
+        if failed:
+            raise RuntimeError(_("Failed to run the deferred ip commands: "
+                                 "%s") % '; '.join(failed))
+
+
+def defer_apply_on():
+    """Queue the ip commands changing devices, addresses and routes.
+
+    Queued commands are run by the outermost defer_apply_off() call, or
+    before any other ip command is run by the same green thread.
+    Consecutive commands of a namespace are run by a single ip -batch call.
+    A failing queued command doesn't stop the following ones, the failures
+    are logged and raised as a single RuntimeError by defer_apply_off() or
+    flush_deferred().
+    Deferred mode is only enabled when the ip_lib_batch option is set.
+    """
+    try:
+        if not cfg.CONF.ip_lib_batch:
+            return
+    except cfg.NoSuchOptError:
+        return
+    deferred = _deferred.setdefault(greenthread.getcurrent(),
+                                    _DeferredCommands())
+    deferred.depth += 1
+
+
+def defer_apply_off():
+    current = greenthread.getcurrent()
+    deferred = _deferred.get(current)
+    if deferred is None:
+        return
+    deferred.depth -= 1
+    if not deferred.depth:
+        del _deferred[current]
+        deferred.run()
+        deferred.raise_failures()
+
+
+def flush_deferred():
+    """Run the commands queued so far and stay in deferred mode."""
+    deferred = _deferred.get(greenthread.getcurrent())
+    if deferred:
+        deferred.run()
+        deferred.raise_failures()
+
+
+def _run_deferred():
+    # The failures are raised by the caller of defer_apply_off() rather
+    # than by an unrelated ip command whose caller may ignore them
+    deferred = _deferred.get(greenthread.getcurrent())
+    if deferred and deferred.commands:
+        deferred.run()
+
+
+def defer_apply(f):
+    """Decorator running the function in deferred mode."""
+    @functools.wraps(f)
+    def inner(*args, **kwargs):
+        defer_apply_on()
+        try:
+            result = f(*args, **kwargs)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                try:
+                    defer_apply_off()
+                except RuntimeError:
+                    # The failed commands are logged, the error of the
+                    # function is the one raised
+                    pass
+        defer_apply_off()
+        return result
+    return inner
+
+
+def _queue_command(options, command, args, root_helper, namespace):
+    deferred = _deferred.get(greenthread.getcurrent())
+    if deferred is None:
+        return False
+    if not args or args[0] not in DEFERRABLE_COMMANDS.get(command, ()):
+        return False
+    # Global options can't be given per command in batch mode, only the
+    # address family of addr add/del can be dropped since it is implied by
+    # the address itself
+    if options and (command != 'addr' or args[0] not in ('add', 'del') or
+                    any(str(o) not in ('4', '6') for o in options)):
+        return False
+    args = [str(a) for a in args]
+    if any(len(a.split()) != 1 for a in args):
+        return False
+    deferred.commands.append((root_helper, namespace,
+                              ' '.join([command] + args)))
+    return True
+
+
+def _run_batches(commands):
+    """Run queued commands, return the failed ones."""
+    failures = []
+    for (root_helper, namespace), batch in itertools.groupby(
+            commands, lambda c: c[:2]):
+        if namespace:
+            ip_cmd = ['ip', 'netns', 'exec', namespace, 'ip']
+        else:
+            ip_cmd = ['ip']
+        lines = [c[2] for c in batch]
+        try:
+            stderr = utils.execute(ip_cmd + ['-force', '-batch', '-'],
+                                   root_helper=root_helper,
+                                   process_input='\n'.join(lines) + '\n',
+                                   check_exit_code=False,
+                                   return_stderr=True)[1]
+        except Exception:
+            LOG.exception(_("Failed to run the ip commands %(lines)s in "
+                            "namespace %(namespace)s"),
+                          {'lines': lines, 'namespace': namespace})
+            failures.extend(lines)
+            continue
+        # ip reports each failing line after its error message
+        message = []
+        for line in stderr.splitlines():
+            failed = BATCH_FAILURE_RE.match(line)
+            if not failed:
+                message.append(line)
+                continue
+            line = lines[int(failed.group(1)) - 1]
+            LOG.error(_("Failed to run the ip command '%(cmd)s' in "
+                        "namespace %(namespace)s: %(error)s"),
+                      {'cmd': line, 'namespace': namespace,
+                       'error': ' '.join(message)})
+            failures.append(line)
+            message = []
+    return failures
+
 
 class SubProcessBase(object):
     def __init__(self, root_helper=None, namespace=None):
@@ -63,6 +240,9 @@ class SubProcessBase(object):
 
         namespace = self.namespace if not use_root_namespace else None
 
+        if _queue_command(options, command, args, self.root_helper,
+                          namespace):
+            return ''
         return self._execute(options,
                              command,
                              args,
@@ -72,6 +252,7 @@ class SubProcessBase(object):
     @classmethod
     def _execute(cls, options, command, args, root_helper=None,
                  namespace=None):
+        _run_deferred()
         opt_list = ['-%s' % o for o in options]
         if namespace:
             ip_cmd = ['ip', 'netns', 'exec', namespace, 'ip']
@@ -456,6 +637,7 @@ class IpNetnsCommand(IpCommandBase):
         elif not self._parent.namespace:
             raise Exception(_('No namespace defined for parent'))
         else:
+            _run_deferred()
             env_params = []
             if addl_env:
                 env_params = (['env'] +
@@ -0,0 +1,279 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Long lived root helper for the agents
+
+   neutron-rootwrap starts a new interpreter and loads all the filter files
+   for every single command. neutron-rootwrap-daemon is started once by an
+   agent, through sudo, with the same configuration file:
+
+   neutron ALL = (root) NOPASSWD: /usr/bin/neutron-rootwrap-daemon
+                                   /etc/neutron/rootwrap.conf
+
+   It loads the filters once, then runs the commands received on a unix
+   socket, only accessible by the user who started it, after matching them
+   against the filters like neutron-rootwrap does. Clients must prove that
+   they know the key written by the daemon on its standard output, it exits
+   when its standard input is closed, i.e. when the agent exits.
+
+   Messages are single lines of JSON. Command output is decoded as latin-1
+   so that any byte goes through unchanged.
+"""
+
+from __future__ import print_function
+
+import ConfigParser
+import hashlib
+import hmac
+import json
+import logging
+import os
+import shutil
+import signal
+import SocketServer
+import subprocess
+import sys
+import tempfile
+import threading
+
+from neutron.openstack.common.rootwrap import cmd as rootwrap_cmd
+from neutron.openstack.common.rootwrap import wrapper
+
+
+SOCKET_NAME = 'rootwrap.sock'
+AUTHKEY_SIZE = 32
+CHALLENGE_SIZE = 16
+# Longest line read before the client is authenticated
+MAX_AUTH_LINE = 1024
+
+
+def auth_digest(authkey, challenge):
+    return hmac.new(authkey, challenge, hashlib.sha256).hexdigest()
+
+
+def send_message(wfile, message):
+    wfile.write(json.dumps(message) + '\n')
+    wfile.flush()
+
+
+def recv_message(rfile, limit=-1):
+    line = rfile.readline(limit)
+    if not line.endswith('\n'):
+        raise EOFError()
+    return json.loads(line)
+
+
+def _constant_time_compare(first, second):
+    if len(first) != len(second):
+        return False
+    result = 0
+    for x, y in zip(first, second):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+
+def _parse_request(request):
+    """Returns the (userargs, process_input) of a command request.
+
+    Raises ValueError if the request is malformed.
+    """
+    if not isinstance(request, dict):
+        raise ValueError("Request is not an object")
+    cmd = request.get('cmd')
+    if (not isinstance(cmd, list) or not cmd or
+            not all(isinstance(arg, basestring) for arg in cmd)):
+        raise ValueError("Invalid command: %r" % (cmd,))
+    process_input = request.get('process_input')
+    if process_input is not None:
+        if not isinstance(process_input, basestring):
+            raise ValueError("Invalid process input")
+        process_input = process_input.encode('latin-1')
+    return [arg.encode('utf-8') for arg in cmd], process_input
+
+
+def _subprocess_setup():
+    # Python installs a SIGPIPE handler by default. This is usually not what
+    # non-Python subprocesses expect.
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+
+class RootwrapDaemon(object):
+    """Runs the commands matching the loaded filters."""
+
+    def __init__(self, config, filters):
+        self.config = config
+        self.filters = filters
+
+    def run_command(self, userargs, process_input=None):
+        """Run a command as neutron-rootwrap would.
+
+        Returns a tuple (returncode, stdout, stderr), the return codes of
+        neutron-rootwrap are used when the command is not allowed.
+        """
+        try:
+            filtermatch = wrapper.match_filter(
+                self.filters, userargs, exec_dirs=self.config.exec_dirs)
+        except wrapper.FilterMatchNotExecutable as exc:
+            msg = ("Executable not found: %s (filter match = %s)"
+                   % (exc.match.exec_path, exc.match.name))
+            if self.config.use_syslog:
+                logging.error(msg)
+            return rootwrap_cmd.RC_NOEXECFOUND, '', msg
+        except wrapper.NoFilterMatched:
+            msg = ("Unauthorized command: %s (no filter matched)"
+                   % ' '.join(userargs))
+            if self.config.use_syslog:
+                logging.error(msg)
+            return rootwrap_cmd.RC_UNAUTHORIZED, '', msg
+
+        command = filtermatch.get_command(userargs,
+                                          exec_dirs=self.config.exec_dirs)
+        if self.config.use_syslog:
+            logging.info("Executing %s (filter match = %s)" % (
+                command, filtermatch.name))
+
+        obj = subprocess.Popen(command,
+                               stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               preexec_fn=_subprocess_setup,
+                               close_fds=True,
+                               env=filtermatch.get_environment(userargs))
+        stdout, stderr = obj.communicate(process_input)
+        return obj.returncode, stdout, stderr
+
+
+class RootwrapRequestHandler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        challenge = os.urandom(CHALLENGE_SIZE).encode('hex')
+        try:
+            send_message(self.wfile, {'challenge': challenge})
+            reply = recv_message(self.rfile, MAX_AUTH_LINE)
+            digest = str(reply['digest'])
+        except (EOFError, ValueError, KeyError, TypeError):
+            return
+        if not _constant_time_compare(
+                digest, auth_digest(self.server.authkey, challenge)):
+            if self.server.daemon.config.use_syslog:
+                logging.error("Rejected a connection with a wrong key")
+            return
+
+        while True:
+            try:
+                userargs, process_input = _parse_request(
+                    recv_message(self.rfile))
+            except EOFError:
+                return
+            except (ValueError, UnicodeError) as exc:
+                msg = "Malformed request: %s" % exc
+                if self.server.daemon.config.use_syslog:
+                    logging.error(msg)
+                send_message(self.wfile, {'returncode':
+                                          rootwrap_cmd.RC_NOCOMMAND,
+                                          'stdout': '', 'stderr': msg})
+                continue
+            returncode, stdout, stderr = self.server.daemon.run_command(
+                userargs, process_input)
+            send_message(self.wfile, {'returncode': returncode,
+                                      'stdout': stdout.decode('latin-1'),
+                                      'stderr': stderr.decode('latin-1')})
+
+
+class RootwrapServer(SocketServer.ThreadingMixIn,
+                     SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, daemon, authkey, uid=None, gid=None):
+        self.uid = uid
+        self.gid = gid
+        SocketServer.UnixStreamServer.__init__(self, socket_path,
+                                               RootwrapRequestHandler)
+        self.daemon = daemon
+        self.authkey = authkey
+
+    def server_bind(self):
+        # The socket is created private, then given to the user who started
+        # the daemon through sudo so that it can connect to it
+        old_umask = os.umask(0o077)
+        try:
+            SocketServer.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(old_umask)
+        os.chmod(self.server_address, 0o600)
+        if self.uid is not None:
+            os.chown(self.server_address, self.uid, self.gid)
+
+
+def _exit_error(execname, message, errorcode):
+    print("%s: %s" % (execname, message), file=sys.stderr)
+    sys.exit(errorcode)
+
+
+def main():
+    execname = sys.argv.pop(0)
+    if len(sys.argv) != 1:
+        _exit_error(execname, "Usage: %s <configuration file>" % execname,
+                    rootwrap_cmd.RC_NOCOMMAND)
+    configfile = sys.argv[0]
+
+    try:
+        rawconfig = ConfigParser.RawConfigParser()
+        rawconfig.read(configfile)
+        config = wrapper.RootwrapConfig(rawconfig)
+    except ValueError as exc:
+        msg = "Incorrect value in %s: %s" % (configfile, exc.message)
+        _exit_error(execname, msg, rootwrap_cmd.RC_BADCONFIG)
+    except ConfigParser.Error:
+        _exit_error(execname, "Incorrect configuration file: %s" % configfile,
+                    rootwrap_cmd.RC_BADCONFIG)
+
+    if config.use_syslog:
+        wrapper.setup_syslog(execname,
+                             config.syslog_log_facility,
+                             config.syslog_log_level)
+
+    daemon = RootwrapDaemon(config, wrapper.load_filters(config.filters_path))
+
+    # The socket directory is only accessible by the user running the agent
+    uid = int(os.environ.get('SUDO_UID', os.getuid()))
+    gid = int(os.environ.get('SUDO_GID', os.getgid()))
+    socket_dir = tempfile.mkdtemp(prefix='neutron-rootwrap-')
+    try:
+        os.chown(socket_dir, uid, gid)
+        socket_path = os.path.join(socket_dir, SOCKET_NAME)
+        authkey = os.urandom(AUTHKEY_SIZE)
+        server = RootwrapServer(socket_path, daemon, authkey, uid, gid)
+
+        server_thread = threading.Thread(target=server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+
+        print(json.dumps({'socket_path': socket_path,
+                          'authkey': authkey.encode('hex')}))
+        sys.stdout.flush()
+
+        # The agent keeps our standard input open until it exits
+        while sys.stdin.read(4096):
+            pass
+        server.shutdown()
+    finally:
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -18,15 +18,20 @@
 # @author: Juliano Martinez, Locaweb.
 
 import fcntl
+import json
 import os
 import shlex
 import socket
 import struct
 import tempfile
 
+from eventlet.green import socket as green_socket
 from eventlet.green import subprocess
 from eventlet import greenthread
+from eventlet import semaphore
+from oslo.config import cfg
 
+from neutron.agent.linux import rootwrap_daemon
 from neutron.common import utils
 from neutron.openstack.common import log as logging
 
@@ -58,20 +63,142 @@ def create_process(cmd, root_helper=None, addl_env=None):
     return obj, cmd
 
 
+class RootwrapDaemonClient(object):
+    """Runs commands through a neutron-rootwrap-daemon.
+
+    The daemon is started on first use and restarted if it exits, idle
+    connections are kept open so that each command only costs a round trip
+    on the socket.
+    """
+
+    def __init__(self, daemon_cmd):
+        self.daemon_cmd = daemon_cmd
+        self._process = None
+        self._socket_path = None
+        self._authkey = None
+        self._connections = []
+        self._start_lock = semaphore.Semaphore()
+
+    def _ensure_daemon(self):
+        with self._start_lock:
+            if self._process and self._process.poll() is None:
+                return
+            self._close_connections()
+            cmd = shlex.split(self.daemon_cmd)
+            LOG.debug(_("Starting root helper daemon: %s"), cmd)
+            self._process = utils.subprocess_popen(cmd,
+                                                   stdin=subprocess.PIPE,
+                                                   stdout=subprocess.PIPE)
+            line = self._process.stdout.readline()
+            try:
+                info = json.loads(line)
+                self._socket_path = str(info['socket_path'])
+                self._authkey = str(info['authkey']).decode('hex')
+            except (ValueError, KeyError, TypeError):
+                self._process.stdin.close()
+                raise RuntimeError(_("Root helper daemon %(cmd)s failed to "
+                                     "start: %(output)r") %
+                                   {'cmd': cmd, 'output': line})
+
+    def _close_connections(self):
+        while self._connections:
+            self._connections.pop().close()
+
+    def _connect(self):
+        sock = green_socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self._socket_path)
+        connection = _RootwrapConnection(sock)
+        try:
+            challenge = str(connection.receive()['challenge'])
+            connection.send(
+                {'digest': rootwrap_daemon.auth_digest(self._authkey,
+                                                       challenge)})
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
+    def execute(self, cmd, process_input=None):
+        """Returns a tuple (returncode, stdout, stderr)."""
+        self._ensure_daemon()
+        if self._connections:
+            connection = self._connections.pop()
+        else:
+            connection = self._connect()
+        if process_input is not None:
+            process_input = process_input.decode('latin-1')
+        try:
+            connection.send({'cmd': cmd, 'process_input': process_input})
+            reply = connection.receive()
+        except (EOFError, ValueError, socket.error) as e:
+            connection.close()
+            raise RuntimeError(_("Lost root helper daemon connection while "
+                                 "running %(cmd)s: %(error)s") %
+                               {'cmd': cmd, 'error': e})
+        self._connections.append(connection)
+        return (reply['returncode'], reply['stdout'].encode('latin-1'),
+                reply['stderr'].encode('latin-1'))
+
+
+class _RootwrapConnection(object):
+    def __init__(self, sock):
+        self.sock = sock
+        self.rfile = sock.makefile('rb')
+        self.wfile = sock.makefile('wb')
+
+    def send(self, message):
+        rootwrap_daemon.send_message(self.wfile, message)
+
+    def receive(self):
+        return rootwrap_daemon.recv_message(self.rfile)
+
+    def close(self):
+        self.rfile.close()
+        self.wfile.close()
+        self.sock.close()
+
+
+# Root helper daemon clients, keyed by daemon command
+_rootwrap_clients = {}
+
+
+def _get_rootwrap_client():
+    try:
+        daemon_cmd = cfg.CONF.AGENT.root_helper_daemon
+    except (cfg.NoSuchOptError, cfg.NoSuchGroupError):
+        return
+    if not daemon_cmd:
+        return
+    if daemon_cmd not in _rootwrap_clients:
+        _rootwrap_clients[daemon_cmd] = RootwrapDaemonClient(daemon_cmd)
+    return _rootwrap_clients[daemon_cmd]
+
+
 def execute(cmd, root_helper=None, process_input=None, addl_env=None,
             check_exit_code=True, return_stderr=False):
     try:
-        obj, cmd = create_process(cmd, root_helper=root_helper,
-                                  addl_env=addl_env)
-        _stdout, _stderr = (process_input and
-                            obj.communicate(process_input) or
-                            obj.communicate())
-        obj.stdin.close()
+        # The daemon doesn't take the environment of the caller, as
+        # rootwrap run through sudo wouldn't
+        rootwrap_client = root_helper and not addl_env and (
+            _get_rootwrap_client())
+        if rootwrap_client:
+            cmd = map(str, cmd)
+            LOG.debug(_("Running command with root helper daemon: %s"), cmd)
+            returncode, _stdout, _stderr = rootwrap_client.execute(
+                cmd, process_input)
+        else:
+            obj, cmd = create_process(cmd, root_helper=root_helper,
+                                      addl_env=addl_env)
+            _stdout, _stderr = (process_input and
+                                obj.communicate(process_input) or
+                                obj.communicate())
+            obj.stdin.close()
+            returncode = obj.returncode
         m = _("\nCommand: %(cmd)s\nExit code: %(code)s\nStdout: %(stdout)r\n"
-              "Stderr: %(stderr)r") % {'cmd': cmd, 'code': obj.returncode,
+              "Stderr: %(stderr)r") % {'cmd': cmd, 'code': returncode,
                                        'stdout': _stdout, 'stderr': _stderr}
         LOG.debug(m)
-        if obj.returncode and check_exit_code:
+        if returncode and check_exit_code:
             raise RuntimeError(m)
     finally:
         # NOTE(termie): this appears to be necessary to let the subprocess
@@ -16,13 +16,16 @@
 #
 # @author: Mark McClain, DreamHost
 
+import collections
 import hashlib
 import hmac
 import os
 import socket
+import time
 import urlparse
 
 import eventlet
+from eventlet import pools
 import httplib2
 from neutronclient.v2_0 import client
 from oslo.config import cfg
@@ -37,6 +40,7 @@ from neutron.common import utils
 from neutron import context
 from neutron.openstack.common import log as logging
 from neutron.openstack.common import loopingcall
+from neutron.openstack.common import service
 from neutron import wsgi
 
 LOG = logging.getLogger(__name__)
@@ -44,6 +48,62 @@ LOG = logging.getLogger(__name__)
 DEVICE_OWNER_ROUTER_INTF = "network:router_interface"
 
 
+class LookupCache(object):
+    """Bounded LRU cache whose entries expire after a fixed TTL.
+
+    A TTL or size of 0 disables the cache: every lookup is a miss and
+    nothing is stored.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[0] > time.time():
+            # re-insert to mark the entry as most recently used
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+
+    def set(self, key, value):
+        if not self.size or not self.ttl:
+            return
+        self._entries.pop(key, None)
+        while len(self._entries) >= self.size:
+            self._entries.popitem(last=False)
+        self._entries[key] = (time.time() + self.ttl, value)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses}
+
+
+class NovaConnectionPool(pools.Pool):
+    """Pool of keep-alive HTTP connections to the Nova metadata server.
+
+    httplib2.Http objects keep their connection open between requests but
+    must not be shared by concurrent green threads, so each request takes
+    one out of the pool and puts it back once the response has been read.
+    """
+    def __init__(self, conf, *args, **kwargs):
+        kwargs.setdefault('max_size', conf.nova_metadata_pool_size)
+        kwargs.setdefault('order_as_stack', True)
+        super(NovaConnectionPool, self).__init__(*args, **kwargs)
+
+    def create(self):
+        return httplib2.Http()
+
+
 class MetadataProxyHandler(object):
     OPTS = [
         cfg.StrOpt('admin_user',
@@ -68,15 +128,35 @@ class MetadataProxyHandler(object):
         cfg.IntOpt('nova_metadata_port',
                    default=8775,
                    help=_("TCP Port used by Nova metadata server.")),
+        cfg.IntOpt('nova_metadata_pool_size',
+                   default=64,
+                   help=_("Maximum number of persistent connections to the "
+                          "Nova metadata server kept by each worker.")),
         cfg.StrOpt('metadata_proxy_shared_secret',
                    default='',
                    help=_('Shared secret to sign instance-id request'),
-                   secret=True)
+                   secret=True),
+        cfg.IntOpt('metadata_cache_ttl',
+                   default=5,
+                   help=_('Number of seconds instance and router network '
+                          'lookups are cached for. 0 disables caching.')),
+        cfg.IntOpt('metadata_cache_size',
+                   default=1024,
+                   help=_('Maximum number of entries in each lookup cache'))
     ]
 
     def __init__(self, conf):
         self.conf = conf
         self.auth_info = {}
+        self.instance_cache = LookupCache(conf.metadata_cache_size,
+                                          conf.metadata_cache_ttl)
+        self.router_cache = LookupCache(conf.metadata_cache_size,
+                                        conf.metadata_cache_ttl)
+        self.nova_pool = NovaConnectionPool(conf)
+
+    def cache_stats(self):
+        return {'instance_cache': self.instance_cache.stats(),
+                'router_cache': self.router_cache.stats()}
 
     def _get_neutron_client(self):
         qclient = client.Client(
@@ -109,21 +189,33 @@ class MetadataProxyHandler(object):
                     'Please try your request again.')
             return webob.exc.HTTPInternalServerError(explanation=unicode(msg))
 
-    def _get_instance_and_tenant_id(self, req):
-        qclient = self._get_neutron_client()
+    def _get_router_networks(self, qclient, router_id):
+        networks = self.router_cache.get(router_id)
+        if networks is None:
+            internal_ports = qclient.list_ports(
+                device_id=router_id,
+                device_owner=DEVICE_OWNER_ROUTER_INTF)['ports']
+
+            networks = [p['network_id'] for p in internal_ports]
+            self.router_cache.set(router_id, networks)
+        return networks
 
+    def _get_instance_and_tenant_id(self, req):
         remote_address = req.headers.get('X-Forwarded-For')
         network_id = req.headers.get('X-Neutron-Network-ID')
         router_id = req.headers.get('X-Neutron-Router-ID')
 
+        key = (network_id or router_id, remote_address)
+        ids = self.instance_cache.get(key)
+        if ids is not None:
+            return ids
+
+        qclient = self._get_neutron_client()
+
         if network_id:
             networks = [network_id]
         else:
-            internal_ports = qclient.list_ports(
-                device_id=router_id,
-                device_owner=DEVICE_OWNER_ROUTER_INTF)['ports']
-
-            networks = [p['network_id'] for p in internal_ports]
+            networks = self._get_router_networks(qclient, router_id)
 
         ports = qclient.list_ports(
             network_id=networks,
@@ -131,7 +223,11 @@ class MetadataProxyHandler(object):
 
         self.auth_info = qclient.get_auth_info()
         if len(ports) == 1:
-            return ports[0]['device_id'], ports[0]['tenant_id']
+            ids = ports[0]['device_id'], ports[0]['tenant_id']
+            # misses are not cached so that a port created right after
+            # a failed lookup is found on the next request
+            self.instance_cache.set(key, ids)
+            return ids
         return None, None
 
     def _proxy_request(self, instance_id, tenant_id, req):
@@ -150,9 +246,9 @@ class MetadataProxyHandler(object):
             req.query_string,
             ''))
 
-        h = httplib2.Http()
-        resp, content = h.request(url, method=req.method, headers=headers,
-                                  body=req.body)
+        with self.nova_pool.item() as h:
+            resp, content = h.request(url, method=req.method,
+                                      headers=headers, body=req.body)
 
         if resp.status == 200:
             LOG.debug(str(resp))
@@ -192,12 +288,27 @@ class UnixDomainHttpProtocol(eventlet.wsgi.HttpProtocol):
                                             server)
 
 
+class UnixDomainWorkerService(wsgi.WorkerService):
+    """Serves the metadata proxy socket from a forked worker process."""
+    def start(self):
+        # Unlike API workers, there are no database connections to dispose
+        self._server = self._service.pool.spawn(self._service._run,
+                                                self._application,
+                                                self._service._socket)
+
+
 class UnixDomainWSGIServer(wsgi.Server):
-    def start(self, application, file_socket, backlog=128):
-        sock = eventlet.listen(file_socket,
-                               family=socket.AF_UNIX,
-                               backlog=backlog)
-        self.pool.spawn_n(self._run, application, sock)
+    def start(self, application, file_socket, workers=0, backlog=128):
+        self._socket = eventlet.listen(file_socket,
+                                       family=socket.AF_UNIX,
+                                       backlog=backlog)
+        if workers < 1:
+            self.pool.spawn_n(self._run, application, self._socket)
+        else:
+            # All workers accept connections on the same listening socket
+            self._launcher = service.ProcessLauncher()
+            self._server = UnixDomainWorkerService(self, application)
+            self._launcher.launch_service(self._server, workers=workers)
 
     def _run(self, application, socket):
         """Start a WSGI service in a new green thread."""
@@ -213,7 +324,16 @@ class UnixDomainMetadataProxy(object):
     OPTS = [
         cfg.StrOpt('metadata_proxy_socket',
                    default='$state_path/metadata_proxy',
-                   help=_('Location for Metadata Proxy UNIX domain socket'))
+                   help=_('Location for Metadata Proxy UNIX domain socket')),
+        cfg.IntOpt('metadata_workers',
+                   default=0,
+                   help=_('Number of separate worker processes for the '
+                          'metadata server. 0 serves requests from the '
+                          'main process.')),
+        cfg.IntOpt('metadata_backlog',
+                   default=128,
+                   help=_('Number of backlog requests to configure the '
+                          'metadata server socket with'))
     ]
 
     def __init__(self, conf):
@@ -229,6 +349,7 @@ class UnixDomainMetadataProxy(object):
         else:
             os.makedirs(dirname, 0o755)
 
+        self.handler = MetadataProxyHandler(self.conf)
         self._init_state_reporting()
 
     def _init_state_reporting(self):
@@ -242,6 +363,7 @@ class UnixDomainMetadataProxy(object):
                 'metadata_proxy_socket': cfg.CONF.metadata_proxy_socket,
                 'nova_metadata_ip': cfg.CONF.nova_metadata_ip,
                 'nova_metadata_port': cfg.CONF.nova_metadata_port,
+                'metadata_workers': cfg.CONF.metadata_workers,
             },
             'start_flag': True,
             'agent_type': n_const.AGENT_TYPE_METADATA}
@@ -252,6 +374,11 @@ class UnixDomainMetadataProxy(object):
             self.heartbeat.start(interval=report_interval)
 
     def _report_state(self):
+        if not cfg.CONF.metadata_workers:
+            # Worker processes have their own caches, which can not be
+            # seen from here
+            self.agent_state['configurations'].update(
+                self.handler.cache_stats())
         try:
             self.state_rpc.report_state(
                 self.context,
@@ -270,8 +397,9 @@ class UnixDomainMetadataProxy(object):
 
     def run(self):
         server = UnixDomainWSGIServer('neutron-metadata-agent')
-        server.start(MetadataProxyHandler(self.conf),
-                     self.conf.metadata_proxy_socket)
+        server.start(self.handler, self.conf.metadata_proxy_socket,
+                     workers=self.conf.metadata_workers,
+                     backlog=self.conf.metadata_backlog)
         server.wait()
 
 
@@ -46,10 +46,13 @@ on port-attach) on an additional PUT to do a bulk dump of all persistent data.
 
 import base64
 import copy
+import hashlib
 import httplib
 import json
 import socket
+import time
 
+from eventlet import semaphore
 from oslo.config import cfg
 
 from neutron.api import extensions as neutron_extensions
@@ -68,6 +71,7 @@ from neutron.db import dhcp_rpc_base
 from neutron.db import external_net_db
 from neutron.db import extradhcpopt_db
 from neutron.db import l3_db
+from neutron.db import models_v2
 from neutron.extensions import external_net
 from neutron.extensions import extra_dhcp_opt as edo_ext
 from neutron.extensions import l3
@@ -102,6 +106,10 @@ restproxy_opts = [
     cfg.IntOpt('server_timeout', default=10,
                help=_("Maximum number of seconds to wait for proxy request "
                       "to connect and complete.")),
+    cfg.IntOpt('server_max_connections', default=4,
+               help=_("Maximum number of concurrent requests, and of "
+                      "persistent connections kept open, to each "
+                      "BigSwitch or Floodlight controller.")),
     cfg.StrOpt('neutron_id', default='neutron-' + utils.get_hostname(),
                deprecated_name='quantum_id',
                help=_("User defined identifier for this Neutron deployment")),
@@ -156,6 +164,12 @@ PORTS_PATH = "/tenants/%s/networks/%s/ports/%s"
 ATTACHMENT_PATH = "/tenants/%s/networks/%s/ports/%s/attachment"
 ROUTERS_PATH = "/tenants/%s/routers/%s"
 ROUTER_INTF_PATH = "/tenants/%s/routers/%s/interfaces/%s"
+FLOATINGIP_RESOURCE_PATH = "/tenants/%s/floatingips"
+FLOATINGIPS_PATH = "/tenants/%s/floatingips/%s"
+TOPOLOGY_PATH = "/topology"
+TENANT_TOPOLOGY_RESOURCE_PATH = "/topology/tenants"
+TENANT_TOPOLOGY_PATH = "/topology/tenants/%s"
+CAPABILITIES_PATH = "/capabilities"
 SUCCESS_CODES = range(200, 207)
 FAILURE_CODES = [0, 301, 302, 303, 400, 401, 403, 404, 500, 501, 502, 503,
                  504, 505]
@@ -174,7 +188,7 @@ class ServerProxy(object):
     """REST server proxy to a network controller."""
 
     def __init__(self, server, port, ssl, auth, neutron_id, timeout,
-                 base_uri, name):
+                 base_uri, name, max_connections=1):
         self.server = server
         self.port = port
         self.ssl = ssl
@@ -187,6 +201,54 @@ class ServerProxy(object):
         self.failed = False
         if auth:
             self.auth = 'Basic ' + base64.encodestring(auth).strip()
+        # Idle connections kept open for the following requests, and
+        # the limit of concurrent requests to the server
+        self.connections = []
+        self.capacity = semaphore.Semaphore(max_connections)
+        # Request counters
+        self.requests = 0
+        self.errors = 0
+        self.latency = 0.0
+
+    def _new_connection(self):
+        if self.ssl:
+            return httplib.HTTPSConnection(
+                self.server, self.port, timeout=self.timeout)
+        return httplib.HTTPConnection(
+            self.server, self.port, timeout=self.timeout)
+
+    def _send_request(self, action, uri, body, headers):
+        try:
+            conn = self.connections.pop()
+            reused = True
+        except IndexError:
+            conn = self._new_connection()
+            reused = False
+        try:
+            conn.request(action, uri, body, headers)
+            response = conn.getresponse()
+            respstr = response.read()
+        except (socket.timeout, socket.error, httplib.HTTPException) as e:
+            conn.close()
+            if reused and not isinstance(e, socket.timeout):
+                # The server might have closed the idle connection, try
+                # again with the next one
+                return self._send_request(action, uri, body, headers)
+            LOG.error(_('ServerProxy: %(action)s failure, %(e)r'),
+                      {'action': action, 'e': e})
+            return 0, None, None, None
+        if response.will_close:
+            conn.close()
+        else:
+            self.connections.append(conn)
+        respdata = respstr
+        if response.status in self.success_codes:
+            try:
+                respdata = json.loads(respstr)
+            except ValueError:
+                # response was not JSON, ignore the exception
+                pass
+        return response.status, response.reason, respstr, respdata
 
     def rest_call(self, action, resource, data, headers):
         uri = self.base_uri + resource
@@ -202,71 +264,58 @@ class ServerProxy(object):
             headers['Authorization'] = self.auth
 
         LOG.debug(_("ServerProxy: server=%(server)s, port=%(port)d, "
-                    "ssl=%(ssl)r, action=%(action)s"),
+                    "ssl=%(ssl)r, action=%(action)s, resource=%(resource)s, "
+                    "body length=%(length)d"),
                   {'server': self.server, 'port': self.port, 'ssl': self.ssl,
-                   'action': action})
-        LOG.debug(_("ServerProxy: resource=%(resource)s, data=%(data)r, "
-                    "headers=%(headers)r"),
-                  {'resource': resource, 'data': data, 'headers': headers})
-
-        conn = None
-        if self.ssl:
-            conn = httplib.HTTPSConnection(
-                self.server, self.port, timeout=self.timeout)
-            if conn is None:
-                LOG.error(_('ServerProxy: Could not establish HTTPS '
-                            'connection'))
-                return 0, None, None, None
-        else:
-            conn = httplib.HTTPConnection(
-                self.server, self.port, timeout=self.timeout)
-            if conn is None:
-                LOG.error(_('ServerProxy: Could not establish HTTP '
-                            'connection'))
-                return 0, None, None, None
-
-        try:
-            conn.request(action, uri, body, headers)
-            response = conn.getresponse()
-            respstr = response.read()
-            respdata = respstr
-            if response.status in self.success_codes:
-                try:
-                    respdata = json.loads(respstr)
-                except ValueError:
-                    # response was not JSON, ignore the exception
-                    pass
-            ret = (response.status, response.reason, respstr, respdata)
-        except (socket.timeout, socket.error) as e:
-            LOG.error(_('ServerProxy: %(action)s failure, %(e)r'),
-                      {'action': action, 'e': e})
-            ret = 0, None, None, None
-        conn.close()
-        LOG.debug(_("ServerProxy: status=%(status)d, reason=%(reason)r, "
-                    "ret=%(ret)s, data=%(data)r"), {'status': ret[0],
-                                                    'reason': ret[1],
-                                                    'ret': ret[2],
-                                                    'data': ret[3]})
+                   'action': action, 'resource': resource,
+                   'length': len(body)})
+
+        with self.capacity:
+            start = time.time()
+            ret = self._send_request(action, uri, body, headers)
+            self.latency += time.time() - start
+        self.requests += 1
+        if ret[0] not in self.success_codes:
+            self.errors += 1
+        LOG.debug(_("ServerProxy: status=%(status)d, reason=%(reason)r"),
+                  {'status': ret[0], 'reason': ret[1]})
         return ret
 
+    def get_stats(self):
+        """Return the request counters of the server."""
+        return {'server': '%s:%d' % (self.server, self.port),
+                'failed': self.failed,
+                'requests': self.requests,
+                'errors': self.errors,
+                'average_latency': self.latency / (self.requests or 1),
+                'idle_connections': len(self.connections)}
+
 
 class ServerPool(object):
 
     def __init__(self, servers, ssl, auth, neutron_id, timeout=10,
-                 base_uri='/quantum/v1.0', name='NeutronRestProxy'):
+                 base_uri='/quantum/v1.0', name='NeutronRestProxy',
+                 max_connections=1):
         self.base_uri = base_uri
         self.timeout = timeout
         self.name = name
         self.auth = auth
         self.ssl = ssl
         self.neutron_id = neutron_id
+        self.max_connections = max_connections
         self.servers = []
         for server_port in servers:
             self.servers.append(self.server_proxy_for(*server_port))
+        # The last server which answered, tried first by the next call
+        self.active_server = None
+        # Optional features supported by the controller, retrieved on
+        # first use
+        self.capabilities = None
 
     def server_proxy_for(self, server, port):
         return ServerProxy(server, port, self.ssl, self.auth, self.neutron_id,
-                           self.timeout, self.base_uri, self.name)
+                           self.timeout, self.base_uri, self.name,
+                           self.max_connections)
 
     def server_failure(self, resp, ignore_codes=[]):
         """Define failure codes as required.
@@ -283,13 +332,41 @@ class ServerPool(object):
         """
         return resp[0] in SUCCESS_CODES
 
-    @utils.synchronized('bsn-rest-call', external=True)
+    def get_stats(self):
+        """Return the request counters of all servers."""
+        return [server.get_stats() for server in self.servers]
+
+    def get_capabilities(self):
+        """Return the list of optional features of the controller.
+
+        Controllers which do not know about capabilities answer 404 and
+        support none of them.
+        """
+        if self.capabilities is None:
+            resp = self.rest_call('GET', CAPABILITIES_PATH, '', None, [404])
+            if self.action_success(resp):
+                capabilities = resp[3]
+                self.capabilities = (capabilities
+                                     if isinstance(capabilities, list)
+                                     else [])
+            elif resp[0] == 404:
+                self.capabilities = []
+            else:
+                # Try again at the next call
+                return []
+            LOG.info(_("NeutronRestProxyV2: controller capabilities: %s"),
+                     self.capabilities)
+        return self.capabilities
+
     def rest_call(self, action, resource, data, headers, ignore_codes):
-        good_first = sorted(self.servers, key=lambda x: x.failed)
+        good_first = sorted(self.servers,
+                            key=lambda x: (x.failed,
+                                           x is not self.active_server))
         for active_server in good_first:
             ret = active_server.rest_call(action, resource, data, headers)
             if not self.server_failure(ret, ignore_codes):
                 active_server.failed = False
+                self.active_server = active_server
                 return ret
             else:
                 LOG.error(_('ServerProxy: %(action)s failure for servers: '
@@ -396,6 +473,39 @@ class ServerPool(object):
         errstr = _("Unable to delete remote port: %s")
         self.rest_action('DELETE', resource, errstr=errstr)
 
+    def rest_create_floatingip(self, tenant_id, floatingip):
+        resource = FLOATINGIP_RESOURCE_PATH % tenant_id
+        data = {"floatingip": floatingip}
+        errstr = _("Unable to create remote floating IP: %s")
+        self.rest_action('POST', resource, data, errstr)
+
+    def rest_update_floatingip(self, tenant_id, floatingip, floatingip_id):
+        resource = FLOATINGIPS_PATH % (tenant_id, floatingip_id)
+        data = {"floatingip": floatingip}
+        errstr = _("Unable to update remote floating IP: %s")
+        self.rest_action('PUT', resource, data, errstr)
+
+    def rest_delete_floatingip(self, tenant_id, floatingip_id):
+        resource = FLOATINGIPS_PATH % (tenant_id, floatingip_id)
+        errstr = _("Unable to delete remote floating IP: %s")
+        self.rest_action('DELETE', resource, errstr=errstr)
+
+    def rest_get_tenant_checksums(self):
+        errstr = _("Unable to get remote topology checksums: %s")
+        resp = self.rest_action('GET', TENANT_TOPOLOGY_RESOURCE_PATH,
+                                errstr=errstr)
+        return resp[3] if isinstance(resp[3], dict) else {}
+
+    def rest_update_tenant_topology(self, tenant_id, topology):
+        resource = TENANT_TOPOLOGY_PATH % tenant_id
+        errstr = _("Unable to update remote tenant topology: %s")
+        self.rest_action('PUT', resource, topology, errstr)
+
+    def rest_delete_tenant_topology(self, tenant_id):
+        resource = TENANT_TOPOLOGY_PATH % tenant_id
+        errstr = _("Unable to delete remote tenant topology: %s")
+        self.rest_action('DELETE', resource, errstr=errstr)
+
     def rest_plug_interface(self, tenant_id, net_id, port,
                             remote_interface_id):
         if port["mac_address"] is not None:
@@ -453,6 +563,7 @@ class NeutronRestProxyV2(db_base_plugin_v2.NeutronDbPluginV2,
         neutron_id = cfg.CONF.RESTPROXY.neutron_id
         self.add_meta_server_route = cfg.CONF.RESTPROXY.add_meta_server_route
         timeout = cfg.CONF.RESTPROXY.server_timeout
+        max_connections = cfg.CONF.RESTPROXY.server_max_connections
         if server_timeout is not None:
             timeout = server_timeout
 
@@ -464,7 +575,8 @@ class NeutronRestProxyV2(db_base_plugin_v2.NeutronDbPluginV2,
 
         # init network ctrl connections
         self.servers = ServerPool(servers, server_ssl, server_auth, neutron_id,
-                                  timeout, BASE_URI)
+                                  timeout, BASE_URI,
+                                  max_connections=max_connections)
 
         # init dhcp support
         self.topic = topics.PLUGIN
@@ -1034,7 +1146,11 @@ class NeutronRestProxyV2(db_base_plugin_v2.NeutronDbPluginV2,
 
             # create floatingip on the network controller
             try:
-                self._send_floatingip_update(context)
+                if 'floatingip' in self.servers.get_capabilities():
+                    self.servers.rest_create_floatingip(
+                        new_fl_ip['tenant_id'], new_fl_ip)
+                else:
+                    self._send_floatingip_update(context)
             except RemoteRestError as e:
                 with excutils.save_and_reraise_exception():
                     LOG.error(
@@ -1052,24 +1168,46 @@ class NeutronRestProxyV2(db_base_plugin_v2.NeutronDbPluginV2,
                               self).update_floatingip(context, id, floatingip)
 
             # update network on network controller
-            self._send_floatingip_update(context)
+            if 'floatingip' in self.servers.get_capabilities():
+                self.servers.rest_update_floatingip(new_fl_ip['tenant_id'],
+                                                    new_fl_ip, id)
+            else:
+                self._send_floatingip_update(context)
             return new_fl_ip
 
     def delete_floatingip(self, context, id):
         LOG.debug(_("NeutronRestProxyV2: delete_floatingip() called"))
 
         with context.session.begin(subtransactions=True):
+            old_fl_ip = super(NeutronRestProxyV2,
+                              self).get_floatingip(context, id)
             # delete floating IP in DB
             super(NeutronRestProxyV2, self).delete_floatingip(context, id)
 
             # update network on network controller
-            self._send_floatingip_update(context)
+            if 'floatingip' in self.servers.get_capabilities():
+                self.servers.rest_delete_floatingip(old_fl_ip['tenant_id'],
+                                                    id)
+            else:
+                self._send_floatingip_update(context)
 
     def disassociate_floatingips(self, context, port_id):
         LOG.debug(_("NeutronRestProxyV2: diassociate_floatingips() called"))
+        if 'floatingip' not in self.servers.get_capabilities():
+            super(NeutronRestProxyV2, self).disassociate_floatingips(context,
+                                                                     port_id)
+            self._send_floatingip_update(context)
+            return
+        admin_context = context.elevated()
+        fl_ips = super(NeutronRestProxyV2, self).get_floatingips(
+            admin_context, filters={'port_id': [port_id]})
         super(NeutronRestProxyV2, self).disassociate_floatingips(context,
                                                                  port_id)
-        self._send_floatingip_update(context)
+        for fl_ip in fl_ips:
+            fl_ip = super(NeutronRestProxyV2,
+                          self).get_floatingip(admin_context, fl_ip['id'])
+            self.servers.rest_update_floatingip(fl_ip['tenant_id'],
+                                                fl_ip, fl_ip['id'])
 
     def _send_floatingip_update(self, context):
         try:
@@ -1092,22 +1230,62 @@ class NeutronRestProxyV2(db_base_plugin_v2.NeutronDbPluginV2,
         This gives the controller an option to re-sync it's persistent store
         with neutron's current view of that data.
         """
+        if 'tenant-sync' in self.servers.get_capabilities():
+            return self._send_tenant_data()
+        data = self._get_topology(qcontext.get_admin_context())
+        errstr = _("Unable to update remote topology: %s")
+        return self.servers.rest_action('PUT', TOPOLOGY_PATH, data, errstr)
+
+    def _send_tenant_data(self):
+        """Pushes the topology of tenants out of sync on the network ctrl.
+
+        The topology of each tenant is built and compared to the controller
+        one by checksum, one tenant at a time, and sent only on mismatch.
+        """
         admin_context = qcontext.get_admin_context()
+        remote_checksums = self.servers.rest_get_tenant_checksums()
+        query = admin_context.session.query
+        tenant_ids = set(tenant_id for (tenant_id,) in
+                         query(models_v2.Network.tenant_id).distinct())
+        tenant_ids.update(tenant_id for (tenant_id,) in
+                          query(l3_db.Router.tenant_id).distinct())
+        sent = 0
+        for tenant_id in sorted(tenant_ids):
+            topology = self._get_topology(admin_context, tenant_id)
+            checksum = hashlib.md5(
+                json.dumps(topology, sort_keys=True)).hexdigest()
+            if remote_checksums.get(tenant_id) == checksum:
+                continue
+            topology['checksum'] = checksum
+            self.servers.rest_update_tenant_topology(tenant_id, topology)
+            sent += 1
+        for tenant_id in set(remote_checksums) - tenant_ids:
+            self.servers.rest_delete_tenant_topology(tenant_id)
+        LOG.info(_("NeutronRestProxyV2: topology sent for %(sent)d of "
+                   "%(total)d tenants"),
+                 {'sent': sent, 'total': len(tenant_ids)})
+
+    def _get_topology(self, admin_context, tenant_id=None):
+        filters = {'tenant_id': [tenant_id]} if tenant_id else None
         networks = []
         routers = []
 
         all_networks = super(NeutronRestProxyV2,
-                             self).get_networks(admin_context) or []
-        for net in all_networks:
+                             self).get_networks(admin_context,
+                                                filters=filters) or []
+        for net in sorted(all_networks, key=lambda net: net['id']):
             mapped_network = self._get_mapped_network_with_subnets(net)
             net_fl_ips = self._get_network_with_floatingips(mapped_network)
+            # Keep a stable order for computing checksums
+            for key in ('subnets', 'floatingips'):
+                net_fl_ips[key].sort(key=lambda item: item['id'])
 
             ports = []
             net_filter = {'network_id': [net.get('id')]}
             net_ports = super(NeutronRestProxyV2,
                               self).get_ports(admin_context,
                                               filters=net_filter) or []
-            for port in net_ports:
+            for port in sorted(net_ports, key=lambda port: port['id']):
                 mapped_port = self._map_state_and_status(port)
                 mapped_port['attachment'] = {
                     'id': port.get('device_id'),
@@ -1119,8 +1297,9 @@ class NeutronRestProxyV2(db_base_plugin_v2.NeutronDbPluginV2,
             networks.append(net_fl_ips)
 
         all_routers = super(NeutronRestProxyV2,
-                            self).get_routers(admin_context) or []
-        for router in all_routers:
+                            self).get_routers(admin_context,
+                                              filters=filters) or []
+        for router in sorted(all_routers, key=lambda router: router['id']):
             interfaces = []
             mapped_router = self._map_state_and_status(router)
             router_filter = {
@@ -1130,7 +1309,7 @@ class NeutronRestProxyV2(db_base_plugin_v2.NeutronDbPluginV2,
             router_ports = super(NeutronRestProxyV2,
                                  self).get_ports(admin_context,
                                                  filters=router_filter) or []
-            for port in router_ports:
+            for port in sorted(router_ports, key=lambda port: port['id']):
                 net_id = port.get('network_id')
                 subnet_id = port['fixed_ips'][0]['subnet_id']
                 intf_details = self._get_router_intf_details(admin_context,
@@ -1141,13 +1320,10 @@ class NeutronRestProxyV2(db_base_plugin_v2.NeutronDbPluginV2,
 
             routers.append(mapped_router)
 
-        resource = '/topology'
-        data = {
+        return {
             'networks': networks,
             'routers': routers,
         }
-        errstr = _("Unable to update remote topology: %s")
-        return self.servers.rest_action('PUT', resource, data, errstr)
 
     def _add_host_route(self, context, destination, port):
         subnet = {}
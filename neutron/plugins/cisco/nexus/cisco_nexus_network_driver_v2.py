@@ -23,6 +23,7 @@ Implements a Nexus-OS NETCONF over SSHv2 API Client
 
 import logging
 
+import eventlet
 from ncclient import manager
 
 from neutron.openstack.common import excutils
@@ -35,9 +36,20 @@ from neutron.plugins.cisco.nexus import cisco_nexus_snippets as snipp
 
 LOG = logging.getLogger(__name__)
 
+# Errors ignored when changing the state of a VLAN
+VLAN_STATE_EXC_STRS = ["Can't modify state for extended",
+                       "Command is only allowed on VLAN"]
+
 
 class CiscoNEXUSDriver():
-    """Nexus Driver Main Class."""
+    """Nexus Driver Main Class.
+
+    The configuration of each switch is applied by a worker green thread
+    of the switch, so that switches are configured in parallel. The
+    snippets queued while the worker is busy are sent together in a single
+    edit-config request; if it fails, they are sent one by one so that
+    each caller gets the result of its own snippets.
+    """
     def __init__(self):
         cisco_switches = conf.get_device_dictionary()
         self.nexus_switches = dict(((key[1], key[2]), val)
@@ -45,11 +57,18 @@ class CiscoNEXUSDriver():
                                    if key[0] == 'NEXUS_SWITCH')
         self.credentials = {}
         self.connections = {}
+        # pending (snippet, allowed_exc_strs, after, event) of each switch
+        self.pending = {}
+        # switches whose worker is running
+        self.workers = set()
 
     def _edit_config(self, nexus_host, target='running', config='',
                      allowed_exc_strs=None):
         """Modify switch config for a target config type.
 
+        The request is sent again on a new session if the session to the
+        switch was found closed when it failed.
+
         :param nexus_host: IP address of switch to configure
         :param target: Target config type
         :param config: Configuration string in XML format
@@ -62,18 +81,88 @@ class CiscoNEXUSDriver():
         """
         if not allowed_exc_strs:
             allowed_exc_strs = []
-        mgr = self.nxos_connect(nexus_host)
-        try:
-            mgr.edit_config(target, config=config)
-        except Exception as e:
-            for exc_str in allowed_exc_strs:
-                if exc_str in str(e):
-                    break
-            else:
+        for attempt in range(2):
+            mgr = self.nxos_connect(nexus_host)
+            try:
+                mgr.edit_config(target, config=config)
+                return
+            except Exception as e:
+                if not attempt and not mgr.connected:
+                    LOG.warning(_("Session to Nexus %(host)s was closed, "
+                                  "reconnecting: %(exc)s"),
+                                {'host': nexus_host, 'exc': e})
+                    continue
+                for exc_str in allowed_exc_strs:
+                    if exc_str in str(e):
+                        return
                 # Raise a Neutron exception. Include a description of
                 # the original ncclient exception. No need to preserve T/B
                 raise cexc.NexusConfigFailed(config=config, exc=e)
 
+    def _queue_config(self, nexus_host, snippet, allowed_exc_strs=None,
+                      after=None):
+        """Queue a configuration snippet for a switch.
+
+        :param nexus_host: IP address of switch to configure
+        :param snippet: Configuration snippet, without the exec-configure
+                        envelope
+        :param allowed_exc_strs: See _edit_config
+        :param after: Event of a snippet queued before, this snippet is
+                      not applied if that one fails
+        :returns: Event sent once the snippet is applied, wait() raises
+                  NexusConfigFailed or NexusConnectFailed on failure
+        """
+        event = eventlet.event.Event()
+        self.pending.setdefault(nexus_host, []).append(
+            (snippet, allowed_exc_strs, after, event))
+        if nexus_host not in self.workers:
+            self.workers.add(nexus_host)
+            eventlet.spawn_n(self._run_worker, nexus_host)
+        return event
+
+    def _edit_snippet(self, nexus_host, snippet, allowed_exc_strs=None):
+        """Apply a configuration snippet on a switch and wait for it."""
+        self._queue_config(nexus_host, snippet, allowed_exc_strs).wait()
+
+    def _run_worker(self, nexus_host):
+        try:
+            while self.pending.get(nexus_host):
+                self._apply_configs(nexus_host, self.pending.pop(nexus_host))
+        finally:
+            self.workers.discard(nexus_host)
+
+    def _apply_configs(self, nexus_host, configs):
+        if len(configs) > 1:
+            confstr = self.create_xml_snippet(
+                ''.join(config[0] for config in configs))
+            # the errors allowed for a snippet are only ignored when it is
+            # applied alone, any error makes the snippets applied one by one
+            try:
+                self._edit_config(nexus_host, target='running',
+                                  config=confstr)
+            except Exception as e:
+                LOG.debug(_("NexusDriver: combined configuration of "
+                            "%(host)s failed, applying it in parts: "
+                            "%(exc)s"), {'host': nexus_host, 'exc': e})
+            else:
+                for config in configs:
+                    config[3].send()
+                return
+
+        failed = {}
+        for snippet, allowed_exc_strs, after, event in configs:
+            try:
+                if after in failed:
+                    raise failed[after]
+                self._edit_config(nexus_host, target='running',
+                                  config=self.create_xml_snippet(snippet),
+                                  allowed_exc_strs=allowed_exc_strs)
+            except Exception as e:
+                failed[event] = e
+                event.send_exception(e)
+            else:
+                event.send()
+
     def get_credential(self, nexus_ip):
         if nexus_ip not in self.credentials:
             nexus_username = cred.Store.get_username(nexus_ip)
@@ -114,11 +203,10 @@ class CiscoNEXUSDriver():
         conf_xml_snippet = snipp.EXEC_CONF_SNIPPET % (cutomized_config)
         return conf_xml_snippet
 
-    def create_vlan(self, nexus_host, vlanid, vlanname):
-        """Create a VLAN on Nexus Switch given the VLAN ID and Name."""
-        confstr = self.create_xml_snippet(
-            snipp.CMD_VLAN_CONF_SNIPPET % (vlanid, vlanname))
-        self._edit_config(nexus_host, target='running', config=confstr)
+    def _queue_vlan(self, nexus_host, vlanid, vlanname):
+        """Queue the creation of a VLAN, see _wait_vlan."""
+        created = self._queue_config(
+            nexus_host, snipp.CMD_VLAN_CONF_SNIPPET % (vlanid, vlanname))
 
         # Enable VLAN active and no-shutdown states. Some versions of
         # Nexus switch do not allow state changes for the extended VLAN
@@ -126,27 +214,37 @@ class CiscoNEXUSDriver():
         # values are appropriate).
         state_config = [snipp.CMD_VLAN_ACTIVE_SNIPPET,
                         snipp.CMD_VLAN_NO_SHUTDOWN_SNIPPET]
+        events = [created]
         for snippet in state_config:
-            try:
-                confstr = self.create_xml_snippet(snippet % vlanid)
-                self._edit_config(
-                    nexus_host,
-                    target='running',
-                    config=confstr,
-                    allowed_exc_strs=["Can't modify state for extended",
-                                      "Command is only allowed on VLAN"])
-            except cexc.NexusConfigFailed:
-                with excutils.save_and_reraise_exception():
-                    self.delete_vlan(nexus_host, vlanid)
+            events.append(self._queue_config(
+                nexus_host, snippet % vlanid,
+                allowed_exc_strs=VLAN_STATE_EXC_STRS, after=events[-1]))
+        return events
+
+    def _wait_vlan(self, nexus_host, vlanid, events):
+        """Wait for a VLAN creation, delete it if its state is not set.
+
+        The events are the ones returned by _queue_vlan, each of them
+        depends on the previous one.
+        """
+        events[0].wait()
+        try:
+            for event in events[1:]:
+                event.wait()
+        except cexc.NexusConfigFailed:
+            with excutils.save_and_reraise_exception():
+                self.delete_vlan(nexus_host, vlanid)
+
+    def create_vlan(self, nexus_host, vlanid, vlanname):
+        """Create a VLAN on Nexus Switch given the VLAN ID and Name."""
+        events = self._queue_vlan(nexus_host, vlanid, vlanname)
+        self._wait_vlan(nexus_host, vlanid, events)
 
     def delete_vlan(self, nexus_host, vlanid):
         """Delete a VLAN on Nexus Switch given the VLAN ID."""
-        confstr = snipp.CMD_NO_VLAN_CONF_SNIPPET % vlanid
-        confstr = self.create_xml_snippet(confstr)
-        self._edit_config(nexus_host, target='running', config=confstr)
+        self._edit_snippet(nexus_host, snipp.CMD_NO_VLAN_CONF_SNIPPET % vlanid)
 
-    def enable_vlan_on_trunk_int(self, nexus_host, vlanid, etype, interface):
-        """Enable a VLAN on a trunk interface."""
+    def _trunk_snippet(self, nexus_host, vlanid, etype, interface):
         # If one or more VLANs are already configured on this interface,
         # include the 'add' keyword.
         if nexus_db_v2.get_port_switch_bindings('%s:%s' % (etype, interface),
@@ -155,42 +253,59 @@ class CiscoNEXUSDriver():
         else:
             snippet = snipp.CMD_INT_VLAN_SNIPPET
         confstr = snippet % (etype, interface, vlanid, etype)
-        confstr = self.create_xml_snippet(confstr)
         LOG.debug(_("NexusDriver: %s"), confstr)
-        self._edit_config(nexus_host, target='running', config=confstr)
+        return confstr
 
-    def disable_vlan_on_trunk_int(self, nexus_host, vlanid, etype, interface):
-        """Disable a VLAN on a trunk interface."""
+    def enable_vlan_on_trunk_int(self, nexus_host, vlanid, etype, interface):
+        """Enable a VLAN on a trunk interface."""
+        self._edit_snippet(nexus_host, self._trunk_snippet(
+            nexus_host, vlanid, etype, interface))
+
+    def _untrunk_snippet(self, vlanid, etype, interface):
         confstr = snipp.CMD_NO_VLAN_INT_SNIPPET % (etype, interface,
                                                    vlanid, etype)
-        confstr = self.create_xml_snippet(confstr)
         LOG.debug(_("NexusDriver: %s"), confstr)
-        self._edit_config(nexus_host, target='running', config=confstr)
+        return confstr
+
+    def disable_vlan_on_trunk_int(self, nexus_host, vlanid, etype, interface):
+        """Disable a VLAN on a trunk interface."""
+        self._edit_snippet(nexus_host, self._untrunk_snippet(
+            vlanid, etype, interface))
 
     def create_and_trunk_vlan(self, nexus_host, vlan_id, vlan_name,
                               etype, nexus_port):
         """Create VLAN and trunk it on the specified ports."""
-        self.create_vlan(nexus_host, vlan_id, vlan_name)
+        if nexus_port:
+            trunk_config = self._trunk_snippet(nexus_host, vlan_id,
+                                               etype, nexus_port)
+        events = self._queue_vlan(nexus_host, vlan_id, vlan_name)
+        if nexus_port:
+            trunked = self._queue_config(nexus_host, trunk_config,
+                                         after=events[-1])
+        self._wait_vlan(nexus_host, vlan_id, events)
         LOG.debug(_("NexusDriver created VLAN: %s"), vlan_id)
         if nexus_port:
-            self.enable_vlan_on_trunk_int(nexus_host, vlan_id,
-                                          etype, nexus_port)
+            trunked.wait()
 
     def delete_and_untrunk_vlan(self, nexus_host, vlan_id, etype, nexus_port):
         """Delete VLAN and untrunk it from the specified ports."""
-        self.delete_vlan(nexus_host, vlan_id)
+        deleted = self._queue_config(nexus_host,
+                                     snipp.CMD_NO_VLAN_CONF_SNIPPET % vlan_id)
+        if nexus_port:
+            untrunked = self._queue_config(
+                nexus_host,
+                self._untrunk_snippet(vlan_id, etype, nexus_port),
+                after=deleted)
+        deleted.wait()
         if nexus_port:
-            self.disable_vlan_on_trunk_int(nexus_host, vlan_id,
-                                           etype, nexus_port)
+            untrunked.wait()
 
     def create_vlan_svi(self, nexus_host, vlan_id, gateway_ip):
         confstr = snipp.CMD_VLAN_SVI_SNIPPET % (vlan_id, gateway_ip)
-        confstr = self.create_xml_snippet(confstr)
         LOG.debug(_("NexusDriver: %s"), confstr)
-        self._edit_config(nexus_host, target='running', config=confstr)
+        self._edit_snippet(nexus_host, confstr)
 
     def delete_vlan_svi(self, nexus_host, vlan_id):
         confstr = snipp.CMD_NO_VLAN_SVI_SNIPPET % vlan_id
-        confstr = self.create_xml_snippet(confstr)
         LOG.debug(_("NexusDriver: %s"), confstr)
-        self._edit_config(nexus_host, target='running', config=confstr)
+        self._edit_snippet(nexus_host, confstr)
@@ -26,6 +26,8 @@ PlugIn for Nexus OS driver
 
 import logging
 
+import eventlet
+
 from neutron.openstack.common import excutils
 from neutron.openstack.common import importutils
 from neutron.plugins.cisco.common import cisco_constants as const
@@ -89,9 +91,13 @@ class NexusPlugin(L2DevicePluginBase):
             auto_trunk = conf.CISCO.provider_vlan_auto_trunk
 
         # Check if this network is already in the DB
+        switch_configs = []
+        # switches on which an earlier interface creates the vlan
+        created_switches = set()
         for switch_ip, etype, port_id in host_connections:
             vlan_created = False
             vlan_trunked = False
+            call = None
             eport_id = '%s:%s' % (etype, port_id)
             # Check for switch vlan bindings
             try:
@@ -103,30 +109,45 @@ class NexusPlugin(L2DevicePluginBase):
             except cisco_exc.NexusPortBindingNotFound:
                 # No changes, proceed as normal
                 pass
+            create_vlan = auto_create and switch_ip not in created_switches
 
             try:
                 nxos_db.get_port_vlan_switch_binding(eport_id, vlan_id,
                                                      switch_ip)
             except cisco_exc.NexusPortBindingNotFound:
-                if auto_create and auto_trunk:
+                if create_vlan and auto_trunk:
                     # Create vlan and trunk vlan on the port
                     LOG.debug(_("Nexus: create & trunk vlan %s"), vlan_name)
-                    self._client.create_and_trunk_vlan(
-                        switch_ip, vlan_id, vlan_name, etype, port_id)
+                    call = (self._client.create_and_trunk_vlan,
+                            switch_ip, vlan_id, vlan_name, etype, port_id)
                     vlan_created = True
                     vlan_trunked = True
-                elif auto_create:
+                elif create_vlan:
                     # Create vlan but do not trunk it on the port
                     LOG.debug(_("Nexus: create vlan %s"), vlan_name)
-                    self._client.create_vlan(switch_ip, vlan_id, vlan_name)
+                    call = (self._client.create_vlan,
+                            switch_ip, vlan_id, vlan_name)
                     vlan_created = True
                 elif auto_trunk:
                     # Only trunk vlan on the port
                     LOG.debug(_("Nexus: trunk vlan %s"), vlan_name)
-                    self._client.enable_vlan_on_trunk_int(
-                        switch_ip, vlan_id, etype, port_id)
+                    call = (self._client.enable_vlan_on_trunk_int,
+                            switch_ip, vlan_id, etype, port_id)
                     vlan_trunked = True
-
+                if create_vlan:
+                    created_switches.add(switch_ip)
+            switch_configs.append((call, switch_ip, etype, port_id,
+                                   vlan_created, vlan_trunked))
+
+        # Configure the switches in parallel, then bind the ones which were
+        # configured before raising any error
+        errors = self._configure_switches(
+            [config[0] for config in switch_configs])
+        for (call, switch_ip, etype, port_id, vlan_created,
+             vlan_trunked), error in zip(switch_configs, errors):
+            if error:
+                continue
+            eport_id = '%s:%s' % (etype, port_id)
             try:
                 instance = attachment[const.INSTANCE_ID]
                 nxos_db.add_nexusport_binding(eport_id, str(vlan_id),
@@ -149,6 +170,9 @@ class NexusPlugin(L2DevicePluginBase):
                                                                vlan_id,
                                                                etype,
                                                                port_id)
+        for error in errors:
+            if error:
+                raise error
 
         net_id = network[const.NET_ID]
         new_net_dict = {const.NET_ID: net_id,
@@ -159,6 +183,43 @@ class NexusPlugin(L2DevicePluginBase):
         self._networks[net_id] = new_net_dict
         return new_net_dict
 
+    def _configure_switches(self, calls):
+        """Configure several switches in parallel.
+
+        :param calls: list of (function, switch_ip, arg2, ...) tuples, or
+                      None for the switches which need no configuration.
+                      The calls configuring the same switch are run one
+                      after the other in order, once one of them fails the
+                      next ones are not run and get its exception.
+        :returns: list of the exceptions raised by the calls, None for the
+                  calls which succeeded
+        """
+        errors = [None] * len(calls)
+
+        def configure(indexes):
+            error = None
+            for i in indexes:
+                if error is None:
+                    try:
+                        calls[i][0](*calls[i][1:])
+                    except Exception as e:
+                        error = e
+                errors[i] = error
+
+        switch_calls = {}
+        for i, call in enumerate(calls):
+            if call:
+                switch_calls.setdefault(call[1], []).append(i)
+        if len(switch_calls) < 2:
+            for indexes in switch_calls.values():
+                configure(indexes)
+            return errors
+        pool = eventlet.GreenPool(len(switch_calls))
+        for indexes in switch_calls.values():
+            pool.spawn_n(configure, indexes)
+        pool.waitall()
+        return errors
+
     def add_router_interface(self, vlan_name, vlan_id, subnet_id,
                              gateway_ip, router_id):
         """Create VLAN SVI on the Nexus switch."""
@@ -272,6 +333,8 @@ class NexusPlugin(L2DevicePluginBase):
             LOG.debug(_("delete_network(): provider vlan %s"), vlan_id)
 
         instance_id = False
+        switch_configs = []
+        deleted_switches = set()
         for row in rows:
             instance_id = row['instance_id']
             switch_ip = row.switch_ip
@@ -291,35 +354,53 @@ class NexusPlugin(L2DevicePluginBase):
                 nxos_db.get_port_vlan_switch_binding(row.port_id,
                                                      row.vlan_id,
                                                      row.switch_ip)
+                switch_configs.append(None)
+                continue
             except cisco_exc.NexusPortBindingNotFound:
+                pass
+
+            untrunk = bool(nexus_port and auto_untrunk)
+            # Check whether there are any remaining instances
+            # using this vlan on the Nexus switch.
+            delete = False
+            if auto_delete and switch_ip not in deleted_switches:
                 try:
-                    if nexus_port and auto_untrunk:
-                        # Untrunk the vlan from this Nexus interface
-                        self._client.disable_vlan_on_trunk_int(
-                            switch_ip, row.vlan_id, etype, nexus_port)
-
-                    # Check whether there are any remaining instances
-                    # using this vlan on the Nexus switch.
-                    if auto_delete:
-                        try:
-                            nxos_db.get_nexusvlan_binding(row.vlan_id,
-                                                          row.switch_ip)
-                        except cisco_exc.NexusPortBindingNotFound:
-                            # Delete this vlan from this switch
-                            self._client.delete_vlan(switch_ip, row.vlan_id)
-                except Exception:
-                    # The delete vlan operation on the Nexus failed,
-                    # so this delete_port request has failed. For
-                    # consistency, roll back the Nexus database to what
-                    # it was before this request.
-                    with excutils.save_and_reraise_exception():
-                        nxos_db.add_nexusport_binding(row.port_id,
-                                                      row.vlan_id,
-                                                      row.switch_ip,
-                                                      row.instance_id)
+                    nxos_db.get_nexusvlan_binding(row.vlan_id,
+                                                  row.switch_ip)
+                except cisco_exc.NexusPortBindingNotFound:
+                    delete = True
+                    deleted_switches.add(switch_ip)
+            switch_configs.append((self._unconfigure_switch, switch_ip,
+                                   row.vlan_id, etype, nexus_port,
+                                   untrunk, delete))
+
+        errors = self._configure_switches(switch_configs)
+        for row, error in zip(rows, errors):
+            if error:
+                # The delete vlan operation on the Nexus failed,
+                # so this delete_port request has failed. For
+                # consistency, roll back the Nexus database to what
+                # it was before this request.
+                nxos_db.add_nexusport_binding(row.port_id,
+                                              row.vlan_id,
+                                              row.switch_ip,
+                                              row.instance_id)
+        for error in errors:
+            if error:
+                raise error
 
         return instance_id
 
+    def _unconfigure_switch(self, switch_ip, vlan_id, etype, nexus_port,
+                            untrunk, delete):
+        if untrunk:
+            # Untrunk the vlan from this Nexus interface
+            self._client.disable_vlan_on_trunk_int(
+                switch_ip, vlan_id, etype, nexus_port)
+        if delete:
+            # Delete this vlan from this switch
+            self._client.delete_vlan(switch_ip, vlan_id)
+
     def update_port(self, tenant_id, net_id, port_id, port_state, **kwargs):
         """Update port.
 
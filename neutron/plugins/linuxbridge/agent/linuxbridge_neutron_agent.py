@@ -25,6 +25,7 @@
 import distutils.version as dist_version
 import os
 import platform
+import select
 import sys
 import time
 
@@ -60,6 +61,7 @@ BRIDGE_NAME_PLACEHOLDER = "bridge_name"
 BRIDGE_INTERFACES_FS = BRIDGE_FS + BRIDGE_NAME_PLACEHOLDER + "/brif/"
 DEVICE_NAME_PLACEHOLDER = "device_name"
 BRIDGE_PORT_FS_FOR_DEVICE = BRIDGE_FS + DEVICE_NAME_PLACEHOLDER + "/brport"
+BRIDGE_FOR_DEVICE_FS = BRIDGE_PORT_FS_FOR_DEVICE + "/bridge"
 VXLAN_INTERFACE_PREFIX = "vxlan-"
 
 
@@ -70,11 +72,23 @@ class NetworkSegment:
         self.segmentation_id = segmentation_id
 
 
+class FdbTable(object):
+    """Forwarding entries of a VXLAN device.
+
+    bridge holds (mac, remote vtep ip) pairs and neigh (mac, ip) pairs.
+    """
+    def __init__(self):
+        self.bridge = set()
+        self.neigh = set()
+
+
 class LinuxBridgeManager:
     def __init__(self, interface_mappings, root_helper):
         self.interface_mappings = interface_mappings
         self.root_helper = root_helper
         self.ip = ip_lib.IPWrapper(self.root_helper)
+        # Forwarding tables of the VXLAN devices, by device name
+        self.fdb_tables = {}
         # VXLAN related parameters:
         self.local_ip = cfg.CONF.VXLAN.local_ip
         self.vxlan_mode = lconst.VXLAN_NONE
@@ -89,8 +103,9 @@ class LinuxBridgeManager:
         self.network_map = {}
 
         self.udev = pyudev.Context()
-        monitor = pyudev.Monitor.from_netlink(self.udev)
-        monitor.filter_by('net')
+        # Set when the tap devices are tracked from udev events
+        self.udev_monitor = None
+        self.tap_devices = set()
 
     def device_exists(self, device):
         """Check if ethernet device exists."""
@@ -166,13 +181,14 @@ class LinuxBridgeManager:
                 return device.name
 
     def get_bridge_for_tap_device(self, tap_device_name):
-        bridges = self.get_all_neutron_bridges()
-        for bridge in bridges:
-            interfaces = self.get_interfaces_on_bridge(bridge)
-            if tap_device_name in interfaces:
-                return bridge
-
-        return None
+        bridge_path = BRIDGE_FOR_DEVICE_FS.replace(DEVICE_NAME_PLACEHOLDER,
+                                                   tap_device_name)
+        try:
+            bridge = os.path.basename(os.readlink(bridge_path))
+        except OSError:
+            return None
+        if bridge.startswith(BRIDGE_NAME_PREFIX):
+            return bridge
 
     def is_device_on_bridge(self, device_name):
         if not device_name:
@@ -259,6 +275,7 @@ class LinuxBridgeManager:
                 args['tos'] = cfg.CONF.VXLAN.tos
             if cfg.CONF.VXLAN.l2_population:
                 args['proxy'] = True
+            self.fdb_tables.pop(interface, None)
             int_vxlan = self.ip.add_vxlan(interface, segmentation_id, **args)
             int_vxlan.link.set_up()
             LOG.debug(_("Done creating vxlan interface %s"), interface)
@@ -498,10 +515,59 @@ class LinuxBridgeManager:
             int_vxlan = self.ip.device(interface)
             int_vxlan.link.set_down()
             int_vxlan.link.delete()
+            self.fdb_tables.pop(interface, None)
             LOG.debug(_("Done deleting vxlan interface %s"), interface)
 
+    def start_udev_monitor(self):
+        """Track the tap devices from udev events instead of listing them."""
+        monitor = pyudev.Monitor.from_netlink(self.udev)
+        monitor.filter_by('net')
+        monitor.start()
+        self.udev_monitor = monitor
+        # Listed once the monitor is started so that no change is missed
+        self.tap_devices = self.udev_get_tap_devices()
+
+    def _receive_udev_events(self):
+        events = []
+        while select.select([self.udev_monitor], [], [], 0)[0]:
+            if hasattr(self.udev_monitor, 'poll'):
+                device = self.udev_monitor.poll(timeout=0)
+                if device is None:
+                    break
+                events.append((device.action, device))
+            else:
+                events.append(self.udev_monitor.receive_device())
+        return events
+
+    def udev_update_tap_devices(self):
+        try:
+            events = self._receive_udev_events()
+        except EnvironmentError:
+            # Events are lost when the netlink socket buffer overflows
+            LOG.exception(_("Unable to read udev events, listing devices"))
+            self.resync_tap_devices()
+            return
+        for action, device in events:
+            name = self.udev_get_name(device)
+            if not self.is_tap_device(name):
+                continue
+            if action == 'add':
+                self.tap_devices.add(name)
+            elif action == 'remove':
+                self.tap_devices.discard(name)
+
+    def resync_tap_devices(self):
+        if self.udev_monitor:
+            self.tap_devices = self.udev_get_tap_devices()
+
+    def get_tap_devices(self):
+        if self.udev_monitor:
+            self.udev_update_tap_devices()
+            return set(self.tap_devices)
+        return self.udev_get_tap_devices()
+
     def update_devices(self, registered_devices):
-        devices = self.udev_get_tap_devices()
+        devices = self.get_tap_devices()
         if devices == registered_devices:
             return
         added = devices - registered_devices
@@ -549,63 +615,136 @@ class LinuxBridgeManager:
                           'linux kernel and iproute2 3.8'))
         LOG.debug(_('Using %s VXLAN mode'), self.vxlan_mode)
 
-    def fdb_ip_entry_exists(self, mac, ip, interface):
-        entries = utils.execute(['ip', 'neigh', 'show', 'to', ip,
-                                 'dev', interface],
-                                root_helper=self.root_helper)
-        return mac in entries
+    def get_fdb_table(self, interface):
+        """Return the forwarding entries programmed on a VXLAN device.
 
-    def fdb_bridge_entry_exists(self, mac, interface, agent_ip=None):
-        entries = utils.execute(['bridge', 'fdb', 'show', 'dev', interface],
-                                root_helper=self.root_helper)
-        if not agent_ip:
-            return mac in entries
+        The kernel tables are dumped the first time a device is used, the
+        entries are then tracked in memory as they are added and removed.
+        """
+        table = self.fdb_tables.get(interface)
+        if table is None:
+            table = FdbTable()
+            entries = utils.execute(['bridge', 'fdb', 'show',
+                                     'dev', interface],
+                                    root_helper=self.root_helper)
+            for line in entries.splitlines():
+                fields = line.split()
+                if 'dst' in fields[:-1]:
+                    table.bridge.add(
+                        (fields[0], fields[fields.index('dst') + 1]))
+            entries = utils.execute(['ip', 'neigh', 'show',
+                                     'dev', interface],
+                                    root_helper=self.root_helper)
+            for line in entries.splitlines():
+                fields = line.split()
+                if 'lladdr' in fields[:-1]:
+                    table.neigh.add(
+                        (fields[fields.index('lladdr') + 1], fields[0]))
+            self.fdb_tables[interface] = table
+        return table
+
+    def _apply_fdb_commands(self, interface, neigh_cmds, bridge_cmds):
+        """Run the commands updating the forwarding entries of a device.
+
+        The device table already holds the result of the commands. It is
+        dropped when one of them fails, to be dumped again from the kernel
+        the next time the device is used.
+        """
+        if cfg.CONF.VXLAN.fdb_batch:
+            for cmd, lines in (('ip', neigh_cmds), ('bridge', bridge_cmds)):
+                if lines:
+                    self._execute_fdb_command(
+                        interface, [cmd, '-force', '-batch', '-'],
+                        process_input='\n'.join(
+                            ' '.join(line) for line in lines) + '\n')
+            return
+        for cmd, lines in (('ip', neigh_cmds), ('bridge', bridge_cmds)):
+            for line in lines:
+                self._execute_fdb_command(interface, [cmd] + line)
 
-        return (agent_ip in entries and mac in entries)
+    def _execute_fdb_command(self, interface, args, **kwargs):
+        try:
+            utils.execute(args, root_helper=self.root_helper, **kwargs)
+        except RuntimeError as e:
+            LOG.warning(_("Failed to update the forwarding entries of "
+                          "%(interface)s: %(error)s"),
+                        {'interface': interface, 'error': e})
+            self.fdb_tables.pop(interface, None)
+
+    def _neigh_cmds(self, table, interface, added, removed):
+        cmds = []
+        for mac, ip in removed:
+            if (mac, ip) in table.neigh:
+                table.neigh.remove((mac, ip))
+                cmds.append(['neigh', 'del', ip, 'lladdr', mac,
+                             'dev', interface])
+        for mac, ip in added:
+            if (mac, ip) not in table.neigh:
+                table.neigh.add((mac, ip))
+                cmds.append(['neigh', 'replace', ip, 'lladdr', mac,
+                             'dev', interface, 'nud', 'permanent'])
+        return cmds
+
+    def update_fdb_entries(self, interface, added=None, removed=None,
+                           ips_added=(), ips_removed=()):
+        """Program the forwarding entries of remote ports on a device.
+
+        added and removed map agent IPs to lists of [mac, ip] port entries,
+        ips_added and ips_removed are [mac, ip] entries only changing the
+        neighbour table. Only the entries missing from, or present in, the
+        device table are programmed, with one ip and one bridge call per
+        device when the fdb_batch option is set.
+        """
+        table = self.get_fdb_table(interface)
+        neigh_added = list(ips_added)
+        neigh_removed = list(ips_removed)
+        bridge_cmds = []
+        for agent_ip, ports in (removed or {}).items():
+            for mac, ip in ports:
+                if mac != constants.FLOODING_ENTRY[0]:
+                    neigh_removed.append((mac, ip))
+                elif self.vxlan_mode != lconst.VXLAN_UCAST:
+                    continue
+                if (mac, agent_ip) in table.bridge:
+                    table.bridge.remove((mac, agent_ip))
+                    bridge_cmds.append(['fdb', 'del', mac, 'dev', interface,
+                                        'dst', agent_ip])
+        for agent_ip, ports in (added or {}).items():
+            for mac, ip in ports:
+                if mac != constants.FLOODING_ENTRY[0]:
+                    neigh_added.append((mac, ip))
+                    if (mac, agent_ip) not in table.bridge:
+                        # the port may have moved from another host
+                        table.bridge.difference_update(
+                            [e for e in table.bridge if e[0] == mac])
+                        table.bridge.add((mac, agent_ip))
+                        bridge_cmds.append(['fdb', 'replace', mac,
+                                            'dev', interface,
+                                            'dst', agent_ip])
+                elif (self.vxlan_mode == lconst.VXLAN_UCAST and
+                      (mac, agent_ip) not in table.bridge):
+                    # each remote host gets its own flooding entry
+                    operation = 'add'
+                    if any(e[0] == mac for e in table.bridge):
+                        operation = 'append'
+                    table.bridge.add((mac, agent_ip))
+                    bridge_cmds.append(['fdb', operation, mac,
+                                        'dev', interface, 'dst', agent_ip])
+        neigh_cmds = self._neigh_cmds(table, interface,
+                                      neigh_added, neigh_removed)
+        self._apply_fdb_commands(interface, neigh_cmds, bridge_cmds)
 
     def add_fdb_ip_entry(self, mac, ip, interface):
-        utils.execute(['ip', 'neigh', 'add', ip, 'lladdr', mac,
-                       'dev', interface, 'nud', 'permanent'],
-                      root_helper=self.root_helper,
-                      check_exit_code=False)
+        self.update_fdb_entries(interface, ips_added=[(mac, ip)])
 
     def remove_fdb_ip_entry(self, mac, ip, interface):
-        utils.execute(['ip', 'neigh', 'del', ip, 'lladdr', mac,
-                       'dev', interface],
-                      root_helper=self.root_helper,
-                      check_exit_code=False)
-
-    def add_fdb_bridge_entry(self, mac, agent_ip, interface, operation="add"):
-        utils.execute(['bridge', 'fdb', operation, mac, 'dev', interface,
-                       'dst', agent_ip],
-                      root_helper=self.root_helper,
-                      check_exit_code=False)
-
-    def remove_fdb_bridge_entry(self, mac, agent_ip, interface):
-        utils.execute(['bridge', 'fdb', 'del', mac, 'dev', interface,
-                       'dst', agent_ip],
-                      root_helper=self.root_helper,
-                      check_exit_code=False)
+        self.update_fdb_entries(interface, ips_removed=[(mac, ip)])
 
     def add_fdb_entries(self, agent_ip, ports, interface):
-        for mac, ip in ports:
-            if mac != constants.FLOODING_ENTRY[0]:
-                self.add_fdb_ip_entry(mac, ip, interface)
-                self.add_fdb_bridge_entry(mac, agent_ip, interface)
-            elif self.vxlan_mode == lconst.VXLAN_UCAST:
-                if self.fdb_bridge_entry_exists(mac, interface):
-                    self.add_fdb_bridge_entry(mac, agent_ip, interface,
-                                              "append")
-                else:
-                    self.add_fdb_bridge_entry(mac, agent_ip, interface)
+        self.update_fdb_entries(interface, added={agent_ip: ports})
 
     def remove_fdb_entries(self, agent_ip, ports, interface):
-        for mac, ip in ports:
-            if mac != constants.FLOODING_ENTRY[0]:
-                self.remove_fdb_ip_entry(mac, ip, interface)
-                self.remove_fdb_bridge_entry(mac, agent_ip, interface)
-            elif self.vxlan_mode == lconst.VXLAN_UCAST:
-                self.remove_fdb_bridge_entry(mac, agent_ip, interface)
+        self.update_fdb_entries(interface, removed={agent_ip: ports})
 
 
 class LinuxBridgeRpcCallbacks(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
@@ -633,7 +772,7 @@ class LinuxBridgeRpcCallbacks(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
         # Check port exists on node
         port = kwargs.get('port')
         tap_device_name = self.agent.br_mgr.get_tap_device_name(port['id'])
-        devices = self.agent.br_mgr.udev_get_tap_devices()
+        devices = self.agent.br_mgr.get_tap_devices()
         if tap_device_name not in devices:
             return
 
@@ -681,6 +820,11 @@ class LinuxBridgeRpcCallbacks(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
         except rpc_common.Timeout:
             LOG.error(_("RPC timeout while updating port %s"), port['id'])
 
+    def _get_remote_ports(self, agent_ports):
+        return dict((agent_ip, ports)
+                    for agent_ip, ports in agent_ports.items()
+                    if agent_ip != self.agent.br_mgr.local_ip)
+
     def fdb_add(self, context, fdb_entries):
         LOG.debug(_("fdb_add received"))
         for network_id, values in fdb_entries.items():
@@ -694,14 +838,10 @@ class LinuxBridgeRpcCallbacks(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
             interface = self.agent.br_mgr.get_vxlan_device_name(
                 segment.segmentation_id)
 
-            agent_ports = values.get('ports')
-            for agent_ip, ports in agent_ports.items():
-                if agent_ip == self.agent.br_mgr.local_ip:
-                    continue
-
-                self.agent.br_mgr.add_fdb_entries(agent_ip,
-                                                  ports,
-                                                  interface)
+            agent_ports = self._get_remote_ports(values.get('ports'))
+            if agent_ports:
+                self.agent.br_mgr.update_fdb_entries(interface,
+                                                     added=agent_ports)
 
     def fdb_remove(self, context, fdb_entries):
         LOG.debug(_("fdb_remove received"))
@@ -716,14 +856,10 @@ class LinuxBridgeRpcCallbacks(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
             interface = self.agent.br_mgr.get_vxlan_device_name(
                 segment.segmentation_id)
 
-            agent_ports = values.get('ports')
-            for agent_ip, ports in agent_ports.items():
-                if agent_ip == self.agent.br_mgr.local_ip:
-                    continue
-
-                self.agent.br_mgr.remove_fdb_entries(agent_ip,
-                                                     ports,
-                                                     interface)
+            agent_ports = self._get_remote_ports(values.get('ports'))
+            if agent_ports:
+                self.agent.br_mgr.update_fdb_entries(interface,
+                                                     removed=agent_ports)
 
     def _fdb_chg_ip(self, context, fdb_entries):
         LOG.debug(_("update chg_ip received"))
@@ -738,17 +874,16 @@ class LinuxBridgeRpcCallbacks(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
             interface = self.agent.br_mgr.get_vxlan_device_name(
                 segment.segmentation_id)
 
-            for agent_ip, state in agent_ports.items():
-                if agent_ip == self.agent.br_mgr.local_ip:
-                    continue
-
-                after = state.get('after')
-                for mac, ip in after:
-                    self.agent.br_mgr.add_fdb_ip_entry(mac, ip, interface)
-
-                before = state.get('before')
-                for mac, ip in before:
-                    self.agent.br_mgr.remove_fdb_ip_entry(mac, ip, interface)
+            after = []
+            before = []
+            for agent_ip, state in self._get_remote_ports(
+                    agent_ports).items():
+                after.extend(state.get('after'))
+                before.extend(state.get('before'))
+            if after or before:
+                self.agent.br_mgr.update_fdb_entries(interface,
+                                                     ips_added=after,
+                                                     ips_removed=before)
 
     def fdb_update(self, context, fdb_entries):
         LOG.debug(_("fdb_update received"))
@@ -798,7 +933,7 @@ class LinuxBridgeNeutronAgentRPC(sg_rpc.SecurityGroupAgentRpcMixin):
 
     def _report_state(self):
         try:
-            devices = len(self.br_mgr.udev_get_tap_devices())
+            devices = len(self.br_mgr.get_tap_devices())
             self.agent_state.get('configurations')['devices'] = devices
             self.state_rpc.report_state(self.context,
                                         self.agent_state)
@@ -847,6 +982,12 @@ class LinuxBridgeNeutronAgentRPC(sg_rpc.SecurityGroupAgentRpcMixin):
 
     def setup_linux_bridge(self, interface_mappings):
         self.br_mgr = LinuxBridgeManager(interface_mappings, self.root_helper)
+        if cfg.CONF.AGENT.minimize_polling:
+            try:
+                self.br_mgr.start_udev_monitor()
+            except Exception:
+                LOG.exception(_("Unable to monitor udev events, devices "
+                                "will be polled"))
 
     def remove_port_binding(self, network_id, interface_id):
         bridge_name = self.br_mgr.get_bridge_name(network_id)
@@ -932,7 +1073,7 @@ class LinuxBridgeNeutronAgentRPC(sg_rpc.SecurityGroupAgentRpcMixin):
                 LOG.info(_("Port %s updated."), device)
             else:
                 LOG.debug(_("Device %s not defined on plugin"), device)
-            self.br_mgr.remove_empty_bridges()
+        self.br_mgr.remove_empty_bridges()
         return resync
 
     def daemon_loop(self):
@@ -946,6 +1087,7 @@ class LinuxBridgeNeutronAgentRPC(sg_rpc.SecurityGroupAgentRpcMixin):
             if sync:
                 LOG.info(_("Agent out of sync with plugin!"))
                 devices.clear()
+                self.br_mgr.resync_tap_devices()
                 sync = False
             device_info = {}
             try:
@@ -53,6 +53,11 @@ vxlan_opts = [
                 help=_("Extension to use alongside ml2 plugin's l2population "
                        "mechanism driver. It enables the plugin to populate "
                        "VXLAN forwarding table.")),
+    cfg.BoolOpt('fdb_batch', default=False,
+                help=_("Program the forwarding entries of each VXLAN device "
+                       "with single 'ip -batch' and 'bridge -batch' calls. "
+                       "The root helper must allow these commands, whose "
+                       "input it cannot filter.")),
 ]
 
 bridge_opts = [
@@ -65,6 +70,10 @@ agent_opts = [
     cfg.IntOpt('polling_interval', default=2,
                help=_("The number of seconds the agent will wait between "
                       "polling for local device changes.")),
+    cfg.BoolOpt('minimize_polling', default=False,
+                help=_("Minimize polling by tracking the tap devices from "
+                       "udev events instead of listing all the devices of "
+                       "the host at each polling interval.")),
     cfg.BoolOpt('rpc_support_old_agents', default=False,
                 help=_("Enable server RPC compatibility with old agents")),
 ]
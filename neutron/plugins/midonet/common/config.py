@@ -40,7 +40,12 @@ midonet_opts = [
                help=_('Operational mode. Internal dev use only.')),
     cfg.StrOpt('midonet_host_uuid_path',
                default='/etc/midolman/host_uuid.properties',
-               help=_('Path to midonet host uuid file'))
+               help=_('Path to midonet host uuid file')),
+    cfg.IntOpt('cache_ttl',
+               default=0,
+               help=_('Number of seconds MidoNet bridges, routers, ports, '
+                      'chains and port groups are cached. 0 caches them '
+                      'only while an API call is handled.'))
 ]
 
 
@@ -21,15 +21,28 @@
 # @author: Rossella Sblendido, Midokura Japan KK
 # @author: Duarte Nunes, Midokura Japan KK
 
+import contextlib
+import hashlib
+import threading
+import time
+
 from midonetclient import exc
 from webob import exc as w_exc
 
 from neutron.common import exceptions as n_exc
+from neutron.openstack.common import jsonutils
 from neutron.openstack.common import log as logging
 from neutron.plugins.midonet.common import net_util
 
 LOG = logging.getLogger(__name__)
 
+# Rule property holding the digest of the rule fields, used to tell which
+# rules of a chain have to be changed when it is synchronized
+OS_RULE_DIGEST_KEY = 'OS_RULE_DIGEST'
+
+# Number of cached DTOs above which expired ones are purged
+CACHE_PURGE_SIZE = 1024
+
 
 def handle_api_error(fn):
     """Wrapper for methods that throws custom exceptions."""
@@ -50,10 +63,85 @@ class MidonetApiException(n_exc.NeutronException):
     message = _("MidoNet API error: %(msg)s")
 
 
+def _rule_digest(action, fields):
+    rule = dict(fields, action=action)
+    rule.pop('position', None)
+    rule.pop('properties', None)
+    return hashlib.md5(jsonutils.dumps(rule, sort_keys=True)).hexdigest()
+
+
 class MidoClient:
 
-    def __init__(self, mido_api):
+    def __init__(self, mido_api, cache_ttl=0):
         self.mido_api = mido_api
+        self.cache_ttl = cache_ttl
+        # DTOs kept for cache_ttl seconds, keyed by (resource type, id)
+        self._cache = {}
+        # DTOs kept until the end of the request scope of the current thread
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def request_scope(self):
+        """Reuse the DTOs fetched by the current thread within the block
+
+        Lookups done inside the block hit the MidoNet API at most once per
+        resource, unless the resource is written in between. Nested scopes
+        share the cache of the outermost one.
+        """
+        if getattr(self._local, 'dtos', None) is not None:
+            yield
+            return
+        self._local.dtos = {}
+        try:
+            yield
+        finally:
+            self._local.dtos = None
+
+    def _get_cached(self, key, fetch):
+        dtos = getattr(self._local, 'dtos', None)
+        if dtos is not None and key in dtos:
+            return dtos[key]
+        now = time.time()
+        entry = self._cache.get(key)
+        if entry and entry[0] > now:
+            dto = entry[1]
+        else:
+            dto = fetch()
+            if self.cache_ttl > 0:
+                if len(self._cache) >= CACHE_PURGE_SIZE:
+                    self._purge_cache(now)
+                self._cache[key] = (now + self.cache_ttl, dto)
+        if dtos is not None:
+            dtos[key] = dto
+        return dto
+
+    def _purge_cache(self, now):
+        for key, (expires, _dto) in self._cache.items():
+            if expires <= now:
+                del self._cache[key]
+
+    def _invalidate(self, *keys):
+        dtos = getattr(self._local, 'dtos', None) or {}
+        for key in keys:
+            self._cache.pop(key, None)
+            dtos.pop(key, None)
+
+    def _invalidate_type(self, resource_type):
+        dtos = getattr(self._local, 'dtos', None) or {}
+        for cache in (self._cache, dtos):
+            for key in cache.keys():
+                if key[0] == resource_type:
+                    del cache[key]
+
+    def _get_chains(self, tenant_id):
+        return self._get_cached(
+            ('chains', tenant_id),
+            lambda: self.mido_api.get_chains({'tenant_id': tenant_id}))
+
+    def _get_port_groups(self, tenant_id):
+        return self._get_cached(
+            ('port_groups', tenant_id),
+            lambda: self.mido_api.get_port_groups({'tenant_id': tenant_id}))
 
     @classmethod
     def _fill_dto(cls, dto, fields):
@@ -92,6 +180,7 @@ class MidoClient:
         :param id: id of the bridge
         """
         LOG.debug(_("MidoClient.delete_bridge called: id=%(id)s"), {'id': id})
+        self._invalidate(('bridge', id))
         return self.mido_api.delete_bridge(id)
 
     @handle_api_error
@@ -103,7 +192,8 @@ class MidoClient:
         """
         LOG.debug(_("MidoClient.get_bridge called: id=%s"), id)
         try:
-            return self.mido_api.get_bridge(id)
+            return self._get_cached(('bridge', id),
+                                    lambda: self.mido_api.get_bridge(id))
         except w_exc.HTTPNotFound:
             raise MidonetResourceNotFound(resource_type='Bridge', id=id)
 
@@ -118,6 +208,7 @@ class MidoClient:
         LOG.debug(_("MidoClient.update_bridge called: "
                     "id=%(id)s, kwargs=%(kwargs)s"),
                   {'id': id, 'kwargs': kwargs})
+        self._invalidate(('bridge', id))
         try:
             return self._update_dto(self.mido_api.get_bridge(id), kwargs)
         except w_exc.HTTPNotFound:
@@ -235,6 +326,7 @@ class MidoClient:
         if delete_chains:
             self.delete_port_chains(id)
 
+        self._invalidate(('port', id))
         self.mido_api.delete_port(id)
 
     @handle_api_error
@@ -246,7 +338,8 @@ class MidoClient:
         """
         LOG.debug(_("MidoClient.get_port called: id=%(id)s"), {'id': id})
         try:
-            return self.mido_api.get_port(id)
+            return self._get_cached(('port', id),
+                                    lambda: self.mido_api.get_port(id))
         except w_exc.HTTPNotFound:
             raise MidonetResourceNotFound(resource_type='Port', id=id)
 
@@ -273,6 +366,7 @@ class MidoClient:
         LOG.debug(_("MidoClient.update_port called: "
                     "id=%(id)s, kwargs=%(kwargs)s"),
                   {'id': id, 'kwargs': kwargs})
+        self._invalidate(('port', id))
         try:
             return self._update_dto(self.mido_api.get_port(id), kwargs)
         except w_exc.HTTPNotFound:
@@ -306,6 +400,7 @@ class MidoClient:
         :param id: id of the router
         """
         LOG.debug(_("MidoClient.delete_router called: id=%(id)s"), {'id': id})
+        self._invalidate(('router', id))
         return self.mido_api.delete_router(id)
 
     @handle_api_error
@@ -317,7 +412,8 @@ class MidoClient:
         """
         LOG.debug(_("MidoClient.get_router called: id=%(id)s"), {'id': id})
         try:
-            return self.mido_api.get_router(id)
+            return self._get_cached(('router', id),
+                                    lambda: self.mido_api.get_router(id))
         except w_exc.HTTPNotFound:
             raise MidonetResourceNotFound(resource_type='Router', id=id)
 
@@ -332,6 +428,7 @@ class MidoClient:
         LOG.debug(_("MidoClient.update_router called: "
                     "id=%(id)s, kwargs=%(kwargs)s"),
                   {'id': id, 'kwargs': kwargs})
+        self._invalidate(('router', id))
         try:
             return self._update_dto(self.mido_api.get_router(id), kwargs)
         except w_exc.HTTPNotFound:
@@ -370,6 +467,7 @@ class MidoClient:
     @handle_api_error
     def link(self, port, peer_id):
         """Link a port to a given peerId."""
+        self._invalidate(('port', port.get_id()), ('port', peer_id))
         self.mido_api.link(port, peer_id)
 
     @handle_api_error
@@ -393,6 +491,8 @@ class MidoClient:
         LOG.debug(_("MidoClient.unlink called: port=%(port)s"),
                   {'port': port})
         if port.get_peer_id():
+            self._invalidate(('port', port.get_id()),
+                             ('port', port.get_peer_id()))
             self.mido_api.unlink(port)
         else:
             LOG.warn(_("Attempted to unlink a port that was not linked. %s"),
@@ -440,6 +540,8 @@ class MidoClient:
         outbound_chain = self.mido_api.add_chain().tenant_id(tenant_id).name(
             outbound_chain_name).create()
 
+        self._invalidate(('router', router.get_id()), ('chains', tenant_id))
+
         # set chains to in/out filters
         router.inbound_filter_id(inbound_chain.get_id()).outbound_filter_id(
             outbound_chain.get_id()).update()
@@ -454,6 +556,7 @@ class MidoClient:
         LOG.debug(_("MidoClient.delete_router_chains called: "
                     "id=%(id)s"), {'id': id})
         router = self.get_router(id)
+        self._invalidate_type('chains')
         if (router.get_inbound_filter_id()):
             self.mido_api.delete_chain(router.get_inbound_filter_id())
 
@@ -469,6 +572,7 @@ class MidoClient:
         LOG.debug(_("MidoClient.delete_port_chains called: "
                     "id=%(id)s"), {'id': id})
         port = self.get_port(id)
+        self._invalidate_type('chains')
         if (port.get_inbound_filter_id()):
             self.mido_api.delete_chain(port.get_inbound_filter_id())
 
@@ -593,6 +697,7 @@ class MidoClient:
                     "outbound_chain_id=%(outbound_chain_id)s"),
                   {"port": port, "inbound_chain_id": inbound_chain_id,
                    "outbound_chain_id": outbound_chain_id})
+        self._invalidate(('port', port.get_id()))
         port.inbound_filter_id(inbound_chain_id).outbound_filter_id(
             outbound_chain_id).update()
 
@@ -601,6 +706,7 @@ class MidoClient:
         """Create a new chain."""
         LOG.debug(_("MidoClient.create_chain called: tenant_id=%(tenant_id)s "
                     " name=%(name)s"), {"tenant_id": tenant_id, "name": name})
+        self._invalidate(('chains', tenant_id))
         return self.mido_api.add_chain().tenant_id(tenant_id).name(
             name).create()
 
@@ -608,6 +714,7 @@ class MidoClient:
     def delete_chain(self, id):
         """Delete chain matching the ID."""
         LOG.debug(_("MidoClient.delete_chain called: id=%(id)s"), {"id": id})
+        self._invalidate_type('chains')
         self.mido_api.delete_chain(id)
 
     @handle_api_error
@@ -616,7 +723,8 @@ class MidoClient:
         LOG.debug(_("MidoClient.delete_chains_by_names called: "
                     "tenant_id=%(tenant_id)s names=%(names)s "),
                   {"tenant_id": tenant_id, "names": names})
-        chains = self.mido_api.get_chains({'tenant_id': tenant_id})
+        chains = self._get_chains(tenant_id)
+        self._invalidate(('chains', tenant_id))
         for c in chains:
             if c.get_name() in names:
                 self.mido_api.delete_chain(c.get_id())
@@ -627,7 +735,7 @@ class MidoClient:
         LOG.debug(_("MidoClient.get_chain_by_name called: "
                     "tenant_id=%(tenant_id)s name=%(name)s "),
                   {"tenant_id": tenant_id, "name": name})
-        for c in self.mido_api.get_chains({'tenant_id': tenant_id}):
+        for c in self._get_chains(tenant_id):
             if c.get_name() == name:
                 return c
         return None
@@ -638,7 +746,7 @@ class MidoClient:
         LOG.debug(_("MidoClient.get_port_group_by_name called: "
                     "tenant_id=%(tenant_id)s name=%(name)s "),
                   {"tenant_id": tenant_id, "name": name})
-        for p in self.mido_api.get_port_groups({'tenant_id': tenant_id}):
+        for p in self._get_port_groups(tenant_id):
             if p.get_name() == name:
                 return p
         return None
@@ -652,6 +760,7 @@ class MidoClient:
         LOG.debug(_("MidoClient.create_port_group called: "
                     "tenant_id=%(tenant_id)s name=%(name)s"),
                   {"tenant_id": tenant_id, "name": name})
+        self._invalidate(('port_groups', tenant_id))
         return self.mido_api.add_port_group().tenant_id(tenant_id).name(
             name).create()
 
@@ -661,7 +770,8 @@ class MidoClient:
         LOG.debug(_("MidoClient.delete_port_group_by_name called: "
                     "tenant_id=%(tenant_id)s name=%(name)s "),
                   {"tenant_id": tenant_id, "name": name})
-        pgs = self.mido_api.get_port_groups({'tenant_id': tenant_id})
+        pgs = self._get_port_groups(tenant_id)
+        self._invalidate(('port_groups', tenant_id))
         for pg in pgs:
             if pg.get_name() == name:
                 LOG.debug(_("Deleting pg %(id)s"), {"id": pg.get_id()})
@@ -694,3 +804,68 @@ class MidoClient:
     def add_chain_rule(self, chain, action='accept', **kwargs):
         """Create a new accept chain rule."""
         self.mido_api.add_chain_rule(chain, action, **kwargs)
+
+    def _add_digest_rule(self, chain, action, fields, digest, position):
+        fields = dict(fields, position=position)
+        fields['properties'] = dict(fields.get('properties') or {})
+        fields['properties'][OS_RULE_DIGEST_KEY] = digest
+        self.mido_api.add_chain_rule(chain, action, **fields)
+
+    @handle_api_error
+    def add_chain_rules(self, chain, rules):
+        """Insert rules at the head of a chain, typically a new one
+
+        :param chain: chain to add the rules to
+        :param rules: list of (action, fields) tuples in chain order
+        """
+        LOG.debug(_("MidoClient.add_chain_rules called: chain=%(chain)s "
+                    "rules=%(rules)s"), {"chain": chain, "rules": rules})
+        for position, (action, fields) in enumerate(rules, 1):
+            self._add_digest_rule(chain, action, fields,
+                                  _rule_digest(action, fields), position)
+
+    @handle_api_error
+    def sync_chain_rules(self, chain, rules):
+        """Make the rules of a chain match the given rules
+
+        Only the rules which differ are changed: the rules of the chain
+        which are not given are deleted and the missing ones are inserted
+        after the given rule preceding them.  The rules are compared with
+        the digest stored in their properties, rules without a digest are
+        replaced.
+
+        :param chain: chain to synchronize
+        :param rules: list of (action, fields) tuples in chain order
+        :returns: number of rules added and deleted
+        """
+        LOG.debug(_("MidoClient.sync_chain_rules called: chain=%(chain)s "
+                    "rules=%(rules)s"), {"chain": chain, "rules": rules})
+        wanted = []
+        wanted_digests = set()
+        for action, fields in rules:
+            digest = _rule_digest(action, fields)
+            if digest not in wanted_digests:
+                wanted.append((digest, action, fields))
+                wanted_digests.add(digest)
+
+        current = []
+        deleted = 0
+        for r in chain.get_rules():
+            digest = (r.get_properties() or {}).get(OS_RULE_DIGEST_KEY)
+            if digest in wanted_digests and digest not in current:
+                current.append(digest)
+            else:
+                self.mido_api.delete_rule(r.get_id())
+                deleted += 1
+
+        added = 0
+        index = 0
+        for digest, action, fields in wanted:
+            if digest in current:
+                index = current.index(digest) + 1
+                continue
+            self._add_digest_rule(chain, action, fields, digest, index + 1)
+            current.insert(index, digest)
+            index += 1
+            added += 1
+        return added + deleted
@@ -22,6 +22,8 @@
 # @author: Rossella Sblendido, Midokura Japan KK
 # @author: Duarte Nunes, Midokura Japan KK
 
+import functools
+
 from midonetclient import api
 from oslo.config import cfg
 from sqlalchemy.orm import exc as sa_exc
@@ -167,6 +169,46 @@ def _is_dhcp_port(port):
     return device_owner.startswith('network:dhcp')
 
 
+def _chain_rule(action, **kwargs):
+    """Get the action and fields of a chain rule for the MidoNet client."""
+    nw_proto = kwargs.get("nw_proto")
+    src_addr = kwargs.pop("src_addr", None)
+    dst_addr = kwargs.pop("dst_addr", None)
+    src_port_from = kwargs.pop("src_port_from", None)
+    src_port_to = kwargs.pop("src_port_to", None)
+    dst_port_from = kwargs.pop("dst_port_from", None)
+    dst_port_to = kwargs.pop("dst_port_to", None)
+
+    # Convert to the keys and values that midonet client understands
+    if src_addr:
+        kwargs["nw_src_addr"], kwargs["nw_src_length"] = net_util.net_addr(
+            src_addr)
+
+    if dst_addr:
+        kwargs["nw_dst_addr"], kwargs["nw_dst_length"] = net_util.net_addr(
+            dst_addr)
+
+    kwargs["tp_src"] = {"start": src_port_from, "end": src_port_to}
+
+    kwargs["tp_dst"] = {"start": dst_port_from, "end": dst_port_to}
+
+    if nw_proto == 1:  # ICMP
+        # Overwrite port fields regardless of the direction
+        kwargs["tp_src"] = {"start": src_port_from, "end": src_port_from}
+        kwargs["tp_dst"] = {"start": dst_port_to, "end": dst_port_to}
+
+    return action, kwargs
+
+
+def _request_scope(fn):
+    """Reuse the MidoNet resources fetched while handling a call."""
+    @functools.wraps(fn)
+    def wrapped(self, *args, **kwargs):
+        with self.client.request_scope():
+            return fn(self, *args, **kwargs)
+    return wrapped
+
+
 def _check_resource_exists(func, id, name, raise_exc=False):
     """Check whether the given resource exists in MidoNet data store."""
     try:
@@ -221,7 +263,8 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         self.mido_api = api.MidonetApi(midonet_uri, admin_user,
                                        admin_pass,
                                        project_id=admin_project_id)
-        self.client = midonet_lib.MidoClient(self.mido_api)
+        self.client = midonet_lib.MidoClient(
+            self.mido_api, cache_ttl=midonet_conf.cache_ttl)
 
         # self.provider_router_id should have been set.
         if self.provider_router_id is None:
@@ -263,54 +306,55 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                 continue
             yield subnet['cidr'], fixed_ip["ip_address"]
 
-    def _initialize_port_chains(self, port, in_chain, out_chain, sg_ids):
-
+    def _port_chain_rules(self, port, sg_ids):
+        """Get the rules of the inbound and outbound chains of a port."""
         tenant_id = port["tenant_id"]
 
-        position = 1
         # mac spoofing protection
-        self._add_chain_rule(in_chain, action='drop',
-                             dl_src=port["mac_address"], inv_dl_src=True,
-                             position=position)
+        in_rules = [_chain_rule('drop', dl_src=port["mac_address"],
+                                inv_dl_src=True)]
 
         # ip spoofing protection
         for fixed_ip in port["fixed_ips"]:
-            position += 1
-            self._add_chain_rule(in_chain, action="drop",
-                                 src_addr=fixed_ip["ip_address"] + "/32",
-                                 inv_nw_src=True, dl_type=0x0800,  # IPv4
-                                 position=position)
+            in_rules.append(_chain_rule(
+                'drop', src_addr=fixed_ip["ip_address"] + "/32",
+                inv_nw_src=True, dl_type=0x0800))  # IPv4
 
         # conntrack
-        position += 1
-        self._add_chain_rule(in_chain, action='accept',
-                             match_forward_flow=True,
-                             position=position)
-
-        # Reset the position to process egress
-        position = 1
+        in_rules.append(_chain_rule('accept', match_forward_flow=True))
 
         # Add rule for SGs
-        if sg_ids:
-            for sg_id in sg_ids:
-                chain_name = _sg_chain_names(sg_id)["ingress"]
-                chain = self.client.get_chain_by_name(tenant_id, chain_name)
-                self._add_chain_rule(out_chain, action='jump',
-                                     jump_chain_id=chain.get_id(),
-                                     jump_chain_name=chain_name,
-                                     position=position)
-                position += 1
+        out_rules = []
+        for sg_id in sorted(sg_ids or []):
+            chain_name = _sg_chain_names(sg_id)["ingress"]
+            chain = self.client.get_chain_by_name(tenant_id, chain_name)
+            out_rules.append(_chain_rule('jump',
+                                         jump_chain_id=chain.get_id(),
+                                         jump_chain_name=chain_name))
 
         # add reverse flow matching at the end
-        self._add_chain_rule(out_chain, action='accept',
-                             match_return_flow=True,
-                             position=position)
-        position += 1
+        out_rules.append(_chain_rule('accept', match_return_flow=True))
 
         # fall back DROP rule at the end except for ARP
-        self._add_chain_rule(out_chain, action='drop',
-                             dl_type=0x0806,  # ARP
-                             inv_dl_type=True, position=position)
+        out_rules.append(_chain_rule('drop', dl_type=0x0806,  # ARP
+                                     inv_dl_type=True))
+        return {'inbound': in_rules, 'outbound': out_rules}
+
+    def _initialize_port_chains(self, port, in_chain, out_chain, sg_ids):
+        rules = self._port_chain_rules(port, sg_ids)
+        self.client.add_chain_rules(in_chain, rules['inbound'])
+        self.client.add_chain_rules(out_chain, rules['outbound'])
+
+    def _update_port_chains(self, port, sg_ids):
+        """Apply the changed addresses and security groups of a port."""
+        rules = self._port_chain_rules(port, sg_ids)
+        for d, name in _port_chain_names(port["id"]).iteritems():
+            chain = self.client.get_chain_by_name(port["tenant_id"], name)
+            if chain is None:
+                LOG.warn(_("No %(name)s chain for port %(id)s in MidoNet."),
+                         {"name": name, "id": port["id"]})
+                continue
+            self.client.sync_chain_rules(chain, rules[d])
 
     def _bind_port_to_sgs(self, context, port, sg_ids):
         self._process_port_create_security_group(context, port, sg_ids)
@@ -390,6 +434,7 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         # Consume from all consumers in a thread
         self.conn.consume_in_thread()
 
+    @_request_scope
     def create_subnet(self, context, subnet):
         """Create Neutron subnet.
 
@@ -431,6 +476,7 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                   sn_entry)
         return sn_entry
 
+    @_request_scope
     def delete_subnet(self, context, id):
         """Delete Neutron subnet.
 
@@ -522,6 +568,7 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                       'had been deleted'), id)
             raise
 
+    @_request_scope
     def create_port(self, context, port):
         """Create a L2 port in Neutron/MidoNet."""
         LOG.debug(_("MidonetPluginV2.create_port called: port=%r"), port)
@@ -618,6 +665,7 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                                                        fields)
         return ports
 
+    @_request_scope
     def delete_port(self, context, id, l3_port_check=True):
         """Delete a neutron port and corresponding MidoNet bridge port."""
         LOG.debug(_("MidonetPluginV2.delete_port called: id=%(id)s "
@@ -659,6 +707,7 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
 
         super(MidonetPluginV2, self).delete_port(context, id)
 
+    @_request_scope
     def update_port(self, context, id, port):
         """Handle port update, including security groups and fixed IPs."""
         with context.session.begin(subtransactions=True):
@@ -703,11 +752,20 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                         self.client.add_dhcp_host(
                             bridge, cidr, ip, mac)
 
-            if (self._check_update_deletes_security_groups(port) or
-                    self._check_update_has_security_groups(port)):
+            sgs_changed = (
+                self._check_update_deletes_security_groups(port) or
+                self._check_update_has_security_groups(port))
+            if sgs_changed:
                 self._unbind_port_from_sgs(context, p["id"])
                 sg_ids = self._get_security_groups_on_port(context, port)
                 self._bind_port_to_sgs(context, p, sg_ids)
+            else:
+                sg_ids = p.get(ext_sg.SECURITYGROUPS)
+
+            # Only the rules affected by the change are rewritten
+            if _is_vif_port(p) and (sgs_changed or
+                                    "fixed_ips" in port["port"]):
+                self._update_port_chains(p, sg_ids)
 
             self._process_portbindings_create_and_update(context,
                                                          port['port'],
@@ -851,6 +909,7 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                     r.get_dst_network_length() == 0):
                 self.client.delete_route(r.get_id())
 
+    @_request_scope
     def update_router(self, context, id, router):
         """Handle router updates."""
         LOG.debug(_("MidonetPluginV2.update_router called: id=%(id)s "
@@ -896,6 +955,7 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         LOG.debug(_("MidonetPluginV2.update_router exiting: router=%r"), r)
         return r
 
+    @_request_scope
     def delete_router(self, context, id):
         """Handler for router deletion.
 
@@ -1002,6 +1062,7 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         self.client.delete_port_routes(routes, bridge_port.get_peer_id())
         self.client.unlink(bridge_port)
 
+    @_request_scope
     def add_router_interface(self, context, router_id, interface_info):
         """Handle router linking with network."""
         LOG.debug(_("MidonetPluginV2.add_router_interface called: "
@@ -1073,6 +1134,7 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                                        link_port.get_id(),
                                        nat_type, **props)
 
+    @_request_scope
     def create_floatingip(self, context, floatingip):
         session = context.session
         with session.begin(subtransactions=True):
@@ -1082,6 +1144,7 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                 self._assoc_fip(fip)
         return fip
 
+    @_request_scope
     def update_floatingip(self, context, id, floatingip):
         """Handle floating IP association and disassociation."""
         LOG.debug(_("MidonetPluginV2.update_floatingip called: id=%(id)s "
@@ -1106,6 +1169,7 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         LOG.debug(_("MidonetPluginV2.update_floating_ip exiting: fip=%s"), fip)
         return fip
 
+    @_request_scope
     def disassociate_floatingips(self, context, port_id):
         """Disassociate floating IPs (if any) from this port."""
         try:
@@ -1117,6 +1181,7 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
 
         super(MidonetPluginV2, self).disassociate_floatingips(context, port_id)
 
+    @_request_scope
     def create_security_group(self, context, security_group, default_sg=False):
         """Create security group.
 
@@ -1237,31 +1302,5 @@ class MidonetPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                 context, sg_rule_id)
 
     def _add_chain_rule(self, chain, action, **kwargs):
-
-        nw_proto = kwargs.get("nw_proto")
-        src_addr = kwargs.pop("src_addr", None)
-        dst_addr = kwargs.pop("dst_addr", None)
-        src_port_from = kwargs.pop("src_port_from", None)
-        src_port_to = kwargs.pop("src_port_to", None)
-        dst_port_from = kwargs.pop("dst_port_from", None)
-        dst_port_to = kwargs.pop("dst_port_to", None)
-
-        # Convert to the keys and values that midonet client understands
-        if src_addr:
-            kwargs["nw_src_addr"], kwargs["nw_src_length"] = net_util.net_addr(
-                src_addr)
-
-        if dst_addr:
-            kwargs["nw_dst_addr"], kwargs["nw_dst_length"] = net_util.net_addr(
-                dst_addr)
-
-        kwargs["tp_src"] = {"start": src_port_from, "end": src_port_to}
-
-        kwargs["tp_dst"] = {"start": dst_port_from, "end": dst_port_to}
-
-        if nw_proto == 1:  # ICMP
-            # Overwrite port fields regardless of the direction
-            kwargs["tp_src"] = {"start": src_port_from, "end": src_port_from}
-            kwargs["tp_dst"] = {"start": dst_port_to, "end": dst_port_to}
-
+        action, kwargs = _chain_rule(action, **kwargs)
         return self.client.add_chain_rule(chain, action=action, **kwargs)
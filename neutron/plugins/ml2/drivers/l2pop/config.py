@@ -24,6 +24,14 @@ l2_population_options = [
     cfg.IntOpt('agent_boot_time', default=180,
                help=_('Delay within which agent is expected to update '
                       'existing ports whent it restarts')),
+    cfg.IntOpt('fdb_index_size', default=0,
+               help=_('Maximum number of networks whose fdb entries are '
+                      'kept in memory, 0 disables the index. The index is '
+                      'only kept up to date by the port events of its own '
+                      'process and agent ips are never refreshed from the '
+                      'database, only enable it when a single neutron '
+                      'server process handles the ports. It is always '
+                      'disabled when api_workers is set')),
 ]
 
 cfg.CONF.register_opts(l2_population_options, "l2pop")
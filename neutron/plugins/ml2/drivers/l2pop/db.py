@@ -75,3 +75,11 @@ class L2populationDbMixin(base_db.CommonDbMixin):
             query = query.filter(models_v2.Port.network_id == network_id,
                                  ml2_models.PortBinding.host == agent_host)
             return query.count()
+
+    def get_network_port_hosts(self, session, network_id):
+        with session.begin(subtransactions=True):
+            query = session.query(ml2_models.PortBinding.port_id,
+                                  ml2_models.PortBinding.host)
+            query = query.join(models_v2.Port)
+            query = query.filter(models_v2.Port.network_id == network_id)
+            return query
@@ -0,0 +1,199 @@
+# Copyright (c) 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+
+from neutron.common import constants as const
+from neutron.db import api as db_api
+from neutron.openstack.common import lockutils
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+INDEX_LOCK = 'l2pop-fdb-index'
+
+
+def get_port_fdb_entries(port):
+    return [[port['mac_address'],
+             ip['ip_address']] for ip in port['fixed_ips']]
+
+
+class NetworkFdb(object):
+    """fdb state of a single network.
+
+    bound_ports maps each host to the ids of all the ports bound to it,
+    whatever their admin state, fdb_entries maps each host to the fdb
+    entries of its admin up ports, keyed by port id.
+    """
+
+    def __init__(self):
+        self.port_hosts = {}
+        self.bound_ports = {}
+        self.fdb_entries = {}
+
+    def add_port(self, port_id, host, fdb_entries=None):
+        self.port_hosts[port_id] = host
+        self.bound_ports.setdefault(host, set()).add(port_id)
+        if fdb_entries is not None:
+            self.fdb_entries.setdefault(host, {})[port_id] = fdb_entries
+
+    def remove_port(self, port_id):
+        host = self.port_hosts.pop(port_id, None)
+        if host is None:
+            return
+        host_ports = self.bound_ports[host]
+        host_ports.discard(port_id)
+        if not host_ports:
+            del self.bound_ports[host]
+        host_entries = self.fdb_entries.get(host)
+        if host_entries is not None:
+            host_entries.pop(port_id, None)
+            if not host_entries:
+                del self.fdb_entries[host]
+
+
+class FdbIndex(object):
+    """In-memory index of the fdb entries known by the l2pop driver.
+
+    A network is loaded from the database the first time one of its ports
+    is brought up or down, it is then kept up to date by the port events
+    received by the mechanism driver so that neither full fdb dumps nor
+    per host port counts need to hit the database anymore. At most
+    max_networks networks are kept, the least recently used ones are
+    dropped first. The port events only reach the process handling them,
+    the index must be disabled, with max_networks set to 0, when other
+    processes change ports. The database is then read on each call.
+    """
+
+    def __init__(self, db_mixin, max_networks):
+        self.db_mixin = db_mixin
+        self.max_networks = max_networks
+        # network_id->NetworkFdb, in least recently used first order
+        self._networks = collections.OrderedDict()
+        # host->agent ip, None for the hosts without agent
+        self._agent_ips = {}
+
+    def _load_network(self, network_id):
+        network = self._networks.pop(network_id, None)
+        if network is not None:
+            self._networks[network_id] = network
+            return network
+
+        network = NetworkFdb()
+        session = db_api.get_session()
+        for port_id, host in self.db_mixin.get_network_port_hosts(
+                session, network_id):
+            if host:
+                network.add_port(port_id, host)
+        for binding, agent in self.db_mixin.get_network_ports(session,
+                                                              network_id):
+            self._agent_ips[agent.host] = self.db_mixin.get_agent_ip(agent)
+            network.add_port(binding.port_id, binding.host,
+                             get_port_fdb_entries(binding.port))
+
+        self._networks[network_id] = network
+        while len(self._networks) > self.max_networks:
+            self._networks.popitem(last=False)
+        return network
+
+    def _get_agent_ip(self, host):
+        if host not in self._agent_ips:
+            session = db_api.get_session()
+            agent = self.db_mixin.get_agent_by_host(session, host)
+            self._agent_ips[host] = agent and self.db_mixin.get_agent_ip(
+                agent)
+        return self._agent_ips[host]
+
+    def _read_fdb_entries(self, network_id, exclude_host):
+        session = db_api.get_session()
+        ports = {}
+        for binding, agent in self.db_mixin.get_network_ports(session,
+                                                              network_id):
+            if agent.host == exclude_host:
+                continue
+
+            ip = self.db_mixin.get_agent_ip(agent)
+            if not ip:
+                LOG.debug(_("Unable to retrieve the agent ip, check "
+                            "the agent %(agent_host)s configuration."),
+                          {'agent_host': agent.host})
+                continue
+
+            agent_ports = ports.setdefault(ip, [const.FLOODING_ENTRY])
+            agent_ports += get_port_fdb_entries(binding.port)
+        return ports
+
+    @lockutils.synchronized(INDEX_LOCK, 'neutron-')
+    def set_agent_ip(self, host, agent_ip):
+        if self.max_networks:
+            self._agent_ips[host] = agent_ip
+
+    @lockutils.synchronized(INDEX_LOCK, 'neutron-')
+    def get_agent_port_count(self, network_id, host):
+        if not self.max_networks:
+            session = db_api.get_session()
+            return self.db_mixin.get_agent_network_port_count(
+                session, host, network_id)
+        network = self._load_network(network_id)
+        return len(network.bound_ports.get(host, ()))
+
+    @lockutils.synchronized(INDEX_LOCK, 'neutron-')
+    def get_fdb_entries(self, network_id, exclude_host=None):
+        """Return the fdb entries of a network grouped by agent ip."""
+        if not self.max_networks:
+            return self._read_fdb_entries(network_id, exclude_host)
+        network = self._load_network(network_id)
+
+        ports = {}
+        for host, host_entries in network.fdb_entries.iteritems():
+            if host == exclude_host:
+                continue
+
+            ip = self._get_agent_ip(host)
+            if not ip:
+                LOG.debug(_("Unable to retrieve the agent ip, check "
+                            "the agent %(agent_host)s configuration."),
+                          {'agent_host': host})
+                continue
+
+            agent_ports = ports.setdefault(ip, [const.FLOODING_ENTRY])
+            for fdb_entries in host_entries.itervalues():
+                agent_ports += fdb_entries
+        return ports
+
+    @lockutils.synchronized(INDEX_LOCK, 'neutron-')
+    def update_port(self, port):
+        network = self._networks.get(port['network_id'])
+        if network is None:
+            # Not loaded yet, the database will be read on first use
+            return
+
+        network.remove_port(port['id'])
+        host = port.get('binding:host_id')
+        if host:
+            fdb_entries = None
+            if port['admin_state_up']:
+                fdb_entries = get_port_fdb_entries(port)
+            network.add_port(port['id'], host, fdb_entries)
+
+    @lockutils.synchronized(INDEX_LOCK, 'neutron-')
+    def remove_port(self, port):
+        network = self._networks.get(port['network_id'])
+        if network is not None:
+            network.remove_port(port['id'])
+
+    @lockutils.synchronized(INDEX_LOCK, 'neutron-')
+    def remove_network(self, network_id):
+        self._networks.pop(network_id, None)
@@ -26,10 +26,13 @@ from neutron.openstack.common import log as logging
 from neutron.plugins.ml2 import driver_api as api
 from neutron.plugins.ml2.drivers.l2pop import config  # noqa
 from neutron.plugins.ml2.drivers.l2pop import db as l2pop_db
+from neutron.plugins.ml2.drivers.l2pop import fdb_index
 from neutron.plugins.ml2.drivers.l2pop import rpc as l2pop_rpc
 
 LOG = logging.getLogger(__name__)
 
+cfg.CONF.import_opt('api_workers', 'neutron.service')
+
 
 class L2populationMechanismDriver(api.MechanismDriver,
                                   l2pop_db.L2populationDbMixin):
@@ -37,15 +40,27 @@ class L2populationMechanismDriver(api.MechanismDriver,
     def initialize(self):
         LOG.debug(_("Experimental L2 population driver"))
         self.rpc_ctx = n_context.get_admin_context_without_session()
+        # The port events handled by the API workers wouldn't reach the
+        # index of the process answering the agents
+        max_networks = 0
+        if not cfg.CONF.api_workers:
+            max_networks = cfg.CONF.l2pop.fdb_index_size
+        self.fdb_index = fdb_index.FdbIndex(self, max_networks)
 
     def _get_port_fdb_entries(self, port):
-        return [[port['mac_address'],
-                 ip['ip_address']] for ip in port['fixed_ips']]
+        return fdb_index.get_port_fdb_entries(port)
+
+    def delete_network_postcommit(self, context):
+        self.fdb_index.remove_network(context.current['id'])
+
+    def create_port_postcommit(self, context):
+        self.fdb_index.update_port(context.current)
 
     def delete_port_precommit(self, context):
         self.remove_fdb_entries = self._update_port_down(context)
 
     def delete_port_postcommit(self, context):
+        self.fdb_index.remove_port(context.current)
         l2pop_rpc.L2populationAgentNotify.remove_fdb_entries(
             self.rpc_ctx, self.remove_fdb_entries)
 
@@ -92,6 +107,8 @@ class L2populationMechanismDriver(api.MechanismDriver,
         port = context.current
         orig = context.original
 
+        self.fdb_index.update_port(port)
+
         if port['status'] == orig['status']:
             self._fixed_ips_changed(context, orig, port)
         elif port['status'] == const.PORT_STATUS_ACTIVE:
@@ -116,6 +133,7 @@ class L2populationMechanismDriver(api.MechanismDriver,
             LOG.warning(_("Unable to retrieve the agent ip, check the agent "
                           "configuration."))
             return
+        self.fdb_index.set_agent_ip(agent_host, agent_ip)
 
         segment = context.bound_segment
         if not segment:
@@ -142,9 +160,8 @@ class L2populationMechanismDriver(api.MechanismDriver,
         agent_host = port_context['binding:host_id']
         network_id = port_context['network_id']
 
-        session = db_api.get_session()
-        agent_ports = self.get_agent_network_port_count(session, agent_host,
-                                                        network_id)
+        agent_ports = self.fdb_index.get_agent_port_count(network_id,
+                                                          agent_host)
 
         other_fdb_entries = {network_id:
                              {'segment_id': segment['segmentation_id'],
@@ -155,28 +172,12 @@ class L2populationMechanismDriver(api.MechanismDriver,
                 self.get_agent_uptime(agent) < cfg.CONF.l2pop.agent_boot_time):
             # First port plugged on current agent in this network,
             # we have to provide it with the whole list of fdb entries
+            ports = self.fdb_index.get_fdb_entries(network_id,
+                                                   exclude_host=agent_host)
             agent_fdb_entries = {network_id:
                                  {'segment_id': segment['segmentation_id'],
                                   'network_type': segment['network_type'],
-                                  'ports': {}}}
-            ports = agent_fdb_entries[network_id]['ports']
-
-            network_ports = self.get_network_ports(session, network_id)
-            for network_port in network_ports:
-                binding, agent = network_port
-                if agent.host == agent_host:
-                    continue
-
-                ip = self.get_agent_ip(agent)
-                if not ip:
-                    LOG.debug(_("Unable to retrieve the agent ip, check "
-                                "the agent %(agent_host)s configuration."),
-                              {'agent_host': agent.host})
-                    continue
-
-                agent_ports = ports.get(ip, [const.FLOODING_ENTRY])
-                agent_ports += self._get_port_fdb_entries(binding.port)
-                ports[ip] = agent_ports
+                                  'ports': ports}}
 
             # And notify other agents to add flooding entry
             other_fdb_entries[network_id]['ports'][agent_ip].append(
@@ -202,9 +203,8 @@ class L2populationMechanismDriver(api.MechanismDriver,
         agent_host = port_context['binding:host_id']
         network_id = port_context['network_id']
 
-        session = db_api.get_session()
-        agent_ports = self.get_agent_network_port_count(session, agent_host,
-                                                        network_id)
+        agent_ports = self.fdb_index.get_agent_port_count(network_id,
+                                                          agent_host)
 
         other_fdb_entries = {network_id:
                              {'segment_id': segment['segmentation_id'],
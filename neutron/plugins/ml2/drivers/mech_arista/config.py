@@ -63,7 +63,21 @@ ARISTA_DRIVER_OPTS = [
                       'the region name registered (or known) to keystone'
                       'service. Authentication with Keysotne is performed by'
                       'EOS. This is optional. If not set, a value of'
-                      '"RegionOne" is assumed'))
+                      '"RegionOne" is assumed')),
+    cfg.IntOpt('eapi_batch_size',
+               default=500,
+               help=_('Maximum number of commands sent to Arista EOS in a '
+                      'single request when several changes are sent '
+                      'together, as done during synchronization. This is '
+                      'an optional field. If not set, a value of 500 is '
+                      'assumed')),
+    cfg.FloatOpt('port_flush_delay',
+                 default=0,
+                 help=_('Delay in seconds during which new ports are '
+                        'collected before being plugged on Arista EOS in a '
+                        'single request. A value of 0 plugs every port as '
+                        'soon as it is created. This is an optional field. '
+                        'If not set, a value of 0 is assumed'))
 ]
 
 cfg.CONF.register_opts(ARISTA_DRIVER_OPTS, "ml2_arista")
@@ -344,6 +344,48 @@ def get_vms(tenant_id):
         return res
 
 
+def get_networks_by_tenant():
+    """Returns the networks of all tenants in EOS-compatible format.
+
+    The networks of each tenant are formatted as by get_networks().
+    """
+    session = db.get_session()
+    with session.begin():
+        model = AristaProvisionedNets
+        # hack for pep8 E711: comparison to None should be
+        # 'if cond is not None'
+        none = None
+        all_nets = session.query(model).filter(model.segmentation_id != none)
+        res = {}
+        for net in all_nets:
+            res.setdefault(net.tenant_id, {})[net.network_id] = (
+                net.eos_network_representation(VLAN_SEGMENTATION))
+        return res
+
+
+def get_vms_by_tenant():
+    """Returns the VMs of all tenants in EOS-compatible format.
+
+    The VMs of each tenant are formatted as by get_vms().
+    """
+    session = db.get_session()
+    with session.begin():
+        model = AristaProvisionedVms
+        # hack for pep8 E711: comparison to None should be
+        # 'if cond is not None'
+        none = None
+        all_vms = (session.query(model).
+                   filter(model.host_id != none,
+                          model.vm_id != none,
+                          model.network_id != none,
+                          model.port_id != none))
+        res = {}
+        for vm in all_vms:
+            res.setdefault(vm.tenant_id, {})[vm.vm_id] = (
+                vm.eos_vm_representation())
+        return res
+
+
 def get_ports(tenant_id):
     """Returns all ports of VMs in EOS-compatible format.
 
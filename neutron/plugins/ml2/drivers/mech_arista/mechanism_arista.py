@@ -43,6 +43,7 @@ class AristaRPCWrapper(object):
         self._server = jsonrpclib.Server(self._eapi_host_url())
         self.keystone_conf = cfg.CONF.keystone_authtoken
         self.region = cfg.CONF.ml2_arista.region_name
+        self.batch_size = cfg.CONF.ml2_arista.eapi_batch_size
 
     def _keystone_url(self):
         keystone_auth_url = ('%s://%s:%s/v2.0/' %
@@ -248,6 +249,136 @@ class AristaRPCWrapper(object):
         cmds = ['no tenant %s' % tenant_id, 'exit']
         self._run_openstack_cmds(cmds)
 
+    def create_network_cmds(self, network_id, network_name, seg_id):
+        """Returns the tenant mode commands creating a network.
+
+        See run_batched_cmds() for the use of the returned commands.
+        :param network_id: globally unique neutron network identifier
+        :param network_name: Network name - for display purposes
+        :param seg_id: Segment ID of the network
+        """
+        if network_name:
+            cmds = ['network id %s name "%s"' % (network_id, network_name)]
+        else:
+            cmds = ['network id %s' % network_id]
+        cmds.append('segment 1 type vlan id %d' % seg_id)
+        cmds.append('exit')  # exit for segment mode
+        cmds.append('exit')  # exit for network mode
+        return cmds
+
+    def plug_port_cmds(self, vm_id, host_id, port_id, net_id,
+                       port_name, device_owner):
+        """Returns the tenant mode commands plugging a port into a network.
+
+        See run_batched_cmds() for the use of the returned commands.
+        :param vm_id: globally unique identifier for VM instance
+        :param host_id: ID of the host where the VM is placed
+        :param port_id: globally unique port ID that connects VM to network
+        :param net_id: globally unique neutron network identifier
+        :param port_name: Name of the port - for display purposes
+        :param device_owner: Device owner - e.g. compute or network:dhcp
+        """
+        if device_owner == n_const.DEVICE_OWNER_DHCP:
+            cmds = ['network id %s' % net_id]
+            if port_name:
+                cmds.append('dhcp id %s hostid %s port-id %s name "%s"' %
+                            (vm_id, host_id, port_id, port_name))
+            else:
+                cmds.append('dhcp id %s hostid %s port-id %s' %
+                            (vm_id, host_id, port_id))
+        elif device_owner.startswith('compute'):
+            cmds = ['vm id %s hostid %s' % (vm_id, host_id)]
+            if port_name:
+                cmds.append('port id %s name "%s" network-id %s' %
+                            (port_id, port_name, net_id))
+            else:
+                cmds.append('port id %s network-id %s' % (port_id, net_id))
+        else:
+            return []
+        cmds.append('exit')
+        return cmds
+
+    def run_batched_cmds(self, tenant_cmds):
+        """Sends blocks of commands to EOS in as few requests as possible.
+
+        Each request holds at most eapi_batch_size commands, a block of
+        commands is never split between two requests. Consecutive blocks
+        of the same tenant share a single 'tenant' command. EOS stops a
+        request at its first failing command, the blocks of a failed
+        request are therefore sent again one at a time so that a single
+        failing block doesn't hold back the others.
+
+        :param tenant_cmds: list of (tenant_id, commands) tuples. The
+                            commands are executed in the mode of the given
+                            tenant and must return to it, or in region
+                            mode if tenant_id is None.
+        :raises AristaRpcError: if any block failed, once all the others
+                                have been sent.
+        """
+        batches = []
+        batch = []
+        size = 0
+        current = None
+        for tenant_id, block in tenant_cmds:
+            if not block:
+                continue
+            # Leave room for entering and leaving tenant modes
+            if batch and size + len(block) + 3 > self.batch_size:
+                batches.append(batch)
+                batch = []
+                size = 0
+                current = None
+            if tenant_id != current:
+                size += bool(current) + bool(tenant_id)
+                current = tenant_id
+            batch.append((tenant_id, block))
+            size += len(block)
+        if batch:
+            batches.append(batch)
+
+        failed = 0
+        for batch in batches:
+            try:
+                self._run_openstack_cmds(self._tenant_mode_cmds(batch))
+                continue
+            except arista_exc.AristaRpcError:
+                if len(batch) == 1:
+                    failed += 1
+                    continue
+            batch_failed = 0
+            for tenant_id, block in batch:
+                try:
+                    self._run_openstack_cmds(
+                        self._tenant_mode_cmds([(tenant_id, block)]))
+                except arista_exc.AristaRpcError:
+                    LOG.warning(_('Failed to run commands %(cmds)s of '
+                                  'tenant %(tenant)s on EOS'),
+                                {'cmds': block, 'tenant': tenant_id})
+                    batch_failed += 1
+            if batch_failed == len(batch):
+                # Nothing went through, EOS is most likely unavailable
+                raise arista_exc.AristaRpcError(
+                    msg=_('No command could be run on EOS'))
+            failed += batch_failed
+        if failed:
+            raise arista_exc.AristaRpcError(
+                msg=_('%d blocks of commands failed on EOS') % failed)
+
+    def _tenant_mode_cmds(self, tenant_cmds):
+        cmds = []
+        current = None
+        for tenant_id, block in tenant_cmds:
+            if tenant_id != current:
+                if current:
+                    cmds.append('exit')
+                if tenant_id:
+                    cmds.append('tenant %s' % tenant_id)
+                current = tenant_id
+            cmds.extend(block)
+        if current:
+            cmds.append('exit')
+        return cmds
+
     def delete_this_region(self):
         """Deletes this entire region from EOS.
 
@@ -367,69 +498,48 @@ class SyncService(object):
             LOG.warning(msg)
             return
 
+        # Tenants which are no longer known to Neutron are deleted from
+        # EOS first. All the corrective commands are then sent together.
+        tenant_cmds = [(None, ['no tenant %s' % tenant])
+                       for tenant in sorted(eos_tenants)
+                       if tenant not in db_tenants]
+
         # EOS and Neutron has matching set of tenants. Now check
         # to ensure that networks and VMs match on both sides for
         # each tenant.
-        for tenant in eos_tenants.keys():
-            if tenant not in db_tenants:
-                #send delete tenant to EOS
-                try:
-                    self._rpc.delete_tenant(tenant)
-                    del eos_tenants[tenant]
-                except arista_exc.AristaRpcError:
-                    msg = _('EOS is not available, '
-                            'failed to delete tenant %s') % tenant
-                    LOG.warning(msg)
-
-        for tenant in db_tenants:
-            db_nets = db.get_networks(tenant)
-            db_vms = db.get_vms(tenant)
+        all_db_nets = db.get_networks_by_tenant()
+        all_db_vms = db.get_vms_by_tenant()
+        for tenant in sorted(db_tenants):
+            db_nets = all_db_nets.get(tenant, {})
+            db_vms = all_db_vms.get(tenant, {})
             eos_nets = self._get_eos_networks(eos_tenants, tenant)
             eos_vms = self._get_eos_vms(eos_tenants, tenant)
 
             # Check for the case if everything is already in sync.
-            if eos_nets == db_nets:
-                # Net list is same in both Neutron and EOS.
-                # check the vM list
-                if eos_vms == db_vms:
-                    # Nothing to do. Everything is in sync for this tenant
-                    continue
+            if eos_nets == db_nets and eos_vms == db_vms:
+                continue
 
             # Neutron DB and EOS reruires synchronization.
             # First delete anything which should not be EOS
             # delete VMs from EOS if it is not present in neutron DB
             for vm_id in eos_vms:
                 if vm_id not in db_vms:
-                    try:
-                        self._rpc.delete_vm(tenant, vm_id)
-                    except arista_exc.AristaRpcError:
-                        msg = _('EOS is not available,'
-                                'failed to delete vm %s') % vm_id
-                        LOG.warning(msg)
+                    tenant_cmds.append((tenant, ['no vm id %s' % vm_id]))
 
             # delete network from EOS if it is not present in neutron DB
             for net_id in eos_nets:
                 if net_id not in db_nets:
-                    try:
-                        self._rpc.delete_network(tenant, net_id)
-                    except arista_exc.AristaRpcError:
-                        msg = _('EOS is not available,'
-                                'failed to delete network %s') % net_id
-                        LOG.warning(msg)
+                    tenant_cmds.append((tenant, ['no network id %s' % net_id]))
 
             # update networks in EOS if it is present in neutron DB
             for net_id in db_nets:
                 if net_id not in eos_nets:
                     vlan_id = db_nets[net_id]['segmentationTypeId']
                     net_name = self._ndb.get_network_name(tenant, net_id)
-                    try:
-                        self._rpc.create_network(tenant, net_id,
-                                                 net_name,
-                                                 vlan_id)
-                    except arista_exc.AristaRpcError:
-                        msg = _('EOS is not available, failed to create'
-                                'network id %s') % net_id
-                        LOG.warning(msg)
+                    tenant_cmds.append(
+                        (tenant, self._rpc.create_network_cmds(net_id,
+                                                               net_name,
+                                                               vlan_id)))
 
             # Update VMs in EOS if it is present in neutron DB
             for vm_id in db_vms:
@@ -437,24 +547,19 @@ class SyncService(object):
                     vm = db_vms[vm_id]
                     ports = self._ndb.get_all_ports_for_vm(tenant, vm_id)
                     for port in ports:
-                        port_id = port['id']
-                        net_id = port['network_id']
-                        port_name = port['name']
-                        device_owner = port['device_owner']
-                        vm_id = vm['vmId']
-                        host_id = vm['host']
-                        try:
-                            self._rpc.plug_port_into_network(vm_id,
-                                                             host_id,
-                                                             port_id,
-                                                             net_id,
-                                                             tenant,
-                                                             port_name,
-                                                             device_owner)
-                        except arista_exc.AristaRpcError:
-                            msg = _('EOS is not available, failed to create '
-                                    'vm id %s') % vm['vmId']
-                            LOG.warning(msg)
+                        tenant_cmds.append(
+                            (tenant, self._rpc.plug_port_cmds(
+                                vm['vmId'], vm['host'], port['id'],
+                                port['network_id'], port['name'],
+                                port['device_owner'])))
+
+        if not tenant_cmds:
+            return
+        try:
+            self._rpc.run_batched_cmds(tenant_cmds)
+        except arista_exc.AristaRpcError:
+            msg = _('Failed to synchronize EOS, will try sync later')
+            LOG.warning(msg)
 
     def _get_eos_networks(self, eos_tenants, tenant):
         networks = {}
@@ -490,6 +595,9 @@ class AristaDriver(driver_api.MechanismDriver):
         self.eos = SyncService(self.rpc, self.ndb)
         self.sync_timeout = confg['sync_interval']
         self.eos_sync_lock = threading.Lock()
+        self.port_flush_delay = confg['port_flush_delay']
+        self.flush_timer = None
+        self._pending_plugs = []
 
     def initialize(self):
         self.rpc._register_with_eos()
@@ -592,6 +700,7 @@ class AristaDriver(driver_api.MechanismDriver):
         network_id = network['id']
         tenant_id = network['tenant_id']
         with self.eos_sync_lock:
+            self._send_pending_plugs()
 
             # Succeed deleting network in case EOS is not accessible.
             # EOS state will be updated by sync thread once EOS gets
@@ -650,7 +759,16 @@ class AristaDriver(driver_api.MechanismDriver):
                                                       tenant_id)
                 net_provisioned = db.is_network_provisioned(tenant_id,
                                                             network_id)
-                if vm_provisioned and net_provisioned:
+                if (vm_provisioned and net_provisioned and
+                        self.port_flush_delay):
+                    cmds = self.rpc.plug_port_cmds(device_id,
+                                                   hostname,
+                                                   port_id,
+                                                   network_id,
+                                                   port_name,
+                                                   device_owner)
+                    self._defer_port_plug(tenant_id, cmds)
+                elif vm_provisioned and net_provisioned:
                     try:
                         self.rpc.plug_port_into_network(device_id,
                                                         hostname,
@@ -704,6 +822,7 @@ class AristaDriver(driver_api.MechanismDriver):
             network_id = port['network_id']
             tenant_id = port['tenant_id']
             with self.eos_sync_lock:
+                self._send_pending_plugs()
                 hostname = self._host_name(host)
                 segmentation_id = db.get_segmentation_id(tenant_id,
                                                          network_id)
@@ -765,6 +884,7 @@ class AristaDriver(driver_api.MechanismDriver):
 
         try:
             with self.eos_sync_lock:
+                self._send_pending_plugs()
                 hostname = self._host_name(host)
                 if device_owner == n_const.DEVICE_OWNER_DHCP:
                     self.rpc.unplug_dhcp_port_from_network(device_id,
@@ -797,8 +917,45 @@ class AristaDriver(driver_api.MechanismDriver):
         fqdns_used = cfg.CONF.ml2_arista['use_fqdn']
         return hostname if fqdns_used else hostname.split('.')[0]
 
+    def _defer_port_plug(self, tenant_id, cmds):
+        """Queues port plug commands until the next flush.
+
+        Ports created within port_flush_delay seconds are plugged into
+        their networks with a single EOS request. Must be called with
+        eos_sync_lock held.
+        """
+        self._pending_plugs.append((tenant_id, cmds))
+        if not self.flush_timer:
+            self.flush_timer = threading.Timer(self.port_flush_delay,
+                                               self._flush_port_plugs)
+            self.flush_timer.start()
+
+    def _flush_port_plugs(self):
+        with self.eos_sync_lock:
+            self._send_pending_plugs()
+
+    def _send_pending_plugs(self):
+        """Sends the queued port plugs to EOS.
+
+        Must be called with eos_sync_lock held. Plugs failing because EOS
+        is not accessible are sent again by the sync thread.
+        """
+        if self.flush_timer:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        if not self._pending_plugs:
+            return
+        pending, self._pending_plugs = self._pending_plugs, []
+        try:
+            self.rpc.run_batched_cmds(pending)
+        except arista_exc.AristaRpcError:
+            msg = _('EOS is not available, %d ports will be plugged by '
+                    'the next synchronization') % len(pending)
+            LOG.warning(msg)
+
     def _synchronization_thread(self):
         with self.eos_sync_lock:
+            self._send_pending_plugs()
             self.eos.synchronize()
 
         self.timer = threading.Timer(self.sync_timeout,
@@ -809,6 +966,9 @@ class AristaDriver(driver_api.MechanismDriver):
         if self.timer:
             self.timer.cancel()
             self.timer = None
+        if self.flush_timer:
+            self.flush_timer.cancel()
+            self.flush_timer = None
 
     def _cleanupDb(self):
         """Clean up any uncessary entries in our DB."""
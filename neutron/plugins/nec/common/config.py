@@ -48,6 +48,10 @@ ofc_opts = [
                help=_("Key file")),
     cfg.StrOpt('cert_file', default=None,
                help=_("Certificate file")),
+    cfg.IntOpt('operation_workers', default=0,
+               help=_("Number of green threads applying operations on OFC "
+                      "in the background. If 0, operations are applied "
+                      "within API requests.")),
 ]
 
 provider_opts = [
@@ -23,6 +23,7 @@ from neutron.db import models_v2
 from neutron.db import securitygroups_db as sg_db
 from neutron.extensions import securitygroup as ext_sg
 from neutron import manager
+from neutron.openstack.common import jsonutils
 from neutron.openstack.common import log as logging
 from neutron.plugins.nec.common import config  # noqa
 from neutron.plugins.nec.common import exceptions as nexc
@@ -175,6 +176,88 @@ def del_ofc_item_lookup_both(session, resource, neutron_id):
                 {'resource': resource, 'id': neutron_id})
 
 
+def add_ofc_operation(session, tenant_id, resource, neutron_id, operation,
+                      data=None):
+    """Queue an operation on OFC for a resource.
+
+    A delete cancels a create of the same resource which is not started
+    yet, and an operation already queued last for a resource is not
+    queued again.
+
+    :returns: True if an operation is pending for the resource.
+    """
+    model = nmodels.OFCOperation
+    with session.begin(subtransactions=True):
+        query = session.query(model).filter_by(resource=resource,
+                                               resource_id=neutron_id)
+        last = query.order_by(model.id.desc()).first()
+        if last and not last.in_progress:
+            if last.operation == operation:
+                return True
+            if last.operation == 'create' and operation == 'delete':
+                session.delete(last)
+                session.flush()
+                return query.count() > 0
+        item = model(tenant_id=tenant_id, resource=resource,
+                     resource_id=neutron_id, operation=operation,
+                     data=jsonutils.dumps(data or {}), in_progress=False,
+                     attempts=0)
+        session.add(item)
+    return True
+
+
+def start_ofc_operation(session, tenant_id, owner):
+    """Mark the first queued operation of a tenant in progress by owner.
+
+    :returns: the operation, or None if the tenant has no queued operation
+              or if its first operation is already in progress.
+    """
+    model = nmodels.OFCOperation
+    with session.begin(subtransactions=True):
+        item = (session.query(model).
+                filter_by(tenant_id=tenant_id).
+                order_by(model.id).
+                with_lockmode('update').
+                first())
+        if not item or item.in_progress:
+            return None
+        item.in_progress = True
+        item.owner = owner
+    return item
+
+
+def del_ofc_operation(session, id):
+    with session.begin(subtransactions=True):
+        session.query(nmodels.OFCOperation).filter_by(id=id).delete()
+
+
+def retry_ofc_operation(session, id):
+    """Queue a failed operation again, ahead of the other operations.
+
+    :returns: the number of failed attempts of the operation.
+    """
+    with session.begin(subtransactions=True):
+        item = session.query(nmodels.OFCOperation).filter_by(id=id).one()
+        item.in_progress = False
+        item.owner = None
+        item.attempts += 1
+    return item.attempts
+
+
+def get_ofc_operation_tenants(session, owner):
+    """Get the tenants having queued operations.
+
+    Operations left in progress by a previous run of the same owner are
+    queued again, the ones in progress by other owners are left alone.
+    """
+    model = nmodels.OFCOperation
+    with session.begin(subtransactions=True):
+        (session.query(model).filter_by(in_progress=True, owner=owner).
+         update({'in_progress': False, 'owner': None}))
+        return [tenant_id for tenant_id,
+                in session.query(model.tenant_id).distinct()]
+
+
 def get_portinfo(session, id):
     try:
         return (session.query(nmodels.PortInfo).
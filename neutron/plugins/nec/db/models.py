@@ -79,6 +79,23 @@ class OFCFilter(model_base.BASEV2, models_v2.HasId, HasNeutronId):
     """Represents a Filter on OpenFlow Network/Controller."""
 
 
+class OFCOperation(model_base.BASEV2):
+    """Represents an operation queued for OpenFlow Network/Controller.
+
+    Operations of a tenant are applied in the order of their id.
+    """
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    tenant_id = sa.Column(sa.String(255), nullable=False)
+    resource = sa.Column(sa.String(36), nullable=False)
+    resource_id = sa.Column(sa.String(36), nullable=False)
+    operation = sa.Column(sa.String(16), nullable=False)
+    data = sa.Column(sa.Text)
+    in_progress = sa.Column(sa.Boolean, nullable=False, default=False)
+    # host of the neutron server applying the operation
+    owner = sa.Column(sa.String(255))
+    attempts = sa.Column(sa.Integer, nullable=False, default=0)
+
+
 class PortInfo(model_base.BASEV2):
     """Represents a Virtual Interface."""
     id = sa.Column(sa.String(36),
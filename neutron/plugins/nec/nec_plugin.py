@@ -37,6 +37,7 @@ from neutron.db import quota_db  # noqa
 from neutron.db import securitygroups_rpc_base as sg_db_rpc
 from neutron.extensions import allowedaddresspairs as addr_pair
 from neutron.extensions import portbindings
+from neutron.openstack.common import excutils
 from neutron.openstack.common import importutils
 from neutron.openstack.common import log as logging
 from neutron.openstack.common import rpc
@@ -50,6 +51,7 @@ from neutron.plugins.nec.db import router as rdb
 from neutron.plugins.nec import extensions
 from neutron.plugins.nec import nec_router
 from neutron.plugins.nec import ofc_manager
+from neutron.plugins.nec import ofc_queue
 from neutron.plugins.nec import packet_filter
 
 LOG = logging.getLogger(__name__)
@@ -104,6 +106,11 @@ class NECPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
 
         ndb.initialize()
         self.ofc = ofc_manager.OFCManager()
+        self.ofc_queue = None
+        if config.OFC.operation_workers:
+            self.ofc_queue = ofc_queue.OFCOperationQueue(
+                self._apply_ofc_operation, config.OFC.operation_workers)
+            self.ofc_queue.start()
         self.base_binding_dict = self._get_base_binding_dict()
         portbindings_base.register_port_dict_function()
 
@@ -190,8 +197,8 @@ class NECPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                 reason = _("delete_ofc_tenant() failed due to %s") % exc
                 LOG.warn(reason)
 
-    def activate_port_if_ready(self, context, port, network=None):
-        """Activate port by creating port on OFC if ready.
+    def _is_port_ready(self, context, port, network=None):
+        """Check if the port can be activated on OFC.
 
         Conditions to activate port on OFC are:
             * port admin_state is UP
@@ -205,54 +212,161 @@ class NECPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         if not port['admin_state_up']:
             LOG.debug(_("activate_port_if_ready(): skip, "
                         "port.admin_state_up is False."))
-            return port
+            return False
         elif not network['admin_state_up']:
             LOG.debug(_("activate_port_if_ready(): skip, "
                         "network.admin_state_up is False."))
-            return port
+            return False
         elif not ndb.get_portinfo(context.session, port['id']):
             LOG.debug(_("activate_port_if_ready(): skip, "
                         "no portinfo for this port."))
-            return port
-        elif self.ofc.exists_ofc_port(context, port['id']):
+            return False
+        return True
+
+    def _set_port_status(self, context, port, port_status):
+        if port_status and port_status is not port['status']:
+            self._update_resource_status(context, "port", port['id'],
+                                         port_status)
+            port['status'] = port_status
+        return port
+
+    def _queue_port_operation(self, context, port, operation):
+        """Queue a port operation on OFC, the port is in BUILD meanwhile."""
+        data = {'tenant_id': port['tenant_id'],
+                'network_id': port['network_id']}
+        if self.ofc_queue.add(context, port['tenant_id'], "ofc_port",
+                              port['id'], operation, data):
+            port_status = const.PORT_STATUS_BUILD
+        else:
+            port_status = const.PORT_STATUS_DOWN
+        return self._set_port_status(context, port, port_status)
+
+    def _create_ofc_port(self, context, port):
+        """Create port on OFC if it does not exist yet.
+
+        :returns: the new status of the port, None if unchanged.
+        """
+        if self.ofc.exists_ofc_port(context, port['id']):
             LOG.debug(_("activate_port_if_ready(): skip, "
                         "ofc_port already exists."))
-            return port
+            return None
 
         try:
             self.ofc.create_ofc_port(context, port['id'], port)
-            port_status = const.PORT_STATUS_ACTIVE
+            return const.PORT_STATUS_ACTIVE
         except (nexc.OFCException, nexc.OFCConsistencyBroken) as exc:
             LOG.error(_("create_ofc_port() failed due to %s"), exc)
-            port_status = const.PORT_STATUS_ERROR
-
-        if port_status is not port['status']:
-            self._update_resource_status(context, "port", port['id'],
-                                         port_status)
-            port['status'] = port_status
+            return const.PORT_STATUS_ERROR
 
-        return port
+    def _delete_ofc_port(self, context, port):
+        """Delete port from OFC if it exists.
 
-    def deactivate_port(self, context, port):
-        """Deactivate port by deleting port from OFC if exists."""
+        :returns: the new status of the port, None if unchanged.
+        """
         if not self.ofc.exists_ofc_port(context, port['id']):
             LOG.debug(_("deactivate_port(): skip, ofc_port does not "
                         "exist."))
-            return port
+            return None
 
         try:
             self.ofc.delete_ofc_port(context, port['id'], port)
-            port_status = const.PORT_STATUS_DOWN
+            return const.PORT_STATUS_DOWN
         except (nexc.OFCException, nexc.OFCConsistencyBroken) as exc:
             LOG.error(_("delete_ofc_port() failed due to %s"), exc)
-            port_status = const.PORT_STATUS_ERROR
+            return const.PORT_STATUS_ERROR
 
-        if port_status is not port['status']:
-            self._update_resource_status(context, "port", port['id'],
-                                         port_status)
-            port['status'] = port_status
+    def activate_port_if_ready(self, context, port, network=None):
+        """Activate port by creating port on OFC if ready.
 
-        return port
+        See _is_port_ready() for the conditions to activate port on OFC.
+        With OFC operation workers, the port is created on OFC in the
+        background.
+        """
+        if not self._is_port_ready(context, port, network):
+            return port
+        if self.ofc_queue:
+            return self._queue_port_operation(context, port, 'create')
+        port_status = self._create_ofc_port(context, port)
+        return self._set_port_status(context, port, port_status)
+
+    def deactivate_port(self, context, port):
+        """Deactivate port by deleting port from OFC if exists."""
+        if self.ofc_queue:
+            return self._queue_port_operation(context, port, 'delete')
+        port_status = self._delete_ofc_port(context, port)
+        return self._set_port_status(context, port, port_status)
+
+    def _apply_ofc_operation(self, context, resource, neutron_id,
+                             operation, data):
+        """Apply an operation queued by the OFC operation workers."""
+        if resource == "ofc_port":
+            self._apply_ofc_port_operation(context, neutron_id,
+                                           operation, data)
+        elif resource == "ofc_network":
+            self._apply_ofc_network_operation(context, neutron_id,
+                                              operation, data)
+        elif resource == "ofc_tenant":
+            self._cleanup_ofc_tenant(context, neutron_id)
+
+    def _apply_ofc_port_operation(self, context, port_id, operation, data):
+        """Apply a port operation, raise OFCException if it failed."""
+        try:
+            port = super(NECPluginV2, self).get_port(context, port_id)
+        except q_exc.PortNotFound:
+            # The port is deleted from DB before it is deleted from OFC
+            port = None
+
+        port_status = None
+        if operation == 'create':
+            if port and self._is_port_ready(context, port):
+                port_status = self._create_ofc_port(context, port)
+        else:
+            port_status = self._delete_ofc_port(
+                context, port or dict(data, id=port_id))
+
+        if port:
+            if not port_status and port['status'] == const.PORT_STATUS_BUILD:
+                # Nothing changed on OFC, show the current state
+                if self.ofc.exists_ofc_port(context, port_id):
+                    port_status = const.PORT_STATUS_ACTIVE
+                else:
+                    port_status = const.PORT_STATUS_DOWN
+            self._set_port_status(context, port, port_status)
+        if port_status == const.PORT_STATUS_ERROR:
+            # The operation is retried by the queue
+            reason = _("%(operation)s of port %(id)s failed") % {
+                'operation': operation, 'id': port_id}
+            raise nexc.OFCException(reason=reason)
+
+    def _apply_ofc_network_operation(self, context, network_id, operation,
+                                     data):
+        """Apply a network operation, raise OFC exceptions if it failed."""
+        if operation == 'delete':
+            # The network is already deleted from DB, the operation is
+            # retried by the queue if it fails
+            if self.ofc.exists_ofc_network(context, network_id):
+                self.ofc.delete_ofc_network(context, network_id, data)
+            return
+
+        try:
+            network = super(NECPluginV2, self).get_network(context,
+                                                           network_id)
+        except q_exc.NetworkNotFound:
+            return
+        tenant_id = network['tenant_id']
+        try:
+            self.ofc.ensure_ofc_tenant(context, tenant_id)
+            if not self.ofc.exists_ofc_network(context, network_id):
+                self.ofc.create_ofc_network(context, tenant_id, network_id,
+                                            network['name'])
+            net_status = self._net_status({'network': network})
+        except (nexc.OFCException, nexc.OFCConsistencyBroken):
+            # The operation is retried by the queue
+            with excutils.save_and_reraise_exception():
+                self._update_resource_status(context, "network", network_id,
+                                             const.NET_STATUS_ERROR)
+        self._update_resource_status(context, "network", network_id,
+                                     net_status)
 
     def _net_status(self, network):
         # NOTE: NEC Plugin accept admin_state_up. When it's False, this plugin
@@ -277,19 +391,27 @@ class NECPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         network['network']['id'] = net_id
         network['network']['status'] = self._net_status(network)
 
-        try:
-            if not self.ofc.exists_ofc_tenant(context, tenant_id):
-                self.ofc.create_ofc_tenant(context, tenant_id)
-            self.ofc.create_ofc_network(context, tenant_id, net_id, net_name)
-        except (nexc.OFCException, nexc.OFCConsistencyBroken) as exc:
-            LOG.error(_("Failed to create network id=%(id)s on "
-                        "OFC: %(exc)s"), {'id': net_id, 'exc': exc})
-            network['network']['status'] = const.NET_STATUS_ERROR
+        if self.ofc_queue:
+            # The network is created on OFC once it is in the DB
+            network['network']['status'] = const.NET_STATUS_BUILD
+        else:
+            try:
+                if not self.ofc.exists_ofc_tenant(context, tenant_id):
+                    self.ofc.create_ofc_tenant(context, tenant_id)
+                self.ofc.create_ofc_network(context, tenant_id, net_id,
+                                            net_name)
+            except (nexc.OFCException, nexc.OFCConsistencyBroken) as exc:
+                LOG.error(_("Failed to create network id=%(id)s on "
+                            "OFC: %(exc)s"), {'id': net_id, 'exc': exc})
+                network['network']['status'] = const.NET_STATUS_ERROR
 
         with context.session.begin(subtransactions=True):
             new_net = super(NECPluginV2, self).create_network(context, network)
             self._process_l3_create(context, new_net, network['network'])
 
+        if self.ofc_queue:
+            self.ofc_queue.add(context, tenant_id, "ofc_network", net_id,
+                               'create')
         return new_net
 
     def update_network(self, context, id, network):
@@ -313,16 +435,20 @@ class NECPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
             self._process_l3_update(context, new_net, network['network'])
 
         changed = (old_net['admin_state_up'] is not new_net['admin_state_up'])
+        # Ports in BUILD have an operation queued on OFC, which the new
+        # admin state must override
         if changed and not new_net['admin_state_up']:
             # disable all active ports of the network
-            filters = dict(network_id=[id], status=[const.PORT_STATUS_ACTIVE])
+            filters = dict(network_id=[id], status=[const.PORT_STATUS_ACTIVE,
+                                                    const.PORT_STATUS_BUILD])
             ports = super(NECPluginV2, self).get_ports(context,
                                                        filters=filters)
             for port in ports:
                 self.deactivate_port(context, port)
         elif changed and new_net['admin_state_up']:
             # enable ports of the network
-            filters = dict(network_id=[id], status=[const.PORT_STATUS_DOWN],
+            filters = dict(network_id=[id], status=[const.PORT_STATUS_DOWN,
+                                                    const.PORT_STATUS_BUILD],
                            admin_state_up=[True])
             ports = super(NECPluginV2, self).get_ports(context,
                                                        filters=filters)
@@ -365,18 +491,29 @@ class NECPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         for pf in net_db.packetfilters:
             self.delete_packet_filter(context, pf['id'])
 
-        try:
-            self.ofc.delete_ofc_network(context, id, net_db)
-        except (nexc.OFCException, nexc.OFCConsistencyBroken) as exc:
-            reason = _("delete_network() failed due to %s") % exc
-            LOG.error(reason)
-            self._update_resource_status(context, "network", net_db['id'],
-                                         const.NET_STATUS_ERROR)
-            raise
+        if self.ofc_queue:
+            self.ofc_queue.add(context, tenant_id, "ofc_network", id,
+                               'delete', {'tenant_id': tenant_id})
+        else:
+            try:
+                self.ofc.delete_ofc_network(context, id, net_db)
+            except (nexc.OFCException, nexc.OFCConsistencyBroken) as exc:
+                reason = _("delete_network() failed due to %s") % exc
+                LOG.error(reason)
+                self._update_resource_status(context, "network",
+                                             net_db['id'],
+                                             const.NET_STATUS_ERROR)
+                raise
 
         super(NECPluginV2, self).delete_network(context, id)
 
-        self._cleanup_ofc_tenant(context, tenant_id)
+        if self.ofc_queue:
+            # The tenant is deleted from OFC if it is still unused once
+            # the operations queued before are applied.
+            self.ofc_queue.add(context, tenant_id, "ofc_tenant", tenant_id,
+                               'delete')
+        else:
+            self._cleanup_ofc_tenant(context, tenant_id)
 
     def _get_base_binding_dict(self):
         binding = {
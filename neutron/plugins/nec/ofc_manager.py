@@ -28,6 +28,11 @@ from neutron.plugins.nec import drivers
 
 LOG = logging.getLogger(__name__)
 
+# Resources keeping the same OFC ID from their creation to their deletion.
+# Ports are not included, a port is deleted from OFC and created again when
+# its portinfo changes.
+CACHED_RESOURCES = ('ofc_network', 'ofc_router')
+
 
 class OFCManager(object):
     """This class manages an OpenFlow Controller and map resources.
@@ -41,10 +46,18 @@ class OFCManager(object):
 
     def __init__(self):
         self.driver = drivers.get_driver(config.OFC.driver)(config.OFC)
+        # OFC IDs of CACHED_RESOURCES, keyed by resource and neutron ID
+        self._ofc_ids = {}
 
     def _get_ofc_id(self, context, resource, neutron_id):
-        return ndb.get_ofc_id_lookup_both(context.session,
-                                          resource, neutron_id)
+        key = (resource, neutron_id)
+        ofc_id = self._ofc_ids.get(key)
+        if ofc_id is None:
+            ofc_id = ndb.get_ofc_id_lookup_both(context.session,
+                                                resource, neutron_id)
+            if resource in CACHED_RESOURCES:
+                self._ofc_ids[key] = ofc_id
+        return ofc_id
 
     def _exists_ofc_item(self, context, resource, neutron_id):
         return ndb.exists_ofc_item_lookup_both(context.session,
@@ -55,6 +68,7 @@ class OFCManager(object):
         ndb.add_ofc_item(context.session, resource, neutron_id, ofc_id)
 
     def _del_ofc_item(self, context, resource, neutron_id):
+        self._ofc_ids.pop((resource, neutron_id), None)
         ndb.del_ofc_item_lookup_both(context.session, resource, neutron_id)
 
     def ensure_ofc_tenant(self, context, tenant_id):
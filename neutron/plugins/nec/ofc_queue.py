@@ -0,0 +1,137 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright 2014 NEC Corporation.  All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+from oslo.config import cfg
+
+from neutron import context as q_context
+from neutron.openstack.common import jsonutils
+from neutron.openstack.common import log as logging
+from neutron.plugins.nec.db import api as ndb
+
+
+LOG = logging.getLogger(__name__)
+
+# Seconds before the first retry of a failed operation
+RETRY_INTERVAL = 1
+MAX_RETRY_INTERVAL = 60
+
+
+class OFCOperationQueue(object):
+    """Applies operations queued in the DB on OFC in the background.
+
+    Operations of a tenant are applied one at a time in the order they
+    were queued, since a port can only be created on OFC once its network
+    and tenant exist there. Operations of different tenants are applied
+    concurrently by up to 'workers' green threads.
+
+    Each operation is applied by calling apply_func with an admin context,
+    the resource, the neutron ID of the resource, the operation and its
+    data. The operation is removed from the queue once apply_func returns.
+    When apply_func raises, the operation stays first in the queue of its
+    tenant and is applied again after a delay doubling with each failed
+    attempt, up to MAX_RETRY_INTERVAL seconds.
+    """
+
+    def __init__(self, apply_func, workers):
+        self.apply_func = apply_func
+        self.pool = eventlet.GreenPool(workers)
+        # operations in progress are owned by the server applying them
+        self.owner = cfg.CONF.host
+        # tenants whose operations are being applied
+        self.running = set()
+        # tenants with operations queued while they were running
+        self.notified = set()
+        # tenants waiting for a failed operation to be retried
+        self.retrying = set()
+
+    def start(self):
+        """Resume the operations queued before the last shutdown."""
+        session = q_context.get_admin_context().session
+        for tenant_id in ndb.get_ofc_operation_tenants(session, self.owner):
+            self.notify(tenant_id)
+
+    def add(self, context, tenant_id, resource, neutron_id, operation,
+            data=None):
+        """Queue an operation on a resource and apply it in the background.
+
+        Must not be called within a DB transaction, the workers would not
+        see the operation before it is committed.
+
+        :returns: True if an operation is pending for the resource, False
+                  if the operation cancelled a create which is not applied
+                  yet.
+        """
+        pending = ndb.add_ofc_operation(context.session, tenant_id, resource,
+                                        neutron_id, operation, data)
+        self.notify(tenant_id)
+        return pending
+
+    def notify(self, tenant_id):
+        if tenant_id in self.retrying:
+            # The operations are resumed by the retry
+            return
+        if tenant_id in self.running:
+            self.notified.add(tenant_id)
+        else:
+            self.running.add(tenant_id)
+            self.pool.spawn_n(self._run, tenant_id)
+
+    def _retry(self, tenant_id):
+        self.retrying.discard(tenant_id)
+        self.notify(tenant_id)
+
+    def _run(self, tenant_id):
+        context = q_context.get_admin_context()
+        try:
+            while True:
+                self.notified.discard(tenant_id)
+                op = ndb.start_ofc_operation(context.session, tenant_id,
+                                             self.owner)
+                if op:
+                    if not self._apply(context, op):
+                        break
+                elif tenant_id not in self.notified:
+                    break
+        finally:
+            self.running.discard(tenant_id)
+
+    def _apply(self, context, op):
+        """Apply an operation, schedule its retry if it fails.
+
+        :returns: True if the operation was applied.
+        """
+        LOG.debug(_("Applying %(operation)s of %(resource)s %(id)s on OFC."),
+                  {'operation': op.operation, 'resource': op.resource,
+                   'id': op.resource_id})
+        try:
+            self.apply_func(context, op.resource, op.resource_id,
+                            op.operation, jsonutils.loads(op.data))
+        except Exception:
+            attempts = ndb.retry_ofc_operation(context.session, op.id)
+            interval = min(RETRY_INTERVAL * 2 ** (attempts - 1),
+                           MAX_RETRY_INTERVAL)
+            LOG.exception(_("Failed to apply %(operation)s of %(resource)s "
+                            "%(id)s on OFC, retrying in %(interval)d "
+                            "seconds."),
+                          {'operation': op.operation,
+                           'resource': op.resource, 'id': op.resource_id,
+                           'interval': interval})
+            self.retrying.add(op.tenant_id)
+            eventlet.spawn_after(interval, self._retry, op.tenant_id)
+            return False
+        ndb.del_ofc_operation(context.session, op.id)
+        return True
@@ -217,7 +217,8 @@ class NvpPluginV2(addr_pair_db.AllowedAddressPairsMixin,
             self.nvp_sync_opts.state_sync_interval,
             self.nvp_sync_opts.min_sync_req_delay,
             self.nvp_sync_opts.min_chunk_size,
-            self.nvp_sync_opts.max_random_sync_delay)
+            self.nvp_sync_opts.max_random_sync_delay,
+            self.nvp_sync_opts.compact_cache)
 
     def _ensure_default_network_gateway(self):
         if self._is_default_net_gw_in_sync:
@@ -88,7 +88,13 @@ sync_opts = [
                 deprecated_group='NVP_SYNC',
                 help=_('Always read operational status from backend on show '
                        'operations. Enabling this option might slow down '
-                       'the system.'))
+                       'the system.')),
+    cfg.BoolOpt('compact_cache', default=False,
+                help=_('Keep only the hash, neutron id and operational '
+                       'status of NSX resources in the state '
+                       'synchronization cache instead of their full '
+                       'representation. This reduces memory usage in '
+                       'large deployments.'))
 ]
 
 connection_opts = [
@@ -15,6 +15,9 @@
 
 import random
 
+import eventlet
+from sqlalchemy.orm import attributes
+
 from neutron.common import constants
 from neutron.common import exceptions
 from neutron import context
@@ -33,6 +36,10 @@ from neutron.plugins.nicira import nvplib
 LOG = log.getLogger(__name__)
 
 
+def _hash_resource(item):
+    return hash(jsonutils.dumps(item))
+
+
 class NvpCache(object):
     """A simple Cache for NVP resources.
 
@@ -71,14 +78,11 @@ class NvpCache(object):
                 del resources[uuid]
                 del self._uuid_dict_mappings[uuid]
 
-        def do_hash(item):
-            return hash(jsonutils.dumps(item))
-
         # Parse new data and identify new, deleted, and updated resources
         for item in new_resources:
             item_id = item['uuid']
             if resources.get(item_id):
-                new_hash = do_hash(item)
+                new_hash = _hash_resource(item)
                 if new_hash != resources[item_id]['hash']:
                     resources[item_id]['hash'] = new_hash
                     resources[item_id]['changed'] = True
@@ -88,7 +92,7 @@ class NvpCache(object):
                 # Mark the item as hit in any case
                 resources[item_id]['hit'] = True
             else:
-                resources[item_id] = {'hash': do_hash(item)}
+                resources[item_id] = {'hash': _hash_resource(item)}
                 resources[item_id]['hit'] = True
                 resources[item_id]['changed'] = True
                 resources[item_id]['data'] = item
@@ -147,6 +151,141 @@ class NvpCache(object):
                 self._get_resource_ids(self._lswitchports, changed_only=True))
 
 
+class _CompactEntry(object):
+    """Digest, neutron id and operational status of a NVP resource.
+
+    Subclasses specify the tag scope holding the neutron id and the
+    relation and attribute holding the operational status.
+    """
+
+    __slots__ = ('hash', 'neutron_id', 'status', 'hit', 'changed',
+                 'deleted')
+    tag_scope = None
+    relation = None
+    status_field = None
+
+    def __init__(self, digest, item):
+        self.hit = True
+        self.changed = True
+        self.deleted = False
+        self.update(digest, item)
+
+    def update(self, digest, item):
+        self.hash = digest
+        self.deleted = False
+        self.neutron_id = None
+        for tag in item.get('tags', []):
+            if tag.get('scope') == self.tag_scope:
+                self.neutron_id = tag['tag']
+        relation = item.get('_relations', {}).get(self.relation, {})
+        self.status = relation.get(self.status_field)
+
+    def to_dict(self, uuid):
+        """Build a cache entry in the format used by NvpCache."""
+        data = {'uuid': uuid,
+                'tags': [],
+                '_relations': {self.relation: {
+                    self.status_field: self.status}}}
+        if self.neutron_id is not None:
+            data['tags'].append({'scope': self.tag_scope,
+                                 'tag': self.neutron_id})
+        entry = {'hash': self.hash}
+        if self.hit:
+            entry['hit'] = True
+        if self.changed:
+            entry['changed'] = True
+        entry['data_bk' if self.deleted else 'data'] = data
+        return entry
+
+
+class _CompactLSwitch(_CompactEntry):
+    __slots__ = ()
+    tag_scope = 'neutron_net_id'
+    relation = 'LogicalSwitchStatus'
+    status_field = 'fabric_status'
+
+
+class _CompactLRouter(_CompactEntry):
+    __slots__ = ()
+    relation = 'LogicalRouterStatus'
+    status_field = 'fabric_status'
+
+
+class _CompactLSwitchPort(_CompactEntry):
+    __slots__ = ()
+    tag_scope = 'q_port_id'
+    relation = 'LogicalPortStatus'
+    status_field = 'link_status_up'
+
+
+class _CompactResources(dict):
+    """Cached resources of a single type."""
+
+    def __init__(self, entry_class):
+        super(_CompactResources, self).__init__()
+        self.entry_class = entry_class
+
+
+class CompactNvpCache(NvpCache):
+    """A NvpCache storing only what the synchronizer needs.
+
+    Instead of the resource bodies, each entry keeps the resource hash,
+    the neutron id found in its tags and its operational status. Items
+    returned by __getitem__ are built on demand and contain only these
+    attributes.
+    """
+
+    def __init__(self):
+        super(CompactNvpCache, self).__init__()
+        self._lswitches = _CompactResources(_CompactLSwitch)
+        self._lswitchports = _CompactResources(_CompactLSwitchPort)
+        self._lrouters = _CompactResources(_CompactLRouter)
+
+    def __getitem__(self, key):
+        resources = self._uuid_dict_mappings[key]
+        return resources[key].to_dict(key)
+
+    def _update_resources(self, resources, new_resources):
+        # Clear the 'changed' attribute for all items
+        for uuid, entry in resources.items():
+            if entry.changed and entry.deleted:
+                # The item is not anymore in NVP, so delete it
+                del resources[uuid]
+                del self._uuid_dict_mappings[uuid]
+            entry.changed = False
+
+        # Parse new data and identify new, deleted, and updated resources
+        for item in new_resources:
+            item_id = item['uuid']
+            new_hash = _hash_resource(item)
+            entry = resources.get(item_id)
+            if entry is not None:
+                if new_hash != entry.hash:
+                    entry.update(new_hash, item)
+                    entry.changed = True
+                # Mark the item as hit in any case
+                entry.hit = True
+            else:
+                resources[item_id] = resources.entry_class(new_hash, item)
+                # add a uuid to dict mapping for easy retrieval
+                # with __getitem__
+                self._uuid_dict_mappings[item_id] = resources
+
+    def _delete_resources(self, resources):
+        # Mark for removal all the elements which have not been visited.
+        # And clear the 'hit' attribute.
+        for entry in resources.itervalues():
+            if not entry.hit:
+                entry.changed = True
+                entry.deleted = True
+            entry.hit = False
+
+    def _get_resource_ids(self, resources, changed_only):
+        if changed_only:
+            return [k for (k, v) in resources.iteritems() if v.changed]
+        return resources.keys()
+
+
 class SyncParameters():
     """Defines attributes used by the synchronization procedure.
 
@@ -156,6 +295,8 @@ class SyncParameters():
     current_chunk: Counter of the current data chunk being synchronized
     Page cursors: markers for the next resource to fetch.
                  'start' means page cursor unset for fetching 1st page
+    Remaining counts: number of resources of each type still to fetch
+                      in the current synchronization cycle
     init_sync_performed: True if the initial synchronization concluded
     """
 
@@ -166,6 +307,9 @@ class SyncParameters():
         self.ls_cursor = 'start'
         self.lr_cursor = 'start'
         self.lp_cursor = 'start'
+        self.ls_remaining = 0
+        self.lr_remaining = 0
+        self.lp_remaining = 0
         self.init_sync_performed = False
         self.total_size = 0
 
@@ -200,9 +344,10 @@ class NvpSynchronizer():
         relations='LogicalPortStatus')
 
     def __init__(self, plugin, cluster, state_sync_interval,
-                 req_delay, min_chunk_size, max_rand_delay=0):
+                 req_delay, min_chunk_size, max_rand_delay=0,
+                 compact_cache=False):
         random.seed()
-        self._nvp_cache = NvpCache()
+        self._nvp_cache = compact_cache and CompactNvpCache() or NvpCache()
         # Store parameters as instance members
         # NOTE(salv-orlando): apologies if it looks java-ish
         self._plugin = plugin
@@ -220,6 +365,8 @@ class NvpSynchronizer():
             raise nvp_exc.NvpPluginException(err_msg=err_msg)
         # Backoff time in case of failures while fetching sync data
         self._sync_backoff = 1
+        # External network ids, refreshed at each synchronization cycle
+        self._ext_networks = None
         # Store the looping call in an instance variable to allow unit tests
         # for controlling its lifecycle
         self._sync_looping_call = _start_loopingcall(
@@ -239,6 +386,50 @@ class NvpSynchronizer():
             neutron_data['status'] = status
             context.session.add(neutron_data)
 
+    def _update_neutron_objects(self, context, model, status_updates):
+        """Write status changes with one UPDATE per status value.
+
+        status_updates maps each status to the list of neutron objects
+        which must be moved to it.
+        """
+        for status, neutron_objects in status_updates.iteritems():
+            ids = [neutron_data['id'] for neutron_data in neutron_objects]
+            LOG.debug(_("Updating status for neutron resources %(q_ids)s "
+                        "to: %(status)s"), {'q_ids': ids, 'status': status})
+            context.session.query(model).filter(model.id.in_(ids)).update(
+                {'status': status}, synchronize_session=False)
+            # Keep the objects loaded in the session consistent with the
+            # database without flushing them again
+            for neutron_data in neutron_objects:
+                attributes.set_committed_value(neutron_data, 'status',
+                                               status)
+
+    def _get_ext_networks(self, context):
+        if self._ext_networks is None:
+            self._ext_networks = set(
+                net_id for (net_id,) in context.session.query(
+                    external_net_db.ExternalNetwork.network_id))
+        return self._ext_networks
+
+    def _get_network_status(self, lswitches):
+        # By default assume things go wrong
+        status = constants.NET_STATUS_ERROR
+        # In most cases lswitches will contain a single element
+        for ls in lswitches:
+            if not ls:
+                # Logical switch was deleted
+                break
+            ls_status = ls['_relations']['LogicalSwitchStatus']
+            if not ls_status['fabric_status']:
+                status = constants.NET_STATUS_DOWN
+                break
+        else:
+            # No switch was down or missing. Set status to ACTIVE unless
+            # there were no switches in the first place!
+            if lswitches:
+                status = constants.NET_STATUS_ACTIVE
+        return status
+
     def synchronize_network(self, context, neutron_network_data,
                             lswitches=None):
         """Synchronize a Neutron network with its NVP counterpart.
@@ -261,22 +452,7 @@ class NvpSynchronizer():
             else:
                 for lswitch in lswitches:
                     self._nvp_cache.update_lswitch(lswitch)
-        # By default assume things go wrong
-        status = constants.NET_STATUS_ERROR
-        # In most cases lswitches will contain a single element
-        for ls in lswitches:
-            if not ls:
-                # Logical switch was deleted
-                break
-            ls_status = ls['_relations']['LogicalSwitchStatus']
-            if not ls_status['fabric_status']:
-                status = constants.NET_STATUS_DOWN
-                break
-        else:
-            # No switch was down or missing. Set status to ACTIVE unless
-            # there were no switches in the first place!
-            if lswitches:
-                status = constants.NET_STATUS_ACTIVE
+        status = self._get_network_status(lswitches)
         # Update db object
         self._update_neutron_object(context, neutron_network_data, status)
 
@@ -297,6 +473,7 @@ class NvpSynchronizer():
             neutron_nvp_mappings[neutron_id] = (
                 neutron_nvp_mappings.get(neutron_id, []) +
                 [self._nvp_cache[ls_uuid]])
+        status_updates = {}
         with ctx.session.begin(subtransactions=True):
             # Fetch neutron networks from database
             filters = {'router:external': [False]}
@@ -307,7 +484,23 @@ class NvpSynchronizer():
                 ctx, models_v2.Network, filters=filters):
                 lswitches = neutron_nvp_mappings.get(network['id'], [])
                 lswitches = [lswitch.get('data') for lswitch in lswitches]
-                self.synchronize_network(ctx, network, lswitches)
+                status = self._get_network_status(lswitches)
+                if status != network['status']:
+                    status_updates.setdefault(status, []).append(network)
+            self._update_neutron_objects(ctx, models_v2.Network,
+                                         status_updates)
+
+    def _get_router_status(self, lrouter):
+        # By default assume things go wrong
+        status = constants.NET_STATUS_ERROR
+        if lrouter:
+            lr_status = (lrouter['_relations']
+                         ['LogicalRouterStatus']
+                         ['fabric_status'])
+            status = (lr_status and
+                      constants.NET_STATUS_ACTIVE
+                      or constants.NET_STATUS_DOWN)
+        return status
 
     def synchronize_router(self, context, neutron_router_data,
                            lrouter=None):
@@ -331,15 +524,7 @@ class NvpSynchronizer():
 
         # Note(salv-orlando): It might worth adding a check to verify neutron
         # resource tag in nvp entity matches a Neutron id.
-        # By default assume things go wrong
-        status = constants.NET_STATUS_ERROR
-        if lrouter:
-            lr_status = (lrouter['_relations']
-                         ['LogicalRouterStatus']
-                         ['fabric_status'])
-            status = (lr_status and
-                      constants.NET_STATUS_ACTIVE
-                      or constants.NET_STATUS_DOWN)
+        status = self._get_router_status(lrouter)
         # Update db object
         self._update_neutron_object(context, neutron_router_data, status)
 
@@ -348,6 +533,7 @@ class NvpSynchronizer():
             return
         neutron_router_mappings = (
             dict((lr_uuid, self._nvp_cache[lr_uuid]) for lr_uuid in lr_uuids))
+        status_updates = {}
         with ctx.session.begin(subtransactions=True):
             # Fetch neutron routers from database
             filters = ({} if scan_missing else
@@ -355,19 +541,32 @@ class NvpSynchronizer():
             for router in self._plugin._get_collection_query(
                 ctx, l3_db.Router, filters=filters):
                 lrouter = neutron_router_mappings.get(router['id'])
-                self.synchronize_router(
-                    ctx, router, lrouter and lrouter.get('data'))
+                status = self._get_router_status(
+                    lrouter and lrouter.get('data'))
+                if status != router['status']:
+                    status_updates.setdefault(status, []).append(router)
+            self._update_neutron_objects(ctx, l3_db.Router, status_updates)
+
+    def _get_port_status(self, lswitchport):
+        # By default assume things go wrong
+        status = constants.PORT_STATUS_ERROR
+        if lswitchport:
+            lp_status = (lswitchport['_relations']
+                         ['LogicalPortStatus']
+                         ['link_status_up'])
+            status = (lp_status and
+                      constants.PORT_STATUS_ACTIVE
+                      or constants.PORT_STATUS_DOWN)
+        return status
 
     def synchronize_port(self, context, neutron_port_data,
                          lswitchport=None, ext_networks=None):
         """Synchronize a Neutron port with its NVP counterpart."""
         # Skip synchronization for ports on external networks
         if not ext_networks:
-            ext_networks = [net['id'] for net in context.session.query(
-                models_v2.Network).join(
-                    external_net_db.ExternalNetwork,
-                    (models_v2.Network.id ==
-                     external_net_db.ExternalNetwork.network_id))]
+            ext_networks = [net_id for (net_id,) in context.session.query(
+                external_net_db.ExternalNetwork.network_id).filter_by(
+                    network_id=neutron_port_data['network_id'])]
         if neutron_port_data['network_id'] in ext_networks:
             with context.session.begin(subtransactions=True):
                 neutron_port_data['status'] = constants.PORT_STATUS_ACTIVE
@@ -397,15 +596,7 @@ class NvpSynchronizer():
                     self._nvp_cache.update_lswitchport(lswitchport)
         # Note(salv-orlando): It might worth adding a check to verify neutron
         # resource tag in nvp entity matches Neutron id.
-        # By default assume things go wrong
-        status = constants.PORT_STATUS_ERROR
-        if lswitchport:
-            lp_status = (lswitchport['_relations']
-                         ['LogicalPortStatus']
-                         ['link_status_up'])
-            status = (lp_status and
-                      constants.PORT_STATUS_ACTIVE
-                      or constants.PORT_STATUS_DOWN)
+        status = self._get_port_status(lswitchport)
         # Update db object
         self._update_neutron_object(context, neutron_port_data, status)
 
@@ -425,24 +616,25 @@ class NvpSynchronizer():
             if neutron_port_id:
                 neutron_port_mappings[neutron_port_id] = (
                     self._nvp_cache[lp_uuid])
+        status_updates = {}
         with ctx.session.begin(subtransactions=True):
             # Fetch neutron ports from database
             # At the first sync we need to fetch all ports
             filters = ({} if scan_missing else
                        {'id': neutron_port_mappings.keys()})
-            # TODO(salv-orlando): Work out a solution for avoiding
-            # this query
-            ext_nets = [net['id'] for net in ctx.session.query(
-                models_v2.Network).join(
-                    external_net_db.ExternalNetwork,
-                    (models_v2.Network.id ==
-                     external_net_db.ExternalNetwork.network_id))]
+            ext_nets = self._get_ext_networks(ctx)
             for port in self._plugin._get_collection_query(
                 ctx, models_v2.Port, filters=filters):
-                lswitchport = neutron_port_mappings.get(port['id'])
-                self.synchronize_port(
-                    ctx, port, lswitchport and lswitchport.get('data'),
-                    ext_networks=ext_nets)
+                if port['network_id'] in ext_nets:
+                    # Skip synchronization for ports on external networks
+                    status = constants.PORT_STATUS_ACTIVE
+                else:
+                    lswitchport = neutron_port_mappings.get(port['id'])
+                    status = self._get_port_status(
+                        lswitchport and lswitchport.get('data'))
+                if status != port['status']:
+                    status_updates.setdefault(status, []).append(port)
+            self._update_neutron_objects(ctx, models_v2.Port, status_updates)
 
     def _get_chunk_size(self, sp):
         # NOTE(salv-orlando): Try to use __future__ for this routine only?
@@ -493,29 +685,79 @@ class NvpSynchronizer():
             return results, cursor if page_size else 'start', total_size
         return [], cursor, None
 
+    def _get_remaining(self, sp):
+        """Return the number of resources of each type left to fetch."""
+        remaining = {}
+        for res in ('ls', 'lr', 'lp'):
+            if getattr(sp, '%s_cursor' % res):
+                # There might be more resources than counted at the
+                # beginning of the cycle
+                remaining[res] = max(getattr(sp, '%s_remaining' % res), 1)
+            else:
+                remaining[res] = 0
+        return remaining
+
+    def _get_page_sizes(self, sp, chunk_size):
+        """Share the chunk size between the resource types to fetch.
+
+        The resource counts are not known until the first chunk has been
+        fetched, so the first chunk is split evenly. The following chunks
+        fetch an equal part of what remains of each resource type, so that
+        all of them are fetched by the last chunk of the cycle.
+        """
+        remaining = self._get_remaining(sp)
+        active = [res for res in remaining if remaining[res]]
+        if not active:
+            return {}
+        if sp.current_chunk == 0:
+            size = chunk_size / len(active) + (chunk_size % len(active) != 0)
+            return dict((res, size) for res in active)
+        total = sum(remaining.values())
+        chunks_left = total / chunk_size + (total % chunk_size != 0)
+        return dict((res, remaining[res] / chunks_left +
+                     (remaining[res] % chunks_left != 0))
+                    for res in active)
+
     def _fetch_nvp_data_chunk(self, sp):
         base_chunk_size = sp.chunk_size
         chunk_size = base_chunk_size + sp.extra_chunk_size
         LOG.info(_("Fetching up to %s resources "
                    "from NVP backend"), chunk_size)
-        fetched = ls_count = lr_count = lp_count = 0
-        lswitches = lrouters = lswitchports = []
-        if sp.ls_cursor or sp.ls_cursor == 'start':
-            (lswitches, sp.ls_cursor, ls_count) = self._fetch_data(
-                self.LS_URI, sp.ls_cursor, chunk_size)
-            fetched = len(lswitches)
-        if fetched < chunk_size and sp.lr_cursor or sp.lr_cursor == 'start':
-            (lrouters, sp.lr_cursor, lr_count) = self._fetch_data(
-                self.LR_URI, sp.lr_cursor, max(chunk_size - fetched, 0))
-        fetched += len(lrouters)
-        if fetched < chunk_size and sp.lp_cursor or sp.lp_cursor == 'start':
-            (lswitchports, sp.lp_cursor, lp_count) = self._fetch_data(
-                self.LP_URI, sp.lp_cursor, max(chunk_size - fetched, 0))
-        fetched += len(lswitchports)
+        uris = {'ls': self.LS_URI, 'lr': self.LR_URI, 'lp': self.LP_URI}
+        cursors = dict((res, getattr(sp, '%s_cursor' % res)) for res in uris)
+        page_sizes = self._get_page_sizes(sp, chunk_size)
+        # The three resource types are fetched concurrently through the
+        # api client connection pool. Pages of a single resource type are
+        # still fetched one after the other as each page request needs
+        # the cursor returned with the previous page.
+        pool = eventlet.GreenPool(len(uris))
+        threads = dict((res, pool.spawn(self._fetch_data, uris[res],
+                                        cursors[res], page_sizes[res]))
+                       for res in page_sizes)
+        results = {}
+        error = None
+        for res, thread in threads.iteritems():
+            try:
+                results[res] = thread.wait()
+            except Exception as e:
+                error = error or e
+        if error:
+            raise error
+        fetched = {}
+        counts = {}
+        for res in uris:
+            (fetched[res], cursor, counts[res]) = results.get(
+                res, ([], cursors[res], None))
+            setattr(sp, '%s_cursor' % res, cursor)
         if sp.current_chunk == 0:
             # No cursors were provided. Then it must be possible to
             # calculate the total amount of data to fetch
-            sp.total_size = ls_count + lr_count + lp_count
+            for res in uris:
+                setattr(sp, '%s_remaining' % res, counts[res] or 0)
+            sp.total_size = sum(counts[res] or 0 for res in uris)
+        for res in uris:
+            setattr(sp, '%s_remaining' % res,
+                    getattr(sp, '%s_remaining' % res) - len(fetched[res]))
         LOG.debug(_("Total data size: %d"), sp.total_size)
         sp.chunk_size = self._get_chunk_size(sp)
         # Calculate chunk size adjustment
@@ -523,10 +765,10 @@ class NvpSynchronizer():
         LOG.debug(_("Fetched %(num_lswitches)d logical switches, "
                     "%(num_lswitchports)d logical switch ports,"
                     "%(num_lrouters)d logical routers"),
-                  {'num_lswitches': len(lswitches),
-                   'num_lswitchports': len(lswitchports),
-                   'num_lrouters': len(lrouters)})
-        return (lswitches, lrouters, lswitchports)
+                  {'num_lswitches': len(fetched['ls']),
+                   'num_lswitchports': len(fetched['lp']),
+                   'num_lrouters': len(fetched['lr'])})
+        return (fetched['ls'], fetched['lr'], fetched['lp'])
 
     def _synchronize_state(self, sp):
         # If the plugin has been destroyed, stop the LoopingCall
@@ -536,6 +778,8 @@ class NvpSynchronizer():
         # Reset page cursor variables if necessary
         if sp.current_chunk == 0:
             sp.ls_cursor = sp.lr_cursor = sp.lp_cursor = 'start'
+            # Pick up external networks created since the last cycle
+            self._ext_networks = None
         LOG.info(_("Running state synchronization task. Chunk: %s"),
                  sp.current_chunk)
         # Fetch chunk_size data from NVP
@@ -552,11 +796,10 @@ class NvpSynchronizer():
             return sleep_interval
         LOG.debug(_("Time elapsed querying NVP: %s"),
                   timeutils.utcnow() - start)
-        if sp.total_size:
-            num_chunks = ((sp.total_size / sp.chunk_size) +
-                          (sp.total_size % sp.chunk_size != 0))
-        else:
-            num_chunks = 1
+        # The cycle ends with the chunk fetching the last resources
+        remaining = sum(self._get_remaining(sp).values())
+        num_chunks = (sp.current_chunk + 1 + remaining / sp.chunk_size +
+                      (remaining % sp.chunk_size != 0))
         LOG.debug(_("Number of chunks: %d"), num_chunks)
         # Find objects which have changed on NVP side and need
         # to be synchronized
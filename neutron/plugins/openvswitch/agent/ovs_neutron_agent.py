@@ -345,6 +345,10 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
 
     def fdb_add(self, context, fdb_entries):
         LOG.debug(_("fdb_add received"))
+        # All the flows of one fdb message are sent to ovs-ofctl in a single
+        # batch, flooding flows being rewritten once per local vlan
+        flood_lvms = {}
+        deferred = False
         for network_id, values in fdb_entries.items():
             lvm = self.local_vlan_map.get(network_id)
             if not lvm:
@@ -353,7 +357,9 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
             agent_ports = values.get('ports')
             agent_ports.pop(self.local_ip, None)
             if len(agent_ports):
-                self.tun_br.defer_apply_on()
+                if not deferred:
+                    self.tun_br.defer_apply_on()
+                    deferred = True
                 for agent_ip, ports in agent_ports.items():
                     # Ensure we have a tunnel port with this remote agent
                     ofport = self.tun_br_ofports[
@@ -365,11 +371,18 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                         if ofport == 0:
                             continue
                     for port in ports:
-                        self._add_fdb_flow(port, agent_ip, lvm, ofport)
-                self.tun_br.defer_apply_off()
+                        if self._add_fdb_flow(port, agent_ip, lvm, ofport):
+                            flood_lvms[lvm.vlan] = lvm
+        if deferred:
+            for lvm in flood_lvms.values():
+                self._set_flood_flow(lvm)
+            self.tun_br.defer_apply_off()
 
     def fdb_remove(self, context, fdb_entries):
         LOG.debug(_("fdb_remove received"))
+        flood_lvms = {}
+        removed_ofports = set()
+        deferred = False
         for network_id, values in fdb_entries.items():
             lvm = self.local_vlan_map.get(network_id)
             if not lvm:
@@ -378,25 +391,50 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
             agent_ports = values.get('ports')
             agent_ports.pop(self.local_ip, None)
             if len(agent_ports):
-                self.tun_br.defer_apply_on()
+                if not deferred:
+                    self.tun_br.defer_apply_on()
+                    deferred = True
                 for agent_ip, ports in agent_ports.items():
                     ofport = self.tun_br_ofports[
                         lvm.network_type].get(agent_ip)
                     if not ofport:
                         continue
                     for port in ports:
-                        self._del_fdb_flow(port, agent_ip, lvm, ofport)
-                self.tun_br.defer_apply_off()
-
-    def _add_fdb_flow(self, port_info, agent_ip, lvm, ofport):
-        if port_info == q_const.FLOODING_ENTRY:
-            lvm.tun_ofports.add(ofport)
-            ofports = ','.join(lvm.tun_ofports)
+                        if self._del_fdb_flow(port, agent_ip, lvm, ofport):
+                            flood_lvms[lvm.vlan] = lvm
+                            removed_ofports.add((ofport, lvm.network_type))
+        if deferred:
+            for lvm in flood_lvms.values():
+                self._set_flood_flow(lvm)
+            self.tun_br.defer_apply_off()
+        # Tunnel ports are only deleted once no flow references them anymore
+        for ofport, network_type in removed_ofports:
+            self.cleanup_tunnel_port(ofport, network_type)
+
+    def _set_flood_flow(self, lvm):
+        if lvm.tun_ofports:
+            ofports = ','.join(sorted(lvm.tun_ofports))
             self.tun_br.mod_flow(table=constants.FLOOD_TO_TUN,
                                  priority=1,
                                  dl_vlan=lvm.vlan,
                                  actions="strip_vlan,set_tunnel:%s,"
                                  "output:%s" % (lvm.segmentation_id, ofports))
+        else:
+            # This local vlan doesn't require any more tunelling
+            self.tun_br.delete_flows(table=constants.FLOOD_TO_TUN,
+                                     dl_vlan=lvm.vlan)
+
+    def _add_fdb_flow(self, port_info, agent_ip, lvm, ofport):
+        """Add the flow for an fdb entry.
+
+        Returns True when the entry changes the set of tunnel ports used to
+        flood the local vlan, the flooding flow is then left to the caller.
+        """
+        if port_info == q_const.FLOODING_ENTRY:
+            if ofport in lvm.tun_ofports:
+                return False
+            lvm.tun_ofports.add(ofport)
+            return True
         else:
             # TODO(feleouet): add ARP responder entry
             self.tun_br.add_flow(table=constants.UCAST_TO_TUN,
@@ -405,29 +443,25 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                                  dl_dst=port_info[0],
                                  actions="strip_vlan,set_tunnel:%s,output:%s" %
                                  (lvm.segmentation_id, ofport))
+            return False
 
     def _del_fdb_flow(self, port_info, agent_ip, lvm, ofport):
+        """Delete the flow for an fdb entry.
+
+        Returns True when the entry changes the set of tunnel ports used to
+        flood the local vlan, the flooding flow is then left to the caller.
+        """
         if port_info == q_const.FLOODING_ENTRY:
+            if ofport not in lvm.tun_ofports:
+                return False
             lvm.tun_ofports.remove(ofport)
-            if len(lvm.tun_ofports) > 0:
-                ofports = ','.join(lvm.tun_ofports)
-                self.tun_br.mod_flow(table=constants.FLOOD_TO_TUN,
-                                     priority=1,
-                                     dl_vlan=lvm.vlan,
-                                     actions="strip_vlan,"
-                                     "set_tunnel:%s,output:%s" %
-                                     (lvm.segmentation_id, ofports))
-            else:
-                # This local vlan doesn't require any more tunelling
-                self.tun_br.delete_flows(table=constants.FLOOD_TO_TUN,
-                                         dl_vlan=lvm.vlan)
-            # Check if this tunnel port is still used
-            self.cleanup_tunnel_port(ofport, lvm.network_type)
+            return True
         else:
             #TODO(feleouet): remove ARP responder entry
             self.tun_br.delete_flows(table=constants.UCAST_TO_TUN,
                                      dl_vlan=lvm.vlan,
                                      dl_dst=port_info[0])
+            return False
 
     def fdb_update(self, context, fdb_entries):
         LOG.debug(_("fdb_update received"))
@@ -49,6 +49,17 @@ class FWaaSL3PluginApi(api.FWaaSPluginApiMixin):
                                        host=self.host),
                          topic=self.topic)
 
+    def get_firewalls_for_tenants(self, context, tenant_ids):
+        """Get the Firewalls with rules of the given Tenants from Plugin."""
+        LOG.debug(_("Retrieve Firewalls with rules for Tenants from Plugin"))
+
+        return self.call(context,
+                         self.make_msg('get_firewalls_for_tenants',
+                                       tenant_ids=tenant_ids,
+                                       host=self.host),
+                         topic=self.topic,
+                         version='1.1')
+
     def get_tenants_with_firewalls(self, context, **kwargs):
         """Get all Tenants that have Firewalls configured from plugin."""
         LOG.debug(_("Retrieve Tenants with Firewalls configured from Plugin"))
@@ -83,27 +94,35 @@ class FWaaSL3AgentRpcCallback(api.FWaaSAgentRpcCallbackMixin):
                                              conf.host)
         super(FWaaSL3AgentRpcCallback, self).__init__(host=conf.host)
 
+    def _get_local_namespaces(self):
+        if not self.conf.use_namespaces:
+            return set()
+        root_ip = ip_lib.IPWrapper(self.root_helper)
+        return set(root_ip.get_namespaces(self.root_helper))
+
+    def _get_router_info_by_tenant(self, routers):
+        """Returns tenant_id->router info objects on which to apply the fw.
+
+        The namespaces of the host are listed once for all the routers.
+        """
+        local_ns_list = self._get_local_namespaces()
+        tenant_router_info = {}
+        for router in routers:
+            ri = self.router_info.get(router['id'])
+            if not ri:
+                continue
+            # Pick up namespaces for Tenant Routers
+            if ri.use_namespaces and ri.ns_name() not in local_ns_list:
+                continue
+            tenant_router_info.setdefault(router['tenant_id'], []).append(ri)
+        return tenant_router_info
+
     def _get_router_info_list_for_tenant(self, routers, tenant_id):
         """Returns the list of router info objects on which to apply the fw."""
-        root_ip = ip_lib.IPWrapper(self.root_helper)
         # Get the routers for the tenant
-        router_ids = [
-            router['id']
-            for router in routers
-            if router['tenant_id'] == tenant_id]
-        local_ns_list = root_ip.get_namespaces(
-            self.root_helper) if self.conf.use_namespaces else []
-
-        router_info_list = []
-        # Pick up namespaces for Tenant Routers
-        for rid in router_ids:
-            if self.router_info[rid].use_namespaces:
-                router_ns = self.router_info[rid].ns_name()
-                if router_ns in local_ns_list:
-                    router_info_list.append(self.router_info[rid])
-            else:
-                router_info_list.append(self.router_info[rid])
-        return router_info_list
+        routers = [router for router in routers
+                   if router['tenant_id'] == tenant_id]
+        return self._get_router_info_by_tenant(routers).get(tenant_id, [])
 
     def _invoke_driver_for_plugin_api(self, context, fw, func_name):
         """Invoke driver method for plugin API and provide status back."""
@@ -189,23 +208,20 @@ class FWaaSL3AgentRpcCallback(api.FWaaSAgentRpcCallbackMixin):
     def _process_router_add(self, ri):
         """On router add, get fw with rules from plugin and update driver."""
         LOG.debug(_("Process router add, router_id: '%s'"), ri.router['id'])
-        routers = []
-        routers.append(ri.router)
-        router_info_list = self._get_router_info_list_for_tenant(
-            routers,
-            ri.router['tenant_id'])
-        if router_info_list:
-            # Get the firewall with rules
-            # for the tenant the router is on.
-            ctx = context.Context('', ri.router['tenant_id'])
-            fw_list = self.fwplugin_rpc.get_firewalls_for_tenant(ctx)
-            LOG.debug(_("Process router add, fw_list: '%s'"),
-                      [fw['id'] for fw in fw_list])
-            for fw in fw_list:
-                self._invoke_driver_for_sync_from_plugin(
-                    ctx,
-                    router_info_list,
-                    fw)
+        # The agent has just created the namespace of the router, there is
+        # no need to list the namespaces of the host.
+        router_info_list = [ri]
+        # Get the firewall with rules
+        # for the tenant the router is on.
+        ctx = context.Context('', ri.router['tenant_id'])
+        fw_list = self.fwplugin_rpc.get_firewalls_for_tenant(ctx)
+        LOG.debug(_("Process router add, fw_list: '%s'"),
+                  [fw['id'] for fw in fw_list])
+        for fw in fw_list:
+            self._invoke_driver_for_sync_from_plugin(
+                ctx,
+                router_info_list,
+                fw)
 
     def process_router_add(self, ri):
         """On router add, get fw with rules from plugin and update driver."""
@@ -228,36 +244,27 @@ class FWaaSL3AgentRpcCallback(api.FWaaSAgentRpcCallbackMixin):
         try:
             # get all routers
             routers = self.plugin_rpc.get_routers(ctx)
-            # get the list of tenants with firewalls configured
-            # from the plugin
-            tenant_ids = self.fwplugin_rpc.get_tenants_with_firewalls(ctx)
-            LOG.debug(_("Tenants with Firewalls: '%s'"), tenant_ids)
-            for tenant_id in tenant_ids:
-                ctx = context.Context('', tenant_id)
-                fw_list = self.fwplugin_rpc.get_firewalls_for_tenant(ctx)
-                if fw_list:
-                    # if fw present on tenant
-                    router_info_list = self._get_router_info_list_for_tenant(
-                        routers,
-                        tenant_id)
-                    if router_info_list:
-                        LOG.debug(_("Router List: '%s'"),
-                                  [ri.router['id'] for ri in router_info_list])
-                        LOG.debug(_("fw_list: '%s'"),
-                                  [fw['id'] for fw in fw_list])
-                        # apply sync data on fw for this tenant
-                        for fw in fw_list:
-                            # fw, routers present on this host for tenant
-                            # install
-                            LOG.debug(_("Apply fw on Router List: '%s'"),
-                                      [ri.router['id']
-                                          for ri in router_info_list])
-                            # no need to apply sync data for ACTIVE fw
-                            if fw['status'] != constants.ACTIVE:
-                                self._invoke_driver_for_sync_from_plugin(
-                                    ctx,
-                                    router_info_list,
-                                    fw)
+            tenant_router_info = self._get_router_info_by_tenant(routers)
+            # get the firewalls with rules of the tenants having
+            # routers on this host from the plugin
+            fw_list = []
+            if tenant_router_info:
+                fw_list = self.fwplugin_rpc.get_firewalls_for_tenants(
+                    ctx, list(tenant_router_info))
+            LOG.debug(_("fw_list: '%s'"), [fw['id'] for fw in fw_list])
+            for fw in fw_list:
+                # no need to apply sync data for ACTIVE fw
+                if fw['status'] == constants.ACTIVE:
+                    continue
+                # fw, routers present on this host for tenant
+                # install
+                router_info_list = tenant_router_info[fw['tenant_id']]
+                LOG.debug(_("Apply fw on Router List: '%s'"),
+                          [ri.router['id'] for ri in router_info_list])
+                self._invoke_driver_for_sync_from_plugin(
+                    context.Context('', fw['tenant_id']),
+                    router_info_list,
+                    fw)
             self.services_sync = False
         except Exception:
             LOG.exception(_("Failed fwaas process services sync"))
@@ -17,6 +17,8 @@
 #
 # @author: Rajesh Mohan, Rajesh_Mohan3@Dell.com, DELL Inc.
 
+import eventlet
+
 from neutron.agent.linux import iptables_manager
 from neutron.extensions import firewall as fw_ext
 from neutron.openstack.common import log as logging
@@ -48,6 +50,8 @@ class IptablesFwaasDriver(fwaas_base.FwaasDriverBase):
 
     def __init__(self):
         LOG.debug(_("Initializing fwaas iptables driver"))
+        # (fwid, router_id)->(iptables manager, rules applied on it)
+        self.applied_rules = {}
 
     def create_firewall(self, apply_list, firewall):
         LOG.debug(_('Creating firewall %(fw_id)s for tenant %(tid)s)'),
@@ -68,6 +72,7 @@ class IptablesFwaasDriver(fwaas_base.FwaasDriverBase):
         fwid = firewall['id']
         try:
             for router_info in apply_list:
+                self.applied_rules.pop((fwid, router_info.router_id), None)
                 ipt_mgr = router_info.iptables_manager
                 self._remove_chains(fwid, ipt_mgr)
                 self._remove_default_chains(ipt_mgr)
@@ -96,6 +101,7 @@ class IptablesFwaasDriver(fwaas_base.FwaasDriverBase):
         fwid = firewall['id']
         try:
             for router_info in apply_list:
+                self.applied_rules.pop((fwid, router_info.router_id), None)
                 ipt_mgr = router_info.iptables_manager
 
                 # the following only updates local memory; no hole in FW
@@ -115,10 +121,33 @@ class IptablesFwaasDriver(fwaas_base.FwaasDriverBase):
             raise fw_ext.FirewallInternalDriverError(driver=FWAAS_DRIVER_NAME)
 
     def _setup_firewall(self, apply_list, firewall):
-        fwid = firewall['id']
-        for router_info in apply_list:
-            ipt_mgr = router_info.iptables_manager
-
+        """Apply the firewall on the routers concurrently."""
+        fw_rules = self._get_fw_rules(firewall)
+        pool = eventlet.GreenPool()
+        threads = [pool.spawn(self._setup_router_firewall,
+                              router_info, firewall['id'], fw_rules)
+                   for router_info in apply_list]
+        error = None
+        for thread in threads:
+            try:
+                thread.wait()
+            except Exception as e:
+                error = error or e
+        if error:
+            raise error
+
+    def _setup_router_firewall(self, router_info, fwid, fw_rules):
+        ipt_mgr = router_info.iptables_manager
+        key = (fwid, router_info.router_id)
+        applied_mgr, applied_rules = self.applied_rules.pop(key,
+                                                            (None, None))
+        if applied_mgr is ipt_mgr:
+            if applied_rules == fw_rules:
+                self.applied_rules[key] = (ipt_mgr, fw_rules)
+                return
+            # only the chains of the changed ip versions are rewritten
+            self._update_chains(fwid, ipt_mgr, applied_rules, fw_rules)
+        else:
             # the following only updates local memory; no hole in FW
             self._remove_chains(fwid, ipt_mgr)
             self._remove_default_chains(ipt_mgr)
@@ -126,54 +155,73 @@ class IptablesFwaasDriver(fwaas_base.FwaasDriverBase):
             # create default 'DROP ALL' policy chain
             self._add_default_policy_chain_v4v6(ipt_mgr)
             #create chain based on configured policy
-            self._setup_chains(firewall, ipt_mgr)
+            self._setup_chains(fwid, fw_rules, ipt_mgr)
 
-            # apply the changes
-            ipt_mgr.apply()
+        # apply the changes
+        ipt_mgr.apply()
+        self.applied_rules[key] = (ipt_mgr, fw_rules)
 
     def _get_chain_name(self, fwid, ver, direction):
         return '%s%s%s' % (CHAIN_NAME_PREFIX[direction],
                            IP_VER_TAG[ver],
                            fwid)
 
-    def _setup_chains(self, firewall, ipt_mgr):
-        """Create Fwaas chain using the rules in the policy
-        """
-        fw_rules_list = firewall['firewall_rule_list']
-        fwid = firewall['id']
+    def _get_fw_rules(self, firewall):
+        """Return the (ip version, iptables rule) of the enabled rules."""
+        fw_rules = []
+        for rule in firewall['firewall_rule_list']:
+            if not rule['enabled']:
+                continue
+            iptbl_rule = self._convert_fwaas_to_iptables_rule(rule)
+            ver = IPV4 if rule['ip_version'] == 4 else IPV6
+            fw_rules.append((ver, iptbl_rule))
+        return fw_rules
+
+    def _get_table(self, ipt_mgr, ver):
+        if ver == IPV4:
+            return ipt_mgr.ipv4['filter']
+        return ipt_mgr.ipv6['filter']
 
-        #default rules for invalid packets and established sessions
-        invalid_rule = self._drop_invalid_packets_rule()
-        est_rule = self._allow_established_rule()
+    def _get_default_rules(self):
+        """Default rules for invalid packets and established sessions."""
+        return [self._drop_invalid_packets_rule(),
+                self._allow_established_rule()]
 
+    def _setup_chains(self, fwid, fw_rules, ipt_mgr):
+        """Create Fwaas chain using the rules in the policy
+        """
         for ver in [IPV4, IPV6]:
-            if ver == IPV4:
-                table = ipt_mgr.ipv4['filter']
-            else:
-                table = ipt_mgr.ipv6['filter']
+            table = self._get_table(ipt_mgr, ver)
             ichain_name = self._get_chain_name(fwid, ver, INGRESS_DIRECTION)
             ochain_name = self._get_chain_name(fwid, ver, EGRESS_DIRECTION)
             for name in [ichain_name, ochain_name]:
                 table.add_chain(name)
-                table.add_rule(name, invalid_rule)
-                table.add_rule(name, est_rule)
+                for default_rule in self._get_default_rules():
+                    table.add_rule(name, default_rule)
 
-        for rule in fw_rules_list:
-            if not rule['enabled']:
-                continue
-            iptbl_rule = self._convert_fwaas_to_iptables_rule(rule)
-            if rule['ip_version'] == 4:
-                ver = IPV4
-                table = ipt_mgr.ipv4['filter']
-            else:
-                ver = IPV6
-                table = ipt_mgr.ipv6['filter']
+        for ver, iptbl_rule in fw_rules:
+            table = self._get_table(ipt_mgr, ver)
             ichain_name = self._get_chain_name(fwid, ver, INGRESS_DIRECTION)
             ochain_name = self._get_chain_name(fwid, ver, EGRESS_DIRECTION)
             table.add_rule(ichain_name, iptbl_rule)
             table.add_rule(ochain_name, iptbl_rule)
         self._enable_policy_chain(fwid, ipt_mgr)
 
+    def _update_chains(self, fwid, ipt_mgr, old_fw_rules, fw_rules):
+        """Rewrite the chains whose rules changed, keeping the jumps."""
+        for ver in [IPV4, IPV6]:
+            rules = [rule for rule_ver, rule in fw_rules if rule_ver == ver]
+            old_rules = [rule for rule_ver, rule in old_fw_rules
+                         if rule_ver == ver]
+            if rules == old_rules:
+                continue
+            table = self._get_table(ipt_mgr, ver)
+            for direction in [INGRESS_DIRECTION, EGRESS_DIRECTION]:
+                chain_name = self._get_chain_name(fwid, ver, direction)
+                table.empty_chain(chain_name)
+                for rule in self._get_default_rules() + rules:
+                    table.add_rule(chain_name, rule)
+
     def _remove_default_chains(self, nsid):
         """Remove fwaas default policy chain."""
         self._remove_chain_by_name(IPV4, FWAAS_DEFAULT_CHAIN, nsid)
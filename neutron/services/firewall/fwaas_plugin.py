@@ -36,7 +36,10 @@ LOG = logging.getLogger(__name__)
 
 
 class FirewallCallbacks(object):
-    RPC_API_VERSION = '1.0'
+    RPC_API_VERSION = '1.1'
+    # history
+    #   1.0 Initial version
+    #   1.1 get_firewalls_for_tenants() method added
 
     def __init__(self, plugin):
         self.plugin = plugin
@@ -79,6 +82,16 @@ class FirewallCallbacks(object):
         ]
         return fw_list
 
+    def get_firewalls_for_tenants(self, context, tenant_ids=None, **kwargs):
+        """Agent uses this to get all firewalls and rules for tenants."""
+        LOG.debug(_("get_firewalls_for_tenants() called"))
+        if not tenant_ids:
+            return []
+        ctx = neutron_context.get_admin_context()
+        fw_list = self.plugin.get_firewalls(
+            ctx, filters={'tenant_id': tenant_ids})
+        return self.plugin._make_firewalls_dict_with_rules(ctx, fw_list)
+
     def get_firewalls_for_tenant_without_rules(self, context, **kwargs):
         """Agent uses this to get all firewalls for a tenant."""
         LOG.debug(_("get_firewalls_for_tenant_without_rules() called"))
@@ -182,6 +195,21 @@ class FirewallPlugin(firewall_db.Firewall_db_mixin):
         # then we will have a problem.
         return firewall
 
+    def _make_firewalls_dict_with_rules(self, context, firewalls):
+        """Add the rules to the firewalls, fetching them in one query."""
+        policy_ids = set(fw['firewall_policy_id'] for fw in firewalls
+                         if fw['firewall_policy_id'])
+        policy_rules = dict((policy_id, []) for policy_id in policy_ids)
+        if policy_ids:
+            fw_rules = self.get_firewall_rules(
+                context, filters={'firewall_policy_id': list(policy_ids)})
+            for fw_rule in sorted(fw_rules, key=lambda r: r['position']):
+                policy_rules[fw_rule['firewall_policy_id']].append(fw_rule)
+        for firewall in firewalls:
+            firewall['firewall_rule_list'] = list(
+                policy_rules.get(firewall['firewall_policy_id'], []))
+        return firewalls
+
     def _rpc_update_firewall(self, context, firewall_id):
         status_update = {"firewall": {"status": const.PENDING_UPDATE}}
         fw = super(FirewallPlugin, self).update_firewall(context, firewall_id,
@@ -16,6 +16,9 @@
 #
 # @author: Mark McClain, DreamHost
 
+import hashlib
+
+import eventlet
 from oslo.config import cfg
 
 from neutron.agent import rpc as agent_rpc
@@ -23,9 +26,11 @@ from neutron.common import constants as n_const
 from neutron.common import exceptions as n_exc
 from neutron import context
 from neutron.openstack.common import importutils
+from neutron.openstack.common import jsonutils
 from neutron.openstack.common import log as logging
 from neutron.openstack.common import loopingcall
 from neutron.openstack.common import periodic_task
+from neutron.openstack.common.rpc import common as rpc_common
 from neutron.plugins.common import constants
 from neutron.services.loadbalancer.drivers.haproxy import (
     agent_api,
@@ -45,6 +50,11 @@ OPTS = [
         'interface_driver',
         help=_('The driver used to manage the virtual interface')
     ),
+    cfg.IntOpt(
+        'num_resync_threads',
+        default=4,
+        help=_('Number of pools deployed concurrently during a resync')
+    ),
 ]
 
 
@@ -86,6 +96,14 @@ class LbaasAgentManager(periodic_task.PeriodicTasks):
         self.needs_resync = False
         # pool_id->device_driver_name mapping used to store known instances
         self.instance_mapping = {}
+        # pool_id->hash of the logical config deployed by the last resync
+        self.deployed_hashes = {}
+        # pool_id->stats last sent to the plugin
+        self.sent_stats = {}
+        # pools changed while their stats were being collected
+        self.invalidated_stats = set()
+        # cleared when the plugin doesn't support update_pools_stats
+        self.batch_stats = True
 
     def _load_drivers(self):
         self.device_drivers = {}
@@ -137,15 +155,85 @@ class LbaasAgentManager(periodic_task.PeriodicTasks):
 
     @periodic_task.periodic_task(spacing=6)
     def collect_stats(self, context):
+        self.invalidated_stats.clear()
+        pools_stats = {}
         for pool_id, driver_name in self.instance_mapping.items():
             driver = self.device_drivers[driver_name]
             try:
                 stats = driver.get_stats(pool_id)
-                if stats:
-                    self.plugin_rpc.update_pool_stats(pool_id, stats)
             except Exception:
                 LOG.exception(_('Error upating stats'))
                 self.needs_resync = True
+                continue
+            if stats:
+                changed = self._get_changed_stats(pool_id, stats)
+                if changed:
+                    pools_stats[pool_id] = (stats, changed)
+
+        if not pools_stats:
+            return
+        if self.batch_stats:
+            try:
+                self.plugin_rpc.update_pools_stats(
+                    dict((pool_id, changed)
+                         for pool_id, (stats, changed) in pools_stats.items()))
+            except rpc_common.RemoteError as e:
+                if e.exc_type != 'UnsupportedRpcVersion':
+                    LOG.exception(_('Error upating stats'))
+                    self.needs_resync = True
+                    return
+                LOG.info(_('The plugin does not support update_pools_stats, '
+                           'stats are sent for each pool'))
+                self.batch_stats = False
+            except Exception:
+                LOG.exception(_('Error upating stats'))
+                self.needs_resync = True
+                return
+            else:
+                self._stats_sent(pools_stats)
+                return
+
+        for pool_id, (stats, changed) in pools_stats.items():
+            try:
+                self.plugin_rpc.update_pool_stats(pool_id, changed)
+            except Exception:
+                LOG.exception(_('Error upating stats'))
+                self.needs_resync = True
+            else:
+                self._stats_sent({pool_id: (stats, changed)})
+
+    def _stats_sent(self, pools_stats):
+        for pool_id, (stats, changed) in pools_stats.items():
+            # Pools changed since their stats were read are sent in full
+            if pool_id not in self.invalidated_stats:
+                self.sent_stats[pool_id] = stats
+
+    def _invalidate_stats(self, pool_id):
+        # Pool and member events and deployments may set member statuses
+        # that the health reported by the stats must overwrite again
+        self.sent_stats.pop(pool_id, None)
+        self.invalidated_stats.add(pool_id)
+
+    def _get_changed_stats(self, pool_id, stats):
+        """Return the stats to send for a pool, None if nothing changed.
+
+        The plugin replaces the pool counters as a whole but only updates
+        the members it is given, so unchanged members are left out.
+        """
+        sent = self.sent_stats.get(pool_id, {})
+        sent_members = sent.get('members', {})
+        members = dict((member_id, member_stats)
+                       for member_id, member_stats
+                       in stats.get('members', {}).items()
+                       if sent_members.get(member_id) != member_stats)
+        counters = dict((key, value) for key, value in stats.items()
+                        if key != 'members')
+        sent_counters = dict((key, value) for key, value in sent.items()
+                             if key != 'members')
+        if not members and counters == sent_counters:
+            return
+        counters['members'] = members
+        return counters
 
     def sync_state(self):
         known_instances = set(self.instance_mapping.keys())
@@ -155,8 +243,19 @@ class LbaasAgentManager(periodic_task.PeriodicTasks):
             for deleted_id in known_instances - ready_instances:
                 self._destroy_pool(deleted_id)
 
+            logical_configs = {}
+            if ready_instances:
+                logical_configs = self.plugin_rpc.get_logical_devices(
+                    list(ready_instances))
+            pool = eventlet.GreenPool(self.conf.num_resync_threads)
             for pool_id in ready_instances:
-                self._reload_pool(pool_id)
+                if pool_id not in logical_configs:
+                    # not active anymore, left for the next resync
+                    self.needs_resync = True
+                    continue
+                pool.spawn_n(self._reload_pool, pool_id,
+                             logical_configs[pool_id])
+            pool.waitall()
 
         except Exception:
             LOG.exception(_('Unable to retrieve ready devices'))
@@ -168,12 +267,21 @@ class LbaasAgentManager(periodic_task.PeriodicTasks):
         if pool_id not in self.instance_mapping:
             raise DeviceNotFoundOnAgent(pool_id=pool_id)
 
+        # The instance is about to change, the next resync must deploy it
+        self.deployed_hashes.pop(pool_id, None)
+        self._invalidate_stats(pool_id)
         driver_name = self.instance_mapping[pool_id]
         return self.device_drivers[driver_name]
 
-    def _reload_pool(self, pool_id):
+    @staticmethod
+    def _get_config_hash(logical_config):
+        return hashlib.sha1(
+            jsonutils.dumps(logical_config, sort_keys=True)).hexdigest()
+
+    def _reload_pool(self, pool_id, logical_config=None):
         try:
-            logical_config = self.plugin_rpc.get_logical_device(pool_id)
+            if logical_config is None:
+                logical_config = self.plugin_rpc.get_logical_device(pool_id)
             driver_name = logical_config['driver']
             if driver_name not in self.device_drivers:
                 LOG.error(_('No device driver '
@@ -182,9 +290,15 @@ class LbaasAgentManager(periodic_task.PeriodicTasks):
                     'pool', pool_id, constants.ERROR)
                 return
 
-            self.device_drivers[driver_name].deploy_instance(logical_config)
-            self.instance_mapping[pool_id] = driver_name
+            config_hash = self._get_config_hash(logical_config)
+            if (self.instance_mapping.get(pool_id) != driver_name or
+                    self.deployed_hashes.get(pool_id) != config_hash):
+                self.device_drivers[driver_name].deploy_instance(
+                    logical_config)
+                self.instance_mapping[pool_id] = driver_name
+                self.deployed_hashes[pool_id] = config_hash
             self.plugin_rpc.pool_deployed(pool_id)
+            self._invalidate_stats(pool_id)
         except Exception:
             LOG.exception(_('Unable to deploy instance for pool: %s'), pool_id)
             self.needs_resync = True
@@ -194,6 +308,7 @@ class LbaasAgentManager(periodic_task.PeriodicTasks):
         try:
             driver.undeploy_instance(pool_id)
             del self.instance_mapping[pool_id]
+            self.sent_stats.pop(pool_id, None)
             self.plugin_rpc.pool_destroyed(pool_id)
         except Exception:
             LOG.exception(_('Unable to destroy device for pool: %s'), pool_id)
@@ -269,6 +384,7 @@ class LbaasAgentManager(periodic_task.PeriodicTasks):
         driver = self._get_driver(pool['id'])
         driver.delete_pool(pool)
         del self.instance_mapping[pool['id']]
+        self.sent_stats.pop(pool['id'], None)
 
     def create_member(self, context, member):
         driver = self._get_driver(member['pool_id'])
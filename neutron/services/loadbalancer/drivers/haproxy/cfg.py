@@ -17,6 +17,7 @@
 # @author: Mark McClain, DreamHost
 
 import itertools
+import os
 
 from neutron.agent.linux import utils
 from neutron.plugins.common import constants as qconstants
@@ -54,13 +55,38 @@ INACTIVE = qconstants.INACTIVE
 def save_config(conf_path, logical_config, socket_path=None,
                 user_group='nogroup'):
     """Convert a logical configuration to the HAProxy version."""
+    data = build_config(logical_config, socket_path=socket_path,
+                        user_group=user_group)
+    utils.replace_file(conf_path, '\n'.join(data))
+
+
+def build_config(logical_config, socket_path=None, user_group='nogroup',
+                 server_settings=True):
+    """Return the lines of the HAProxy configuration.
+
+    The server settings which can be changed at runtime through the stats
+    socket, the weight and the disabled state, are left out when
+    server_settings is False.
+    """
     data = []
     data.extend(_build_global(logical_config, socket_path=socket_path,
                               user_group=user_group))
     data.extend(_build_defaults(logical_config))
     data.extend(_build_frontend(logical_config))
-    data.extend(_build_backend(logical_config))
-    utils.replace_file(conf_path, '\n'.join(data))
+    data.extend(_build_backend(logical_config,
+                               server_settings=server_settings))
+    return data
+
+
+def get_server_settings(config):
+    """Return the weight and the admin state of each backend server."""
+    return dict((member['id'], (member['weight'], member['admin_state_up']))
+                for member in _get_backend_members(config))
+
+
+def _get_backend_members(config):
+    return [member for member in config['members']
+            if member['status'] in (ACTIVE, INACTIVE)]
 
 
 def _build_global(config, socket_path=None, user_group='nogroup'):
@@ -73,7 +99,9 @@ def _build_global(config, socket_path=None, user_group='nogroup'):
     ]
 
     if socket_path:
-        opts.append('stats socket %s mode 0666 level user' % socket_path)
+        # Only the agent may change the servers through the socket
+        opts.append('stats socket %s mode 0600 uid %d level admin' %
+                    (socket_path, os.getuid()))
 
     return itertools.chain(['global'], ('\t' + o for o in opts))
 
@@ -116,7 +144,7 @@ def _build_frontend(config):
     )
 
 
-def _build_backend(config):
+def _build_backend(config, server_settings=True):
     protocol = config['pool']['protocol']
     lb_method = config['pool']['lb_method']
 
@@ -136,14 +164,18 @@ def _build_backend(config):
     persist_opts = _get_session_persistence(config)
     opts.extend(persist_opts)
 
-    # add the members
-    for member in config['members']:
-        if member['status'] in (ACTIVE, INACTIVE) and member['admin_state_up']:
-            server = (('server %(id)s %(address)s:%(protocol_port)s '
-                       'weight %(weight)s') % member) + server_addon
-            if _has_http_cookie_persistence(config):
-                server += ' cookie %d' % config['members'].index(member)
-            opts.append(server)
+    # add the members, the ones which are administratively down are
+    # disabled so that they can be enabled through the stats socket
+    for member in _get_backend_members(config):
+        server = 'server %(id)s %(address)s:%(protocol_port)s' % member
+        if server_settings:
+            server += ' weight %(weight)s' % member
+        server += server_addon
+        if _has_http_cookie_persistence(config):
+            server += ' cookie %d' % config['members'].index(member)
+        if server_settings and not member['admin_state_up']:
+            server += ' disabled'
+        opts.append(server)
 
     return itertools.chain(
         ['backend %s' % config['pool']['id']],
@@ -26,8 +26,8 @@ from neutron.agent.common import config
 from neutron.agent.linux import ip_lib
 from neutron.agent.linux import utils
 from neutron.common import exceptions
-from neutron.common import utils as n_utils
 from neutron.openstack.common import importutils
+from neutron.openstack.common import lockutils
 from neutron.openstack.common import log as logging
 from neutron.plugins.common import constants
 from neutron.services.loadbalancer import constants as lb_const
@@ -79,6 +79,8 @@ class HaproxyNSDriver(agent_device_driver.AgentDeviceDriver):
         self.vif_driver = vif_driver
         self.plugin_rpc = plugin_rpc
         self.pool_to_port_id = {}
+        # last logical config deployed for each pool
+        self.deployed_configs = {}
 
     @classmethod
     def get_name(cls):
@@ -92,6 +94,12 @@ class HaproxyNSDriver(agent_device_driver.AgentDeviceDriver):
         self._spawn(logical_config)
 
     def update(self, logical_config):
+        if self._update_servers(logical_config):
+            return
+
+        if self._is_running(logical_config):
+            return
+
         pool_id = logical_config['pool']['id']
         pid_path = self._get_state_file_path(pool_id, 'pid')
 
@@ -116,15 +124,109 @@ class HaproxyNSDriver(agent_device_driver.AgentDeviceDriver):
 
         # remember the pool<>port mapping
         self.pool_to_port_id[pool_id] = logical_config['vip']['port']['id']
+        self.deployed_configs[pool_id] = logical_config
+
+    def _is_running(self, logical_config):
+        """Check if haproxy already runs with this exact configuration.
+
+        This is the case for the unchanged pools resynced after an agent
+        restart, they are then kept running instead of being reloaded.
+        """
+        pool_id = logical_config['pool']['id']
+        if pool_id in self.deployed_configs:
+            return False
+
+        conf_path = self._get_state_file_path(pool_id, 'conf')
+        sock_path = self._get_state_file_path(pool_id, 'sock')
+        try:
+            with open(conf_path, 'r') as conf_file:
+                running_config = conf_file.read()
+        except IOError:
+            return False
+        if running_config != '\n'.join(hacfg.build_config(
+                logical_config, sock_path, self.conf.haproxy.user_group)):
+            return False
+
+        self.pool_to_port_id[pool_id] = logical_config['vip']['port']['id']
+        self.deployed_configs[pool_id] = logical_config
+        return True
+
+    def _update_servers(self, logical_config):
+        """Apply the changes through the stats socket if possible.
+
+        Only the weight and the admin state of the members can be changed
+        without reloading haproxy. Returns False when anything else changed
+        or when haproxy rejected a command.
+        """
+        pool_id = logical_config['pool']['id']
+        deployed_config = self.deployed_configs.get(pool_id)
+        if not deployed_config:
+            return False
+
+        sock_path = self._get_state_file_path(pool_id, 'sock')
+        user_group = self.conf.haproxy.user_group
+        if (hacfg.build_config(deployed_config, sock_path, user_group,
+                               server_settings=False) !=
+                hacfg.build_config(logical_config, sock_path, user_group,
+                                   server_settings=False)):
+            return False
+
+        old_settings = hacfg.get_server_settings(deployed_config)
+        commands = []
+        for member_id, (weight, enabled) in sorted(
+                hacfg.get_server_settings(logical_config).items()):
+            old_weight, old_enabled = old_settings[member_id]
+            server = '%s/%s' % (pool_id, member_id)
+            if weight != old_weight:
+                commands.append('set weight %s %s' % (server, weight))
+            if enabled != old_enabled:
+                commands.append('%s server %s' % (
+                    'enable' if enabled else 'disable', server))
+
+        if commands and not self._send_commands(sock_path, commands):
+            return False
+
+        # keep the changes if haproxy is restarted
+        conf_path = self._get_state_file_path(pool_id, 'conf')
+        hacfg.save_config(conf_path, logical_config, sock_path, user_group)
+        self.deployed_configs[pool_id] = logical_config
+        return True
+
+    def _send_commands(self, socket_path, commands):
+        try:
+            s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            s.connect(socket_path)
+            s.send('%s\n' % ';'.join(commands))
+            output = ''
+            while True:
+                chunk = s.recv(1024)
+                if not chunk:
+                    break
+                output += chunk
+            s.close()
+        except socket.error as e:
+            LOG.warn(_('Error while connecting to stats socket: %s'), e)
+            return False
+
+        # haproxy only answers to the commands which failed
+        if output.strip():
+            LOG.warn(_('haproxy rejected %(commands)s: %(output)s'),
+                     {'commands': commands, 'output': output.strip()})
+            return False
+        return True
 
-    @n_utils.synchronized('haproxy-driver')
     def undeploy_instance(self, pool_id):
+        with _pool_lock(pool_id):
+            self._undeploy_instance(pool_id)
+
+    def _undeploy_instance(self, pool_id):
         namespace = get_ns_name(pool_id)
         ns = ip_lib.IPWrapper(self.root_helper, namespace)
         pid_path = self._get_state_file_path(pool_id, 'pid')
 
         # kill the process
         kill_pids_in_file(self.root_helper, pid_path)
+        self.deployed_configs.pop(pool_id, None)
 
         # unplug the ports
         if pool_id in self.pool_to_port_id:
@@ -268,8 +370,11 @@ class HaproxyNSDriver(agent_device_driver.AgentDeviceDriver):
         interface_name = self.vif_driver.get_device_name(Wrap(port_stub))
         self.vif_driver.unplug(interface_name, namespace=namespace)
 
-    @n_utils.synchronized('haproxy-driver')
     def deploy_instance(self, logical_config):
+        with _pool_lock(logical_config['pool']['id']):
+            self._deploy_instance(logical_config)
+
+    def _deploy_instance(self, logical_config):
         # do actual deploy only if vip is configured and active
         if ('vip' not in logical_config or
             logical_config['vip']['status'] not in ACTIVE_PENDING or
@@ -307,14 +412,49 @@ class HaproxyNSDriver(agent_device_driver.AgentDeviceDriver):
         if self.exists(pool['id']):
             self.undeploy_instance(pool['id'])
 
+    def _refresh_member(self, member, deleted=False):
+        """Redeploy the last deployed config with the member change.
+
+        The whole logical device is only fetched from the plugin when the
+        pool wasn't deployed by this agent yet.
+        """
+        with _pool_lock(member['pool_id']):
+            self._refresh_member_locked(member, deleted)
+
+    def _refresh_member_locked(self, member, deleted):
+        deployed_config = self.deployed_configs.get(member['pool_id'])
+        if not deployed_config:
+            logical_config = self.plugin_rpc.get_logical_device(
+                member['pool_id'])
+            self._deploy_instance(logical_config)
+            return
+
+        logical_config = dict(deployed_config)
+        logical_config['members'] = []
+        new_member = None
+        if not deleted:
+            # the member is pending until the agent reports it deployed
+            new_member = dict(member, status=constants.ACTIVE)
+        for old_member in deployed_config['members']:
+            if old_member['id'] != member['id']:
+                logical_config['members'].append(old_member)
+            elif new_member:
+                new_member['status'] = old_member['status']
+                logical_config['members'].append(new_member)
+                new_member = None
+        if new_member:
+            logical_config['members'].append(new_member)
+
+        self._deploy_instance(logical_config)
+
     def create_member(self, member):
-        self._refresh_device(member['pool_id'])
+        self._refresh_member(member)
 
     def update_member(self, old_member, member):
-        self._refresh_device(member['pool_id'])
+        self._refresh_member(member)
 
     def delete_member(self, member):
-        self._refresh_device(member['pool_id'])
+        self._refresh_member(member, deleted=True)
 
     def create_pool_health_monitor(self, health_monitor, pool_id):
         self._refresh_device(pool_id)
@@ -337,6 +477,11 @@ class Wrap(object):
         return self.__dict__[key]
 
 
+def _pool_lock(pool_id):
+    # the pools are independent, only the changes of a pool are serialized
+    return lockutils.lock('haproxy-driver-%s' % pool_id)
+
+
 def get_ns_name(namespace_id):
     return NS_PREFIX + namespace_id
 
@@ -16,9 +16,11 @@
 #
 # @author: Mark McClain, DreamHost
 
+import copy
 import uuid
 
 from oslo.config import cfg
+from sqlalchemy import orm
 
 from neutron.common import constants as q_const
 from neutron.common import exceptions as q_exc
@@ -26,6 +28,7 @@ from neutron.common import rpc as q_rpc
 from neutron.db import agents_db
 from neutron.db.loadbalancer import loadbalancer_db
 from neutron.extensions import lbaas_agentscheduler
+from neutron.extensions import loadbalancer
 from neutron.extensions import portbindings
 from neutron.openstack.common import importutils
 from neutron.openstack.common import log as logging
@@ -51,6 +54,7 @@ AGENT_SCHEDULER_OPTS = [
 ]
 
 cfg.CONF.register_opts(AGENT_SCHEDULER_OPTS)
+cfg.CONF.import_opt('api_workers', 'neutron.service')
 
 # topic name for this particular agent implementation
 TOPIC_LOADBALANCER_PLUGIN = 'n-lbaas-plugin'
@@ -64,20 +68,54 @@ class DriverNotSpecified(q_exc.NeutronException):
 
 class LoadBalancerCallbacks(object):
 
-    RPC_API_VERSION = '2.0'
+    RPC_API_VERSION = '2.2'
     # history
     #   1.0 Initial version
     #   2.0 Generic API for agent based drivers
     #       - get_logical_device() handling changed;
     #       - pool_deployed() and update_status() methods added;
+    #   2.1 update_pools_stats() method added
+    #   2.2 get_logical_devices() method added
 
     def __init__(self, plugin):
         self.plugin = plugin
+        # pool_id->revision, bumped whenever the logical config may change
+        self.revisions = {}
+        # pool_id->(revision, logical config without the vip subnets)
+        self.devices = {}
+        # the revisions only see the changes made by this process
+        self.cache_devices = not cfg.CONF.api_workers
 
     def create_rpc_dispatcher(self):
         return q_rpc.PluginRpcDispatcher(
             [self, agents_db.AgentExtRpcCallback(self.plugin)])
 
+    def pools_changed(self, context, pool_ids=None, monitor_id=None):
+        """Invalidate the cached logical config of the given pools.
+
+        The config of a pool lists the other pools of its health
+        monitors, so all of them change along with the monitor.
+        """
+        pool_ids = set(pool_ids or [])
+        if monitor_id:
+            qry = context.session.query(
+                loadbalancer_db.PoolMonitorAssociation.pool_id)
+            qry = qry.filter_by(monitor_id=monitor_id)
+            pool_ids.update(pool_id for pool_id, in qry)
+        for pool_id in pool_ids:
+            self.revisions[pool_id] = self.revisions.get(pool_id, 0) + 1
+            self.devices.pop(pool_id, None)
+
+    def pool_deleted(self, context, pool_id):
+        """Forget the cached logical config of a deleted pool."""
+        self.revisions.pop(pool_id, None)
+        self.devices.pop(pool_id, None)
+
+    def _vip_port_changed(self, context, port_id):
+        qry = context.session.query(loadbalancer_db.Vip.pool_id)
+        qry = qry.filter_by(port_id=port_id)
+        self.pools_changed(context, [pool_id for pool_id, in qry])
+
     def get_ready_devices(self, context, host=None):
         with context.session.begin(subtransactions=True):
             agents = self.plugin.get_lbaas_agents(context,
@@ -98,45 +136,90 @@ class LoadBalancerCallbacks(object):
             return [id for id, in qry]
 
     def get_logical_device(self, context, pool_id=None):
-        with context.session.begin(subtransactions=True):
-            qry = context.session.query(loadbalancer_db.Pool)
-            qry = qry.filter_by(id=pool_id)
-            pool = qry.one()
-
-            if pool.status != constants.ACTIVE:
-                raise q_exc.Invalid(_('Expected active pool'))
-
-            retval = {}
-            retval['pool'] = self.plugin._make_pool_dict(pool)
-
-            if pool.vip:
-                retval['vip'] = self.plugin._make_vip_dict(pool.vip)
-                retval['vip']['port'] = (
-                    self.plugin._core_plugin._make_port_dict(pool.vip.port)
-                )
-                for fixed_ip in retval['vip']['port']['fixed_ips']:
-                    fixed_ip['subnet'] = (
-                        self.plugin._core_plugin.get_subnet(
-                            context,
-                            fixed_ip['subnet_id']
-                        )
-                    )
-            retval['members'] = [
-                self.plugin._make_member_dict(m)
-                for m in pool.members if m.status in (constants.ACTIVE,
-                                                      constants.INACTIVE)
-            ]
-            retval['healthmonitors'] = [
-                self.plugin._make_health_monitor_dict(hm.healthmonitor)
-                for hm in pool.monitors
-                if hm.status == constants.ACTIVE
-            ]
-            retval['driver'] = (
-                self.plugin.drivers[pool.provider.provider_name].device_driver)
-
-            return retval
+        devices = self._get_logical_devices(context, [pool_id])
+        if pool_id not in devices:
+            raise loadbalancer.PoolNotFound(pool_id=pool_id)
+        if devices[pool_id]['pool']['status'] != constants.ACTIVE:
+            raise q_exc.Invalid(_('Expected active pool'))
+        return devices[pool_id]
+
+    def get_logical_devices(self, context, pool_ids=None):
+        """Return pool_id->logical config of the given active pools."""
+        devices = self._get_logical_devices(context, pool_ids or [])
+        return dict((pool_id, device)
+                    for pool_id, device in devices.iteritems()
+                    if device['pool']['status'] == constants.ACTIVE)
+
+    def _get_logical_devices(self, context, pool_ids):
+        devices = {}
+        missing = {}
+        for pool_id in pool_ids:
+            revision = self.revisions.get(pool_id, 0)
+            cached = self.devices.get(pool_id)
+            if cached and cached[0] == revision:
+                devices[pool_id] = copy.deepcopy(cached[1])
+            else:
+                missing[pool_id] = revision
+
+        if missing:
+            with context.session.begin(subtransactions=True):
+                qry = context.session.query(loadbalancer_db.Pool)
+                qry = qry.filter(loadbalancer_db.Pool.id.in_(list(missing)))
+                qry = qry.options(
+                    orm.joinedload_all('vip.port'),
+                    orm.joinedload_all('vip.session_persistence'),
+                    orm.subqueryload('members'),
+                    orm.subqueryload_all('monitors.healthmonitor'))
+                for pool in qry:
+                    device = self._make_logical_device(pool)
+                    if self.cache_devices:
+                        self.devices[pool.id] = (missing[pool.id],
+                                                 copy.deepcopy(device))
+                    devices[pool.id] = device
+
+        self._add_vip_subnets(context, devices.values())
+        return devices
+
+    def _make_logical_device(self, pool):
+        retval = {}
+        retval['pool'] = self.plugin._make_pool_dict(pool)
+
+        if pool.vip:
+            retval['vip'] = self.plugin._make_vip_dict(pool.vip)
+            retval['vip']['port'] = (
+                self.plugin._core_plugin._make_port_dict(pool.vip.port)
+            )
+        retval['members'] = [
+            self.plugin._make_member_dict(m)
+            for m in pool.members if m.status in (constants.ACTIVE,
+                                                  constants.INACTIVE)
+        ]
+        retval['healthmonitors'] = [
+            self.plugin._make_health_monitor_dict(hm.healthmonitor)
+            for hm in pool.monitors
+            if hm.status == constants.ACTIVE
+        ]
+        retval['driver'] = (
+            self.plugin.drivers[pool.provider.provider_name].device_driver)
+
+        return retval
+
+    def _add_vip_subnets(self, context, devices):
+        # the subnets are not cached, they can change outside of lbaas
+        fixed_ips = [fixed_ip for device in devices if 'vip' in device
+                     for fixed_ip in device['vip']['port']['fixed_ips']]
+        if not fixed_ips:
+            return
+        subnet_ids = set(fixed_ip['subnet_id'] for fixed_ip in fixed_ips)
+        subnets = self.plugin._core_plugin.get_subnets(
+            context, filters={'id': list(subnet_ids)})
+        subnets = dict((subnet['id'], subnet) for subnet in subnets)
+        for fixed_ip in fixed_ips:
+            fixed_ip['subnet'] = copy.deepcopy(
+                subnets.get(fixed_ip['subnet_id']))
 
     def pool_deployed(self, context, pool_id):
+        changed = False
         with context.session.begin(subtransactions=True):
             qry = context.session.query(loadbalancer_db.Pool)
             qry = qry.filter_by(id=pool_id)
@@ -144,19 +227,31 @@ class LoadBalancerCallbacks(object):
 
             # set all resources to active
             if pool.status in ACTIVE_PENDING:
+                changed |= pool.status != constants.ACTIVE
                 pool.status = constants.ACTIVE
 
             if pool.vip and pool.vip.status in ACTIVE_PENDING:
+                changed |= pool.vip.status != constants.ACTIVE
                 pool.vip.status = constants.ACTIVE
 
             for m in pool.members:
                 if m.status in ACTIVE_PENDING:
+                    changed |= m.status != constants.ACTIVE
                     m.status = constants.ACTIVE
 
+            monitor_ids = []
             for hm in pool.monitors:
                 if hm.status in ACTIVE_PENDING:
+                    if hm.status != constants.ACTIVE:
+                        monitor_ids.append(hm.monitor_id)
                     hm.status = constants.ACTIVE
 
+        # a resync deploys unchanged pools, keep their config cached
+        if changed:
+            self.pools_changed(context, [pool_id])
+        for monitor_id in monitor_ids:
+            self.pools_changed(context, monitor_id=monitor_id)
+
     def update_status(self, context, obj_type, obj_id, status):
         model_mapping = {
             'pool': loadbalancer_db.Pool,
@@ -169,9 +264,17 @@ class LoadBalancerCallbacks(object):
         elif obj_type == 'health_monitor':
             self.plugin.update_pool_health_monitor(
                 context, obj_id['monitor_id'], obj_id['pool_id'], status)
+            self.pools_changed(context, [obj_id['pool_id']],
+                               monitor_id=obj_id['monitor_id'])
         else:
             self.plugin.update_status(
                 context, model_mapping[obj_type], obj_id, status)
+            if obj_type == 'pool':
+                self.pools_changed(context, [obj_id])
+            else:
+                obj = self.plugin._get_resource(
+                    context, model_mapping[obj_type], obj_id)
+                self.pools_changed(context, [obj.pool_id])
 
     def pool_destroyed(self, context, pool_id=None):
         """Agent confirmation hook that a pool has been destroyed.
@@ -204,6 +307,7 @@ class LoadBalancerCallbacks(object):
             port_id,
             {'port': port}
         )
+        self._vip_port_changed(context, port_id)
 
     def unplug_vip_port(self, context, port_id=None, host=None):
         if not port_id:
@@ -235,9 +339,24 @@ class LoadBalancerCallbacks(object):
             msg = _('Unable to find port %s to unplug.  This can occur when '
                     'the Vip has been deleted first.')
             LOG.debug(msg, port_id)
+        else:
+            self._vip_port_changed(context, port_id)
 
     def update_pool_stats(self, context, pool_id=None, stats=None, host=None):
+        self._update_pool_stats(context, pool_id, stats)
+
+    def update_pools_stats(self, context, pools_stats=None, host=None):
+        for pool_id, stats in (pools_stats or {}).iteritems():
+            try:
+                self._update_pool_stats(context, pool_id, stats)
+            except (q_exc.NotFound, loadbalancer.StateInvalid):
+                # The pool is being deleted, the others are still updated
+                LOG.debug(_('Stats of pool %s not updated'), pool_id)
+
+    def _update_pool_stats(self, context, pool_id, stats):
         self.plugin.update_pool_stats(context, pool_id, data=stats)
+        # the stats carry the status of the members
+        self.pools_changed(context, [pool_id])
 
 
 class LoadBalancerAgentApi(proxy.RpcProxy):
@@ -359,11 +478,17 @@ class AgentBasedPluginDriver(abstract_driver.LoadBalancerAbstractDriver):
             raise lbaas_agentscheduler.NoActiveLbaasAgent(pool_id=pool_id)
         return agent['agent']
 
+    def _pools_changed(self, context, pool_ids, monitor_id=None):
+        self.plugin.agent_callbacks.pools_changed(context, pool_ids,
+                                                  monitor_id=monitor_id)
+
     def create_vip(self, context, vip):
+        self._pools_changed(context, [vip['pool_id']])
         agent = self.get_pool_agent(context, vip['pool_id'])
         self.agent_rpc.create_vip(context, vip, agent['host'])
 
     def update_vip(self, context, old_vip, vip):
+        self._pools_changed(context, [vip['pool_id']])
         agent = self.get_pool_agent(context, vip['pool_id'])
         if vip['status'] in ACTIVE_PENDING:
             self.agent_rpc.update_vip(context, old_vip, vip, agent['host'])
@@ -372,6 +497,7 @@ class AgentBasedPluginDriver(abstract_driver.LoadBalancerAbstractDriver):
 
     def delete_vip(self, context, vip):
         self.plugin._delete_db_vip(context, vip['id'])
+        self._pools_changed(context, [vip['pool_id']])
         agent = self.get_pool_agent(context, vip['pool_id'])
         self.agent_rpc.delete_vip(context, vip, agent['host'])
 
@@ -384,6 +510,7 @@ class AgentBasedPluginDriver(abstract_driver.LoadBalancerAbstractDriver):
                                    self.device_driver)
 
     def update_pool(self, context, old_pool, pool):
+        self._pools_changed(context, [pool['id']])
         agent = self.get_pool_agent(context, pool['id'])
         if pool['status'] in ACTIVE_PENDING:
             self.agent_rpc.update_pool(context, old_pool, pool,
@@ -396,14 +523,18 @@ class AgentBasedPluginDriver(abstract_driver.LoadBalancerAbstractDriver):
         # after pool is deleted from db
         agent = self.plugin.get_lbaas_agent_hosting_pool(context, pool['id'])
         self.plugin._delete_db_pool(context, pool['id'])
+        self.plugin.agent_callbacks.pool_deleted(context, pool['id'])
         if agent:
             self.agent_rpc.delete_pool(context, pool, agent['agent']['host'])
 
     def create_member(self, context, member):
+        self._pools_changed(context, [member['pool_id']])
         agent = self.get_pool_agent(context, member['pool_id'])
         self.agent_rpc.create_member(context, member, agent['host'])
 
     def update_member(self, context, old_member, member):
+        self._pools_changed(context,
+                            [old_member['pool_id'], member['pool_id']])
         agent = self.get_pool_agent(context, member['pool_id'])
         # member may change pool id
         if member['pool_id'] != old_member['pool_id']:
@@ -419,17 +550,20 @@ class AgentBasedPluginDriver(abstract_driver.LoadBalancerAbstractDriver):
 
     def delete_member(self, context, member):
         self.plugin._delete_db_member(context, member['id'])
+        self._pools_changed(context, [member['pool_id']])
         agent = self.get_pool_agent(context, member['pool_id'])
         self.agent_rpc.delete_member(context, member, agent['host'])
 
     def create_pool_health_monitor(self, context, healthmon, pool_id):
-        # healthmon is not used here
+        self._pools_changed(context, [pool_id], monitor_id=healthmon['id'])
         agent = self.get_pool_agent(context, pool_id)
         self.agent_rpc.create_pool_health_monitor(context, healthmon,
                                                   pool_id, agent['host'])
 
     def update_pool_health_monitor(self, context, old_health_monitor,
                                    health_monitor, pool_id):
+        self._pools_changed(context, [pool_id],
+                            monitor_id=health_monitor['id'])
         agent = self.get_pool_agent(context, pool_id)
         self.agent_rpc.update_pool_health_monitor(context, old_health_monitor,
                                                   health_monitor, pool_id,
@@ -439,6 +573,8 @@ class AgentBasedPluginDriver(abstract_driver.LoadBalancerAbstractDriver):
         self.plugin._delete_db_pool_health_monitor(
             context, health_monitor['id'], pool_id
         )
+        self._pools_changed(context, [pool_id],
+                            monitor_id=health_monitor['id'])
 
         agent = self.get_pool_agent(context, pool_id)
         self.agent_rpc.delete_pool_health_monitor(context, health_monitor,
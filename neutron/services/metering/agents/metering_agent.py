@@ -14,6 +14,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import array
 import time
 
 import eventlet
@@ -58,6 +59,69 @@ class MeteringPluginRpc(proxy.RpcProxy):
             LOG.exception(_("Failed synchronizing routers"))
 
 
+class MeteringInfos(object):
+    """Traffic measured for each metering label since its last report.
+
+    Each label is given a slot in arrays holding the counters of all the
+    labels rather than a dict of its own, slots of purged labels are reused.
+    """
+
+    FIELDS = ('pkts', 'bytes', 'time', 'first_update', 'last_update')
+
+    def __init__(self):
+        self.slots = {}
+        self.free_slots = []
+        for field in self.FIELDS:
+            setattr(self, field, array.array('L'))
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, label_id):
+        return label_id in self.slots
+
+    def _new_slot(self, label_id, ts):
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            for field in self.FIELDS:
+                getattr(self, field)[slot] = 0
+        else:
+            slot = len(self.pkts)
+            for field in self.FIELDS:
+                getattr(self, field).append(0)
+        self.first_update[slot] = ts
+        self.last_update[slot] = ts
+        self.slots[label_id] = slot
+        return slot
+
+    def add(self, label_id, pkts, bytes, ts):
+        slot = self.slots.get(label_id)
+        if slot is None:
+            slot = self._new_slot(label_id, ts)
+        self.pkts[slot] += pkts
+        self.bytes[slot] += bytes
+        self.time[slot] += max(ts - self.last_update[slot], 0)
+        self.last_update[slot] = ts
+
+    def get(self, label_id):
+        slot = self.slots[label_id]
+        return dict((field, getattr(self, field)[slot])
+                    for field in self.FIELDS)
+
+    def reset(self, label_id):
+        slot = self.slots[label_id]
+        self.pkts[slot] = 0
+        self.bytes[slot] = 0
+        self.time[slot] = 0
+
+    def purge(self, before):
+        """Forget the labels which weren't updated since before."""
+        for label_id, slot in self.slots.items():
+            if self.last_update[slot] < before:
+                del self.slots[label_id]
+                self.free_slots.append(slot)
+
+
 class MeteringAgent(MeteringPluginRpc, manager.Manager):
 
     Opts = [
@@ -69,6 +133,11 @@ class MeteringAgent(MeteringPluginRpc, manager.Manager):
                    help=_("Interval between two metering measures")),
         cfg.IntOpt('report_interval', default=300,
                    help=_("Interval between two metering reports")),
+        cfg.IntOpt('report_batch_size', default=0,
+                   help=_("Maximum number of labels reported by a single "
+                          "l3.meter notification, whose payload is then the "
+                          "host and the list of the label reports. 0 sends "
+                          "a notification per label")),
     ]
 
     def __init__(self, host, conf=None):
@@ -76,7 +145,6 @@ class MeteringAgent(MeteringPluginRpc, manager.Manager):
         self._load_drivers()
         self.root_helper = config.get_root_helper(self.conf)
         self.context = context.get_admin_context_without_session()
-        self.metering_info = {}
         self.metering_loop = loopingcall.FixedIntervalLoopingCall(
             self._metering_loop
         )
@@ -86,8 +154,9 @@ class MeteringAgent(MeteringPluginRpc, manager.Manager):
         self.host = host
 
         self.label_tenant_id = {}
+        self.router_labels = {}
         self.routers = {}
-        self.metering_infos = {}
+        self.metering_infos = MeteringInfos()
         super(MeteringAgent, self).__init__(host=self.conf.host)
 
     def _load_drivers(self):
@@ -98,60 +167,72 @@ class MeteringAgent(MeteringPluginRpc, manager.Manager):
         self.metering_driver = importutils.import_object(
             self.conf.driver, self, self.conf)
 
+    def _notify(self, data):
+        notifier_api.notify(self.context,
+                            notifier_api.publisher_id('metering'),
+                            'l3.meter',
+                            notifier_api.CONF.default_notification_level,
+                            data)
+
     def _metering_notification(self):
-        for label_id, info in self.metering_infos.items():
-            data = {'label_id': label_id,
-                    'tenant_id': self.label_tenant_id.get(label_id),
-                    'pkts': info['pkts'],
-                    'bytes': info['bytes'],
-                    'time': info['time'],
-                    'first_update': info['first_update'],
-                    'last_update': info['last_update'],
-                    'host': self.host}
-
-            LOG.debug(_("Send metering report: %s"), data)
-            notifier_api.notify(self.context,
-                                notifier_api.publisher_id('metering'),
-                                'l3.meter',
-                                notifier_api.CONF.default_notification_level,
-                                data)
-            info['pkts'] = 0
-            info['bytes'] = 0
-            info['time'] = 0
+        batch_size = self.conf.report_batch_size
+        batch = []
+        for label_id in self.metering_infos.slots.keys():
+            data = self.metering_infos.get(label_id)
+            data['label_id'] = label_id
+            data['tenant_id'] = self.label_tenant_id.get(label_id)
+            self.metering_infos.reset(label_id)
+
+            if batch_size <= 0:
+                data['host'] = self.host
+                LOG.debug(_("Send metering report: %s"), data)
+                self._notify(data)
+                continue
+
+            batch.append(data)
+            if len(batch) >= batch_size:
+                self._notify_batch(batch)
+                batch = []
+        if batch:
+            self._notify_batch(batch)
+
+    def _notify_batch(self, batch):
+        LOG.debug(_("Send metering report of %d labels"), len(batch))
+        self._notify({'host': self.host, 'labels': batch})
 
     def _purge_metering_info(self):
         ts = int(time.time())
-        report_interval = self.conf.report_interval
-        for label_id, info in self.metering_info.items():
-            if info['last_update'] > ts + report_interval:
-                del self.metering_info[label_id]
+        self.metering_infos.purge(ts - self.conf.report_interval)
+
+        # Keep the tenant of removed labels until they are no longer
+        # measured
+        router_labels = set()
+        for label_ids in self.router_labels.itervalues():
+            router_labels.update(label_ids)
+        for label_id in self.label_tenant_id.keys():
+            if (label_id not in router_labels and
+                    label_id not in self.metering_infos):
+                del self.label_tenant_id[label_id]
 
     def _add_metering_info(self, label_id, pkts, bytes):
-        ts = int(time.time())
-        info = self.metering_infos.get(label_id, {'bytes': 0,
-                                                  'pkts': 0,
-                                                  'time': 0,
-                                                  'first_update': ts,
-                                                  'last_update': ts})
-        info['bytes'] += bytes
-        info['pkts'] += pkts
-        info['time'] += ts - info['last_update']
-        info['last_update'] = ts
+        self.metering_infos.add(label_id, pkts, bytes, int(time.time()))
 
-        self.metering_infos[label_id] = info
+    def _update_label_tenants(self, routers, replace=True):
+        """Record the tenant of the labels of the given routers.
 
-        return info
-
-    def _add_metering_infos(self):
-        self.label_tenant_id = {}
-        for router in self.routers.values():
-            tenant_id = router['tenant_id']
+        The routers contain all their labels when replace is set, only the
+        labels being added otherwise.
+        """
+        for router in routers:
             labels = router.get(constants.METERING_LABEL_KEY, [])
+            label_ids = self.router_labels.setdefault(router['id'], set())
+            if replace:
+                label_ids.clear()
             for label in labels:
-                label_id = label['id']
-                self.label_tenant_id[label_id] = tenant_id
+                label_ids.add(label['id'])
+                self.label_tenant_id[label['id']] = router['tenant_id']
 
-            tenant_id = self.label_tenant_id.get
+    def _add_metering_infos(self):
         accs = self._get_traffic_counters(self.context, self.routers.values())
         if not accs:
             return
@@ -196,6 +277,7 @@ class MeteringAgent(MeteringPluginRpc, manager.Manager):
 
         if router_id in self.routers:
             del self.routers[router_id]
+        self.router_labels.pop(router_id, None)
 
         return self._invoke_driver(context, router_id,
                                    'remove_router')
@@ -210,6 +292,7 @@ class MeteringAgent(MeteringPluginRpc, manager.Manager):
     def _update_routers(self, context, routers):
         for router in routers:
             self.routers[router['id']] = router
+        self._update_label_tenants(routers)
 
         return self._invoke_driver(context, routers,
                                    'update_routers')
@@ -225,6 +308,7 @@ class MeteringAgent(MeteringPluginRpc, manager.Manager):
 
     def add_metering_label(self, context, routers):
         LOG.debug(_("Creating a metering label from agent"))
+        self._update_label_tenants(routers, replace=False)
         return self._invoke_driver(context, routers,
                                    'add_metering_label')
 
@@ -14,6 +14,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import eventlet
 from oslo.config import cfg
 
 from neutron.agent.common import config
@@ -39,7 +40,10 @@ IptablesDriverOpts = [
                help=_("The driver used to manage the virtual "
                       "interface.")),
     cfg.BoolOpt('use_namespaces', default=True,
-                help=_("Allow overlapping IP."))
+                help=_("Allow overlapping IP.")),
+    cfg.IntOpt('traffic_counters_pool_size', default=8,
+               help=_("Number of routers whose traffic counters are "
+                      "collected concurrently."))
 ]
 config.register_root_helper(cfg.CONF)
 cfg.CONF.register_opts(interface.OPTS)
@@ -265,29 +269,35 @@ class IptablesMeteringDriver(abstract_driver.MeteringAbstractDriver):
         for router in routers:
             self._process_disassociate_metering_label(router)
 
-    @log.log
-    def get_traffic_counters(self, context, routers):
-        accs = {}
-        for router in routers:
-            rm = self.routers.get(router['id'])
-            if not rm:
-                continue
-
-            for label_id, label in rm.metering_labels.items():
-                chain = iptables_manager.get_chain_name(WRAP_NAME + LABEL +
-                                                        label_id, wrap=False)
+    def _get_router_traffic_counters(self, rm):
+        chains = dict((iptables_manager.get_chain_name(WRAP_NAME + LABEL +
+                                                       label_id, wrap=False),
+                       label_id) for label_id in rm.metering_labels)
+        if not chains:
+            return {}
 
-                chain_acc = rm.iptables_manager.get_traffic_counters(
-                    chain, wrap=False, zero=True)
+        try:
+            chain_accs = rm.iptables_manager.get_chains_traffic_counters(
+                chains, wrap=False, zero=True)
+        except RuntimeError:
+            LOG.exception(_("Failed to get the traffic counters of router "
+                            "%s"), rm.id)
+            return {}
 
-                if not chain_acc:
-                    continue
-
-                acc = accs.get(label_id, {'pkts': 0, 'bytes': 0})
+        return dict((chains[chain], chain_acc)
+                    for chain, chain_acc in chain_accs.iteritems())
 
-                acc['pkts'] += chain_acc['pkts']
-                acc['bytes'] += chain_acc['bytes']
+    @log.log
+    def get_traffic_counters(self, context, routers):
+        rms = [self.routers[router['id']] for router in routers
+               if router['id'] in self.routers]
 
-                accs[label_id] = acc
+        accs = {}
+        pool = eventlet.GreenPool(self.conf.traffic_counters_pool_size)
+        for label_accs in pool.imap(self._get_router_traffic_counters, rms):
+            for label_id, label_acc in label_accs.iteritems():
+                acc = accs.setdefault(label_id, {'pkts': 0, 'bytes': 0})
+                acc['pkts'] += label_acc['pkts']
+                acc['bytes'] += label_acc['bytes']
 
         return accs
@@ -16,10 +16,12 @@
 #    under the License.
 import abc
 import copy
+import hashlib
 import os
 import re
 import shutil
 
+import eventlet
 import jinja2
 import netaddr
 from oslo.config import cfg
@@ -49,7 +51,11 @@ ipsec_opts = [
         help=_('Location to store ipsec server config files')),
     cfg.IntOpt('ipsec_status_check_interval',
                default=60,
-               help=_("Interval for checking ipsec status"))
+               help=_("Interval for checking ipsec status")),
+    cfg.IntOpt('ipsec_sync_threads',
+               default=8,
+               help=_("Number of vpn services updated or polled "
+                      "concurrently"))
 ]
 cfg.CONF.register_opts(ipsec_opts, 'ipsec')
 
@@ -135,11 +141,17 @@ class BaseSwanProcess():
         self.updated_pending_status = False
         self.namespace = namespace
         self.connection_status = {}
+        # hash of the configuration the running process was started with
+        self.config_hash = None
         self.config_dir = os.path.join(
             cfg.CONF.ipsec.config_base_dir, self.id)
         self.etc_dir = os.path.join(self.config_dir, 'etc')
         self.translate_dialect()
 
+    def update_vpnservice(self, vpnservice):
+        self.vpnservice = vpnservice
+        self.translate_dialect()
+
     def translate_dialect(self):
         if not self.vpnservice:
             return
@@ -157,13 +169,14 @@ class BaseSwanProcess():
 
     @abc.abstractmethod
     def ensure_configs(self):
-        pass
+        """Write the config files and return a hash of their content."""
 
     def ensure_config_file(self, kind, template, vpnservice):
         """Update config file,  based on current settings for service."""
         config_str = self._gen_config_content(template, vpnservice)
         config_file_name = self._get_config_filename(kind)
         utils.replace_file(config_file_name, config_str)
+        return config_str
 
     def remove_config(self):
         """Remove whole config file."""
@@ -233,13 +246,20 @@ class BaseSwanProcess():
                 ipsec_site_conn['status'] = conn_status['status']
 
     def enable(self):
-        """Enabling the process."""
+        """Enabling the process.
+
+        A running process is only restarted when its configuration
+        changed since it was started.
+        """
         try:
-            self.ensure_configs()
+            config_hash = self.ensure_configs()
             if self.active:
+                if config_hash == self.config_hash:
+                    return
                 self.restart()
             else:
                 self.start()
+            self.config_hash = config_hash
         except RuntimeError:
             LOG.exception(
                 _("Failed to enable vpn process on router %s"),
@@ -250,6 +270,7 @@ class BaseSwanProcess():
         try:
             if self.active:
                 self.stop()
+            self.config_hash = None
             self.remove_config()
         except RuntimeError:
             LOG.exception(
@@ -318,14 +339,16 @@ class OpenSwanProcess(BaseSwanProcess):
         dirs.
         """
         self.ensure_config_dir(self.vpnservice)
-        self.ensure_config_file(
+        config_hash = hashlib.sha1()
+        config_hash.update(self.ensure_config_file(
             'ipsec.conf',
             self.conf.openswan.ipsec_config_template,
-            self.vpnservice)
-        self.ensure_config_file(
+            self.vpnservice).encode('utf-8'))
+        config_hash.update(self.ensure_config_file(
             'ipsec.secrets',
             self.conf.openswan.ipsec_secret_template,
-            self.vpnservice)
+            self.vpnservice).encode('utf-8'))
+        return config_hash.hexdigest()
 
     def get_status(self):
         return self._execute([self.binary,
@@ -555,6 +578,8 @@ class IPsecDriver(device_drivers.DeviceDriver):
                 vpnservice,
                 namespace)
             self.processes[process_id] = process
+        elif vpnservice:
+            process.update_vpnservice(vpnservice)
         return process
 
     def create_router(self, process_id):
@@ -593,10 +618,10 @@ class IPsecDriver(device_drivers.DeviceDriver):
                 'ipsec_site_connections': {}}
         return self.process_status_cache[process.id]
 
-    def is_status_updated(self, process, previous_status):
+    def is_status_updated(self, process, previous_status, status):
         if process.updated_pending_status:
             return True
-        if process.status != previous_status['status']:
+        if status != previous_status['status']:
             return True
         if (process.connection_status !=
             previous_status['ipsec_site_connections']):
@@ -607,20 +632,31 @@ class IPsecDriver(device_drivers.DeviceDriver):
         for connection_status in process.connection_status.values():
             connection_status['updated_pending_status'] = False
 
-    def copy_process_status(self, process):
+    def copy_process_status(self, process, status):
         return {
             'id': process.vpnservice['id'],
-            'status': process.status,
+            'status': status,
             'updated_pending_status': process.updated_pending_status,
             'ipsec_site_connections': copy.deepcopy(process.connection_status)
         }
 
+    def _get_process_statuses(self, processes):
+        """Poll the status of the processes concurrently.
+
+        Each poll runs ipsec whack in the namespace of the process, which
+        also refreshes the status of its connections.
+        """
+        pool = eventlet.GreenPool(self.conf.ipsec.ipsec_sync_threads)
+        return pool.imap(lambda process: process.status, processes)
+
     def report_status(self, context):
         status_changed_vpn_services = []
-        for process in self.processes.values():
+        processes = self.processes.values()
+        for process, status in zip(processes,
+                                   self._get_process_statuses(processes)):
             previous_status = self.get_process_status_cache(process)
-            if self.is_status_updated(process, previous_status):
-                new_status = self.copy_process_status(process)
+            if self.is_status_updated(process, previous_status, status):
+                new_status = self.copy_process_status(process, status)
                 self.process_status_cache[process.id] = new_status
                 status_changed_vpn_services.append(new_status)
                 # We need unset updated_pending status after it
@@ -632,6 +668,14 @@ class IPsecDriver(device_drivers.DeviceDriver):
                 context,
                 status_changed_vpn_services)
 
+    def _update_process(self, process, vpnservice):
+        try:
+            self._update_nat(vpnservice, self.agent.add_nat_rule)
+            process.update()
+        except Exception:
+            LOG.exception(_("Failed to update vpn service %s"),
+                          vpnservice['id'])
+
     @lockutils.synchronized('vpn-agent', 'neutron-')
     def sync(self, context, routers):
         """Sync status with server side.
@@ -652,12 +696,14 @@ class IPsecDriver(device_drivers.DeviceDriver):
         vpnservices = self.agent_rpc.get_vpn_services_on_host(
             context, self.host)
         router_ids = [vpnservice['router_id'] for vpnservice in vpnservices]
-        # Ensure the ipsec process is enabled
+        # Ensure the ipsec process is enabled, each vpnservice is on its
+        # own router so that they can be updated concurrently
+        pool = eventlet.GreenPool(self.conf.ipsec.ipsec_sync_threads)
         for vpnservice in vpnservices:
             process = self.ensure_process(vpnservice['router_id'],
                                           vpnservice=vpnservice)
-            self._update_nat(vpnservice, self.agent.add_nat_rule)
-            process.update()
+            pool.spawn_n(self._update_process, process, vpnservice)
+        pool.waitall()
 
         # Delete any IPSec processes that are
         # associated with routers, but are not running the VPN service.
@@ -27,6 +27,8 @@ LOG = logging.getLogger(__name__)
 class HTTPResponseMock():
     status = 200
     reason = 'OK'
+    # The fake server closes the connection after each response
+    will_close = True
 
     def __init__(self, sock, debuglevel=0, strict=0, method=None,
                  buffering=False):
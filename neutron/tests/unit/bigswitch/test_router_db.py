@@ -20,7 +20,10 @@
 
 import contextlib
 import copy
+import hashlib
+import json
 
+import mock
 from mock import patch
 from oslo.config import cfg
 from webob import exc
@@ -535,6 +538,73 @@ class RouterDBTestCase(test_base.BigSwitchTestBase,
                              self._get_routers(r['router']['tenant_id']
                                                )[0]['id'])
 
+    def test_floatingip_rest_operations(self):
+        servers = self.plugin_obj.servers
+        servers.capabilities = ['floatingip']
+        with contextlib.nested(
+            patch.object(servers, 'rest_create_floatingip'),
+            patch.object(servers, 'rest_update_floatingip'),
+            patch.object(servers, 'rest_delete_floatingip'),
+            patch.object(self.plugin_obj, '_send_floatingip_update')
+        ) as (mock_create, mock_update, mock_delete, mock_send_update):
+            with self.floatingip_with_assoc() as fip:
+                fip = fip['floatingip']
+                mock_create.assert_called_once_with(
+                    fip['tenant_id'], mock.ANY)
+                self._update('floatingips', fip['id'],
+                             {'floatingip': {'port_id': None}})
+                self.assertEqual(1, mock_update.call_count)
+                self.assertIsNone(mock_update.call_args[0][1]['port_id'])
+            mock_delete.assert_called_once_with(fip['tenant_id'], fip['id'])
+            self.assertFalse(mock_send_update.called)
+
+    def test_disassociate_floatingips_rest_operations(self):
+        servers = self.plugin_obj.servers
+        servers.capabilities = ['floatingip']
+        with contextlib.nested(
+            patch.object(servers, 'rest_create_floatingip'),
+            patch.object(servers, 'rest_update_floatingip'),
+            patch.object(servers, 'rest_delete_floatingip')
+        ) as (mock_create, mock_update, mock_delete):
+            with self.floatingip_with_assoc() as fip:
+                fip = fip['floatingip']
+                self.plugin_obj.disassociate_floatingips(
+                    context.get_admin_context(), fip['port_id'])
+                mock_update.assert_called_once_with(
+                    fip['tenant_id'], mock.ANY, fip['id'])
+                self.assertIsNone(mock_update.call_args[0][1]['port_id'])
+
+    def test_send_tenant_data(self):
+        servers = self.plugin_obj.servers
+        servers.capabilities = ['tenant-sync']
+        with contextlib.nested(
+            self.network(tenant_id='tenant-a'),
+            self.network(tenant_id='tenant-b')
+        ):
+            admin_context = context.get_admin_context()
+            topology = self.plugin_obj._get_topology(admin_context,
+                                                     'tenant-a')
+            checksum = hashlib.md5(
+                json.dumps(topology, sort_keys=True)).hexdigest()
+            with contextlib.nested(
+                patch.object(servers, 'rest_get_tenant_checksums',
+                             return_value={'tenant-a': checksum,
+                                           'tenant-gone': 'checksum'}),
+                patch.object(servers, 'rest_update_tenant_topology'),
+                patch.object(servers, 'rest_delete_tenant_topology'),
+                patch.object(servers, 'rest_action')
+            ) as (mock_checksums, mock_update, mock_delete, mock_action):
+                self.plugin_obj._send_all_data()
+            mock_update.assert_called_once_with('tenant-b', mock.ANY)
+            tenant_b_topology = mock_update.call_args[0][1]
+            self.assertEqual(['tenant-b'],
+                             [net['tenant_id'] for net in
+                              tenant_b_topology['networks']])
+            self.assertIn('checksum', tenant_b_topology)
+            mock_delete.assert_called_once_with('tenant-gone')
+            # The whole topology is not sent in a single request
+            self.assertFalse(mock_action.called)
+
     def _get_routers(self, tenant_id):
         ctx = context.Context('', tenant_id)
         return self.plugin_obj.get_routers(ctx)
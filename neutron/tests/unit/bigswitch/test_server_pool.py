@@ -0,0 +1,162 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright 2013 Big Switch Networks, Inc.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import BaseHTTPServer
+import json
+import socket
+import SocketServer
+import threading
+
+import mock
+
+from neutron.plugins.bigswitch import plugin
+from neutron.tests import base
+from neutron.tests.unit.bigswitch import fake_server
+
+
+class FakeControllerHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def _reply(self):
+        length = int(self.headers.getheader('Content-Length', 0))
+        self.server.requests.append(
+            (self.command, self.path, self.rfile.read(length)))
+        body = json.dumps({'status': 'ok'})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeController(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           FakeControllerHandler)
+        self.connections = 0
+        self.requests = []
+
+
+class KeepAliveResponseMock(fake_server.HTTPResponseMock):
+    will_close = False
+
+
+class ServerPoolTestCase(base.BaseTestCase):
+
+    def _get_pool(self, servers, max_connections=2):
+        return plugin.ServerPool(servers, False, None, 'neutron-id',
+                                 base_uri='/base',
+                                 max_connections=max_connections)
+
+    def test_connections_reused_with_fake_controller(self):
+        controller = FakeController()
+        thread = threading.Thread(target=controller.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(controller.server_close)
+        self.addCleanup(controller.shutdown)
+        pool = self._get_pool([controller.server_address])
+        server = pool.servers[0]
+        self.addCleanup(lambda: [conn.close()
+                                 for conn in server.connections])
+        for i in range(3):
+            ret = pool.rest_call('POST', '/networks', {'id': i}, None, [])
+            self.assertEqual(200, ret[0])
+            self.assertEqual({'status': 'ok'}, ret[3])
+        self.assertEqual(1, controller.connections)
+        self.assertEqual([('POST', '/base/networks', json.dumps({'id': i}))
+                          for i in range(3)], controller.requests)
+        stats = server.get_stats()
+        self.assertEqual(3, stats['requests'])
+        self.assertEqual(0, stats['errors'])
+        self.assertEqual(1, stats['idle_connections'])
+
+    def test_connection_closed_by_server_not_reused(self):
+        pool = self._get_pool([('localhost', 8000)])
+        with mock.patch('httplib.HTTPConnection') as conn_class:
+            conn_class.return_value.getresponse.return_value = (
+                fake_server.HTTPResponseMock(None))
+            pool.rest_call('GET', '/networks', '', None, [])
+            pool.rest_call('GET', '/networks', '', None, [])
+        self.assertEqual(2, conn_class.call_count)
+        self.assertEqual([], pool.servers[0].connections)
+
+    def test_stale_connection_replaced(self):
+        pool = self._get_pool([('localhost', 8000)])
+        stale = mock.Mock()
+        stale.request.side_effect = socket.error()
+        server = pool.servers[0]
+        server.connections.append(stale)
+        with mock.patch('httplib.HTTPConnection') as conn_class:
+            conn_class.return_value.getresponse.return_value = (
+                KeepAliveResponseMock(None))
+            ret = pool.rest_call('GET', '/networks', '', None, [])
+        self.assertEqual(200, ret[0])
+        stale.close.assert_called_once_with()
+        self.assertEqual([conn_class.return_value], server.connections)
+
+    def test_sticky_server(self):
+        pool = self._get_pool([('localhost', 8000), ('localhost', 8001)])
+        responses = {8000: [fake_server.HTTPResponseMock500(None),
+                            fake_server.HTTPResponseMock(None)],
+                     8001: [fake_server.HTTPResponseMock(None),
+                            fake_server.HTTPResponseMock(None)]}
+        ports = []
+
+        def new_connection(server, port, timeout):
+            conn = mock.Mock()
+            conn.getresponse.return_value = responses[port].pop(0)
+            ports.append(port)
+            return conn
+
+        with mock.patch('httplib.HTTPConnection',
+                        side_effect=new_connection):
+            pool.rest_call('GET', '/networks', '', None, [])
+            self.assertTrue(pool.servers[0].failed)
+            # The first server recovered, but the next call still goes
+            # to the server which answered last
+            pool.servers[0].failed = False
+            pool.rest_call('GET', '/networks', '', None, [])
+        self.assertEqual([8000, 8001, 8001], ports)
+        self.assertEqual(1, pool.servers[0].get_stats()['errors'])
+        self.assertEqual(2, pool.servers[1].get_stats()['requests'])
+
+    def test_concurrent_requests_limited(self):
+        pool = self._get_pool([('localhost', 8000)], max_connections=2)
+        server = pool.servers[0]
+
+        def request(*args):
+            self.assertEqual(1, server.capacity.balance)
+            return mock.DEFAULT
+
+        with mock.patch('httplib.HTTPConnection') as conn_class:
+            conn_class.return_value.request.side_effect = request
+            conn_class.return_value.getresponse.return_value = (
+                KeepAliveResponseMock(None))
+            pool.rest_call('GET', '/networks', '', None, [])
+        self.assertEqual(2, server.capacity.balance)
@@ -0,0 +1,216 @@
+# Copyright (c) 2014 OpenStack Foundation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import eventlet
+import mock
+
+from neutron.openstack.common import importutils
+from neutron.plugins.cisco.common import cisco_exceptions as cisco_exc
+from neutron.plugins.cisco.db import nexus_db_v2
+from neutron.plugins.cisco.nexus import cisco_nexus_plugin_v2
+from neutron.tests import base
+
+
+NEXUS_IP_ADDRESS = '1.1.1.1'
+NEXUS_IP_ADDRESS_2 = '2.2.2.2'
+NEXUS_SSH_PORT = '22'
+NEXUS_PORT = '1/10'
+NEXUS_DRIVER = ('neutron.plugins.cisco.nexus.'
+                'cisco_nexus_network_driver_v2.CiscoNEXUSDriver')
+VLAN_ID = 267
+VLAN_NAME = 'q-267vlan'
+
+
+class FakeNetconfSession(object):
+    """NETCONF session to a fake Nexus switch."""
+
+    def __init__(self, switch):
+        self.switch = switch
+        self.connected = True
+
+    def edit_config(self, target, config):
+        if not self.connected:
+            raise Exception('Not connected')
+        if self.switch.drop_sessions:
+            self.switch.drop_sessions -= 1
+            self.connected = False
+            raise Exception('Session closed')
+        self.switch.stats['active'] += 1
+        self.switch.stats['max_active'] = max(self.switch.stats['active'],
+                                              self.switch.stats['max_active'])
+        try:
+            eventlet.sleep(self.switch.latency)
+            for word, exc in self.switch.errors.items():
+                if word in config:
+                    raise exc
+            self.switch.edits.append(config)
+        finally:
+            self.switch.stats['active'] -= 1
+
+
+class FakeNexusSwitch(object):
+    """Fake NETCONF endpoint recording the configuration it accepts."""
+
+    def __init__(self, stats, latency=0):
+        self.stats = stats
+        self.latency = latency
+        self.edits = []
+        # exception raised by the edits containing a string
+        self.errors = {}
+        # number of sessions to close on their next edit
+        self.drop_sessions = 0
+        self.sessions = []
+
+    def connect(self):
+        session = FakeNetconfSession(self)
+        self.sessions.append(session)
+        return session
+
+
+class TestCiscoNexusDriver(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestCiscoNexusDriver, self).setUp()
+        stats = {'active': 0, 'max_active': 0}
+        self.stats = stats
+        self.switches = {NEXUS_IP_ADDRESS: FakeNexusSwitch(stats, 0.01),
+                         NEXUS_IP_ADDRESS_2: FakeNexusSwitch(stats, 0.01)}
+
+        def connect(host, port, username, password):
+            return self.switches[host].connect()
+
+        mock_ncclient = mock.Mock()
+        mock_ncclient.manager.connect.side_effect = connect
+        patch_obj = mock.patch.dict('sys.modules',
+                                    {'ncclient': mock_ncclient})
+        patch_obj.start()
+        self.addCleanup(patch_obj.stop)
+        mock.patch.object(nexus_db_v2, 'get_port_switch_bindings',
+                          return_value=[]).start()
+        self.addCleanup(mock.patch.stopall)
+
+        self.driver = importutils.import_object(NEXUS_DRIVER)
+        self.driver.nexus_switches = {
+            (NEXUS_IP_ADDRESS, 'ssh_port'): NEXUS_SSH_PORT,
+            (NEXUS_IP_ADDRESS_2, 'ssh_port'): NEXUS_SSH_PORT,
+        }
+        self.driver.credentials = dict(
+            (ip, {'username': 'admin', 'password': 'pass1234'})
+            for ip in self.switches)
+        self.switch = self.switches[NEXUS_IP_ADDRESS]
+
+    def test_create_and_trunk_vlan_single_edit(self):
+        self.driver.create_and_trunk_vlan(NEXUS_IP_ADDRESS, VLAN_ID,
+                                          VLAN_NAME, 'ethernet', NEXUS_PORT)
+        self.assertEqual(1, len(self.switch.edits))
+        for word in [VLAN_NAME, '<vstate>active</vstate>', '<shutdown/>',
+                     '<allowed>']:
+            self.assertIn(word, self.switch.edits[0])
+
+    def test_concurrent_edits_coalesced(self):
+        pool = eventlet.GreenPool()
+        for vlan_id in range(100, 103):
+            pool.spawn(self.driver.create_vlan, NEXUS_IP_ADDRESS,
+                       vlan_id, 'q-%d' % vlan_id)
+        pool.waitall()
+        self.assertEqual(1, len(self.switch.edits))
+        for vlan_id in range(100, 103):
+            self.assertIn('q-%d' % vlan_id, self.switch.edits[0])
+
+    def test_extended_vlan_state_error_ignored(self):
+        self.switch.errors['<vstate>active</vstate>'] = Exception(
+            "Can't modify state for extended VLAN")
+        self.driver.create_and_trunk_vlan(NEXUS_IP_ADDRESS, VLAN_ID,
+                                          VLAN_NAME, 'ethernet', NEXUS_PORT)
+        # The combined edit failed, the other snippets were applied alone
+        self.assertEqual(3, len(self.switch.edits))
+        self.assertIn(VLAN_NAME, self.switch.edits[0])
+        self.assertIn('<allowed>', self.switch.edits[-1])
+
+    def test_allowed_error_does_not_hide_failed_snippet(self):
+        self.switch.errors['<vstate>active</vstate>'] = Exception(
+            "Can't modify state for extended VLAN")
+        self.switch.errors['<allowed>'] = ValueError()
+        self.assertRaises(cisco_exc.NexusConfigFailed,
+                          self.driver.create_and_trunk_vlan,
+                          NEXUS_IP_ADDRESS, VLAN_ID, VLAN_NAME,
+                          'ethernet', NEXUS_PORT)
+        self.assertFalse([edit for edit in self.switch.edits
+                          if '<allowed>' in edit])
+
+    def test_vlan_state_failure_rolled_back(self):
+        self.switch.errors['<vstate>active</vstate>'] = ValueError()
+        self.assertRaises(cisco_exc.NexusConfigFailed,
+                          self.driver.create_and_trunk_vlan,
+                          NEXUS_IP_ADDRESS, VLAN_ID, VLAN_NAME,
+                          'ethernet', NEXUS_PORT)
+        self.assertEqual(2, len(self.switch.edits))
+        self.assertIn(VLAN_NAME, self.switch.edits[0])
+        self.assertIn('<no>', self.switch.edits[1])
+        # The vlan is not trunked once its creation failed
+        self.assertFalse([edit for edit in self.switch.edits
+                          if '<allowed>' in edit])
+
+    def test_closed_session_reconnected(self):
+        self.driver.create_vlan(NEXUS_IP_ADDRESS, VLAN_ID, VLAN_NAME)
+        self.switch.drop_sessions = 1
+        self.driver.delete_vlan(NEXUS_IP_ADDRESS, VLAN_ID)
+        self.assertEqual(2, len(self.switch.sessions))
+        self.assertEqual(2, len(self.switch.edits))
+        self.assertIn('<no>', self.switch.edits[1])
+
+    def test_switches_configured_in_parallel(self):
+        with mock.patch.object(cisco_nexus_plugin_v2.NexusPlugin,
+                               '__init__', return_value=None):
+            plugin = cisco_nexus_plugin_v2.NexusPlugin()
+        plugin._client = self.driver
+        self.switches[NEXUS_IP_ADDRESS_2].errors['<allowed>'] = ValueError()
+
+        errors = plugin._configure_switches([
+            (self.driver.create_and_trunk_vlan, NEXUS_IP_ADDRESS, VLAN_ID,
+             VLAN_NAME, 'ethernet', NEXUS_PORT),
+            None,
+            (self.driver.create_and_trunk_vlan, NEXUS_IP_ADDRESS_2, VLAN_ID,
+             VLAN_NAME, 'ethernet', NEXUS_PORT)])
+
+        self.assertEqual(2, self.stats['max_active'])
+        self.assertIsNone(errors[0])
+        self.assertIsNone(errors[1])
+        self.assertIsInstance(errors[2], cisco_exc.NexusConfigFailed)
+        self.assertEqual(1, len(self.switch.edits))
+
+    def test_same_switch_configured_in_order(self):
+        with mock.patch.object(cisco_nexus_plugin_v2.NexusPlugin,
+                               '__init__', return_value=None):
+            plugin = cisco_nexus_plugin_v2.NexusPlugin()
+        calls = []
+
+        def configure(switch_ip, port):
+            calls.append(port)
+            eventlet.sleep(0.01)
+            if port == '1/1':
+                raise ValueError()
+
+        errors = plugin._configure_switches([
+            (configure, NEXUS_IP_ADDRESS, '1/1'),
+            (configure, NEXUS_IP_ADDRESS_2, '1/2'),
+            (configure, NEXUS_IP_ADDRESS, '1/3')])
+
+        # The second interface of the switch is not configured once the
+        # first one failed
+        self.assertEqual(['1/1', '1/2'], calls)
+        self.assertIsInstance(errors[0], ValueError)
+        self.assertIsNone(errors[1])
+        self.assertIs(errors[0], errors[2])
@@ -13,6 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
+
 import mock
 
 from oslo.config import cfg
@@ -235,6 +237,20 @@ class TestCiscoNexusPlugin(base.BaseTestCase):
             INSTANCE3, self.network3[const.NET_VLAN_ID]
         )
 
+    def test_create_network_vlan_created_once_per_switch(self):
+        """Tests a vlan is created once on a switch with two interfaces."""
+        plugin = self._cisco_nexus_plugin
+        plugin._nexus_switches[
+            ('NEXUS_SWITCH_B', NEXUS_IP_ADDRESS, HOSTNAME1)] = NEXUS_PORT2
+        with contextlib.nested(
+            mock.patch.object(plugin._client, 'create_and_trunk_vlan'),
+            mock.patch.object(plugin._client, 'enable_vlan_on_trunk_int')
+        ) as (mock_create, mock_trunk):
+            plugin.create_network(self.network1, self.attachment1)
+        self.assertEqual(1, mock_create.call_count)
+        self.assertEqual(1, mock_trunk.call_count)
+        self.assertEqual(NEXUS_IP_ADDRESS, mock_trunk.call_args[0][0])
+
     def _add_router_interface(self):
         """Add a router interface using fixed (canned) parameters."""
         vlan_name = self.vlan_name
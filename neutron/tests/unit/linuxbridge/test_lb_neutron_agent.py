@@ -16,6 +16,7 @@
 
 import contextlib
 import os
+import select
 
 import mock
 from oslo.config import cfg
@@ -246,14 +247,17 @@ class TestLinuxBridgeManager(base.BaseTestCase):
                              'dev_name')
 
     def test_get_bridge_for_tap_device(self):
-        with contextlib.nested(
-            mock.patch.object(self.lbm, "get_all_neutron_bridges"),
-            mock.patch.object(self.lbm, "get_interfaces_on_bridge")
-        ) as (get_all_qbr_fn, get_if_fn):
-            get_all_qbr_fn.return_value = ["br-int", "br-ex"]
-            get_if_fn.return_value = ["tap1", "tap2", "tap3"]
+        with mock.patch.object(os, 'readlink') as readlink_fn:
+            readlink_fn.return_value = '../../../../virtual/net/brq1'
             self.assertEqual(self.lbm.get_bridge_for_tap_device("tap1"),
-                             "br-int")
+                             "brq1")
+            readlink_fn.assert_called_once_with(
+                "/sys/devices/virtual/net/tap1/brport/bridge")
+
+            readlink_fn.return_value = '../../../../virtual/net/br-int'
+            self.assertIsNone(self.lbm.get_bridge_for_tap_device("tap1"))
+
+            readlink_fn.side_effect = OSError()
             self.assertIsNone(self.lbm.get_bridge_for_tap_device("tap4"))
 
     def test_is_device_on_bridge(self):
@@ -610,6 +614,69 @@ class TestLinuxBridgeManager(base.BaseTestCase):
                               "removed": set(["dev3"])
                               })
 
+    def _udev_device(self, name):
+        device = mock.Mock()
+        device.sys_name = name
+        return device
+
+    def test_start_udev_monitor(self):
+        with contextlib.nested(
+            mock.patch.object(linuxbridge_neutron_agent.pyudev, 'Monitor'),
+            mock.patch.object(self.lbm, 'udev_get_tap_devices',
+                              return_value=set(['tap1']))
+        ) as (monitor_cls, gt_fn):
+            self.lbm.start_udev_monitor()
+            monitor = monitor_cls.from_netlink.return_value
+            monitor.filter_by.assert_called_once_with('net')
+            self.assertTrue(monitor.start.called)
+            self.assertEqual(self.lbm.udev_monitor, monitor)
+            self.assertEqual(self.lbm.tap_devices, set(['tap1']))
+
+    def test_update_devices_udev_events(self):
+        self.lbm.udev_monitor = mock.Mock()
+        self.lbm.tap_devices = set(['tap1', 'tap2'])
+        events = [('add', self._udev_device('tap3')),
+                  ('add', self._udev_device('eth1')),
+                  ('remove', self._udev_device('tap1')),
+                  ('change', self._udev_device('tap2'))]
+        with contextlib.nested(
+            mock.patch.object(self.lbm, '_receive_udev_events',
+                              return_value=events),
+            mock.patch.object(self.lbm, 'udev_get_tap_devices')
+        ) as (events_fn, gt_fn):
+            self.assertEqual(self.lbm.update_devices(set(['tap1', 'tap2'])),
+                             {'current': set(['tap2', 'tap3']),
+                              'added': set(['tap3']),
+                              'removed': set(['tap1'])})
+            self.assertFalse(gt_fn.called)
+
+            events_fn.return_value = []
+            self.assertIsNone(self.lbm.update_devices(set(['tap2', 'tap3'])))
+            self.assertFalse(gt_fn.called)
+
+    def test_update_devices_udev_events_lost(self):
+        self.lbm.udev_monitor = mock.Mock()
+        self.lbm.tap_devices = set(['tap1'])
+        with contextlib.nested(
+            mock.patch.object(self.lbm, '_receive_udev_events',
+                              side_effect=OSError()),
+            mock.patch.object(self.lbm, 'udev_get_tap_devices',
+                              return_value=set(['tap2'])),
+            mock.patch.object(linuxbridge_neutron_agent.LOG, 'exception')
+        ) as (events_fn, gt_fn, log):
+            self.assertEqual(self.lbm.get_tap_devices(), set(['tap2']))
+            self.assertTrue(log.called)
+
+    def test_receive_udev_events(self):
+        monitor = mock.Mock(spec=['fileno', 'receive_device'])
+        self.lbm.udev_monitor = monitor
+        event = ('add', self._udev_device('tap1'))
+        monitor.receive_device.return_value = event
+        with mock.patch.object(select, 'select') as select_fn:
+            select_fn.side_effect = [([monitor], [], []), ([], [], [])]
+            self.assertEqual(self.lbm._receive_udev_events(), [event])
+            select_fn.assert_called_with([monitor], [], [], 0)
+
     def _check_vxlan_support(self, kernel_version, vxlan_proxy_supported,
                              fdb_append_supported, l2_population,
                              expected_mode):
@@ -843,6 +910,15 @@ class TestLinuxBridgeRpcCallbacks(base.BaseTestCase):
             self.assertTrue(plugin_rpc.update_device_down.called)
             self.assertEqual(log.call_count, 1)
 
+    def _fdb_execute(self, bridge_dump='', neigh_dump=''):
+        def execute(cmd, **kwargs):
+            if cmd[:3] == ['bridge', 'fdb', 'show']:
+                return bridge_dump
+            elif cmd[:3] == ['ip', 'neigh', 'show']:
+                return neigh_dump
+            return ''
+        return mock.patch.object(utils, 'execute', side_effect=execute)
+
     def test_fdb_add(self):
         fdb_entries = {'net_id':
                        {'ports':
@@ -851,29 +927,115 @@ class TestLinuxBridgeRpcCallbacks(base.BaseTestCase):
                         'network_type': 'vxlan',
                         'segment_id': 1}}
 
-        with mock.patch.object(utils, 'execute',
-                               return_value='') as execute_fn:
+        with self._fdb_execute() as execute_fn:
             self.lb_rpc.fdb_add(None, fdb_entries)
 
             expected = [
                 mock.call(['bridge', 'fdb', 'show', 'dev', 'vxlan-1'],
                           root_helper=self.root_helper),
+                mock.call(['ip', 'neigh', 'show', 'dev', 'vxlan-1'],
+                          root_helper=self.root_helper),
+                mock.call(['ip', 'neigh', 'replace', 'port_ip', 'lladdr',
+                           'port_mac', 'dev', 'vxlan-1', 'nud', 'permanent'],
+                          root_helper=self.root_helper),
                 mock.call(['bridge', 'fdb', 'add',
                            constants.FLOODING_ENTRY[0],
                            'dev', 'vxlan-1', 'dst', 'agent_ip'],
-                          root_helper=self.root_helper,
-                          check_exit_code=False),
-                mock.call(['ip', 'neigh', 'add', 'port_ip', 'lladdr',
-                           'port_mac', 'dev', 'vxlan-1', 'nud', 'permanent'],
-                          root_helper=self.root_helper,
-                          check_exit_code=False),
-                mock.call(['bridge', 'fdb', 'add', 'port_mac', 'dev',
+                          root_helper=self.root_helper),
+                mock.call(['bridge', 'fdb', 'replace', 'port_mac', 'dev',
                            'vxlan-1', 'dst', 'agent_ip'],
-                          root_helper=self.root_helper,
-                          check_exit_code=False),
+                          root_helper=self.root_helper),
             ]
             execute_fn.assert_has_calls(expected)
 
+            # the entries are known, nothing is programmed again
+            execute_fn.reset_mock()
+            self.lb_rpc.fdb_add(None, fdb_entries)
+            self.assertFalse(execute_fn.called)
+
+    def test_fdb_add_failure_reloads_table(self):
+        fdb_entries = {'net_id':
+                       {'ports':
+                        {'agent_ip': [['port_mac', 'port_ip']]},
+                        'network_type': 'vxlan',
+                        'segment_id': 1}}
+        failures = [RuntimeError()]
+
+        def execute(cmd, **kwargs):
+            if cmd[:3] == ['bridge', 'fdb', 'replace'] and failures:
+                raise failures.pop()
+            return ''
+
+        with mock.patch.object(utils, 'execute',
+                               side_effect=execute) as execute_fn:
+            self.lb_rpc.fdb_add(None, fdb_entries)
+            self.assertNotIn('vxlan-1', self.lb_rpc.agent.br_mgr.fdb_tables)
+
+            # the table is dumped again and the entry programmed again
+            execute_fn.reset_mock()
+            self.lb_rpc.fdb_add(None, fdb_entries)
+            execute_fn.assert_any_call(
+                ['bridge', 'fdb', 'show', 'dev', 'vxlan-1'],
+                root_helper=self.root_helper)
+            execute_fn.assert_called_with(
+                ['bridge', 'fdb', 'replace', 'port_mac', 'dev', 'vxlan-1',
+                 'dst', 'agent_ip'],
+                root_helper=self.root_helper)
+            self.assertIn('vxlan-1', self.lb_rpc.agent.br_mgr.fdb_tables)
+
+    def test_fdb_add_existing_flooding_entry(self):
+        fdb_entries = {'net_id':
+                       {'ports':
+                        {'agent_ip': [constants.FLOODING_ENTRY]},
+                        'network_type': 'vxlan',
+                        'segment_id': 1}}
+        bridge_dump = '%s dst other_ip self permanent\n' % (
+            constants.FLOODING_ENTRY[0])
+
+        with self._fdb_execute(bridge_dump=bridge_dump) as execute_fn:
+            self.lb_rpc.fdb_add(None, fdb_entries)
+
+            execute_fn.assert_called_with(
+                ['bridge', 'fdb', 'append', constants.FLOODING_ENTRY[0],
+                 'dev', 'vxlan-1', 'dst', 'agent_ip'],
+                root_helper=self.root_helper)
+            self.assertEqual(execute_fn.call_count, 3)
+
+    def test_fdb_add_batch(self):
+        cfg.CONF.set_override('fdb_batch', True, 'VXLAN')
+        fdb_entries = {'net_id':
+                       {'ports':
+                        {'agent_ip': [constants.FLOODING_ENTRY,
+                                      ['port_mac', 'port_ip']],
+                         'agent_ip_2': [['port_mac_2', 'port_ip_2']]},
+                        'network_type': 'vxlan',
+                        'segment_id': 1}}
+
+        with self._fdb_execute() as execute_fn:
+            self.lb_rpc.fdb_add(None, fdb_entries)
+
+            self.assertEqual(execute_fn.call_count, 4)
+            calls = dict((c[0][0][0], c[1]['process_input'])
+                         for c in execute_fn.call_args_list[2:])
+            execute_fn.assert_any_call(['ip', '-force', '-batch', '-'],
+                                       root_helper=self.root_helper,
+                                       process_input=calls['ip'])
+            execute_fn.assert_any_call(['bridge', '-force', '-batch', '-'],
+                                       root_helper=self.root_helper,
+                                       process_input=calls['bridge'])
+            self.assertEqual(
+                sorted(calls['ip'].splitlines()),
+                ['neigh replace port_ip lladdr port_mac dev vxlan-1 '
+                 'nud permanent',
+                 'neigh replace port_ip_2 lladdr port_mac_2 dev vxlan-1 '
+                 'nud permanent'])
+            self.assertEqual(
+                sorted(calls['bridge'].splitlines()),
+                ['fdb add %s dev vxlan-1 dst agent_ip' % (
+                    constants.FLOODING_ENTRY[0]),
+                 'fdb replace port_mac dev vxlan-1 dst agent_ip',
+                 'fdb replace port_mac_2 dev vxlan-1 dst agent_ip_2'])
+
     def test_fdb_ignore(self):
         fdb_entries = {'net_id':
                        {'ports':
@@ -910,47 +1072,51 @@ class TestLinuxBridgeRpcCallbacks(base.BaseTestCase):
                                       ['port_mac', 'port_ip']]},
                         'network_type': 'vxlan',
                         'segment_id': 1}}
+        bridge_dump = ('%s dst agent_ip self permanent\n'
+                       'port_mac dst agent_ip self permanent\n'
+                       'local_mac vlan 1 master brq-net self permanent\n' %
+                       constants.FLOODING_ENTRY[0])
+        neigh_dump = 'port_ip lladdr port_mac PERMANENT\n'
 
-        with mock.patch.object(utils, 'execute',
-                               return_value='') as execute_fn:
+        with self._fdb_execute(bridge_dump, neigh_dump) as execute_fn:
             self.lb_rpc.fdb_remove(None, fdb_entries)
 
             expected = [
+                mock.call(['ip', 'neigh', 'del', 'port_ip', 'lladdr',
+                           'port_mac', 'dev', 'vxlan-1'],
+                          root_helper=self.root_helper),
                 mock.call(['bridge', 'fdb', 'del',
                            constants.FLOODING_ENTRY[0],
                            'dev', 'vxlan-1', 'dst', 'agent_ip'],
-                          root_helper=self.root_helper,
-                          check_exit_code=False),
-                mock.call(['ip', 'neigh', 'del', 'port_ip', 'lladdr',
-                           'port_mac', 'dev', 'vxlan-1'],
-                          root_helper=self.root_helper,
-                          check_exit_code=False),
+                          root_helper=self.root_helper),
                 mock.call(['bridge', 'fdb', 'del', 'port_mac',
                            'dev', 'vxlan-1', 'dst', 'agent_ip'],
-                          root_helper=self.root_helper,
-                          check_exit_code=False),
+                          root_helper=self.root_helper),
             ]
             execute_fn.assert_has_calls(expected)
 
+            # the entries are gone, nothing is removed again
+            execute_fn.reset_mock()
+            self.lb_rpc.fdb_remove(None, fdb_entries)
+            self.assertFalse(execute_fn.called)
+
     def test_fdb_update_chg_ip(self):
         fdb_entries = {'chg_ip':
                        {'net_id':
                         {'agent_ip':
                          {'before': [['port_mac', 'port_ip_1']],
                           'after': [['port_mac', 'port_ip_2']]}}}}
+        neigh_dump = 'port_ip_1 lladdr port_mac PERMANENT\n'
 
-        with mock.patch.object(utils, 'execute',
-                               return_value='') as execute_fn:
+        with self._fdb_execute(neigh_dump=neigh_dump) as execute_fn:
             self.lb_rpc.fdb_update(None, fdb_entries)
 
             expected = [
-                mock.call(['ip', 'neigh', 'add', 'port_ip_2', 'lladdr',
-                           'port_mac', 'dev', 'vxlan-1', 'nud', 'permanent'],
-                          root_helper=self.root_helper,
-                          check_exit_code=False),
                 mock.call(['ip', 'neigh', 'del', 'port_ip_1', 'lladdr',
                            'port_mac', 'dev', 'vxlan-1'],
-                          root_helper=self.root_helper,
-                          check_exit_code=False)
+                          root_helper=self.root_helper),
+                mock.call(['ip', 'neigh', 'replace', 'port_ip_2', 'lladdr',
+                           'port_mac', 'dev', 'vxlan-1', 'nud', 'permanent'],
+                          root_helper=self.root_helper)
             ]
             execute_fn.assert_has_calls(expected)
@@ -188,3 +188,106 @@ class MidoClientTestCase(testtools.TestCase):
         self.assertIsNotNone(router)
         self.assertEqual(router.get_id(), router_id)
         self.assertTrue(router.get_admin_state_up())
+
+    def test_get_bridge_request_scope(self):
+        bridge_id = uuidutils.generate_uuid()
+
+        with self.client.request_scope():
+            bridge = self.client.get_bridge(bridge_id)
+            with self.client.request_scope():
+                self.assertIs(bridge, self.client.get_bridge(bridge_id))
+        self.assertEqual(1, self.mock_api.get_bridge.call_count)
+
+        self.client.get_bridge(bridge_id)
+        self.assertEqual(2, self.mock_api.get_bridge.call_count)
+
+    def test_get_port_cached_until_written(self):
+        self.client = midonet_lib.MidoClient(self.mock_api, cache_ttl=60)
+        port_id = uuidutils.generate_uuid()
+
+        self.client.get_port(port_id)
+        self.client.get_port(port_id)
+        self.assertEqual(1, self.mock_api.get_port.call_count)
+
+        self.client.update_port(port_id, admin_state_up=False)
+        self.client.get_port(port_id)
+        self.assertEqual(3, self.mock_api.get_port.call_count)
+
+    def test_get_router_cache_expired(self):
+        self.client = midonet_lib.MidoClient(self.mock_api, cache_ttl=60)
+        router_id = uuidutils.generate_uuid()
+
+        with mock.patch('time.time', return_value=1000):
+            self.client.get_router(router_id)
+            self.client.get_router(router_id)
+        with mock.patch('time.time', return_value=1060):
+            self.client.get_router(router_id)
+        self.assertEqual(2, self.mock_api.get_router.call_count)
+
+    def test_get_chain_by_name_request_scope(self):
+        tenant_id = uuidutils.generate_uuid()
+        self.mock_api_cfg.chains_in = [
+            _create_test_chain(uuidutils.generate_uuid(), "chain1",
+                               tenant_id),
+            _create_test_chain(uuidutils.generate_uuid(), "chain2",
+                               tenant_id)]
+
+        with self.client.request_scope():
+            self.assertEqual("chain1", self.client.get_chain_by_name(
+                tenant_id, "chain1").get_name())
+            self.assertEqual("chain2", self.client.get_chain_by_name(
+                tenant_id, "chain2").get_name())
+            self.assertEqual(1, self.mock_api.get_chains.call_count)
+
+            self.client.create_chain(tenant_id, "chain3")
+            self.client.get_chain_by_name(tenant_id, "chain1")
+            self.assertEqual(2, self.mock_api.get_chains.call_count)
+
+    def _get_digest_rule(self, action, fields):
+        digest = midonet_lib._rule_digest(action, fields)
+        return mock_lib.get_rule_mock(
+            properties={midonet_lib.OS_RULE_DIGEST_KEY: digest})
+
+    def test_sync_chain_rules(self):
+        rules = [('accept', {'match_return_flow': True}),
+                 ('jump', {'jump_chain_name': 'sg'}),
+                 ('drop', {'dl_type': 0x0806, 'inv_dl_type': True})]
+        legacy_rule = mock_lib.get_rule_mock()
+        chain = mock_lib.get_chain_mock(rules=[
+            self._get_digest_rule(*rules[0]), legacy_rule,
+            self._get_digest_rule(*rules[2])])
+
+        self.assertEqual(2, self.client.sync_chain_rules(chain, rules))
+
+        self.mock_api.delete_rule.assert_called_once_with(
+            legacy_rule.get_id())
+        self.mock_api.add_chain_rule.assert_called_once_with(
+            chain, 'jump', jump_chain_name='sg', position=2,
+            properties={midonet_lib.OS_RULE_DIGEST_KEY:
+                        midonet_lib._rule_digest(*rules[1])})
+
+    def test_sync_chain_rules_unchanged(self):
+        rules = [('accept', {'match_forward_flow': True}),
+                 ('drop', {'dl_type': 0x0806, 'inv_dl_type': True})]
+        chain = mock_lib.get_chain_mock(
+            rules=[self._get_digest_rule(*r) for r in rules])
+
+        self.assertEqual(0, self.client.sync_chain_rules(chain, rules))
+
+        self.assertFalse(self.mock_api.delete_rule.called)
+        self.assertFalse(self.mock_api.add_chain_rule.called)
+
+    def test_add_chain_rules(self):
+        chain = mock_lib.get_chain_mock()
+        rules = [('drop', {'dl_src': 'aa:bb:cc:dd:ee:ff'}),
+                 ('accept', {'match_forward_flow': True})]
+
+        self.client.add_chain_rules(chain, rules)
+
+        self.assertFalse(chain.get_rules.called)
+        self.mock_api.add_chain_rule.assert_has_calls([
+            mock.call(chain, action, position=i,
+                      properties={midonet_lib.OS_RULE_DIGEST_KEY:
+                                  midonet_lib._rule_digest(action, fields)},
+                      **fields)
+            for i, (action, fields) in enumerate(rules, 1)])
@@ -202,6 +202,16 @@ class TestMidonetPortsV2(test_plugin.TestPortsV2,
             self.assertEqual('midonet', port['port']['binding:vif_type'])
             self.assertTrue(port['port']['admin_state_up'])
 
+    def test_update_port_fixed_ips_syncs_chains(self):
+        client = self.instance.return_value
+        with self.port() as port:
+            self.assertFalse(client.sync_chain_rules.called)
+            data = {'port': {'fixed_ips': port['port']['fixed_ips']}}
+            req = self.new_update_request('ports', data, port['port']['id'])
+            req.get_response(self.api)
+            self.assertEqual(2, client.add_chain_rules.call_count)
+            self.assertEqual(2, client.sync_chain_rules.call_count)
+
 
 class TestMidonetPluginPortBinding(test_bindings.PortBindingsTestCase,
                                    MidonetPluginV2TestCase):
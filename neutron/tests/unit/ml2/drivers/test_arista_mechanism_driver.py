@@ -329,6 +329,91 @@ class PositiveRPCWrapperValidConfigTestCase(base.BaseTestCase):
                 'exit', 'exit', 'exit']
         self.drv._server.runCmds.assert_called_once_with(version=1, cmds=cmds)
 
+    def test_plug_port_cmds(self):
+        cmds = self.drv.plug_port_cmds('vm-1', 'host', 123, 'net-id',
+                                       '123-port', 'compute:nova')
+        self.assertEqual(['vm id vm-1 hostid host',
+                          'port id 123 name "123-port" network-id net-id',
+                          'exit'], cmds)
+        cmds = self.drv.plug_port_cmds('dhcp-1', 'host', 123, 'net-id',
+                                       None, 'network:dhcp')
+        self.assertEqual(['network id net-id',
+                          'dhcp id dhcp-1 hostid host port-id 123',
+                          'exit'], cmds)
+        cmds = self.drv.plug_port_cmds('router-1', 'host', 123, 'net-id',
+                                       None, 'network:router_interface')
+        self.assertEqual([], cmds)
+
+    def test_run_batched_cmds(self):
+        tenant_cmds = [
+            (None, ['no tenant ten-0']),
+            ('ten-1', ['no vm id vm-1']),
+            ('ten-1', self.drv.create_network_cmds('net-1', 'net', 100)),
+            ('ten-2', []),
+            ('ten-2', ['no network id net-2'])]
+        self.drv.run_batched_cmds(tenant_cmds)
+        cmds = ['enable', 'configure', 'management openstack',
+                'region RegionOne',
+                'no tenant ten-0',
+                'tenant ten-1', 'no vm id vm-1',
+                'network id net-1 name "net"', 'segment 1 type vlan id 100',
+                'exit', 'exit',
+                'exit',
+                'tenant ten-2', 'no network id net-2',
+                'exit',
+                'exit', 'exit']
+        self.drv._server.runCmds.assert_called_once_with(version=1, cmds=cmds)
+
+    def test_run_batched_cmds_bounded_requests(self):
+        self.drv.batch_size = 6
+        tenant_cmds = [('ten-1', ['no vm id vm-%d' % i]) for i in range(3)]
+        tenant_cmds.append((None, ['no tenant ten-2']))
+        self.drv.run_batched_cmds(tenant_cmds)
+        start = ['enable', 'configure', 'management openstack',
+                 'region RegionOne']
+        end = ['exit', 'exit']
+        self.assertEqual(
+            [mock.call(version=1,
+                       cmds=start + ['tenant ten-1', 'no vm id vm-0',
+                                     'no vm id vm-1', 'exit'] + end),
+             mock.call(version=1,
+                       cmds=start + ['tenant ten-1', 'no vm id vm-2',
+                                     'exit', 'no tenant ten-2'] + end)],
+            self.drv._server.runCmds.call_args_list)
+
+    def test_run_batched_cmds_failed_block_isolated(self):
+        self.drv.batch_size = 6
+
+        def run_cmds(version, cmds):
+            if 'no vm id vm-bad' in cmds:
+                raise Exception('command failed')
+            return [{}] * len(cmds)
+
+        self.drv._server.runCmds.side_effect = run_cmds
+        tenant_cmds = [('ten-1', ['no vm id vm-1']),
+                       ('ten-1', ['no vm id vm-bad']),
+                       ('ten-2', ['no vm id vm-2'])]
+        self.assertRaises(arista_exc.AristaRpcError,
+                          self.drv.run_batched_cmds, tenant_cmds)
+
+        sent = [c[1]['cmds'][4:-2]
+                for c in self.drv._server.runCmds.call_args_list]
+        self.assertEqual(
+            [['tenant ten-1', 'no vm id vm-1', 'no vm id vm-bad', 'exit'],
+             ['tenant ten-1', 'no vm id vm-1', 'exit'],
+             ['tenant ten-1', 'no vm id vm-bad', 'exit'],
+             ['tenant ten-2', 'no vm id vm-2', 'exit']], sent)
+
+    def test_run_batched_cmds_stops_when_nothing_goes_through(self):
+        self.drv.batch_size = 6
+        self.drv._server.runCmds.side_effect = Exception('unreachable')
+        tenant_cmds = [('ten-1', ['no vm id vm-1']),
+                       ('ten-1', ['no vm id vm-2']),
+                       ('ten-2', ['no vm id vm-3'])]
+        self.assertRaises(arista_exc.AristaRpcError,
+                          self.drv.run_batched_cmds, tenant_cmds)
+        self.assertEqual(3, self.drv._server.runCmds.call_count)
+
     def test_get_network_info_returns_none_when_no_such_net(self):
         expected = []
         self.drv.get_tenants = mock.MagicMock()
@@ -354,6 +439,74 @@ class PositiveRPCWrapperValidConfigTestCase(base.BaseTestCase):
                          ('Must return network info for a valid net'))
 
 
+class SyncServiceTestCase(base.BaseTestCase):
+    """Test cases for the synchronization of Neutron DB and EOS."""
+
+    def setUp(self):
+        super(SyncServiceTestCase, self).setUp()
+        setup_valid_config()
+        ndb.configure_db()
+        self.addCleanup(ndb.clear_db)
+        self.rpc = arista.AristaRPCWrapper()
+        self.rpc._server = mock.MagicMock()
+        self.rpc._register_with_eos = mock.Mock()
+        self.rpc.get_tenants = mock.Mock()
+        self.ndb = mock.Mock()
+        self.ndb.get_network_name.return_value = 'net'
+        self.sync_service = arista.SyncService(self.rpc, self.ndb)
+
+    def _remember_tenant(self, tenant_id):
+        db.remember_tenant(tenant_id)
+        db.remember_network(tenant_id, 'net-%s' % tenant_id, 100)
+        db.remember_vm('vm-%s' % tenant_id, 'host', 'port-%s' % tenant_id,
+                       'net-%s' % tenant_id, tenant_id)
+
+    def _eos_tenants(self, *tenants):
+        return dict(
+            (tenant, {'tenantNetworks': db.get_networks(tenant),
+                      'tenantVmInstances': db.get_vms(tenant)})
+            for tenant in tenants)
+
+    def test_tenants_in_sync(self):
+        self._remember_tenant('ten-1')
+        self._remember_tenant('ten-2')
+        self.rpc.get_tenants.return_value = self._eos_tenants('ten-1',
+                                                              'ten-2')
+        self.sync_service.synchronize()
+        self.assertFalse(self.rpc._server.runCmds.called)
+        self.assertFalse(self.ndb.get_network_name.called)
+
+    def test_corrective_commands_batched(self):
+        self._remember_tenant('ten-1')
+        self._remember_tenant('ten-2')
+        eos_tenants = self._eos_tenants('ten-1')
+        eos_tenants['ten-1']['tenantVmInstances']['vm-stale'] = {}
+        eos_tenants['ten-3'] = {'tenantNetworks': {},
+                                'tenantVmInstances': {}}
+        self.rpc.get_tenants.return_value = eos_tenants
+        self.ndb.get_all_ports_for_vm.return_value = [
+            {'id': 'port-ten-2', 'network_id': 'net-ten-2', 'name': None,
+             'device_owner': 'compute:nova'}]
+
+        self.sync_service.synchronize()
+
+        cmds = ['enable', 'configure', 'management openstack',
+                'region RegionOne',
+                'no tenant ten-3',
+                'tenant ten-1', 'no vm id vm-stale', 'exit',
+                'tenant ten-2',
+                'network id net-ten-2 name "net"',
+                'segment 1 type vlan id 100', 'exit', 'exit',
+                'vm id vm-ten-2 hostid host',
+                'port id port-ten-2 network-id net-ten-2', 'exit',
+                'exit',
+                'exit', 'exit']
+        self.rpc._server.runCmds.assert_called_once_with(version=1,
+                                                         cmds=cmds)
+        self.ndb.get_all_ports_for_vm.assert_called_once_with('ten-2',
+                                                              'vm-ten-2')
+
+
 class AristaRPCWrapperInvalidConfigTestCase(base.BaseTestCase):
     """Negative test cases to test the Arista Driver configuration."""
 
@@ -499,6 +652,45 @@ class RealNetStorageAristaDriverTestCase(base.BaseTestCase):
                          'There should be %d '
                          'VMs, not %d' % (expected_vms, provisioned_vms))
 
+    def test_port_plugs_deferred(self):
+        cfg.CONF.set_override('port_flush_delay', 60, 'ml2_arista')
+        self.addCleanup(cfg.CONF.clear_override, 'port_flush_delay',
+                        'ml2_arista')
+        drv = arista.AristaDriver(self.fake_rpc)
+        self.addCleanup(drv.stop_synchronization_thread)
+        tenant_id = 'ten-1'
+        network_id = 'net1-id'
+        network_context = self._get_network_context(tenant_id,
+                                                    network_id,
+                                                    1001)
+        drv.create_network_precommit(network_context)
+        for vm_id in ['vm1', 'vm2']:
+            port_context = self._get_port_context(tenant_id,
+                                                  network_id,
+                                                  vm_id,
+                                                  network_context)
+            drv.create_port_precommit(port_context)
+            drv.create_port_postcommit(port_context)
+
+        self.assertFalse(self.fake_rpc.plug_port_into_network.called)
+        self.assertFalse(self.fake_rpc.run_batched_cmds.called)
+        self.assertIsNotNone(drv.flush_timer)
+
+        drv._flush_port_plugs()
+        cmds = self.fake_rpc.plug_port_cmds.return_value
+        self.fake_rpc.run_batched_cmds.assert_called_once_with(
+            [(tenant_id, cmds), (tenant_id, cmds)])
+        self.assertIsNone(drv.flush_timer)
+
+    def test_pending_port_plugs_sent_before_unplug(self):
+        self.drv.port_flush_delay = 60
+        self.drv._defer_port_plug('ten-1', ['vm id vm1 hostid ubuntu1'])
+        port_context = self._get_port_context('ten-1', 'net1-id', 'vm1',
+                                              None)
+        self.drv.delete_port_postcommit(port_context)
+        self.assertEqual(['run_batched_cmds', 'unplug_host_from_network'],
+                         [call[0] for call in self.fake_rpc.method_calls])
+
     def _get_network_context(self, tenant_id, net_id, seg_id):
         network = {'id': net_id,
                    'tenant_id': tenant_id}
@@ -511,6 +703,7 @@ class RealNetStorageAristaDriverTestCase(base.BaseTestCase):
                 'binding:host_id': 'ubuntu1',
                 'tenant_id': tenant_id,
                 'id': 101,
+                'name': 'port-%s' % vm_id,
                 'network_id': net_id
                 }
         return FakePortContext(port, port, network)
@@ -29,9 +29,12 @@ from neutron.extensions import providernet as pnet
 from neutron import manager
 from neutron.openstack.common import timeutils
 from neutron.plugins.ml2 import config as config
+from neutron.plugins.ml2.drivers.l2pop import config as l2pop_config
 from neutron.plugins.ml2.drivers.l2pop import constants as l2_consts
+from neutron.plugins.ml2.drivers.l2pop import fdb_index
 from neutron.plugins.ml2 import managers
 from neutron.plugins.ml2 import rpc
+from neutron.tests import base
 from neutron.tests.unit import test_db_plugin as test_plugin
 
 HOST = 'my_l2_host'
@@ -261,6 +264,56 @@ class TestL2PopulationRpcTestCase(test_plugin.NeutronDbPluginV2TestCase):
                     self.mock_fanout.assert_called_with(
                         mock.ANY, expected2, topic=self.fanout_topic)
 
+    def test_fdb_add_served_from_index(self):
+        self._register_ml2_agents()
+
+        with self.subnet(network=self._network) as subnet:
+            host_arg = {portbindings.HOST_ID: HOST}
+            with self.port(subnet=subnet,
+                           arg_list=(portbindings.HOST_ID,),
+                           **host_arg) as port1:
+                host_arg = {portbindings.HOST_ID: HOST + '_2'}
+                with self.port(subnet=subnet,
+                               arg_list=(portbindings.HOST_ID,),
+                               **host_arg) as port2:
+                    p1 = port1['port']
+                    p2 = port2['port']
+
+                    self.callbacks.update_device_up(self.adminContext,
+                                                    agent_id=HOST,
+                                                    device='tap' + p1['id'])
+
+                    get_ports = ('neutron.plugins.ml2.drivers.l2pop.db.'
+                                 'L2populationDbMixin.get_network_ports')
+                    with mock.patch(get_ports) as mock_get_ports:
+                        self.mock_cast.reset_mock()
+                        self.callbacks.update_device_up(
+                            self.adminContext, agent_id=HOST + '_2',
+                            device='tap' + p2['id'])
+                        self.assertFalse(mock_get_ports.called)
+
+                    p1_ips = [p['ip_address'] for p in p1['fixed_ips']]
+                    expected = {'args':
+                                {'fdb_entries':
+                                 {p1['network_id']:
+                                  {'ports':
+                                   {'20.0.0.1': [constants.FLOODING_ENTRY,
+                                                 [p1['mac_address'],
+                                                  p1_ips[0]]]},
+                                   'network_type': 'vxlan',
+                                   'segment_id': 1}}},
+                                'namespace': None,
+                                'method': 'add_fdb_entries'}
+
+                    topic = topics.get_topic_name(topics.AGENT,
+                                                  topics.L2POPULATION,
+                                                  topics.UPDATE,
+                                                  HOST + '_2')
+
+                    self.mock_cast.assert_called_with(mock.ANY,
+                                                      expected,
+                                                      topic=topic)
+
     def test_fdb_add_called_two_networks(self):
         self._register_ml2_agents()
 
@@ -550,3 +603,121 @@ class TestL2PopulationRpcTestCase(test_plugin.NeutronDbPluginV2TestCase):
 
                 self.assertFalse(mock_fanout.called)
                 fanout_patch.stop()
+
+
+class TestL2PopulationRpcTestCaseWithFdbIndex(TestL2PopulationRpcTestCase):
+
+    def setUp(self):
+        l2pop_config.cfg.CONF.set_override('fdb_index_size', 1000, 'l2pop')
+        super(TestL2PopulationRpcTestCaseWithFdbIndex, self).setUp()
+        plugin = manager.NeutronManager.get_plugin()
+        driver = plugin.mechanism_manager.mech_drivers['l2population'].obj
+        self.assertEqual(1000, driver.fdb_index.max_networks)
+
+
+class TestFdbIndex(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestFdbIndex, self).setUp()
+        self.db_mixin = mock.Mock()
+        self.db_mixin.get_network_port_hosts.return_value = []
+        self.db_mixin.get_network_ports.return_value = []
+        self.db_mixin.get_agent_ip.side_effect = (
+            lambda agent: agent.ip)
+        self.db_mixin.get_agent_by_host.side_effect = (
+            lambda session, host: mock.Mock(host=host, ip=host + '_ip'))
+        mock.patch('neutron.db.api.get_session').start()
+        self.addCleanup(mock.patch.stopall)
+        self.index = fdb_index.FdbIndex(self.db_mixin, 2)
+
+    def _port(self, port_id, host, admin_state_up=True):
+        return {'id': port_id,
+                'network_id': 'net1',
+                'mac_address': 'mac_' + port_id,
+                'fixed_ips': [{'ip_address': 'ip_' + port_id}],
+                'admin_state_up': admin_state_up,
+                'binding:host_id': host}
+
+    def test_network_loaded_once(self):
+        self.index.get_agent_port_count('net1', 'host1')
+        self.index.get_fdb_entries('net1')
+        self.assertEqual(
+            self.db_mixin.get_network_port_hosts.call_count, 1)
+        self.assertEqual(self.db_mixin.get_network_ports.call_count, 1)
+
+    def test_events_before_load_ignored(self):
+        self.index.update_port(self._port('p1', 'host1'))
+        self.assertEqual(self.index.get_agent_port_count('net1', 'host1'), 0)
+
+    def test_update_port(self):
+        self.index.get_fdb_entries('net1')
+        self.index.update_port(self._port('p1', 'host1'))
+        self.index.update_port(self._port('p2', 'host2'))
+        self.assertEqual(self.index.get_agent_port_count('net1', 'host1'), 1)
+        self.assertEqual(
+            self.index.get_fdb_entries('net1', exclude_host='host1'),
+            {'host2_ip': [constants.FLOODING_ENTRY, ['mac_p2', 'ip_p2']]})
+
+    def test_update_port_admin_down(self):
+        self.index.get_fdb_entries('net1')
+        self.index.update_port(self._port('p1', 'host1'))
+        self.index.update_port(self._port('p1', 'host1',
+                                          admin_state_up=False))
+        self.assertEqual(self.index.get_agent_port_count('net1', 'host1'), 1)
+        self.assertEqual(self.index.get_fdb_entries('net1'), {})
+
+    def test_update_port_host_changed(self):
+        self.index.get_fdb_entries('net1')
+        self.index.update_port(self._port('p1', 'host1'))
+        self.index.update_port(self._port('p1', 'host2'))
+        self.assertEqual(self.index.get_agent_port_count('net1', 'host1'), 0)
+        self.assertEqual(self.index.get_agent_port_count('net1', 'host2'), 1)
+
+    def test_remove_port(self):
+        self.index.get_fdb_entries('net1')
+        self.index.update_port(self._port('p1', 'host1'))
+        self.index.remove_port(self._port('p1', 'host1'))
+        self.assertEqual(self.index.get_agent_port_count('net1', 'host1'), 0)
+        self.assertEqual(self.index.get_fdb_entries('net1'), {})
+
+    def test_set_agent_ip(self):
+        self.index.get_fdb_entries('net1')
+        self.index.update_port(self._port('p1', 'host1'))
+        self.index.set_agent_ip('host1', '10.0.0.1')
+        self.assertEqual(
+            self.index.get_fdb_entries('net1'),
+            {'10.0.0.1': [constants.FLOODING_ENTRY, ['mac_p1', 'ip_p1']]})
+
+    def test_agent_without_ip_cached(self):
+        self.db_mixin.get_agent_by_host.side_effect = None
+        self.db_mixin.get_agent_by_host.return_value = None
+        self.index.get_fdb_entries('net1')
+        self.index.update_port(self._port('p1', 'host1'))
+        self.assertEqual(self.index.get_fdb_entries('net1'), {})
+        self.assertEqual(self.index.get_fdb_entries('net1'), {})
+        self.assertEqual(self.db_mixin.get_agent_by_host.call_count, 1)
+
+    def test_least_recently_used_network_evicted(self):
+        for network_id in ['net1', 'net2', 'net1', 'net3', 'net1']:
+            self.index.get_agent_port_count(network_id, 'host1')
+        self.assertEqual(['net3', 'net1'], list(self.index._networks))
+        self.assertEqual(
+            self.db_mixin.get_network_port_hosts.call_count, 3)
+
+    def test_index_disabled(self):
+        self.index = fdb_index.FdbIndex(self.db_mixin, 0)
+        self.db_mixin.get_agent_network_port_count.return_value = 3
+        agent = mock.Mock(host='host2', ip='host2_ip')
+        binding = mock.Mock(port=self._port('p2', 'host2'))
+        self.db_mixin.get_network_ports.return_value = [(binding, agent)]
+
+        self.index.update_port(self._port('p1', 'host1'))
+        self.assertEqual(self.index.get_agent_port_count('net1', 'host1'), 3)
+        for i in range(2):
+            self.assertEqual(
+                self.index.get_fdb_entries('net1', exclude_host='host1'),
+                {'host2_ip': [constants.FLOODING_ENTRY,
+                              ['mac_p2', 'ip_p2']]})
+        self.assertEqual(self.db_mixin.get_network_ports.call_count, 2)
+        self.assertFalse(self.db_mixin.get_network_port_hosts.called)
+        self.assertFalse(self.index._networks)
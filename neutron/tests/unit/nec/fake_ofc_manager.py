@@ -26,6 +26,7 @@ def patch_ofc_manager():
     m.create_ofc_tenant.side_effect = f.create_ofc_tenant
     m.delete_ofc_tenant.side_effect = f.delete_ofc_tenant
     m.exists_ofc_tenant.side_effect = f.exists_ofc_tenant
+    m.ensure_ofc_tenant.side_effect = f.ensure_ofc_tenant
     m.create_ofc_network.side_effect = f.create_ofc_net
     m.delete_ofc_network.side_effect = f.delete_ofc_net
     m.exists_ofc_network.side_effect = f.exists_ofc_net
@@ -65,6 +66,10 @@ class FakeOFCManager(object):
         self._raise_exc('exists_ofc_tenant')
         return self.ofc_tenants.get(tenant_id, False)
 
+    def ensure_ofc_tenant(self, context, tenant_id):
+        if not self.exists_ofc_tenant(context, tenant_id):
+            self.create_ofc_tenant(context, tenant_id)
+
     def delete_ofc_tenant(self, context, tenant_id):
         self._raise_exc('delete_ofc_tenant')
         del self.ofc_tenants[tenant_id]
@@ -170,6 +170,95 @@ class NECPluginV2DBTest(NECPluginV2DBTestBase):
             self.assertIsNone(portinfo_none)
 
 
+class NECPluginV2DBOFCOperationTest(NECPluginV2DBTestBase):
+    """Test related to the queue of OFC operations."""
+
+    def _get_operations(self):
+        return [(op.resource_id, op.operation) for op in
+                self.session.query(nmodels.OFCOperation).
+                order_by(nmodels.OFCOperation.id)]
+
+    def test_start_ofc_operation_in_order(self):
+        self.assertTrue(ndb.add_ofc_operation(
+            self.session, 't1', 'ofc_network', 'n1', 'create'))
+        self.assertTrue(ndb.add_ofc_operation(
+            self.session, 't1', 'ofc_port', 'p1', 'create',
+            {'network_id': 'n1'}))
+
+        op = ndb.start_ofc_operation(self.session, 't1', 'host1')
+        self.assertEqual(('ofc_network', 'n1', 'create'),
+                         (op.resource, op.resource_id, op.operation))
+        # The next operation waits for the one in progress
+        self.assertIsNone(ndb.start_ofc_operation(self.session, 't1',
+                                                  'host1'))
+        self.assertIsNone(ndb.start_ofc_operation(self.session, 't2',
+                                                  'host1'))
+
+        ndb.del_ofc_operation(self.session, op.id)
+        op = ndb.start_ofc_operation(self.session, 't1', 'host1')
+        self.assertEqual('p1', op.resource_id)
+        self.assertEqual('{"network_id": "n1"}', op.data)
+
+    def test_delete_cancels_pending_create(self):
+        ndb.add_ofc_operation(self.session, 't1', 'ofc_port', 'p1', 'create')
+        ndb.add_ofc_operation(self.session, 't1', 'ofc_port', 'p2', 'create')
+        self.assertFalse(ndb.add_ofc_operation(
+            self.session, 't1', 'ofc_port', 'p1', 'delete'))
+        self.assertEqual([('p2', 'create')], self._get_operations())
+
+    def test_delete_after_started_create(self):
+        ndb.add_ofc_operation(self.session, 't1', 'ofc_port', 'p1', 'create')
+        ndb.start_ofc_operation(self.session, 't1', 'host1')
+        self.assertTrue(ndb.add_ofc_operation(
+            self.session, 't1', 'ofc_port', 'p1', 'delete'))
+        self.assertEqual([('p1', 'create'), ('p1', 'delete')],
+                         self._get_operations())
+
+    def test_delete_cancels_create_after_delete(self):
+        ndb.add_ofc_operation(self.session, 't1', 'ofc_port', 'p1', 'delete')
+        ndb.add_ofc_operation(self.session, 't1', 'ofc_port', 'p1', 'create')
+        self.assertTrue(ndb.add_ofc_operation(
+            self.session, 't1', 'ofc_port', 'p1', 'delete'))
+        self.assertEqual([('p1', 'delete')], self._get_operations())
+
+    def test_same_operation_not_queued_twice(self):
+        ndb.add_ofc_operation(self.session, 't1', 'ofc_port', 'p1', 'create')
+        self.assertTrue(ndb.add_ofc_operation(
+            self.session, 't1', 'ofc_port', 'p1', 'create'))
+        self.assertEqual([('p1', 'create')], self._get_operations())
+
+    def test_get_ofc_operation_tenants(self):
+        ndb.add_ofc_operation(self.session, 't1', 'ofc_port', 'p1', 'create')
+        ndb.add_ofc_operation(self.session, 't2', 'ofc_port', 'p2', 'create')
+        ndb.start_ofc_operation(self.session, 't1', 'host1')
+
+        tenants = ndb.get_ofc_operation_tenants(self.session, 'host1')
+        self.assertEqual(['t1', 't2'], sorted(tenants))
+        # Operations left in progress are started again
+        op = ndb.start_ofc_operation(self.session, 't1', 'host1')
+        self.assertEqual('p1', op.resource_id)
+
+    def test_get_ofc_operation_tenants_other_owner(self):
+        ndb.add_ofc_operation(self.session, 't1', 'ofc_port', 'p1', 'create')
+        ndb.start_ofc_operation(self.session, 't1', 'host2')
+
+        self.assertEqual(['t1'],
+                         ndb.get_ofc_operation_tenants(self.session, 'host1'))
+        # The operation applied by the other server is left in progress
+        self.assertIsNone(ndb.start_ofc_operation(self.session, 't1',
+                                                  'host1'))
+
+    def test_retry_ofc_operation(self):
+        ndb.add_ofc_operation(self.session, 't1', 'ofc_port', 'p1', 'delete')
+        ndb.add_ofc_operation(self.session, 't1', 'ofc_port', 'p2', 'delete')
+        op = ndb.start_ofc_operation(self.session, 't1', 'host1')
+
+        self.assertEqual(1, ndb.retry_ofc_operation(self.session, op.id))
+        op = ndb.start_ofc_operation(self.session, 't1', 'host1')
+        self.assertEqual('p1', op.resource_id)
+        self.assertEqual(2, ndb.retry_ofc_operation(self.session, op.id))
+
+
 class NECPluginV2DBOldMappingTest(NECPluginV2DBTestBase):
     """Test related to old ID mapping."""
 
@@ -15,6 +15,7 @@
 
 import os
 
+import eventlet
 import fixtures
 import mock
 import webob.exc
@@ -843,3 +844,128 @@ class TestNecPluginOfcManager(NecPluginV2TestCase):
         ]
         self.ofc.assert_has_calls(expected)
         self.assertEqual(self.ofc.delete_ofc_port.call_count, 2)
+
+
+class TestNecPluginOfcOperationQueue(NecPluginV2TestCase):
+    _nec_ini = NEC_PLUGIN_INI + "operation_workers = 2\n"
+
+    def setUp(self):
+        super(TestNecPluginOfcOperationQueue, self).setUp()
+        # The retries of failed operations are run by _wait_ofc_operations
+        self.retries = []
+        mock.patch.object(
+            eventlet, 'spawn_after',
+            side_effect=lambda interval, func, *args: self.retries.append(
+                (func, args))).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _wait_ofc_operations(self):
+        self.plugin.ofc_queue.pool.waitall()
+        while self.retries:
+            func, args = self.retries.pop(0)
+            func(*args)
+            self.plugin.ofc_queue.pool.waitall()
+
+    def test_create_and_delete_network(self):
+        ctx = mock.ANY
+        with self.network() as network:
+            net = network['network']
+            self.assertEqual(net['status'], 'BUILD')
+            self.assertFalse(self.ofc.create_ofc_network.called)
+
+            self._wait_ofc_operations()
+            net_ref = self._show('networks', net['id'])
+            self.assertEqual(net_ref['network']['status'], 'ACTIVE')
+        self._wait_ofc_operations()
+
+        expected = [
+            mock.call.ensure_ofc_tenant(ctx, self._tenant_id),
+            mock.call.exists_ofc_network(ctx, net['id']),
+            mock.call.create_ofc_network(ctx, self._tenant_id, net['id'],
+                                         net['name']),
+            mock.call.exists_ofc_network(ctx, net['id']),
+            mock.call.delete_ofc_network(ctx, net['id'],
+                                         {'tenant_id': self._tenant_id}),
+            mock.call.exists_ofc_tenant(ctx, self._tenant_id),
+            mock.call.delete_ofc_tenant(ctx, self._tenant_id)
+        ]
+        self.ofc.assert_has_calls(expected)
+
+    def test_port_activated_in_background(self):
+        with self.port() as port:
+            port_id = port['port']['id']
+            self._wait_ofc_operations()
+
+            portinfo = {'id': port_id, 'port_no': 123}
+            self.rpcapi_update_ports(added=[portinfo])
+            port_ref = self._show('ports', port_id)
+            self.assertEqual(port_ref['port']['status'], 'BUILD')
+            self.assertFalse(self.ofc.create_ofc_port.called)
+
+            self._wait_ofc_operations()
+            port_ref = self._show('ports', port_id)
+            self.assertEqual(port_ref['port']['status'], 'ACTIVE')
+            self.assertEqual(self.ofc.create_ofc_port.call_count, 1)
+        self._wait_ofc_operations()
+
+        self.assertEqual(self.ofc.delete_ofc_port.call_count, 1)
+
+    def test_port_create_cancelled_by_delete(self):
+        with self.port() as port:
+            port_id = port['port']['id']
+            self._wait_ofc_operations()
+
+            portinfo = {'id': port_id, 'port_no': 123}
+            self.rpcapi_update_ports(added=[portinfo])
+            self.rpcapi_update_ports(removed=[port_id])
+            port_ref = self._show('ports', port_id)
+            self.assertEqual(port_ref['port']['status'], 'DOWN')
+            self._wait_ofc_operations()
+        self._wait_ofc_operations()
+
+        self.assertFalse(self.ofc.create_ofc_port.called)
+        self.assertFalse(self.ofc.delete_ofc_port.called)
+
+    def test_failed_port_delete_retried(self):
+        with self.port() as port:
+            port_id = port['port']['id']
+            portinfo = {'id': port_id, 'port_no': 123}
+            self.rpcapi_update_ports(added=[portinfo])
+            self._wait_ofc_operations()
+
+            delete_ofc_port = self.ofc.delete_ofc_port.side_effect
+
+            def fail_once(*args):
+                self.ofc.delete_ofc_port.side_effect = delete_ofc_port
+                raise nexc.OFCException(reason='hoge')
+
+            self.ofc.delete_ofc_port.side_effect = fail_once
+            self.rpcapi_update_ports(removed=[port_id])
+            self._wait_ofc_operations()
+
+            self.assertEqual(self.ofc.delete_ofc_port.call_count, 2)
+            port_ref = self._show('ports', port_id)
+            self.assertEqual(port_ref['port']['status'], 'DOWN')
+        self._wait_ofc_operations()
+
+    def test_network_admin_state_toggled_before_operations(self):
+        with self.port() as port:
+            port_id = port['port']['id']
+            net_id = port['port']['network_id']
+            portinfo = {'id': port_id, 'port_no': 123}
+            self.rpcapi_update_ports(added=[portinfo])
+            self._wait_ofc_operations()
+
+            # The second update must requeue the create of the port still
+            # in BUILD with its delete pending
+            data = {'network': {'admin_state_up': False}}
+            self._update('networks', net_id, data)
+            data = {'network': {'admin_state_up': True}}
+            self._update('networks', net_id, data)
+            self._wait_ofc_operations()
+
+            port_ref = self._show('ports', port_id)
+            self.assertEqual(port_ref['port']['status'], 'ACTIVE')
+            self.assertEqual(self.ofc.create_ofc_port.call_count, 2)
+            self.assertEqual(self.ofc.delete_ofc_port.call_count, 1)
+        self._wait_ofc_operations()
@@ -20,6 +20,7 @@ import mock
 from neutron import context
 from neutron.openstack.common import uuidutils
 from neutron.plugins.nec.common import config
+from neutron.plugins.nec.common import exceptions as nexc
 from neutron.plugins.nec.db import api as ndb
 from neutron.plugins.nec.db import models as nmodels  # noqa
 from neutron.plugins.nec import ofc_manager
@@ -162,6 +163,28 @@ class OFCManagerTest(OFCManagerTestBase):
         self.assertFalse(ndb.get_ofc_item(self.ctx.session, 'ofc_port', p))
         get_portinfo.assert_called_once_with(mock.ANY, p)
 
+    def test_network_ofc_id_cached(self):
+        """test OFC IDs of networks are cached."""
+        t, n, p, f, none = self.get_random_params()
+        self.ofc.create_ofc_tenant(self.ctx, t)
+        self.ofc.create_ofc_network(self.ctx, t, n)
+        self._mock_get_portinfo(p)
+        lookup = mock.patch.object(
+            ndb, 'get_ofc_id_lookup_both',
+            wraps=ndb.get_ofc_id_lookup_both).start()
+        port = {'tenant_id': t, 'network_id': n}
+        self.ofc.create_ofc_port(self.ctx, p, port)
+        self.ofc.delete_ofc_port(self.ctx, p, port)
+        self.ofc.create_ofc_port(self.ctx, p, port)
+        self.assertEqual([mock.call(mock.ANY, 'ofc_network', n),
+                          mock.call(mock.ANY, 'ofc_port', p)],
+                         lookup.call_args_list)
+
+        self.ofc.delete_ofc_port(self.ctx, p, port)
+        self.ofc.delete_ofc_network(self.ctx, n, {'tenant_id': t})
+        self.assertRaises(nexc.OFCConsistencyBroken,
+                          self.ofc.create_ofc_port, self.ctx, p, port)
+
 
 class OFCManagerFilterTest(OFCManagerTestBase):
     def testj_create_ofc_packet_filter(self):
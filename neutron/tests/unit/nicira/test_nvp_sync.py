@@ -237,6 +237,94 @@ class NvpCacheTestCase(base.BaseTestCase):
             self._verify_delete(resource, hit=False, deleted=deleted)
 
 
+class CompactNvpCacheTestCase(base.BaseTestCase):
+    """Test suite providing coverage for the CompactNvpCache class."""
+
+    def setUp(self):
+        super(CompactNvpCacheTestCase, self).setUp()
+        self.nvp_cache = sync.CompactNvpCache()
+        self.lswitch = self._lswitch(True)
+        self.lswitchport = {
+            'uuid': _uuid(),
+            'tags': [{'scope': 'os_tid', 'tag': 'foo'},
+                     {'scope': 'q_port_id', 'tag': 'port-id'}],
+            '_relations': {'LogicalPortStatus': {'link_status_up': True}}}
+        self.lrouter = {
+            'uuid': _uuid(),
+            'tags': [{'scope': 'os_tid', 'tag': 'foo'}],
+            '_relations': {'LogicalRouterStatus': {'fabric_status': True}}}
+
+    def _lswitch(self, fabric_status):
+        return {'uuid': 'ls-uuid',
+                'display_name': 'ls',
+                'tags': [{'scope': 'os_tid', 'tag': 'foo'},
+                         {'scope': 'neutron_net_id', 'tag': 'net-id'}],
+                '_relations': {'LogicalSwitchStatus': {
+                    'fabric_status': fabric_status}}}
+
+    def _sync_cycle(self, lswitches):
+        changed = self.nvp_cache.process_updates(
+            lswitches, [self.lrouter], [self.lswitchport])
+        deleted = self.nvp_cache.process_deletes()
+        return changed, deleted
+
+    def test_process_updates_initial(self):
+        self.assertEqual(
+            (['ls-uuid'], [self.lrouter['uuid']],
+             [self.lswitchport['uuid']]),
+            self.nvp_cache.process_updates(
+                [self.lswitch], [self.lrouter], [self.lswitchport]))
+        self.assertEqual(
+            {'hash': hash(json.dumps(self.lswitch)),
+             'hit': True,
+             'changed': True,
+             'data': {'uuid': 'ls-uuid',
+                      'tags': [{'scope': 'neutron_net_id',
+                                'tag': 'net-id'}],
+                      '_relations': {'LogicalSwitchStatus': {
+                          'fabric_status': True}}}},
+            self.nvp_cache['ls-uuid'])
+
+    def test_entries_do_not_keep_resource_data(self):
+        self._sync_cycle([self.lswitch])
+        self.assertFalse(hasattr(
+            self.nvp_cache._lswitches['ls-uuid'], '__dict__'))
+        lport = self.nvp_cache[self.lswitchport['uuid']]['data']
+        self.assertEqual([{'scope': 'q_port_id', 'tag': 'port-id'}],
+                         lport['tags'])
+        lrouter = self.nvp_cache[self.lrouter['uuid']]['data']
+        self.assertEqual([], lrouter['tags'])
+
+    def test_process_updates_no_change(self):
+        self._sync_cycle([self.lswitch])
+        self.assertEqual((([], [], []), ([], [], [])),
+                         self._sync_cycle([self.lswitch]))
+
+    def test_process_updates_with_changes(self):
+        self._sync_cycle([self.lswitch])
+        changed = self._sync_cycle([self._lswitch(False)])[0]
+        self.assertEqual((['ls-uuid'], [], []), changed)
+        data = self.nvp_cache['ls-uuid']['data']
+        self.assertFalse(
+            data['_relations']['LogicalSwitchStatus']['fabric_status'])
+
+    def test_process_deletes_with_removals(self):
+        self._sync_cycle([self.lswitch])
+        self.assertEqual((['ls-uuid'], [], []), self._sync_cycle([])[1])
+        cached_lswitch = self.nvp_cache['ls-uuid']
+        self.assertNotIn('data', cached_lswitch)
+        self.assertEqual(
+            [{'scope': 'neutron_net_id', 'tag': 'net-id'}],
+            cached_lswitch['data_bk']['tags'])
+
+    def test_process_updates_cleanup_after_delete(self):
+        self._sync_cycle([self.lswitch])
+        self._sync_cycle([])
+        self._sync_cycle([])
+        self.assertNotIn('ls-uuid', self.nvp_cache._lswitches)
+        self.assertNotIn('ls-uuid', self.nvp_cache._uuid_dict_mappings)
+
+
 class SyncLoopingCallTestCase(base.BaseTestCase):
 
     def test_looping_calls(self):
@@ -253,6 +341,11 @@ class SyncLoopingCallTestCase(base.BaseTestCase):
             # to assess the exact number of calls would be unreliable
             self.assertTrue(synchronizer._synchronize_state.call_count)
 
+    def test_compact_cache(self):
+        synchronizer = sync.NvpSynchronizer(None, None, 0, 0, 0,
+                                            compact_cache=True)
+        self.assertIsInstance(synchronizer._nvp_cache, sync.CompactNvpCache)
+
 
 class NvpSyncTestCase(base.BaseTestCase):
 
@@ -498,43 +591,97 @@ class NvpSyncTestCase(base.BaseTestCase):
                 self.fc.handle_get('/ws.v1/lrouter'))['results']
             fake_lswitchports = json.loads(
                 self.fc.handle_get('/ws.v1/lswitch/*/lport'))['results']
-            return_values = [
-                # Chunk 0 - lswitches
-                (fake_lswitches, None, 4),
-                # Chunk 0 - lrouters
-                (fake_lrouters[:2], 'xxx', 4),
-                # Chunk 0 - lports (size only)
-                ([], 'start', 4),
-                # Chunk 1 - lrouters (2 more) (lswitches are skipped)
-                (fake_lrouters[2:], None, None),
-                # Chunk 1 - lports
-                (fake_lswitchports, None, 4)]
-
-            def fake_fetch_data(*args, **kwargs):
-                return return_values.pop(0)
-
-            # 2 Chunks, with 6 resources each.
-            # 1st chunk lswitches and lrouters
-            # 2nd chunk lrouters and lports
+            synchronizer = self._plugin._synchronizer
+            # 2 chunks with 2 resources of each type
+            return_values = {
+                synchronizer.LS_URI: [(fake_lswitches[:2], 'ls', 4),
+                                      (fake_lswitches[2:], None, None)],
+                synchronizer.LR_URI: [(fake_lrouters[:2], 'lr', 4),
+                                      (fake_lrouters[2:], None, None)],
+                synchronizer.LP_URI: [(fake_lswitchports[:2], 'lp', 4),
+                                      (fake_lswitchports[2:], None, None)]}
+            requests = []
+
+            def fake_fetch_data(uri, cursor, page_size):
+                requests.append((uri, cursor, page_size))
+                return return_values[uri].pop(0)
+
             # Mock _fetch_data
             with mock.patch.object(
-                self._plugin._synchronizer, '_fetch_data',
+                synchronizer, '_fetch_data',
                 side_effect=fake_fetch_data):
                 sp = sync.SyncParameters(6)
 
                 def do_chunk(chunk_idx, ls_cursor, lr_cursor, lp_cursor):
-                    self._plugin._synchronizer._synchronize_state(sp)
+                    synchronizer._synchronize_state(sp)
                     self.assertEqual(chunk_idx, sp.current_chunk)
                     self.assertEqual(ls_cursor, sp.ls_cursor)
                     self.assertEqual(lr_cursor, sp.lr_cursor)
                     self.assertEqual(lp_cursor, sp.lp_cursor)
 
                 # check 1st chunk
-                do_chunk(1, None, 'xxx', 'start')
+                do_chunk(1, 'ls', 'lr', 'lp')
                 # check 2nd chunk
                 do_chunk(0, None, None, None)
                 # Chunk size should have stayed the same
                 self.assertEqual(sp.chunk_size, 6)
+            self.assertEqual(
+                sorted(requests),
+                sorted([(synchronizer.LS_URI, 'start', 2),
+                        (synchronizer.LR_URI, 'start', 2),
+                        (synchronizer.LP_URI, 'start', 2),
+                        (synchronizer.LS_URI, 'ls', 2),
+                        (synchronizer.LR_URI, 'lr', 2),
+                        (synchronizer.LP_URI, 'lp', 2)]))
+
+    def test_sync_uneven_resources_fetched_in_cycle(self):
+        ctx = context.get_admin_context()
+        # 2 networks, 8 ports and 1 router: with a chunk size of 6 the
+        # first chunk is split evenly and the ports are completed by the
+        # following chunk
+        with self._populate_data(ctx, net_size=2, port_size=4,
+                                 router_size=1):
+            sp = sync.SyncParameters(6)
+            synchronizer = self._plugin._synchronizer
+            synchronizer._synchronize_state(sp)
+            self.assertEqual(1, sp.current_chunk)
+            self.assertIsNone(sp.ls_cursor)
+            self.assertIsNone(sp.lr_cursor)
+            self.assertEqual(6, sp.lp_remaining)
+            lp_cursor = sp.lp_cursor
+            with mock.patch.object(
+                synchronizer, '_fetch_data',
+                side_effect=synchronizer._fetch_data) as fetch:
+                synchronizer._synchronize_state(sp)
+            fetch.assert_called_once_with(synchronizer.LP_URI, lp_cursor, 6)
+            self.assertEqual(0, sp.current_chunk)
+
+    def test_sync_bulk_status_update(self):
+        ctx = context.get_admin_context()
+        with self._populate_data(ctx):
+            synchronizer = self._plugin._synchronizer
+            real_update = synchronizer._update_neutron_objects
+            with mock.patch.object(
+                synchronizer, '_update_neutron_objects',
+                side_effect=real_update) as update:
+                self._test_sync(
+                    constants.NET_STATUS_DOWN, constants.PORT_STATUS_DOWN,
+                    constants.NET_STATUS_DOWN,
+                    self._action_callback_status_down)
+            # A single call for each resource type
+            self.assertEqual(3, update.call_count)
+            for call in update.call_args_list:
+                status_updates = call[0][2]
+                self.assertEqual(
+                    1, len(status_updates[constants.NET_STATUS_DOWN]))
+
+    def test_sync_refreshes_ext_networks_each_cycle(self):
+        ctx = context.get_admin_context()
+        with self._populate_data(ctx):
+            synchronizer = self._plugin._synchronizer
+            synchronizer._ext_networks = set(['stale'])
+            synchronizer._synchronize_state(sync.SyncParameters(100))
+            self.assertEqual(set(), synchronizer._ext_networks)
 
     def test_synchronize_network(self):
         ctx = context.get_admin_context()
@@ -631,3 +778,10 @@ class NvpSyncTestCase(base.BaseTestCase):
             self.assertEqual(
                 min(64, 2 ** i),
                 self._plugin._synchronizer._synchronize_state(sp))
+
+
+class NvpSyncCompactCacheTestCase(NvpSyncTestCase):
+
+    def setUp(self):
+        super(NvpSyncCompactCacheTestCase, self).setUp()
+        self._plugin._synchronizer._nvp_cache = sync.CompactNvpCache()
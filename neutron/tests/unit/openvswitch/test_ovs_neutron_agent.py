@@ -532,6 +532,72 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                                            actions='strip_vlan,'
                                            'set_tunnel:seg2,output:1')
 
+    def test_fdb_add_flood_flow_once_per_vlan(self):
+        self._prepare_l2_pop_ofports()
+        fdb_entry = {'net1':
+                     {'network_type': 'gre',
+                      'segment_id': 'tun1',
+                      'ports':
+                      {'ip_agent_1': [n_const.FLOODING_ENTRY],
+                       'ip_agent_2': [n_const.FLOODING_ENTRY,
+                                      ['mac', 'ip']]}}}
+        with contextlib.nested(
+            mock.patch.object(self.agent.tun_br, 'add_flow'),
+            mock.patch.object(self.agent.tun_br, 'mod_flow'),
+            mock.patch.object(self.agent.tun_br, 'defer_apply_on'),
+            mock.patch.object(self.agent.tun_br, 'defer_apply_off')
+        ) as (add_flow_fn, mod_flow_fn, defer_on_fn, defer_off_fn):
+            self.agent.fdb_add(None, fdb_entry)
+            mod_flow_fn.assert_called_once_with(table=constants.FLOOD_TO_TUN,
+                                                priority=1,
+                                                dl_vlan='vlan1',
+                                                actions='strip_vlan,'
+                                                'set_tunnel:seg1,output:1,2')
+            defer_on_fn.assert_called_once_with()
+            defer_off_fn.assert_called_once_with()
+
+    def test_fdb_del_last_flooding_entry(self):
+        self._prepare_l2_pop_ofports()
+        fdb_entry = {'net1':
+                     {'network_type': 'gre',
+                      'segment_id': 'tun1',
+                      'ports': {'ip_agent_1': [n_const.FLOODING_ENTRY]}}}
+        with contextlib.nested(
+            mock.patch.object(self.agent.tun_br, 'mod_flow'),
+            mock.patch.object(self.agent.tun_br, 'delete_flows'),
+            mock.patch.object(self.agent, 'cleanup_tunnel_port')
+        ) as (mod_flow_fn, del_flow_fn, clean_tun_fn):
+            self.agent.fdb_remove(None, fdb_entry)
+            self.assertFalse(mod_flow_fn.called)
+            del_flow_fn.assert_called_once_with(table=constants.FLOOD_TO_TUN,
+                                                dl_vlan='vlan1')
+            clean_tun_fn.assert_called_once_with('1', 'gre')
+
+    def test_fdb_add_full_network_dump(self):
+        self._prepare_l2_pop_ofports()
+        agent_ports = {}
+        for agent in range(20):
+            agent_ip = 'ip_agent_%d' % agent
+            self.agent.tun_br_ofports['gre'][agent_ip] = str(agent + 10)
+            agent_ports[agent_ip] = [n_const.FLOODING_ENTRY]
+            for port in range(100):
+                agent_ports[agent_ip].append(
+                    ['fa:16:3e:00:%02x:%02x' % (agent, port),
+                     '10.%d.%d.2' % (agent, port)])
+        fdb_entry = {'net1': {'network_type': 'gre',
+                              'segment_id': 'tun1',
+                              'ports': agent_ports}}
+        self.agent.tun_br = ovs_lib.OVSBridge('br-tun', 'sudo')
+        with mock.patch.object(utils, 'execute') as execute_fn:
+            self.agent.fdb_add(None, fdb_entry)
+        # 2000 unicast flows and 1 flooding flow in 2 ovs-ofctl calls
+        self.assertEqual(execute_fn.call_count, 2)
+        process_input = dict(
+            (c[0][0][1], c[1]['process_input'])
+            for c in execute_fn.call_args_list)
+        self.assertEqual(len(process_input['add-flows'].splitlines()), 2000)
+        self.assertEqual(len(process_input['mod-flows'].splitlines()), 1)
+
     def test_fdb_add_port(self):
         self._prepare_l2_pop_ofports()
         fdb_entry = {'net1':
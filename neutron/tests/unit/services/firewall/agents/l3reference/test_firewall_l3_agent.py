@@ -190,10 +190,9 @@ class TestFwaasL3AgentRpcCallback(base.BaseTestCase):
         self.api.plugin_rpc = mock.Mock()
         ri = mock.Mock()
         ri.router = fake_router
-        routers = [ri.router]
         with contextlib.nested(
             mock.patch.object(self.api.plugin_rpc, 'get_routers'),
-            mock.patch.object(self.api, '_get_router_info_list_for_tenant'),
+            mock.patch.object(ip_lib.IPWrapper, 'get_namespaces'),
             mock.patch.object(self.api.fwaas_driver, 'update_firewall'),
             mock.patch.object(self.api.fwplugin_rpc, 'set_firewall_status'),
             mock.patch.object(self.api.fwplugin_rpc,
@@ -201,7 +200,7 @@ class TestFwaasL3AgentRpcCallback(base.BaseTestCase):
             mock.patch.object(context, 'Context')
         ) as (
             mock_get_routers,
-            mock_get_router_info_list_for_tenant,
+            mock_get_namespaces,
             mock_driver_update_firewall,
             mock_set_firewall_status,
             mock_get_firewalls_for_tenant,
@@ -210,16 +209,13 @@ class TestFwaasL3AgentRpcCallback(base.BaseTestCase):
             mock_driver_update_firewall.return_value = True
             ctx = mock.sentinel.context
             mock_Context.return_value = ctx
-            mock_get_router_info_list_for_tenant.return_value = routers
             mock_get_firewalls_for_tenant.return_value = fake_firewall_list
 
             self.api._process_router_add(ri)
-            mock_get_router_info_list_for_tenant.assert_called_with(
-                routers,
-                ri.router['tenant_id'])
+            self.assertFalse(mock_get_namespaces.called)
             mock_get_firewalls_for_tenant.assert_called_once_with(ctx)
-            mock_driver_update_firewall.assert_called_once(
-                routers,
+            mock_driver_update_firewall.assert_called_once_with(
+                [ri],
                 fake_firewall_list[0])
 
             mock_set_firewall_status.assert_called_once_with(
@@ -234,10 +230,9 @@ class TestFwaasL3AgentRpcCallback(base.BaseTestCase):
         self.api.plugin_rpc = mock.Mock()
         ri = mock.Mock()
         ri.router = fake_router
-        routers = [ri.router]
         with contextlib.nested(
             mock.patch.object(self.api.plugin_rpc, 'get_routers'),
-            mock.patch.object(self.api, '_get_router_info_list_for_tenant'),
+            mock.patch.object(ip_lib.IPWrapper, 'get_namespaces'),
             mock.patch.object(self.api.fwaas_driver, 'delete_firewall'),
             mock.patch.object(self.api.fwplugin_rpc, 'firewall_deleted'),
             mock.patch.object(self.api.fwplugin_rpc,
@@ -245,7 +240,7 @@ class TestFwaasL3AgentRpcCallback(base.BaseTestCase):
             mock.patch.object(context, 'Context')
         ) as (
             mock_get_routers,
-            mock_get_router_info_list_for_tenant,
+            mock_get_namespaces,
             mock_driver_delete_firewall,
             mock_firewall_deleted,
             mock_get_firewalls_for_tenant,
@@ -254,16 +249,13 @@ class TestFwaasL3AgentRpcCallback(base.BaseTestCase):
             mock_driver_delete_firewall.return_value = True
             ctx = mock.sentinel.context
             mock_Context.return_value = ctx
-            mock_get_router_info_list_for_tenant.return_value = routers
             mock_get_firewalls_for_tenant.return_value = fake_firewall_list
 
             self.api._process_router_add(ri)
-            mock_get_router_info_list_for_tenant.assert_called_with(
-                routers,
-                ri.router['tenant_id'])
+            self.assertFalse(mock_get_namespaces.called)
             mock_get_firewalls_for_tenant.assert_called_once_with(ctx)
-            mock_driver_delete_firewall.assert_called_once(
-                routers,
+            mock_driver_delete_firewall.assert_called_once_with(
+                [ri],
                 fake_firewall_list[0])
 
             mock_firewall_deleted.assert_called_once_with(
@@ -284,7 +276,7 @@ class TestFwaasL3AgentRpcCallback(base.BaseTestCase):
         self.api.router_info = {ri.router_id: ri}
         with mock.patch.object(ip_lib.IPWrapper,
                                'get_namespaces') as mock_get_namespaces:
-            mock_get_namespaces.return_value = ri.ns_name()
+            mock_get_namespaces.return_value = [ri.ns_name()]
             router_info_list = self.api._get_router_info_list_for_tenant(
                 routers,
                 ri.router['tenant_id'])
@@ -322,3 +314,49 @@ class TestFwaasL3AgentRpcCallback(base.BaseTestCase):
     def test_get_router_info_list_tenant_without_namespace_router_with(self):
         self._get_router_info_list_without_namespace_helper(
             router_use_namespaces=True)
+
+    def _process_services_sync_helper(self, fw_status):
+        self.conf.set_override('use_namespaces', True)
+        self.api.fwaas_enabled = True
+        ri = self._prepare_router_data(use_namespaces=True)
+        other_ri = self._prepare_router_data(use_namespaces=True)
+        self.api.router_info = {ri.router_id: ri,
+                                other_ri.router_id: other_ri}
+        fake_firewall_list = [{'id': 0, 'tenant_id': ri.router['tenant_id'],
+                               'status': fw_status}]
+        self.api.plugin_rpc = mock.Mock()
+        self.api.plugin_rpc.get_routers.return_value = [ri.router,
+                                                        other_ri.router]
+        with contextlib.nested(
+            mock.patch.object(ip_lib.IPWrapper, 'get_namespaces'),
+            mock.patch.object(self.api.fwplugin_rpc,
+                              'get_firewalls_for_tenants'),
+            mock.patch.object(self.api, '_invoke_driver_for_sync_from_plugin'),
+            mock.patch.object(context, 'Context')
+        ) as (
+            mock_get_namespaces,
+            mock_get_firewalls_for_tenants,
+            mock_invoke_driver,
+            mock_Context):
+
+            mock_Context.return_value = mock.sentinel.context
+            mock_get_namespaces.return_value = [ri.ns_name()]
+            mock_get_firewalls_for_tenants.return_value = fake_firewall_list
+            self.api.process_services_sync(mock.sentinel.sync_context)
+
+            mock_get_namespaces.assert_called_once_with(self.conf.root_helper)
+            mock_get_firewalls_for_tenants.assert_called_once_with(
+                mock.sentinel.sync_context, [ri.router['tenant_id']])
+            self.assertFalse(self.api.services_sync)
+            return ri, fake_firewall_list, mock_invoke_driver
+
+    def test_process_services_sync(self):
+        ri, fake_firewall_list, mock_invoke_driver = (
+            self._process_services_sync_helper(constants.PENDING_UPDATE))
+        mock_invoke_driver.assert_called_once_with(
+            mock.sentinel.context, [ri], fake_firewall_list[0])
+
+    def test_process_services_sync_active_fw(self):
+        ri, fake_firewall_list, mock_invoke_driver = (
+            self._process_services_sync_helper(constants.ACTIVE))
+        self.assertFalse(mock_invoke_driver.called)
@@ -111,6 +111,12 @@ class IptablesFwaasTestCase(base.BaseTestCase):
             router_count -= 1
         return apply_list
 
+    def _reset_iptables_manager(self, iptables_inst):
+        # the tables are in plain dicts, reset_mock() doesn't reach them
+        iptables_inst.reset_mock()
+        iptables_inst.ipv4['filter'].reset_mock()
+        iptables_inst.ipv6['filter'].reset_mock()
+
     def _setup_firewall_with_rules(self, func, router_count=1):
         apply_list = self._fake_apply_list(router_count=router_count)
         rule_list = self._fake_rules_v4(FAKE_FW_ID, apply_list)
@@ -208,3 +214,71 @@ class IptablesFwaasTestCase(base.BaseTestCase):
                  call.add_chain('fwaas-default-policy'),
                  call.add_rule('fwaas-default-policy', '-j DROP')]
         apply_list[0].iptables_manager.ipv4['filter'].assert_has_calls(calls)
+
+    def test_update_firewall_unchanged(self):
+        apply_list = self._fake_apply_list()
+        rule_list = self._fake_rules_v4(FAKE_FW_ID, apply_list)
+        firewall = self._fake_firewall(rule_list)
+        self.firewall.create_firewall(apply_list, firewall)
+        ipt_mgr = apply_list[0].iptables_manager
+        self._reset_iptables_manager(ipt_mgr)
+
+        self.firewall.update_firewall(apply_list, firewall)
+
+        self.assertFalse(ipt_mgr.ipv4['filter'].mock_calls)
+        self.assertFalse(ipt_mgr.apply.called)
+
+    def test_update_firewall_changed_rule(self):
+        apply_list = self._fake_apply_list()
+        rule_list = self._fake_rules_v4(FAKE_FW_ID, apply_list)
+        firewall = self._fake_firewall(rule_list)
+        self.firewall.create_firewall(apply_list, firewall)
+        ipt_mgr = apply_list[0].iptables_manager
+        self._reset_iptables_manager(ipt_mgr)
+        rule_list[1]['enabled'] = False
+
+        self.firewall.update_firewall(apply_list, firewall)
+
+        invalid_rule = '-m state --state INVALID -j DROP'
+        est_rule = '-m state --state ESTABLISHED,RELATED -j ACCEPT'
+        rule1 = '-p tcp --dport 80  -s 10.24.4.2  -j ACCEPT'
+        ingress_chain = 'iv4%s' % firewall['id']
+        egress_chain = 'ov4%s' % firewall['id']
+        calls = [call.empty_chain(ingress_chain),
+                 call.add_rule(ingress_chain, invalid_rule),
+                 call.add_rule(ingress_chain, est_rule),
+                 call.add_rule(ingress_chain, rule1),
+                 call.empty_chain(egress_chain),
+                 call.add_rule(egress_chain, invalid_rule),
+                 call.add_rule(egress_chain, est_rule),
+                 call.add_rule(egress_chain, rule1)]
+        self.assertEqual(calls, ipt_mgr.ipv4['filter'].mock_calls)
+        self.assertFalse(ipt_mgr.ipv6['filter'].mock_calls)
+        ipt_mgr.apply.assert_called_once_with()
+
+    def test_update_firewall_after_delete(self):
+        apply_list = self._fake_apply_list()
+        firewall = self._fake_firewall_no_rule()
+        self.firewall.create_firewall(apply_list, firewall)
+        self.firewall.delete_firewall(apply_list, firewall)
+        ipt_mgr = apply_list[0].iptables_manager
+        self._reset_iptables_manager(ipt_mgr)
+
+        self.firewall.update_firewall(apply_list, firewall)
+
+        ipt_mgr.ipv4['filter'].add_chain.assert_has_calls(
+            [call('fwaas-default-policy'), call('iv4fake-fw-uuid')])
+        ipt_mgr.apply.assert_called_once_with()
+
+    def test_update_firewall_router_failure(self):
+        apply_list = self._fake_apply_list(router_count=2)
+        firewall = self._fake_firewall_no_rule()
+        apply_list[0].iptables_manager.apply.side_effect = RuntimeError
+
+        self.assertRaises(fwaas.fw_ext.FirewallInternalDriverError,
+                          self.firewall.update_firewall,
+                          apply_list, firewall)
+        apply_list[1].iptables_manager.apply.assert_called_once_with()
+        self.assertEqual(
+            [(FAKE_FW_ID, apply_list[1].router_id)],
+            self.firewall.applied_rules.keys())
@@ -20,6 +20,7 @@ import contextlib
 
 import mock
 
+from neutron.openstack.common.rpc import common as rpc_common
 from neutron.plugins.common import constants
 from neutron.services.loadbalancer.drivers.haproxy import (
     agent_manager as manager
@@ -34,6 +35,7 @@ class TestManager(base.BaseTestCase):
 
         mock_conf = mock.Mock()
         mock_conf.device_driver = ['devdriver']
+        mock_conf.num_resync_threads = 4
 
         self.mock_importer = mock.patch.object(manager, 'importutils').start()
 
@@ -68,11 +70,94 @@ class TestManager(base.BaseTestCase):
             self.assertFalse(sync.called)
 
     def test_collect_stats(self):
+        self.driver_mock.get_stats.side_effect = [{'bytes_in': 1},
+                                                  {'bytes_in': 2}]
         self.mgr.collect_stats(mock.Mock())
-        self.rpc_mock.update_pool_stats.assert_has_calls([
-            mock.call('1', mock.ANY),
-            mock.call('2', mock.ANY)
-        ])
+        self.rpc_mock.update_pools_stats.assert_called_once_with({
+            '1': {'bytes_in': 1, 'members': {}},
+            '2': {'bytes_in': 2, 'members': {}}
+        })
+        self.assertEqual(self.mgr.sent_stats, {'1': {'bytes_in': 1},
+                                               '2': {'bytes_in': 2}})
+
+    def test_collect_stats_changed_only(self):
+        self.mgr.sent_stats = {
+            '1': {'bytes_in': 1, 'members': {'m1': {'status': 'ACTIVE'},
+                                             'm2': {'status': 'ACTIVE'}}},
+            '2': {'bytes_in': 2, 'members': {}}
+        }
+        self.driver_mock.get_stats.side_effect = lambda pool_id: {
+            '1': {'bytes_in': 1, 'members': {'m1': {'status': 'ACTIVE'},
+                                             'm2': {'status': 'INACTIVE'}}},
+            '2': {'bytes_in': 2, 'members': {}}
+        }[pool_id]
+
+        self.mgr.collect_stats(mock.Mock())
+
+        self.rpc_mock.update_pools_stats.assert_called_once_with({
+            '1': {'bytes_in': 1, 'members': {'m2': {'status': 'INACTIVE'}}}
+        })
+        self.assertEqual(self.mgr.sent_stats['1']['members']['m2'],
+                         {'status': 'INACTIVE'})
+
+    def test_collect_stats_unchanged(self):
+        self.mgr.sent_stats = {'1': {'bytes_in': 1}, '2': {'bytes_in': 2}}
+        self.driver_mock.get_stats.side_effect = [{'bytes_in': 1},
+                                                  {'bytes_in': 2}]
+        self.mgr.collect_stats(mock.Mock())
+        self.assertFalse(self.rpc_mock.update_pools_stats.called)
+
+    def test_collect_stats_rpc_exception(self):
+        self.driver_mock.get_stats.return_value = {'bytes_in': 1}
+        self.rpc_mock.update_pools_stats.side_effect = Exception
+
+        self.mgr.collect_stats(mock.Mock())
+
+        self.assertEqual(self.mgr.sent_stats, {})
+        self.assertTrue(self.mgr.needs_resync)
+        self.assertTrue(self.log.exception.called)
+
+    def test_collect_stats_after_member_event(self):
+        stats = {'bytes_in': 1, 'members': {'m1': {'status': 'INACTIVE'}}}
+        self.mgr.sent_stats = {'1': stats, '2': {'bytes_in': 2}}
+        self.driver_mock.get_stats.side_effect = lambda pool_id: {
+            '1': stats, '2': {'bytes_in': 2}}[pool_id]
+
+        self.mgr.update_member(mock.Mock(), {'id': 'm1'},
+                               {'id': 'm1', 'pool_id': '1'})
+        self.mgr.collect_stats(mock.Mock())
+
+        self.rpc_mock.update_pools_stats.assert_called_once_with({'1': stats})
+
+    def test_collect_stats_pool_changed_during_upload(self):
+        self.driver_mock.get_stats.side_effect = [{'bytes_in': 1},
+                                                  {'bytes_in': 2}]
+
+        def update_pools_stats(pools_stats):
+            self.mgr.update_member(mock.Mock(), {'id': 'm1'},
+                                   {'id': 'm1', 'pool_id': '1'})
+
+        self.rpc_mock.update_pools_stats.side_effect = update_pools_stats
+        self.mgr.collect_stats(mock.Mock())
+
+        self.assertEqual(self.mgr.sent_stats, {'2': {'bytes_in': 2}})
+
+    def test_collect_stats_per_pool_fallback(self):
+        self.driver_mock.get_stats.side_effect = [{'bytes_in': 1},
+                                                  {'bytes_in': 2},
+                                                  {'bytes_in': 3},
+                                                  {'bytes_in': 4}]
+        self.rpc_mock.update_pools_stats.side_effect = (
+            rpc_common.RemoteError('UnsupportedRpcVersion'))
+
+        self.mgr.collect_stats(mock.Mock())
+        self.mgr.collect_stats(mock.Mock())
+
+        self.rpc_mock.update_pools_stats.assert_called_once_with(mock.ANY)
+        self.assertEqual(4, self.rpc_mock.update_pool_stats.call_count)
+        self.assertEqual(self.mgr.sent_stats, {'1': {'bytes_in': 3},
+                                               '2': {'bytes_in': 4}})
+        self.assertFalse(self.mgr.needs_resync)
 
     def test_collect_stats_exception(self):
         self.driver_mock.get_stats.side_effect = Exception
@@ -89,14 +174,17 @@ class TestManager(base.BaseTestCase):
             mock.patch.object(self.mgr, '_destroy_pool')
         ) as (reload, destroy):
 
+            configs = dict((i, {'driver': 'devdriver'}) for i in reloaded)
             self.rpc_mock.get_ready_devices.return_value = ready
+            self.rpc_mock.get_logical_devices.return_value = configs
 
             self.mgr.sync_state()
 
             self.assertEqual(len(reloaded), len(reload.mock_calls))
             self.assertEqual(len(destroyed), len(destroy.mock_calls))
 
-            reload.assert_has_calls([mock.call(i) for i in reloaded])
+            reload.assert_has_calls([mock.call(i, configs[i])
+                                     for i in reloaded], any_order=True)
             destroy.assert_has_calls([mock.call(i) for i in destroyed])
             self.assertFalse(self.mgr.needs_resync)
 
@@ -109,11 +197,23 @@ class TestManager(base.BaseTestCase):
 
     def test_sync_state_destroy_all(self):
         self._sync_state_helper([], [], ['1', '2'])
+        self.assertFalse(self.rpc_mock.get_logical_devices.called)
 
     def test_sync_state_both(self):
         self.mgr.instance_mapping = {'1': 'devdriver'}
         self._sync_state_helper(['2'], ['2'], ['1'])
 
+    def test_sync_state_inactive_pool(self):
+        with mock.patch.object(self.mgr, '_reload_pool') as reload:
+            self.rpc_mock.get_ready_devices.return_value = ['1', '2']
+            self.rpc_mock.get_logical_devices.return_value = {
+                '1': {'driver': 'devdriver'}}
+
+            self.mgr.sync_state()
+
+            reload.assert_called_once_with('1', {'driver': 'devdriver'})
+            self.assertTrue(self.mgr.needs_resync)
+
     def test_sync_state_exception(self):
         self.rpc_mock.get_ready_devices.side_effect = Exception
 
@@ -134,6 +234,62 @@ class TestManager(base.BaseTestCase):
         self.assertIn(pool_id, self.mgr.instance_mapping)
         self.rpc_mock.pool_deployed.assert_called_once_with(pool_id)
 
+    def test_reload_pool_with_config(self):
+        config = {'driver': 'devdriver'}
+
+        self.mgr._reload_pool('1', config)
+
+        self.assertFalse(self.rpc_mock.get_logical_device.called)
+        self.driver_mock.deploy_instance.assert_called_once_with(config)
+        self.rpc_mock.pool_deployed.assert_called_once_with('1')
+
+    def test_reload_pool_unchanged(self):
+        config = {'driver': 'devdriver'}
+        self.rpc_mock.get_logical_device.return_value = config
+        self.mgr.deployed_hashes['1'] = self.mgr._get_config_hash(config)
+
+        self.mgr._reload_pool('1')
+
+        self.assertFalse(self.driver_mock.deploy_instance.called)
+        self.rpc_mock.pool_deployed.assert_called_once_with('1')
+
+    def test_reload_pool_changed(self):
+        config = {'driver': 'devdriver', 'pool': {'id': '1'}}
+        self.rpc_mock.get_logical_device.return_value = config
+        self.mgr._reload_pool('1')
+        config['pool']['admin_state_up'] = False
+
+        self.mgr._reload_pool('1')
+
+        self.assertEqual(2, self.driver_mock.deploy_instance.call_count)
+        self.assertEqual(self.mgr.deployed_hashes['1'],
+                         self.mgr._get_config_hash(config))
+
+    def test_reload_pool_after_event(self):
+        config = {'driver': 'devdriver'}
+        self.rpc_mock.get_logical_device.return_value = config
+        self.mgr._reload_pool('1')
+        self.mgr.update_member(mock.Mock(), {}, {'id': 'm1', 'pool_id': '1'})
+
+        self.mgr._reload_pool('1')
+
+        self.assertEqual(2, self.driver_mock.deploy_instance.call_count)
+
+    def test_sync_state_concurrent(self):
+        self.mgr.conf.num_resync_threads = 2
+        with mock.patch.object(manager.eventlet, 'GreenPool') as pool_cls:
+            config = {'driver': 'devdriver'}
+            self.rpc_mock.get_ready_devices.return_value = ['1']
+            self.rpc_mock.get_logical_devices.return_value = {'1': config}
+
+            self.mgr.sync_state()
+
+            self.rpc_mock.get_logical_devices.assert_called_once_with(['1'])
+            pool_cls.assert_called_once_with(2)
+            pool_cls.return_value.spawn_n.assert_called_once_with(
+                self.mgr._reload_pool, '1', config)
+            pool_cls.return_value.waitall.assert_called_once_with()
+
     def test_reload_pool_driver_not_found(self):
         config = {'driver': 'unknown_driver'}
         self.rpc_mock.get_logical_device.return_value = config
@@ -166,10 +322,13 @@ class TestManager(base.BaseTestCase):
         pool_id = '1'
         self.assertIn(pool_id, self.mgr.instance_mapping)
 
+        self.mgr.sent_stats[pool_id] = {'bytes_in': 1}
+
         self.mgr._destroy_pool(pool_id)
 
         self.driver_mock.undeploy_instance.assert_called_once_with(pool_id)
         self.assertNotIn(pool_id, self.mgr.instance_mapping)
+        self.assertNotIn(pool_id, self.mgr.sent_stats)
         self.rpc_mock.pool_destroyed.assert_called_once_with(pool_id)
         self.assertFalse(self.mgr.needs_resync)
 
@@ -55,8 +55,10 @@ class TestHaproxyCfg(base.BaseTestCase):
                          '\tgroup test_group',
                          '\tlog /dev/log local0',
                          '\tlog /dev/log local1 notice',
-                         '\tstats socket test_path mode 0666 level user']
-        opts = cfg._build_global(mock.Mock(), 'test_path', 'test_group')
+                         '\tstats socket test_path mode 0600 uid 1000 '
+                         'level admin']
+        with mock.patch('os.getuid', return_value=1000):
+            opts = cfg._build_global(mock.Mock(), 'test_path', 'test_group')
         self.assertEqual(expected_opts, list(opts))
 
     def test_build_defaults(self):
@@ -130,6 +132,32 @@ class TestHaproxyCfg(base.BaseTestCase):
         opts = cfg._build_backend(test_config)
         self.assertEqual(expected_opts, list(opts))
 
+    def test_build_backend_server_settings(self):
+        test_config = {'pool': {'id': 'pool_id',
+                                'protocol': 'TCP',
+                                'lb_method': 'ROUND_ROBIN'},
+                       'members': [{'status': 'ACTIVE',
+                                    'admin_state_up': False,
+                                    'id': 'member1_id',
+                                    'address': '10.0.0.3',
+                                    'protocol_port': 80,
+                                    'weight': 2},
+                                   {'status': 'PENDING_CREATE',
+                                    'admin_state_up': True,
+                                    'id': 'member2_id',
+                                    'address': '10.0.0.4',
+                                    'protocol_port': 80,
+                                    'weight': 1}],
+                       'healthmonitors': [],
+                       'vip': {}}
+        opts = list(cfg._build_backend(test_config))
+        self.assertEqual('\tserver member1_id 10.0.0.3:80 weight 2 disabled',
+                         opts[-1])
+        opts = list(cfg._build_backend(test_config, server_settings=False))
+        self.assertEqual('\tserver member1_id 10.0.0.3:80', opts[-1])
+        self.assertEqual({'member1_id': (2, False)},
+                         cfg.get_server_settings(test_config))
+
     def test_get_server_health_option(self):
         test_config = {'healthmonitors': [{'admin_state_up': False,
                                            'delay': 3,
@@ -71,8 +71,9 @@ class TestHaproxyNSDriver(base.BaseTestCase):
         with contextlib.nested(
             mock.patch.object(self.driver, '_get_state_file_path'),
             mock.patch.object(self.driver, '_spawn'),
+            mock.patch.object(self.driver, '_is_running', return_value=False),
             mock.patch('__builtin__.open')
-        ) as (gsp, spawn, mock_open):
+        ) as (gsp, spawn, is_running, mock_open):
             mock_open.return_value = ['5']
 
             self.driver.update(self.fake_config)
@@ -80,6 +81,55 @@ class TestHaproxyNSDriver(base.BaseTestCase):
             mock_open.assert_called_once_with(gsp.return_value, 'r')
             spawn.assert_called_once_with(self.fake_config, ['-sf', '5'])
 
+    def test_update_already_running(self):
+        with contextlib.nested(
+            mock.patch.object(self.driver, '_spawn'),
+            mock.patch.object(self.driver, '_is_running', return_value=True)
+        ) as (spawn, is_running):
+            self.driver.update(self.fake_config)
+
+            is_running.assert_called_once_with(self.fake_config)
+            self.assertFalse(spawn.called)
+
+    def _test_is_running(self, running_config):
+        with contextlib.nested(
+            mock.patch.object(self.driver, '_get_state_file_path'),
+            mock.patch.object(namespace_driver.hacfg, 'build_config'),
+            mock.patch('__builtin__.open')
+        ) as (gsp, build, mock_open):
+            gsp.side_effect = lambda x, y: y
+            build.return_value = ['global', 'daemon']
+            conf_file = mock_open.return_value.__enter__.return_value
+            conf_file.read.return_value = running_config
+
+            result = self.driver._is_running(self.fake_config)
+
+            mock_open.assert_called_once_with('conf', 'r')
+            build.assert_called_once_with(self.fake_config, 'sock',
+                                          'test_group')
+            return result
+
+    def test_is_running(self):
+        self.assertTrue(self._test_is_running('global\ndaemon'))
+        self.assertEqual(self.driver.deployed_configs,
+                         {'pool_id': self.fake_config})
+        self.assertEqual(self.driver.pool_to_port_id, {'pool_id': 'port_id'})
+
+    def test_is_running_config_changed(self):
+        self.assertFalse(self._test_is_running('global\n'))
+        self.assertEqual(self.driver.deployed_configs, {})
+
+    def test_is_running_no_config(self):
+        with mock.patch('__builtin__.open') as mock_open:
+            mock_open.side_effect = IOError()
+            self.assertFalse(self.driver._is_running(self.fake_config))
+
+    def test_is_running_deployed(self):
+        self.driver.deployed_configs['pool_id'] = self.fake_config
+        with mock.patch('__builtin__.open') as mock_open:
+            self.assertFalse(self.driver._is_running(self.fake_config))
+            self.assertFalse(mock_open.called)
+
     def test_spawn(self):
         with contextlib.nested(
             mock.patch.object(namespace_driver.hacfg, 'save_config'),
@@ -406,19 +456,120 @@ class TestHaproxyNSDriver(base.BaseTestCase):
                 self.assertFalse(undeploy.called)
 
     def test_create_member(self):
-        with mock.patch.object(self.driver, '_refresh_device') as refresh:
-            self.driver.create_member({'pool_id': '1'})
-            refresh.assert_called_once_with('1')
+        with mock.patch.object(self.driver, '_deploy_instance') as deploy:
+            self.driver.create_member({'pool_id': '1', 'id': 'm1'})
+            self.rpc_mock.get_logical_device.assert_called_once_with('1')
+            deploy.assert_called_once_with(
+                self.rpc_mock.get_logical_device.return_value)
 
     def test_update_member(self):
-        with mock.patch.object(self.driver, '_refresh_device') as refresh:
-            self.driver.update_member({}, {'pool_id': '1'})
-            refresh.assert_called_once_with('1')
+        with mock.patch.object(self.driver, '_deploy_instance') as deploy:
+            self.driver.update_member({}, {'pool_id': '1', 'id': 'm1'})
+            self.rpc_mock.get_logical_device.assert_called_once_with('1')
+            deploy.assert_called_once_with(
+                self.rpc_mock.get_logical_device.return_value)
 
     def test_delete_member(self):
-        with mock.patch.object(self.driver, '_refresh_device') as refresh:
-            self.driver.delete_member({'pool_id': '1'})
-            refresh.assert_called_once_with('1')
+        with mock.patch.object(self.driver, '_deploy_instance') as deploy:
+            self.driver.delete_member({'pool_id': '1', 'id': 'm1'})
+            self.rpc_mock.get_logical_device.assert_called_once_with('1')
+            deploy.assert_called_once_with(
+                self.rpc_mock.get_logical_device.return_value)
+
+    def _deployed_config(self):
+        config = {
+            'pool': {'id': 'pool_id', 'protocol': 'TCP',
+                     'lb_method': 'ROUND_ROBIN'},
+            'vip': {'id': 'vip_id', 'status': 'ACTIVE',
+                    'admin_state_up': True, 'protocol': 'TCP',
+                    'protocol_port': 80, 'connection_limit': -1,
+                    'port': {'id': 'port_id',
+                             'fixed_ips': [{'ip_address': '10.0.0.2'}]}},
+            'members': [{'id': 'member%d' % i, 'pool_id': 'pool_id',
+                         'address': '10.0.0.%d' % (i + 10),
+                         'protocol_port': 80, 'weight': 1,
+                         'admin_state_up': True, 'status': 'ACTIVE'}
+                        for i in range(2)],
+            'healthmonitors': []}
+        self.driver.deployed_configs['pool_id'] = config
+        return config
+
+    def test_update_member_runtime(self):
+        deployed_config = self._deployed_config()
+        member = dict(deployed_config['members'][1], weight=5,
+                      admin_state_up=False, status='PENDING_UPDATE')
+        with contextlib.nested(
+            mock.patch.object(self.driver, 'exists', return_value=True),
+            mock.patch.object(self.driver, '_get_state_file_path'),
+            mock.patch.object(self.driver, '_spawn'),
+            mock.patch.object(self.driver, '_send_commands',
+                              return_value=True),
+            mock.patch.object(namespace_driver.hacfg, 'save_config')
+        ) as (exists, gsp, spawn, send, save):
+            gsp.side_effect = lambda x, y: y
+            self.driver.update_member({}, member)
+
+            send.assert_called_once_with(
+                'sock', ['set weight pool_id/member1 5',
+                         'disable server pool_id/member1'])
+            self.assertFalse(spawn.called)
+            self.assertFalse(self.rpc_mock.get_logical_device.called)
+            new_config = self.driver.deployed_configs['pool_id']
+            self.assertEqual('ACTIVE', new_config['members'][1]['status'])
+            self.assertEqual(5, new_config['members'][1]['weight'])
+            save.assert_called_once_with('conf', new_config, 'sock',
+                                         'test_group')
+
+    def test_update_member_runtime_rejected(self):
+        deployed_config = self._deployed_config()
+        member = dict(deployed_config['members'][1], weight=5)
+        with contextlib.nested(
+            mock.patch.object(self.driver, 'exists', return_value=True),
+            mock.patch.object(self.driver, '_get_state_file_path'),
+            mock.patch.object(self.driver, '_spawn'),
+            mock.patch.object(self.driver, '_send_commands',
+                              return_value=False),
+            mock.patch('__builtin__.open')
+        ) as (exists, gsp, spawn, send, mock_open):
+            mock_open.return_value = ['5']
+            self.driver.update_member({}, member)
+
+            self.assertTrue(send.called)
+            spawn.assert_called_once_with(mock.ANY, ['-sf', '5'])
+
+    def test_create_member_reloads(self):
+        self._deployed_config()
+        member = {'id': 'member2', 'pool_id': 'pool_id',
+                  'address': '10.0.0.12', 'protocol_port': 80, 'weight': 1,
+                  'admin_state_up': True, 'status': 'PENDING_CREATE'}
+        with contextlib.nested(
+            mock.patch.object(self.driver, 'exists', return_value=True),
+            mock.patch.object(self.driver, '_get_state_file_path'),
+            mock.patch.object(self.driver, '_spawn'),
+            mock.patch.object(self.driver, '_send_commands'),
+            mock.patch('__builtin__.open')
+        ) as (exists, gsp, spawn, send, mock_open):
+            mock_open.return_value = ['5']
+            self.driver.create_member(member)
+
+            self.assertFalse(send.called)
+            self.assertFalse(self.rpc_mock.get_logical_device.called)
+            new_config = spawn.call_args[0][0]
+            self.assertEqual(['member0', 'member1', 'member2'],
+                             [m['id'] for m in new_config['members']])
+            self.assertEqual('ACTIVE', new_config['members'][2]['status'])
+
+    def test_send_commands(self):
+        with mock.patch('socket.socket') as socket:
+            socket.return_value.recv.side_effect = ['\n', '']
+            self.assertTrue(self.driver._send_commands(
+                'sock', ['enable server p/m1', 'set weight p/m1 2']))
+            socket.return_value.send.assert_called_once_with(
+                'enable server p/m1;set weight p/m1 2\n')
+
+            socket.return_value.recv.side_effect = ['No such server.\n', '']
+            self.assertFalse(self.driver._send_commands(
+                'sock', ['enable server p/m1']))
 
     def test_create_pool_health_monitor(self):
         with mock.patch.object(self.driver, '_refresh_device') as refresh:
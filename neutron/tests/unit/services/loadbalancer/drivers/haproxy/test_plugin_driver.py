@@ -261,6 +261,53 @@ class TestLoadBalancerCallbacks(TestLoadBalancerPluginBase):
                     self.assertEqual([member['member']],
                                      logical_config['members'])
 
+    def test_get_logical_devices(self):
+        with contextlib.nested(self.pool(), self.pool(name='p2')) as (p1, p2):
+            ctx = context.get_admin_context()
+            self.plugin_instance.update_status(ctx, ldb.Pool,
+                                               p1['pool']['id'], 'ACTIVE')
+
+            devices = self.callbacks.get_logical_devices(
+                ctx, [p1['pool']['id'], p2['pool']['id']])
+
+            self.assertEqual([p1['pool']['id']], devices.keys())
+            self.assertEqual(
+                devices[p1['pool']['id']],
+                self.callbacks.get_logical_device(ctx, p1['pool']['id']))
+
+    def test_get_logical_device_cached(self):
+        with self.pool() as pool:
+            with self.vip(pool=pool) as vip:
+                with self.member(pool_id=pool['pool']['id']) as member:
+                    ctx = context.get_admin_context()
+                    pool_id = pool['pool']['id']
+                    self.callbacks.update_status(ctx, 'pool', pool_id,
+                                                 'ACTIVE')
+                    with mock.patch.object(
+                        self.callbacks, '_make_logical_device',
+                        wraps=self.callbacks._make_logical_device
+                    ) as make_device:
+                        config = self.callbacks.get_logical_device(
+                            ctx, pool_id)
+                        self.assertEqual(
+                            config, self.callbacks.get_logical_device(
+                                ctx, pool_id))
+                        self.assertEqual(1, make_device.call_count)
+                        self.assertIn('subnet',
+                                      config['vip']['port']['fixed_ips'][0])
+
+                        self.callbacks.update_status(
+                            ctx, 'member', member['member']['id'],
+                            'ACTIVE')
+                        config = self.callbacks.get_logical_device(
+                            ctx, pool_id)
+
+                        self.assertEqual(2, make_device.call_count)
+                        self.assertEqual(vip['vip']['id'],
+                                         config['vip']['id'])
+                        self.assertEqual(constants.ACTIVE,
+                                         config['members'][0]['status'])
+
     def _update_port_test_helper(self, expected, func, **kwargs):
         core = self.plugin_instance._core_plugin
 
@@ -317,6 +364,37 @@ class TestLoadBalancerCallbacks(TestLoadBalancerPluginBase):
             host='host'
         )
 
+    def _assert_cache_invalidated(self, func):
+        with self.pool() as pool:
+            with self.vip(pool=pool) as vip:
+                ctx = context.get_admin_context()
+                pool_id = pool['pool']['id']
+                self.callbacks.update_status(ctx, 'pool', pool_id, 'ACTIVE')
+                self.callbacks.get_logical_device(ctx, pool_id)
+                revision = self.callbacks.revisions[pool_id]
+                self.assertIn(pool_id, self.callbacks.devices)
+
+                func(ctx, pool_id, vip['vip']['port_id'])
+
+                self.assertEqual(revision + 1,
+                                 self.callbacks.revisions[pool_id])
+                self.assertNotIn(pool_id, self.callbacks.devices)
+
+    def test_plug_vip_port_invalidates_cache(self):
+        self._assert_cache_invalidated(
+            lambda ctx, pool_id, port_id: self.callbacks.plug_vip_port(
+                ctx, port_id=port_id, host='host'))
+
+    def test_unplug_vip_port_invalidates_cache(self):
+        self._assert_cache_invalidated(
+            lambda ctx, pool_id, port_id: self.callbacks.unplug_vip_port(
+                ctx, port_id=port_id, host='host'))
+
+    def test_update_pool_stats_invalidates_cache(self):
+        self._assert_cache_invalidated(
+            lambda ctx, pool_id, port_id: self.callbacks.update_pool_stats(
+                ctx, pool_id=pool_id, stats={'members': {}}, host='host'))
+
     def test_pool_deployed(self):
         with self.pool() as pool:
             with self.vip(pool=pool) as vip:
@@ -369,6 +447,17 @@ class TestLoadBalancerCallbacks(TestLoadBalancerPluginBase):
                                                              pool_id)
             self.assertEqual('ACTIVE', h['status'])
 
+    def test_update_pools_stats(self):
+        with self.pool() as pool:
+            pool_id = pool['pool']['id']
+            ctx = context.get_admin_context()
+            self.callbacks.update_pools_stats(
+                ctx, {pool_id: {'bytes_in': 10, 'members': {}},
+                      'unknown_pool_id': {'bytes_in': 20, 'members': {}}},
+                'host')
+            stats = self.plugin_instance.stats(ctx, pool_id)
+            self.assertEqual(10, stats['stats']['bytes_in'])
+
 
 class TestLoadBalancerAgentApi(base.BaseTestCase):
     def setUp(self):
@@ -557,7 +646,10 @@ class TestLoadBalancerPluginNotificationWrapper(TestLoadBalancerPluginBase):
                     mock.ANY, old_pool, updated, 'host')
 
     def test_delete_pool(self):
+        callbacks = self.plugin_instance.agent_callbacks
         with self.pool(no_delete=True) as pool:
+            callbacks.pools_changed(context.get_admin_context(),
+                                    [pool['pool']['id']])
             req = self.new_delete_request('pools',
                                           pool['pool']['id'])
             res = req.get_response(self.ext_api)
@@ -565,6 +657,7 @@ class TestLoadBalancerPluginNotificationWrapper(TestLoadBalancerPluginBase):
             pool['pool']['status'] = 'PENDING_DELETE'
             self.mock_api.delete_pool.assert_called_once_with(
                 mock.ANY, pool['pool'], 'host')
+            self.assertNotIn(pool['pool']['id'], callbacks.revisions)
 
     def test_create_member(self):
         with self.pool() as pool:
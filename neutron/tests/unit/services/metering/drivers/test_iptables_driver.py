@@ -373,3 +373,62 @@ class IptablesDriverTestCase(base.BaseTestCase):
                                wrap=False, top=False)]
 
         self.v4filter_inst.assert_has_calls(calls)
+
+    def test_get_traffic_counters(self):
+        routers = [{'_metering_labels': [
+            {'id': 'c5df2fe5-c600-4a2a-b2f4-c0fb6df73c83',
+             'rules': []},
+            {'id': 'eeef45da-c600-4a2a-b2f4-c0fb6df73c83',
+             'rules': []}],
+            'admin_state_up': True,
+            'gw_port_id': '7d411f48-ecc7-45e0-9ece-3b5bdb54fcee',
+            'id': '473ec392-1711-44e3-b008-3251ccfc5099',
+            'name': 'router1',
+            'status': 'ACTIVE',
+            'tenant_id': '6c5f5d2a1fa2441e88e35422926f48e8'},
+            {'_metering_labels': [
+                {'id': 'c5df2fe5-c600-4a2a-b2f4-c0fb6df73c83',
+                 'rules': []}],
+             'admin_state_up': True,
+             'gw_port_id': '6d411f48-ecc7-45e0-9ece-3b5bdb54fcee',
+             'id': '373ec392-1711-44e3-b008-3251ccfc5099',
+             'name': 'router2',
+             'status': 'ACTIVE',
+             'tenant_id': '6c5f5d2a1fa2441e88e35422926f48e8'}]
+
+        self.metering.add_metering_label(None, routers)
+        self.iptables_inst.get_chains_traffic_counters.side_effect = [
+            {'neutron-meter-l-c5df2fe5-c60': {'pkts': 1, 'bytes': 10},
+             'neutron-meter-l-eeef45da-c60': {'pkts': 2, 'bytes': 20}},
+            {'neutron-meter-l-c5df2fe5-c60': {'pkts': 3, 'bytes': 30}}]
+
+        accs = self.metering.get_traffic_counters(None, routers)
+
+        self.assertEqual(
+            {'c5df2fe5-c600-4a2a-b2f4-c0fb6df73c83': {'pkts': 4, 'bytes': 40},
+             'eeef45da-c600-4a2a-b2f4-c0fb6df73c83': {'pkts': 2, 'bytes': 20}},
+            accs)
+        self.assertEqual(
+            2, self.iptables_inst.get_chains_traffic_counters.call_count)
+        self.iptables_inst.get_chains_traffic_counters.assert_any_call(
+            {'neutron-meter-l-c5df2fe5-c60':
+             'c5df2fe5-c600-4a2a-b2f4-c0fb6df73c83'},
+            wrap=False, zero=True)
+
+    def test_get_traffic_counters_router_error(self):
+        routers = [{'_metering_labels': [
+            {'id': 'c5df2fe5-c600-4a2a-b2f4-c0fb6df73c83',
+             'rules': []}],
+            'admin_state_up': True,
+            'gw_port_id': '7d411f48-ecc7-45e0-9ece-3b5bdb54fcee',
+            'id': '473ec392-1711-44e3-b008-3251ccfc5099',
+            'name': 'router1',
+            'status': 'ACTIVE',
+            'tenant_id': '6c5f5d2a1fa2441e88e35422926f48e8'}]
+
+        self.metering.add_metering_label(None, routers)
+        self.iptables_inst.get_chains_traffic_counters.side_effect = (
+            RuntimeError)
+
+        self.assertEqual({}, self.metering.get_traffic_counters(None,
+                                                                routers))
@@ -117,6 +117,49 @@ class TestMeteringOperations(base.BaseTestCase):
         self.assertEqual(payload['pkts'], 88)
         self.assertEqual(payload['bytes'], 444)
 
+    def test_notification_report_batch(self):
+        cfg.CONF.set_override('report_batch_size', 2)
+        label_ids = [_uuid() for i in range(3)]
+        routers = [{'tenant_id': TENANT_ID,
+                    '_metering_labels': [{'rules': [], 'id': label_id}
+                                         for label_id in label_ids],
+                    'id': _uuid()}]
+        self.agent.routers_updated(None, routers)
+
+        self.driver.get_traffic_counters.return_value = dict(
+            (label_id, {'pkts': 1, 'bytes': 10}) for label_id in label_ids)
+        self.agent._metering_loop()
+
+        notifications = [n for n in test_notifier.NOTIFICATIONS
+                         if n['event_type'] == 'l3.meter']
+        self.assertEqual(2, len(notifications))
+        reports = []
+        for n in notifications:
+            self.assertEqual(cfg.CONF.host, n['payload']['host'])
+            reports += n['payload']['labels']
+        self.assertEqual(sorted(label_ids),
+                         sorted(r['label_id'] for r in reports))
+        for report in reports:
+            self.assertEqual(TENANT_ID, report['tenant_id'])
+            self.assertEqual(1, report['pkts'])
+            self.assertEqual(10, report['bytes'])
+
+    def test_label_tenant_updated_incrementally(self):
+        self.agent.routers_updated(None, ROUTERS)
+        self.assertEqual({LABEL_ID: TENANT_ID}, self.agent.label_tenant_id)
+
+        label_id = _uuid()
+        router = {'tenant_id': TENANT_ID,
+                  '_metering_labels': [{'rules': [], 'id': label_id}],
+                  'id': ROUTERS[0]['id']}
+        self.agent.add_metering_label(None, [router])
+        self.assertEqual(set([LABEL_ID, label_id]),
+                         self.agent.router_labels[ROUTERS[0]['id']])
+
+        self.agent.router_deleted(None, ROUTERS[0]['id'])
+        self.agent._purge_metering_info()
+        self.assertEqual({}, self.agent.label_tenant_id)
+
     def test_router_deleted(self):
         label_id = _uuid()
         self.driver.get_traffic_counters = mock.MagicMock()
@@ -134,6 +177,40 @@ class TestMeteringOperations(base.BaseTestCase):
         self.agent._add_metering_info.assert_called_with(label_id, 44, 222)
 
 
+class TestMeteringInfos(base.BaseTestCase):
+    def test_add(self):
+        infos = metering_agent.MeteringInfos()
+        infos.add('label1', 1, 10, 100)
+        infos.add('label1', 2, 20, 130)
+
+        self.assertEqual({'pkts': 3, 'bytes': 30, 'time': 30,
+                          'first_update': 100, 'last_update': 130},
+                         infos.get('label1'))
+
+    def test_reset(self):
+        infos = metering_agent.MeteringInfos()
+        infos.add('label1', 1, 10, 100)
+        infos.reset('label1')
+
+        self.assertEqual({'pkts': 0, 'bytes': 0, 'time': 0,
+                          'first_update': 100, 'last_update': 100},
+                         infos.get('label1'))
+
+    def test_purge_reuses_slots(self):
+        infos = metering_agent.MeteringInfos()
+        infos.add('label1', 1, 10, 100)
+        infos.add('label2', 2, 20, 200)
+        infos.purge(150)
+        self.assertNotIn('label1', infos)
+        self.assertEqual(1, len(infos))
+
+        infos.add('label3', 3, 30, 300)
+        self.assertEqual(2, len(infos.pkts))
+        self.assertEqual({'pkts': 3, 'bytes': 30, 'time': 0,
+                          'first_update': 300, 'last_update': 300},
+                         infos.get('label3'))
+
+
 class TestMeteringDriver(base.BaseTestCase):
     def setUp(self):
         super(TestMeteringDriver, self).setUp()
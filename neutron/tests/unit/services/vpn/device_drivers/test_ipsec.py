@@ -15,6 +15,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 import mock
+from oslo.config import cfg
 
 from neutron.openstack.common import uuidutils
 from neutron.plugins.common import constants
@@ -47,6 +48,7 @@ class TestIPsecDeviceDriver(base.BaseTestCase):
             'os.makedirs',
             'os.path.isdir',
             'neutron.agent.linux.utils.replace_file',
+            'neutron.openstack.common.loopingcall.FixedIntervalLoopingCall',
             'neutron.openstack.common.rpc.create_connection',
             'neutron.services.vpn.device_drivers.ipsec.'
                 'OpenSwanProcess._gen_config_content',
@@ -56,6 +58,7 @@ class TestIPsecDeviceDriver(base.BaseTestCase):
         self.execute = mock.patch(
             'neutron.agent.linux.utils.execute').start()
         self.agent = mock.Mock()
+        self.agent.conf.ipsec.ipsec_sync_threads = 2
         self.driver = driver(
             self.agent,
             FAKE_HOST)
@@ -126,6 +129,7 @@ class TestIPsecDeviceDriver(base.BaseTestCase):
                 top=True),
             mock.call.iptables_apply(FAKE_ROUTER_ID)
         ])
+        process.update_vpnservice.assert_called_once_with(FAKE_VPN_SERVICE)
         process.update.assert_called_once_with()
         self.driver.agent_rpc.update_status.assert_called_once_with(
             context,
@@ -152,3 +156,96 @@ class TestIPsecDeviceDriver(base.BaseTestCase):
         process_id = _uuid()
         self.driver.sync(context, [{'id': process_id}])
         self.assertNotIn(process_id, self.driver.processes)
+
+    def test_sync_update_failure(self):
+        vpnservices = [dict(FAKE_VPN_SERVICE, router_id=_uuid())
+                       for i in range(2)]
+        self.driver.agent_rpc.get_vpn_services_on_host.return_value = (
+            vpnservices)
+        processes = [mock.Mock(), mock.Mock()]
+        processes[0].update.side_effect = RuntimeError
+        self.driver.processes = dict(
+            (vpnservice['router_id'], process)
+            for vpnservice, process in zip(vpnservices, processes))
+        with mock.patch.object(self.driver, 'report_status') as report:
+            self.driver.sync(mock.Mock(), [])
+            self.assertTrue(report.called)
+        for process in processes:
+            process.update.assert_called_once_with()
+
+    def test_report_status_polls_once(self):
+        process = mock.Mock()
+        process.vpnservice = FAKE_VPN_SERVICE
+        process.connection_status = {}
+        process.updated_pending_status = False
+        status = mock.PropertyMock(return_value=constants.ACTIVE)
+        type(process).status = status
+        self.driver.processes = {FAKE_ROUTER_ID: process}
+        context = mock.Mock()
+
+        self.driver.report_status(context)
+        self.driver.report_status(context)
+
+        self.assertEqual(2, status.call_count)
+        self.driver.agent_rpc.update_status.assert_called_once_with(
+            context,
+            [{'status': constants.ACTIVE,
+              'ipsec_site_connections': {},
+              'updated_pending_status': False,
+              'id': FAKE_VPN_SERVICE['id']}])
+
+
+class TestOpenSwanProcess(base.BaseTestCase):
+    def setUp(self):
+        super(TestOpenSwanProcess, self).setUp()
+        self.addCleanup(mock.patch.stopall)
+
+        for klass in [
+            'os.makedirs',
+            'os.path.isdir',
+            'neutron.agent.linux.utils.replace_file',
+        ]:
+            mock.patch(klass).start()
+        self.gen_config = mock.patch.object(
+            ipsec_driver.OpenSwanProcess, '_gen_config_content').start()
+        self.gen_config.return_value = 'config'
+        vpnservice = {'admin_state_up': True,
+                      'status': constants.ACTIVE,
+                      'subnet': {'cidr': '10.0.0.0/24'},
+                      'ipsec_site_connections': []}
+        self.process = ipsec_driver.OpenSwanProcess(
+            cfg.CONF, 'sudo', FAKE_ROUTER_ID, vpnservice, 'ns')
+        for method in ['get_status', 'start', 'restart']:
+            mock.patch.object(self.process, method).start()
+        self.process.get_status.return_value = ''
+
+    def test_enable_not_active(self):
+        self.process.get_status.side_effect = RuntimeError
+
+        self.process.enable()
+
+        self.process.start.assert_called_once_with()
+        self.assertFalse(self.process.restart.called)
+
+    def test_enable_unchanged_config(self):
+        self.process.enable()
+        self.process.enable()
+
+        self.process.restart.assert_called_once_with()
+
+    def test_enable_changed_config(self):
+        self.process.enable()
+        self.gen_config.return_value = 'new config'
+
+        self.process.enable()
+
+        self.assertEqual(2, self.process.restart.call_count)
+
+    def test_enable_after_failed_restart(self):
+        self.process.restart.side_effect = RuntimeError
+        self.process.enable()
+        self.process.restart.side_effect = None
+
+        self.process.enable()
+
+        self.assertEqual(2, self.process.restart.call_count)
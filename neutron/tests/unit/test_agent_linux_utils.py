@@ -15,10 +15,19 @@
 #    under the License.
 # @author: Dan Wendlandt, Nicira, Inc.
 
+import os
+import socket
+import stat
+import sys
+
 import fixtures
 import mock
+from oslo.config import cfg
 
+from neutron.agent.common import config
+from neutron.agent.linux import rootwrap_daemon
 from neutron.agent.linux import utils
+from neutron.openstack.common.rootwrap import cmd as rootwrap_cmd
 from neutron.tests import base
 
 
@@ -79,6 +88,127 @@ class AgentUtilsExecuteTest(base.BaseTestCase):
         self.assertEqual(result, expected)
 
 
+class AgentUtilsRootwrapDaemonTest(base.BaseTestCase):
+    def setUp(self):
+        super(AgentUtilsRootwrapDaemonTest, self).setUp()
+        temp_dir = self.useFixture(fixtures.TempDir()).path
+        filters_dir = os.path.join(temp_dir, 'rootwrap.d')
+        os.mkdir(filters_dir)
+        with open(os.path.join(filters_dir, 'test.filters'), 'w') as f:
+            f.write('[Filters]\n'
+                    'cat: CommandFilter, cat, root\n'
+                    'echo: CommandFilter, echo, root\n')
+        conf_file = os.path.join(temp_dir, 'rootwrap.conf')
+        with open(conf_file, 'w') as f:
+            f.write('[DEFAULT]\n'
+                    'filters_path=%s\n'
+                    'exec_dirs=/bin,/usr/bin\n' % filters_dir)
+        config.register_root_helper(cfg.CONF)
+        cfg.CONF.set_override(
+            'root_helper_daemon',
+            '%s -m neutron.agent.linux.rootwrap_daemon %s' % (sys.executable,
+                                                              conf_file),
+            'AGENT')
+        self.addCleanup(self._stop_daemons)
+
+    def _stop_daemons(self):
+        for client in utils._rootwrap_clients.values():
+            client._close_connections()
+            if client._process:
+                client._process.stdin.close()
+                client._process.wait()
+        utils._rootwrap_clients.clear()
+
+    def test_execute(self):
+        self.assertEqual('hello\n', utils.execute(['echo', 'hello'], 'sudo'))
+        self.assertEqual('world\n', utils.execute(['echo', 'world'], 'sudo'))
+
+        client = utils._get_rootwrap_client()
+        self.assertEqual(1, len(client._connections))
+
+    def test_execute_process_input(self):
+        data = 'line\n\xff\x00'
+        self.assertEqual(data, utils.execute(['cat'], 'sudo',
+                                             process_input=data))
+
+    def test_execute_without_root_helper(self):
+        with mock.patch.object(utils, 'create_process') as create_process:
+            obj = mock.Mock(returncode=0)
+            obj.communicate.return_value = ('', '')
+            create_process.return_value = (obj, ['ls'])
+            utils.execute(['ls'])
+        self.assertFalse(utils._rootwrap_clients)
+
+    def test_unauthorized_command(self):
+        self.assertRaises(RuntimeError, utils.execute, ['ls'], 'sudo')
+        self.assertEqual('', utils.execute(['ls'], 'sudo',
+                                           check_exit_code=False))
+
+    def test_daemon_restarted(self):
+        utils.execute(['echo'], 'sudo')
+        client = utils._get_rootwrap_client()
+        process = client._process
+        process.stdin.close()
+        process.wait()
+
+        self.assertEqual('hello\n', utils.execute(['echo', 'hello'], 'sudo'))
+        self.assertIsNot(process, client._process)
+
+    def test_wrong_authkey_rejected(self):
+        utils.execute(['echo'], 'sudo')
+        client = utils._get_rootwrap_client()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(client._socket_path)
+        connection = utils._RootwrapConnection(sock)
+        try:
+            challenge = str(connection.receive()['challenge'])
+            connection.send({'digest': rootwrap_daemon.auth_digest(
+                'wrong', challenge)})
+            connection.send({'cmd': ['echo', 'hello']})
+            self.assertRaises(EOFError, connection.receive)
+        finally:
+            connection.close()
+
+    def test_malformed_request(self):
+        utils.execute(['echo'], 'sudo')
+        client = utils._get_rootwrap_client()
+        connection = client._connect()
+        try:
+            for request in [{}, {'cmd': 'echo'}, {'cmd': []}, ['echo'],
+                            {'cmd': ['echo'], 'process_input': 1}]:
+                connection.send(request)
+                reply = connection.receive()
+                self.assertEqual(rootwrap_cmd.RC_NOCOMMAND,
+                                 reply['returncode'])
+            # The connection is still usable
+            connection.send({'cmd': ['echo', 'hello']})
+            self.assertEqual('hello\n', connection.receive()['stdout'])
+        finally:
+            connection.close()
+
+    def test_socket_owner_and_mode(self):
+        socket_path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                   rootwrap_daemon.SOCKET_NAME)
+        with mock.patch.object(os, 'chown') as chown:
+            server = rootwrap_daemon.RootwrapServer(socket_path, None, 'key',
+                                                    1234, 5678)
+        try:
+            chown.assert_called_once_with(socket_path, 1234, 5678)
+            self.assertEqual(0o600, stat.S_IMODE(os.stat(socket_path).st_mode))
+        finally:
+            server.server_close()
+
+        os.unlink(socket_path)
+        server = rootwrap_daemon.RootwrapServer(socket_path, None, 'key',
+                                                os.getuid(), os.getgid())
+        try:
+            socket_stat = os.stat(socket_path)
+            self.assertEqual(os.getuid(), socket_stat.st_uid)
+            self.assertEqual(os.getgid(), socket_stat.st_gid)
+        finally:
+            server.server_close()
+
+
 class AgentUtilsGetInterfaceMAC(base.BaseTestCase):
     def test_get_interface_mac(self):
         expect_val = '01:02:03:04:05:06'
@@ -547,6 +547,49 @@ class IptablesManagerStateFulTestCase(base.BaseTestCase):
 
         tools.verify_mock_calls(self.execute, expected_calls_and_values)
 
+    def test_get_chains_traffic_counters(self):
+        self.iptables.ipv4['filter'].add_chain('chain1', wrap=False)
+        self.iptables.ipv4['filter'].add_chain('chain2', wrap=False)
+        iptables_dump = (
+            'Chain OUTPUT (policy ACCEPT 400 packets, 65901 bytes)\n'
+            '    pkts      bytes target     prot opt in     out     source'
+            '               destination         \n'
+            '     400   65901 chain1     all  --  *      *       0.0.0.0/0'
+            '            0.0.0.0/0           \n'
+            '\n'
+            'Chain chain1 (1 references)\n'
+            '    pkts      bytes target     prot opt in     out     source'
+            '               destination         \n'
+            '     100    1000            all  --  *      *       0.0.0.0/0'
+            '            0.0.0.0/0           \n'
+            '      20     200            all  --  *      *       0.0.0.0/0'
+            '            0.0.0.0/0           \n'
+            '\n'
+            'Chain chain2 (0 references)\n'
+            '    pkts      bytes target     prot opt in     out     source'
+            '               destination         \n'
+            '\n'
+            'Chain chain3 (0 references)\n'
+            '    pkts      bytes target     prot opt in     out     source'
+            '               destination         \n'
+            '       5      50            all  --  *      *       0.0.0.0/0'
+            '            0.0.0.0/0           \n')
+
+        expected_calls_and_values = [
+            (mock.call(['iptables', '-t', 'filter', '-L', '-n', '-v', '-x',
+                        '-Z'],
+                       root_helper=self.root_helper),
+             iptables_dump),
+        ]
+        tools.setup_mock_calls(self.execute, expected_calls_and_values)
+
+        accs = self.iptables.get_chains_traffic_counters(
+            ['chain1', 'chain2', 'chain3'], wrap=False, zero=True)
+        self.assertEqual({'chain1': {'pkts': 120, 'bytes': 1200},
+                          'chain2': {'pkts': 0, 'bytes': 0}}, accs)
+
+        tools.verify_mock_calls(self.execute, expected_calls_and_values)
+
 
 class IptablesManagerStateLessTestCase(base.BaseTestCase):
 
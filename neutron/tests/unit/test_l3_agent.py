@@ -491,6 +491,94 @@ class TestBasicRouterOperations(base.BaseTestCase):
         for chain, rule in rules:
             nat.add_rule.assert_any_call(chain, rule, tag='floating_ip')
 
+    @mock.patch('neutron.agent.linux.ip_lib.IPDevice')
+    def test_process_router_floating_ip_incremental(self, IPDevice):
+        fip1 = {
+            'id': _uuid(), 'port_id': _uuid(),
+            'floating_ip_address': '15.1.2.3',
+            'fixed_ip_address': '192.168.0.1'
+        }
+        fip2 = {
+            'id': _uuid(), 'port_id': _uuid(),
+            'floating_ip_address': '15.1.2.4',
+            'fixed_ip_address': '192.168.0.2'
+        }
+
+        IPDevice.return_value = device = mock.Mock()
+        device.addr.list.return_value = [{'cidr': '15.1.2.3/32'}]
+
+        router = {l3_constants.FLOATINGIP_KEY: [fip1]}
+        ri = l3_agent.RouterInfo(_uuid(), self.conf.root_helper,
+                                 self.conf.use_namespaces, router=router)
+        ri.iptables_manager = mock.MagicMock()
+        nat = ri.iptables_manager.ipv4['nat']
+        ex_gw_port = {'id': _uuid()}
+
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent.process_router_floating_ips(ri, ex_gw_port)
+        self.assertFalse(device.addr.add.called)
+
+        device.reset_mock()
+        nat.reset_mock()
+        ri.router = {l3_constants.FLOATINGIP_KEY: [fip1, fip2]}
+        agent.process_router_floating_ips(ri, ex_gw_port)
+
+        self.assertFalse(device.addr.list.called)
+        self.assertFalse(nat.clear_rules_by_tag.called)
+        self.assertFalse(nat.remove_rule.called)
+        device.addr.add.assert_called_once_with(4, '15.1.2.4/32', '15.1.2.4')
+        rules = agent.floating_forward_rules('15.1.2.4', '192.168.0.2')
+        self.assertEqual(nat.add_rule.call_count, len(rules))
+        for chain, rule in rules:
+            nat.add_rule.assert_any_call(chain, rule, tag='floating_ip')
+
+        device.reset_mock()
+        nat.reset_mock()
+        ri.router = {l3_constants.FLOATINGIP_KEY: [fip2]}
+        agent.process_router_floating_ips(ri, ex_gw_port)
+
+        self.assertFalse(device.addr.add.called)
+        self.assertFalse(nat.add_rule.called)
+        device.addr.delete.assert_called_once_with(4, '15.1.2.3/32')
+        rules = agent.floating_forward_rules('15.1.2.3', '192.168.0.1')
+        for chain, rule in rules:
+            nat.remove_rule.assert_any_call(chain, rule)
+
+    @mock.patch('neutron.agent.linux.ip_lib.IPDevice')
+    def test_process_router_floating_ip_add_failure(self, IPDevice):
+        fips = [{'id': _uuid(), 'port_id': _uuid(),
+                 'floating_ip_address': '15.1.2.%d' % i,
+                 'fixed_ip_address': '192.168.0.%d' % i}
+                for i in range(1, 3)]
+
+        IPDevice.return_value = device = mock.Mock()
+        device.addr.list.return_value = []
+        device.addr.add.side_effect = [None, RuntimeError()]
+
+        router = {l3_constants.FLOATINGIP_KEY: fips}
+        ri = l3_agent.RouterInfo(_uuid(), self.conf.root_helper,
+                                 self.conf.use_namespaces, router=router)
+        ri.iptables_manager = mock.MagicMock()
+
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.assertRaises(RuntimeError, agent.process_router_floating_ips,
+                          ri, {'id': _uuid()})
+
+        # Only the address which was added is known to be configured
+        added_cidr = device.addr.add.call_args_list[0][0][1]
+        self.assertEqual(set([added_cidr]), ri.floating_ip_cidrs)
+
+    def test_process_router_failure_relists_floating_ips(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = self._prepare_router_data()
+        ri = l3_agent.RouterInfo(router['id'], self.conf.root_helper,
+                                 self.conf.use_namespaces, router=router)
+        ri.floating_ip_device = 'qg-1'
+        with mock.patch.object(agent, 'routes_updated',
+                               side_effect=RuntimeError()):
+            self.assertRaises(RuntimeError, agent.process_router, ri)
+        self.assertIsNone(ri.floating_ip_device)
+
     def test_process_router_snat_disabled(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         router = self._prepare_router_data(enable_snat=True)
@@ -16,6 +16,7 @@
 #    under the License.
 
 import mock
+from oslo.config import cfg
 
 from neutron.agent.linux import ip_lib
 from neutron.common import exceptions
@@ -187,6 +188,132 @@ class TestSubProcessBase(base.BaseTestCase):
                           [], 'link', ('list',))
 
 
+class TestDeferredExecution(base.BaseTestCase):
+    def setUp(self):
+        super(TestDeferredExecution, self).setUp()
+        cfg.CONF.register_opts(ip_lib.OPTS)
+        cfg.CONF.set_override('ip_lib_batch', True)
+        self.execute_p = mock.patch('neutron.agent.linux.utils.execute')
+        self.execute = self.execute_p.start()
+        self.batch_stderr = ''
+
+        def execute(cmd, root_helper=None, process_input=None,
+                    check_exit_code=True, return_stderr=False):
+            return return_stderr and ('', self.batch_stderr) or ''
+
+        self.execute.side_effect = execute
+        self.addCleanup(self.execute_p.stop)
+        self.addCleanup(ip_lib._deferred.clear)
+        self.device = ip_lib.IPDevice('tap0', 'sudo', 'ns')
+
+    def _assert_batch(self, process_input):
+        self.execute.assert_called_once_with(
+            ['ip', 'netns', 'exec', 'ns', 'ip', '-force', '-batch', '-'],
+            root_helper='sudo', process_input=process_input,
+            check_exit_code=False, return_stderr=True)
+
+    def test_deferred_commands_run_as_one_batch(self):
+        ip_lib.defer_apply_on()
+        self.device.link.set_up()
+        self.device.addr.add(4, '192.168.1.1/24', '192.168.1.255')
+        self.assertFalse(self.execute.called)
+        ip_lib.defer_apply_off()
+
+        self._assert_batch('link set tap0 up\n'
+                           'addr add 192.168.1.1/24 brd 192.168.1.255 '
+                           'scope global dev tap0\n')
+
+    def test_read_flushes_deferred_commands(self):
+        ip_lib.defer_apply_on()
+        self.device.link.set_up()
+        self.device.addr.list()
+        self.assertEqual(2, self.execute.call_count)
+        self.assertEqual(
+            ['ip', 'netns', 'exec', 'ns', 'ip', '-force', '-batch', '-'],
+            self.execute.call_args_list[0][0][0])
+        ip_lib.defer_apply_off()
+        self.assertEqual(2, self.execute.call_count)
+
+    def test_nested_deferred_mode(self):
+        @ip_lib.defer_apply
+        def set_up():
+            self.device.link.set_up()
+
+        ip_lib.defer_apply_on()
+        set_up()
+        self.device.link.set_mtu(1400)
+        self.assertFalse(self.execute.called)
+        ip_lib.defer_apply_off()
+
+        self._assert_batch('link set tap0 up\nlink set tap0 mtu 1400\n')
+
+    def test_failing_commands_logged(self):
+        self.batch_stderr = ('Cannot find device "tap0"\n'
+                             'Command failed -:1\n'
+                             'RTNETLINK answers: No such process\n'
+                             'Command failed -:3\n')
+        with mock.patch.object(ip_lib.LOG, 'error') as log:
+            ip_lib.defer_apply_on()
+            self.device.link.set_up()
+            self.device.link.set_mtu(1400)
+            self.device.route.delete_gateway('10.0.0.1')
+            e = self.assertRaises(RuntimeError, ip_lib.defer_apply_off)
+
+        self.assertIn('link set tap0 up; route del default', str(e))
+        self.assertEqual(1, self.execute.call_count)
+        self.assertEqual(
+            ['link set tap0 up', 'route del default via 10.0.0.1 dev tap0'],
+            [call[0][1]['cmd'] for call in log.call_args_list])
+        self.assertEqual('Cannot find device "tap0"',
+                         log.call_args_list[0][0][1]['error'])
+
+    def test_exception_not_replaced_by_batch_failure(self):
+        @ip_lib.defer_apply
+        def set_up():
+            self.device.link.set_up()
+            raise ValueError()
+
+        self.execute.side_effect = RuntimeError()
+        with mock.patch.object(ip_lib.LOG, 'exception') as log:
+            self.assertRaises(ValueError, set_up)
+        self.assertEqual(1, self.execute.call_count)
+        self.assertTrue(log.called)
+
+    def test_read_failure_raised_by_defer_apply_off(self):
+        self.batch_stderr = ('Cannot find device "tap0"\n'
+                             'Command failed -:1\n')
+        ip_lib.defer_apply_on()
+        self.device.link.set_up()
+        # The failure is not raised to the unrelated read
+        self.device.addr.list()
+        self.assertRaises(RuntimeError, ip_lib.defer_apply_off)
+
+    def test_flush_deferred_raises_failure(self):
+        self.batch_stderr = ('Cannot find device "tap0"\n'
+                             'Command failed -:1\n')
+        ip_lib.defer_apply_on()
+        self.device.link.set_up()
+        self.assertRaises(RuntimeError, ip_lib.flush_deferred)
+        self.batch_stderr = ''
+        self.device.link.set_mtu(1400)
+        ip_lib.defer_apply_off()
+        self.assertEqual(2, self.execute.call_count)
+
+    def test_link_delete_not_deferred(self):
+        self.execute.side_effect = RuntimeError()
+        ip_lib.defer_apply_on()
+        self.assertRaises(RuntimeError, self.device.link.delete)
+        ip_lib.defer_apply_off()
+
+    def test_deferred_mode_disabled(self):
+        cfg.CONF.set_override('ip_lib_batch', False)
+        ip_lib.defer_apply_on()
+        self.device.link.set_up()
+        self.assertEqual(1, self.execute.call_count)
+        ip_lib.defer_apply_off()
+        self.assertEqual(1, self.execute.call_count)
+
+
 class TestIpWrapper(base.BaseTestCase):
     def setUp(self):
         super(TestIpWrapper, self).setUp()
@@ -38,6 +38,9 @@ class FakeConf(object):
     nova_metadata_ip = '9.9.9.9'
     nova_metadata_port = 8775
     metadata_proxy_shared_secret = 'secret'
+    metadata_cache_ttl = 5
+    metadata_cache_size = 1024
+    nova_metadata_pool_size = 4
 
 
 class TestMetadataProxyHandler(base.BaseTestCase):
@@ -190,6 +193,64 @@ class TestMetadataProxyHandler(base.BaseTestCase):
             (None, None)
         )
 
+    def test_get_instance_id_network_id_cached(self):
+        headers = {
+            'X-Neutron-Network-ID': 'the_id',
+            'X-Forwarded-For': '192.168.1.1'
+        }
+        req = mock.Mock(headers=headers)
+        list_ports = self.qclient.return_value.list_ports
+        list_ports.return_value = {
+            'ports': [{'device_id': 'device_id', 'tenant_id': 'tenant_id'}]}
+
+        for i in range(2):
+            self.assertEqual(
+                self.handler._get_instance_and_tenant_id(req),
+                ('device_id', 'tenant_id'))
+        list_ports.assert_called_once_with(
+            network_id=['the_id'], fixed_ips=['ip_address=192.168.1.1'])
+        self.assertEqual(self.handler.instance_cache.stats(),
+                         {'entries': 1, 'hits': 1, 'misses': 1})
+
+    def test_get_instance_id_no_match_not_cached(self):
+        headers = {
+            'X-Neutron-Network-ID': 'the_id',
+            'X-Forwarded-For': '192.168.1.1'
+        }
+        req = mock.Mock(headers=headers)
+        list_ports = self.qclient.return_value.list_ports
+        list_ports.return_value = {'ports': []}
+
+        for i in range(2):
+            self.assertEqual(
+                self.handler._get_instance_and_tenant_id(req),
+                (None, None))
+        self.assertEqual(list_ports.call_count, 2)
+
+    def test_get_instance_id_router_networks_cached(self):
+        req = mock.Mock(headers={'X-Neutron-Router-ID': 'the_id'})
+        ports = [
+            [{'network_id': 'net1'}],
+            [],
+            []
+        ]
+        list_ports = self.qclient.return_value.list_ports
+        list_ports.side_effect = lambda **kwargs: {'ports': ports.pop(0)}
+
+        for ip in ('192.168.1.1', '192.168.1.2'):
+            req.headers['X-Forwarded-For'] = ip
+            self.handler._get_instance_and_tenant_id(req)
+        list_ports.assert_has_calls([
+            mock.call(device_id='the_id',
+                      device_owner='network:router_interface'),
+            mock.call(network_id=['net1'],
+                      fixed_ips=['ip_address=192.168.1.1']),
+            mock.call(network_id=['net1'],
+                      fixed_ips=['ip_address=192.168.1.2'])
+        ])
+        self.assertEqual(self.handler.router_cache.stats(),
+                         {'entries': 1, 'hits': 1, 'misses': 1})
+
     def _proxy_request_test_helper(self, response_code=200, method='GET'):
         hdrs = {'X-Forwarded-For': '8.8.8.8'}
         body = 'body'
@@ -247,6 +308,22 @@ class TestMetadataProxyHandler(base.BaseTestCase):
         with testtools.ExpectedException(Exception):
             self._proxy_request_test_helper(302)
 
+    def test_proxy_request_reuses_connection(self):
+        req = mock.Mock(path_info='/the_path', query_string='', headers={},
+                        method='GET', body='body')
+        resp = mock.Mock(status=200)
+        with mock.patch.object(self.handler, '_sign_instance_id'):
+            with mock.patch('httplib2.Http') as mock_http:
+                mock_http.return_value.request.return_value = (resp, 'content')
+                for i in range(2):
+                    self.assertEqual('content', self.handler._proxy_request(
+                        'the_id', 'tenant_id', req))
+
+                mock_http.assert_called_once_with()
+                self.assertEqual(
+                    2, mock_http.return_value.request.call_count)
+        self.assertEqual(len(self.handler.nova_pool.free_items), 1)
+
     def test_sign_instance_id(self):
         self.assertEqual(
             self.handler._sign_instance_id('foo'),
@@ -254,6 +331,47 @@ class TestMetadataProxyHandler(base.BaseTestCase):
         )
 
 
+class TestLookupCache(base.BaseTestCase):
+    def setUp(self):
+        super(TestLookupCache, self).setUp()
+        self.time_p = mock.patch('time.time', return_value=100)
+        self.time = self.time_p.start()
+        self.addCleanup(self.time_p.stop)
+        self.cache = agent.LookupCache(2, 5)
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.set('a', 1)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.stats(),
+                         {'entries': 1, 'hits': 1, 'misses': 1})
+
+    def test_expired(self):
+        self.cache.set('a', 1)
+        self.time.return_value = 105
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.get('c'), 3)
+
+    def test_disabled(self):
+        cache = agent.LookupCache(2, 0)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+    def test_clear(self):
+        self.cache.set('a', 1)
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('a'))
+
+
 class TestUnixDomainHttpProtocol(base.BaseTestCase):
     def test_init_empty_client(self):
         u = agent.UnixDomainHttpProtocol(mock.Mock(), '', mock.Mock())
@@ -289,6 +407,24 @@ class TestUnixDomainWSGIServer(base.BaseTestCase):
                 self.eventlet.listen.return_value
             )
 
+    def test_start_workers(self):
+        mock_app = mock.Mock()
+        with mock.patch.object(agent.service, 'ProcessLauncher') as launcher:
+            with mock.patch.object(self.server, 'pool') as pool:
+                self.server.start(mock_app, '/the/path', workers=2)
+                self.assertFalse(pool.spawn_n.called)
+                launcher.return_value.launch_service.assert_called_once_with(
+                    mock.ANY, workers=2)
+                worker = launcher.return_value.launch_service.call_args[0][0]
+                self.assertIsInstance(worker, agent.UnixDomainWorkerService)
+
+                worker.start()
+                pool.spawn.assert_called_once_with(
+                    self.server._run,
+                    mock_app,
+                    self.eventlet.listen.return_value
+                )
+
     def test_run(self):
         with mock.patch.object(agent, 'logging') as logging:
             self.server._run('app', 'sock')
@@ -313,6 +449,8 @@ class TestUnixDomainMetadataProxy(base.BaseTestCase):
         self.looping_mock = looping_call_p.start()
         self.addCleanup(mock.patch.stopall)
         self.cfg.CONF.metadata_proxy_socket = '/the/path'
+        self.cfg.CONF.metadata_workers = 0
+        self.cfg.CONF.metadata_backlog = 128
 
     def test_init_doesnot_exists(self):
         with mock.patch('os.path.isdir') as isdir:
@@ -376,7 +514,8 @@ class TestUnixDomainMetadataProxy(base.BaseTestCase):
                         server.assert_has_calls([
                             mock.call('neutron-metadata-agent'),
                             mock.call().start(handler.return_value,
-                                              '/the/path'),
+                                              '/the/path', workers=0,
+                                              backlog=128),
                             mock.call().wait()]
                         )
 
@@ -412,3 +551,6 @@ class TestUnixDomainMetadataProxy(base.BaseTestCase):
                 state_api_inst = state_api.return_value
                 state_api_inst.report_state.assert_called_once_with(
                     proxy.context, proxy.agent_state, use_call=True)
+                configurations = proxy.agent_state['configurations']
+                self.assertIn('instance_cache', configurations)
+                self.assertIn('router_cache', configurations)
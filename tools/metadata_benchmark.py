@@ -0,0 +1,114 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the throughput and latency of the metadata proxy chain.
+
+Usage: metadata_benchmark.py [requests] [concurrency] [proxies] [workers]
+
+A fake Nova metadata server, the metadata agent and a number of namespace
+metadata proxies are started locally, then requests are sent concurrently
+through the namespace proxies. The Neutron API lookups of the metadata agent
+are replaced by a fixed answer so that only the proxying path is measured.
+"""
+
+import os
+import signal
+import sys
+import tempfile
+import time
+
+import eventlet
+import httplib2
+from oslo.config import cfg
+
+from neutron.agent.metadata import agent
+from neutron.agent.metadata import namespace_proxy
+
+
+class FakeNovaMetadata(object):
+    def __call__(self, environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return ['instance-id: %s' % environ.get('HTTP_X_INSTANCE_ID')]
+
+
+class FixedLookupHandler(agent.MetadataProxyHandler):
+    def _get_instance_and_tenant_id(self, req):
+        return 'instance_id', 'tenant_id'
+
+
+def serve(application):
+    sock = eventlet.listen(('127.0.0.1', 0))
+    eventlet.spawn_n(eventlet.wsgi.server, sock, application,
+                     log=open(os.devnull, 'w'))
+    return sock.getsockname()[1]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def main():
+    eventlet.monkey_patch()
+    args = [int(arg) for arg in sys.argv[1:]]
+    if len(args) > 4:
+        sys.exit(__doc__)
+    count, concurrency, proxies, workers = args + [1000, 50, 4, 0][len(args):]
+
+    nova_port = serve(FakeNovaMetadata())
+    socket_path = os.path.join(tempfile.mkdtemp(), 'metadata_proxy')
+    cfg.CONF.register_opts(agent.MetadataProxyHandler.OPTS)
+    cfg.CONF.register_opts(agent.UnixDomainMetadataProxy.OPTS)
+    cfg.CONF([], project='neutron', default_config_files=[])
+    cfg.CONF.set_override('nova_metadata_port', nova_port)
+    cfg.CONF.set_override('metadata_proxy_socket', socket_path)
+
+    server = agent.UnixDomainWSGIServer('neutron-metadata-agent')
+    server.start(FixedLookupHandler(cfg.CONF), socket_path, workers=workers)
+
+    ports = [serve(namespace_proxy.NetworkMetadataProxyHandler(
+        network_id='network-%d' % i)) for i in xrange(proxies)]
+
+    def request(i):
+        url = 'http://127.0.0.1:%d/latest/meta-data/' % ports[i % proxies]
+        start = time.time()
+        resp, content = httplib2.Http().request(url)
+        if resp.status != 200:
+            raise Exception('Unexpected response code: %s' % resp.status)
+        return time.time() - start
+
+    # warm up the connection pools before measuring
+    request(0)
+    pool = eventlet.GreenPool(concurrency)
+    start = time.time()
+    latencies = list(pool.imap(request, xrange(count)))
+    elapsed = time.time() - start
+
+    print('%d requests through %d proxies, %d concurrent, %d workers' % (
+        count, proxies, concurrency, workers))
+    print('%8.1f requests/s, p50 %6.1fms, p99 %6.1fms' % (
+        count / elapsed, percentile(latencies, 50) * 1000,
+        percentile(latencies, 99) * 1000))
+
+    if workers:
+        for pid in server._launcher.children:
+            os.kill(pid, signal.SIGTERM)
+    os.unlink(socket_path)
+
+
+if __name__ == '__main__':
+    main()
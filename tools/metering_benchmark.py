@@ -0,0 +1,92 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the iptables metering driver counter collection cycle time.
+
+Usage: metering_benchmark.py [labels per router] [command time in ms]
+
+No command is really run, each one takes the given time, 50ms by default,
+to emulate the cost of forking iptables through the root helper. The cycle
+time of the driver is compared with the former per label collection for an
+increasing number of routers.
+"""
+
+import sys
+import time
+
+import eventlet
+from oslo.config import cfg
+
+from neutron.agent.linux import iptables_manager
+from neutron.agent.linux import utils
+from neutron.openstack.common import uuidutils
+from neutron.services.metering.drivers.iptables import iptables_driver
+
+
+def fake_execute(exec_time):
+    def execute(cmd, root_helper=None, process_input=None, **kwargs):
+        eventlet.sleep(exec_time)
+        return ''
+    return execute
+
+
+def make_routers(count, labels):
+    label_ids = [uuidutils.generate_uuid() for i in xrange(labels)]
+    return [{'id': uuidutils.generate_uuid(),
+             'tenant_id': uuidutils.generate_uuid(),
+             'gw_port_id': uuidutils.generate_uuid(),
+             '_metering_labels': [{'id': label_id, 'rules': []}
+                                  for label_id in label_ids]}
+            for i in xrange(count)]
+
+
+def per_label_cycle(driver, routers):
+    for router in routers:
+        rm = driver.routers[router['id']]
+        for label_id in rm.metering_labels:
+            chain = iptables_manager.get_chain_name(
+                iptables_driver.WRAP_NAME + iptables_driver.LABEL + label_id,
+                wrap=False)
+            rm.iptables_manager.get_traffic_counters(chain, wrap=False,
+                                                     zero=True)
+
+
+def timed(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def main():
+    labels = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    exec_time = (float(sys.argv[2]) if len(sys.argv) > 2 else 50) / 1000
+
+    utils.execute = fake_execute(exec_time)
+    cfg.CONF.set_override('interface_driver',
+                          'neutron.agent.linux.interface.NullDriver')
+    print('%8s %16s %16s' % ('routers', 'per label (s)', 'per router (s)'))
+    for count in (10, 50, 100, 500):
+        driver = iptables_driver.IptablesMeteringDriver(None, cfg.CONF)
+        routers = make_routers(count, labels)
+        driver.update_routers(None, routers)
+        print('%8d %16.2f %16.2f' % (
+            count, timed(per_label_cycle, driver, routers),
+            timed(driver.get_traffic_counters, None, routers)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the fetch throughput of the NVP state synchronizer.
+
+Usage: nvp_sync_benchmark.py [switches] [routers] [ports] [chunk] [latency]
+
+A fake NVP backend serves pages of logical switches, routers and ports,
+waiting latency milliseconds for each page request. A full synchronization
+cycle is then fetched chunk by chunk. Only the fetch phase is measured, the
+Neutron database is not involved.
+"""
+
+import sys
+import time
+
+import eventlet
+import mock
+
+from neutron.plugins.nicira.common import sync
+from neutron.plugins.nicira import nvplib
+
+
+class FakeNvpBackend(object):
+    def __init__(self, sizes, latency):
+        self.resources = dict(
+            (uri, [{'uuid': '%s-%d' % (uri, i)} for i in xrange(size)])
+            for uri, size in sizes.iteritems())
+        self.latency = latency
+        self.requests = 0
+
+    def get_single_query_page(self, path, cluster, page_cursor=None,
+                              page_length=1000, neutron_only=True):
+        self.requests += 1
+        eventlet.sleep(self.latency)
+        items = self.resources[path]
+        start = int(page_cursor or 0)
+        end = start + page_length
+        next_cursor = str(end) if end < len(items) else None
+        result_count = None if page_cursor else len(items)
+        return items[start:end], next_cursor, result_count
+
+
+def main():
+    args = [int(arg) for arg in sys.argv[1:]]
+    if len(args) > 5:
+        sys.exit(__doc__)
+    switches, routers, ports, chunk, latency = (
+        args + [1000, 200, 4000, 500, 20][len(args):])
+
+    synchronizer = sync.NvpSynchronizer(None, None, 0, 0, chunk)
+    # The looping call is not started with a zero interval, restore
+    # sensible values for the chunk size calculation
+    synchronizer._sync_interval = 120
+    synchronizer._req_delay = 10
+    backend = FakeNvpBackend({synchronizer.LS_URI: switches,
+                              synchronizer.LR_URI: routers,
+                              synchronizer.LP_URI: ports},
+                             latency / 1000.0)
+
+    sp = sync.SyncParameters(chunk)
+    fetched = chunks = 0
+    with mock.patch.object(nvplib, 'get_single_query_page',
+                           side_effect=backend.get_single_query_page):
+        start = time.time()
+        while True:
+            fetched += sum(len(res) for res in
+                           synchronizer._fetch_nvp_data_chunk(sp))
+            chunks += 1
+            remaining = sum(synchronizer._get_remaining(sp).values())
+            if not remaining:
+                break
+            sp.current_chunk += 1
+        elapsed = time.time() - start
+
+    print('%d resources in %d chunks, %d requests, %dms latency' % (
+        fetched, chunks, backend.requests, latency))
+    print('%8.1f resources/s, %6.1fms per chunk' % (
+        fetched / elapsed, elapsed * 1000 / chunks))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare the commands per second run through rootwrap and its daemon.
+
+Usage: rootwrap_benchmark.py <rootwrap.conf> [count] [command...]
+
+The command, "ip link show lo" by default, must be allowed by the filters.
+"""
+
+import sys
+import time
+
+from oslo.config import cfg
+
+from neutron.agent.common import config
+from neutron.agent.linux import utils
+
+
+def run(label, count, command, root_helper):
+    utils.execute(command, root_helper)
+    start = time.time()
+    for i in xrange(count):
+        utils.execute(command, root_helper)
+    elapsed = time.time() - start
+    print('%-8s %5d commands in %6.2fs: %8.1f commands/s' % (
+        label, count, elapsed, count / elapsed))
+
+
+def main():
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    conf_file = sys.argv[1]
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    command = sys.argv[3:] or ['ip', 'link', 'show', 'lo']
+
+    config.register_root_helper(cfg.CONF)
+    root_helper = 'sudo neutron-rootwrap %s' % conf_file
+    run('rootwrap', count, command, root_helper)
+    cfg.CONF.set_override('root_helper_daemon',
+                          'sudo neutron-rootwrap-daemon %s' % conf_file,
+                          'AGENT')
+    run('daemon', count, command, root_helper)
+
+
+if __name__ == '__main__':
+    main()